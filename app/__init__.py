@@ -1,8 +1,12 @@
-from flask import Flask, render_template, url_for, redirect
+import threading
+
+from flask import Flask, render_template, url_for, redirect, send_from_directory
 from flask_jwt_extended import JWTManager, jwt_required
 from .config import Config
 
-def create_app():
+def create_app(tareas_de_fondo: bool = False):
+    # tareas_de_fondo: solo al levantar el servidor (serve.py, run.py y el
+    # lifespan de app/asgi.py); tests, CLI y benchmarks crean la app sin hilos
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.config.from_object(Config)
 
@@ -15,13 +19,11 @@ def create_app():
     from .despachos.routes import despachos_bp
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(despachos_bp, url_prefix="/api/despachos")
-    from flask import send_from_directory
-
-    from flask import send_from_directory
 
     @app.get("/sw.js")
     def sw():
-        return send_from_directory(app.static_folder, "static/sw.js")
+        # servido desde "/" para que el service worker controle toda la app
+        return send_from_directory(app.static_folder, "sw.js")
     # ==========================
     # Manejo elegante cuando falta JWT (para VISTAS)
     # ==========================
@@ -43,7 +45,7 @@ def create_app():
     # ==========================
     @app.get("/login")
     def login_view():
-        return render_template("auth/login.html")
+        return render_template("auth/login.html", sedes=Config.SEDES)
 
     @app.get("/menu")
     @jwt_required()
@@ -65,4 +67,55 @@ def create_app():
     def index():
         return redirect(url_for("login_view"))
 
+    # ==========================
+    # Métricas (Prometheus)
+    # ==========================
+    from .metricas import instrumentar_app
+    instrumentar_app(app)
+
+    @app.get("/metrics")
+    def metrics():
+        from flask import request, Response, abort
+        from . import metricas
+        token = Config.METRICAS_TOKEN
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+        return Response(metricas.exponer(), mimetype="text/plain; version=0.0.4")
+
+    # ==========================
+    # Esquema: migraciones / índices (flask esquema ...)
+    # ==========================
+    from .esquema import al_arrancar, registrar_comandos
+    registrar_comandos(app)
+    al_arrancar()
+
+    if tareas_de_fondo:
+        iniciar_tareas()
+
     return app
+
+
+# ==========================
+# Tareas de fondo (una vez por proceso)
+# ==========================
+_tareas = {"iniciadas": False}
+_tareas_lock = threading.Lock()
+
+
+def iniciar_tareas():
+    with _tareas_lock:
+        if _tareas["iniciadas"]:
+            return
+        _tareas["iniciadas"] = True
+
+    from .tareas import iniciar_tarea_periodica
+    from .despachos.service import compactar_detalle_finalizado
+    iniciar_tarea_periodica(
+        "compactar-detalle", Config.COMPACTACION_INTERVALO_S, compactar_detalle_finalizado
+    )
+
+    # directorio de trabajadores: precarga al arrancar y refresco periódico
+    from .despachos.directorio import refrescar_directorios
+    iniciar_tarea_periodica(
+        "directorio", Config.DIRECTORIO_REFRESCO_S, refrescar_directorios, inmediato=True
+    )
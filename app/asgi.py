@@ -0,0 +1,500 @@
+# app/asgi.py
+"""
+Capa ASGI para las ráfagas de escaneo (WEB_SERVIDOR=asgi, ver serve.py):
+
+    uvicorn app.asgi:app --workers 2
+
+pyodbc es bloqueante (no hay driver async para SQL Server), así que la BD
+sigue en hilos, pero ya no un hilo por request:
+  - las llamadas a BD corren en un ThreadPoolExecutor acotado (ASGI_HILOS,
+    por defecto = pool de SQL): nunca esperan conexión, y los requests que
+    esperan turno no ocupan hilo;
+  - POST /detalle/scan y /detalle/scan/batch se atienden aquí: las lecturas
+    de un pedido que llegan mientras otro lote del MISMO pedido está en BD
+    se juntan en un solo actualizar_scan_lote (en orden de llegada; cada
+    request recibe sus resultados);
+  - GET /stream (SSE) espera eventos en el event loop, sin hilo por tablet;
+  - todo lo demás pasa tal cual a la app Flask (puente WSGI, mismo executor).
+
+Con más de ASGI_EN_CURSO requests en curso se responde 503 (la cola de
+scans del front reintenta sola).
+"""
+import asyncio
+import functools
+import io
+import json
+import logging
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl
+
+from flask_jwt_extended import decode_token
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_cookie
+
+from . import metricas
+from .config import Config
+from .despachos.eventos import suscribir, desuscribir, coincide, formato_sse
+from .despachos.routes import preparar_scan, respuesta_scan, preparar_lote, respuesta_lote
+from .despachos.serializacion import cuerpo_json
+from .despachos.service import actualizar_scan_lote
+from .sedes import resolver_sede, etiqueta_sede, SedeNoPermitida
+
+log = logging.getLogger(__name__)
+
+_PREFIJO = "/api/despachos"
+
+_duracion = metricas.histograma(
+    "picking_http_duracion_segundos",
+    "Duración de cada request por ruta, método, status y sede"
+)
+_agrupados = metricas.histograma(
+    "picking_scan_agrupados",
+    "Requests de scan resueltos por cada viaje a BD (capa ASGI)",
+    buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+_rechazos = metricas.contador(
+    "picking_asgi_rechazos_total",
+    "Requests rechazados con 503 por ASGI_EN_CURSO"
+)
+
+
+# =========================================================
+# Utilidades ASGI
+# =========================================================
+async def _leer_cuerpo(receive) -> bytes:
+    partes = []
+    while True:
+        m = await receive()
+        if m["type"] == "http.disconnect":
+            break
+        partes.append(m.get("body", b""))
+        if not m.get("more_body"):
+            break
+    return b"".join(partes)
+
+
+async def _esperar_desconexion(receive):
+    while True:
+        if (await receive())["type"] == "http.disconnect":
+            return
+
+
+async def _enviar(send, status, cuerpo: bytes, cabeceras=()):
+    await send({"type": "http.response.start", "status": status, "headers": list(cabeceras)})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+def _ruta(scope) -> str:
+    """Path sin el root_path (montaje detrás de un proxy)."""
+    ruta, raiz = scope["path"], scope.get("root_path", "")
+    return ruta[len(raiz):] if raiz and ruta.startswith(raiz) else ruta
+
+
+def _args(scope) -> MultiDict:
+    return MultiDict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+
+
+def _cabecera(scope, nombre: bytes) -> str:
+    valores = [v.decode("latin-1") for k, v in scope.get("headers", []) if k.lower() == nombre]
+    return "; ".join(valores) if nombre == b"cookie" else ",".join(valores)
+
+
+def _environ(scope, cuerpo: bytes) -> dict:
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    env = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": _ruta(scope).encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "REMOTE_ADDR": cliente[0],
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(cuerpo)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(cuerpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for nombre, valor in scope.get("headers", []):
+        nombre = nombre.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nombre == "CONTENT_LENGTH":
+            continue
+        clave = nombre if nombre == "CONTENT_TYPE" else "HTTP_" + nombre
+        if clave in env:
+            env[clave] += ("; " if clave == "HTTP_COOKIE" else ",") + valor
+        else:
+            env[clave] = valor
+    return env
+
+
+def _ejecutar_wsgi(app, environ):
+    """Corre la app WSGI completa en el hilo actual -> (status, cabeceras, cuerpo)."""
+    respuesta, partes = {}, []
+
+    def start_response(status, cabeceras, exc_info=None):
+        respuesta["status"] = int(status.split(" ", 1)[0])
+        respuesta["cabeceras"] = cabeceras
+        return partes.append
+
+    it = app(environ, start_response)
+    try:
+        for parte in it:
+            if parte:
+                partes.append(parte)
+    finally:
+        if hasattr(it, "close"):
+            it.close()
+    return respuesta["status"], respuesta["cabeceras"], b"".join(partes)
+
+
+class _ColaEventos:
+    """
+    Cola de suscriptor para el backend de eventos (interfaz put_nowait de
+    queue.Queue) que entrega en el event loop. El backend llama desde sus
+    hilos; si el cliente va atrasado se descartan eventos, como en la cola normal.
+    """
+
+    def __init__(self, loop, max_cola: int = 1000):
+        self._loop = loop
+        self._cola = asyncio.Queue(maxsize=max_cola)
+
+    def put_nowait(self, evento):
+        if self._cola.full():
+            raise queue.Full
+        try:
+            self._loop.call_soon_threadsafe(self._poner, evento)
+        except RuntimeError:
+            pass  # loop cerrado
+
+    def _poner(self, evento):
+        try:
+            self._cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self):
+        return await self._cola.get()
+
+
+# =========================================================
+# Scans agrupados por pedido
+# =========================================================
+class _AgrupadorScans:
+    """
+    Un solo lote de scans por pedido en BD a la vez (por proceso). Lo que
+    llega mientras tanto espera sin hilo y sale junto en el siguiente viaje,
+    en orden de llegada, hasta SCAN_LOTE_MAX lecturas. El resultado es el
+    mismo que mandarlos uno tras otro: el lote aplica las lecturas en orden.
+    """
+
+    def __init__(self, en_hilo):
+        self._en_hilo = en_hilo
+        self._pendientes = {}   # (cia, suc, ppc, odc) -> [(items, desde, futuro)]
+
+    async def aplicar(self, clave, items, desde):
+        futuro = asyncio.get_running_loop().create_future()
+        cola = self._pendientes.get(clave)
+        if cola is None:
+            self._pendientes[clave] = [(items, desde, futuro)]
+            asyncio.ensure_future(self._drenar(clave))
+        else:
+            cola.append((items, desde, futuro))
+        return await futuro
+
+    async def _drenar(self, clave):
+        cola = self._pendientes[clave]
+        try:
+            while cola:
+                tanda, n = [], 0
+                while cola and (not tanda or n + len(cola[0][0]) <= Config.SCAN_LOTE_MAX):
+                    tanda.append(cola.pop(0))
+                    n += len(tanda[-1][0])
+                await self._aplicar_tanda(clave, tanda)
+        finally:
+            del self._pendientes[clave]
+
+    async def _aplicar_tanda(self, clave, tanda):
+        items = [dict(it) for its, _, _ in tanda for it in its]
+        # la versión más vieja cubre a todos (el delta de más no estorba al front)
+        versiones = [d for _, d, _ in tanda if d is not None]
+        desde = min(versiones) if versiones else None
+        try:
+            r = await self._en_hilo(actualizar_scan_lote, *clave, items, desde_version=desde)
+        except Exception as e:
+            for _, _, futuro in tanda:
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+
+        _agrupados.observar(len(tanda))
+        i = 0
+        for its, _, futuro in tanda:
+            parte = dict(r, resultados=r["resultados"][i:i + len(its)])
+            i += len(its)
+            if not futuro.done():   # el cliente pudo haberse ido
+                futuro.set_result(parte)
+
+
+# =========================================================
+# App
+# =========================================================
+class AppASGI:
+    def __init__(self, flask_app=None):
+        self._flask = flask_app
+        self._ejecutor = None
+        self._en_curso = 0
+        self._agrupador = _AgrupadorScans(self._en_hilo)
+        self._nativas = {
+            ("POST", f"{_PREFIJO}/detalle/scan"): self._scan,
+            ("POST", f"{_PREFIJO}/detalle/scan/batch"): self._scan_lote,
+        }
+        metricas.indicador(
+            "picking_asgi_en_curso",
+            "Requests en curso en la capa ASGI (sin contar streams)",
+            lambda: self._en_curso
+        )
+
+    def _iniciar(self):
+        if self._flask is None:
+            from . import create_app
+            self._flask = create_app()
+        if self._ejecutor is None:
+            self._ejecutor = ThreadPoolExecutor(
+                max_workers=Config.ASGI_HILOS, thread_name_prefix="asgi-bd"
+            )
+
+    async def _en_hilo(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._ejecutor, functools.partial(fn, *args, **kwargs))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1000})
+            return
+
+        self._iniciar()
+        metodo, ruta = scope["method"], _ruta(scope)
+        if metodo == "GET" and ruta == f"{_PREFIJO}/stream":
+            return await self._stream(scope, receive, send)
+
+        if self._en_curso >= Config.ASGI_EN_CURSO:
+            _rechazos.inc()
+            return await _enviar(
+                send, 503, b'{"msg":"Servidor ocupado, reintente."}',
+                [(b"content-type", b"application/json"), (b"retry-after", b"1")]
+            )
+
+        self._en_curso += 1
+        try:
+            manejador = self._nativas.get((metodo, ruta))
+            if manejador is None:
+                await self._puente_wsgi(scope, await _leer_cuerpo(receive), send)
+            else:
+                await manejador(scope, receive, send)
+        finally:
+            self._en_curso -= 1
+
+    async def _lifespan(self, receive, send):
+        while True:
+            m = await receive()
+            if m["type"] == "lifespan.startup":
+                try:
+                    self._iniciar()
+                    # solo el servidor manda lifespan: ahí arrancan los hilos de fondo
+                    from . import iniciar_tareas
+                    iniciar_tareas()
+                except Exception as e:
+                    log.exception("no se pudo iniciar la app")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif m["type"] == "lifespan.shutdown":
+                if self._ejecutor is not None:
+                    self._ejecutor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    # ---------------------------------------------------------
+    # Puente a Flask
+    # ---------------------------------------------------------
+    async def _puente_wsgi(self, scope, cuerpo: bytes, send):
+        status, cabeceras, datos = await self._en_hilo(
+            _ejecutar_wsgi, self._flask, _environ(scope, cuerpo)
+        )
+        await _enviar(send, status, datos, [
+            (k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in cabeceras
+        ])
+
+    def _claims(self, scope) -> Optional[Dict[str, Any]]:
+        """
+        Misma validación que @jwt_required (cookie + CSRF si está activo).
+        Claims del token, o None si no está autenticado.
+        """
+        cfg = self._flask.config
+        token = parse_cookie(_cabecera(scope, b"cookie")).get(cfg["JWT_ACCESS_COOKIE_NAME"])
+        if not token:
+            return None
+        csrf = None
+        if cfg["JWT_COOKIE_CSRF_PROTECT"] and scope["method"] in cfg["JWT_CSRF_METHODS"]:
+            csrf = _cabecera(scope, cfg["JWT_ACCESS_CSRF_HEADER_NAME"].lower().encode("latin-1"))
+            if not csrf:
+                return None
+        try:
+            with self._flask.app_context():
+                datos = decode_token(token, csrf_value=csrf)
+        except Exception:
+            return None
+        return datos if datos.get("type") == "access" else None
+
+    def _sede(self, claims, scope, body=None):
+        """Misma regla que sedes.sede_actual: parámetros > token > defecto."""
+        pedidos = {}
+        if isinstance(body, dict):
+            pedidos.update({k: body[k] for k in ("codcia", "codsuc") if body.get(k)})
+        args = _args(scope)
+        pedidos.update({k: args[k] for k in ("codcia", "codsuc") if args.get(k)})
+        return resolver_sede(claims, pedidos)
+
+    # ---------------------------------------------------------
+    # Rutas nativas
+    # ---------------------------------------------------------
+    async def _responder(self, scope, send, payload, status, t0, sede=None):
+        cuerpo = cuerpo_json(payload, ("detalle",), _args(scope))
+        await _enviar(send, status, cuerpo, [(b"content-type", b"application/json")])
+        _duracion.observar(
+            time.perf_counter() - t0, ruta=_ruta(scope), metodo=scope["method"], status=str(status),
+            sede=etiqueta_sede(sede)
+        )
+
+    async def _leer_json(self, scope, receive, send, t0):
+        """
+        (cuerpo JSON, sede) si el request es válido y autenticado. Si no,
+        Flask responde como siempre (login, 400...) y se devuelve None;
+        sede no habilitada -> 403 aquí mismo.
+        """
+        cuerpo = await _leer_cuerpo(receive)
+        claims = self._claims(scope)
+        body = None
+        if claims is not None:
+            try:
+                body = json.loads(cuerpo) if cuerpo else None
+            except ValueError:
+                body = None
+        if not isinstance(body, dict):
+            await self._puente_wsgi(scope, cuerpo, send)
+            return None
+        try:
+            return body, self._sede(claims, scope, body)
+        except SedeNoPermitida as e:
+            await self._responder(scope, send, {"msg": str(e)}, 403, t0)
+            return None
+
+    async def _scan(self, scope, receive, send):
+        t0 = time.perf_counter()
+        leido = await self._leer_json(scope, receive, send, t0)
+        if leido is None:
+            return
+        body, sede = leido
+
+        lectura, error = preparar_scan(body)
+        if error:
+            return await self._responder(scope, send, *error, t0, sede)
+        try:
+            r = await self._agrupador.aplicar(
+                sede + (lectura["codppc"], lectura["cododc"]),
+                lectura["items"], lectura["version"]
+            )
+            payload, status = respuesta_scan(body.get("codprod"), r)
+        except Exception:
+            log.exception("error en scan")
+            payload, status = {"msg": "Error interno"}, 500
+        await self._responder(scope, send, payload, status, t0, sede)
+
+    async def _scan_lote(self, scope, receive, send):
+        t0 = time.perf_counter()
+        leido = await self._leer_json(scope, receive, send, t0)
+        if leido is None:
+            return
+        body, sede = leido
+
+        lote, error = preparar_lote(body)
+        if error:
+            return await self._responder(scope, send, *error, t0, sede)
+        try:
+            r = None
+            if lote["items"]:
+                r = await self._agrupador.aplicar(
+                    sede + (lote["codppc"], lote["cododc"]),
+                    lote["items"], lote["version"]
+                )
+            payload, status = respuesta_lote(lote, r)
+        except Exception:
+            log.exception("error en scan por lote")
+            payload, status = {"msg": "Error interno"}, 500
+        await self._responder(scope, send, payload, status, t0, sede)
+
+    async def _stream(self, scope, receive, send):
+        """Igual que GET /stream de Flask, esperando en el event loop."""
+        cuerpo = await _leer_cuerpo(receive)
+        claims = self._claims(scope)
+        if claims is None:
+            return await self._puente_wsgi(scope, cuerpo, send)
+        try:
+            codcia, codsuc = self._sede(claims, scope)
+        except SedeNoPermitida as e:
+            return await self._responder(scope, send, {"msg": str(e)}, 403, time.perf_counter())
+
+        args = _args(scope)
+        codppc = (args.get("codppc") or "").strip()
+        cododc = (args.get("cododc") or "").strip()
+        cola = _ColaEventos(asyncio.get_running_loop())
+        suscribir(cola)
+        desconexion = asyncio.ensure_future(_esperar_desconexion(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ]})
+            await send({"type": "http.response.body", "body": b"retry: 3000\n\n", "more_body": True})
+
+            while not desconexion.done():
+                siguiente = asyncio.ensure_future(cola.get())
+                listos, _ = await asyncio.wait(
+                    {siguiente, desconexion},
+                    timeout=Config.EVENTOS_HEARTBEAT_S,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if siguiente not in listos:
+                    siguiente.cancel()
+                    if not desconexion.done():
+                        # mantiene viva la conexión (proxies / Wi-Fi)
+                        await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                    continue
+
+                ev = siguiente.result()
+                if coincide(ev, codcia, codsuc, codppc, cododc):
+                    await send({
+                        "type": "http.response.body",
+                        "body": formato_sse(ev).encode("utf-8"),
+                        "more_body": True
+                    })
+        finally:
+            desuscribir(cola)
+            desconexion.cancel()
+
+
+app = AppASGI()
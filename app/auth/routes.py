@@ -4,7 +4,8 @@ from flask_jwt_extended import (
     set_access_cookies,
     unset_jwt_cookies
 )
-from .service import autenticar_usuario
+from .service import autenticar_usuario, sedes_de_usuario
+from ..sedes import claim_sedes, resolver_sede, SedeNoPermitida
 
 auth_bp = Blueprint("auth", __name__)
 
@@ -21,6 +22,14 @@ def login():
     if not user:
         return jsonify({"msg": "Usuario o contraseña incorrectos"}), 401
 
+    # sede con la que trabaja la sesión (opcional; por defecto la primera
+    # del usuario), siempre una de las suyas
+    sedes = sedes_de_usuario(user.get("codigo"))
+    try:
+        codcia, codsuc = resolver_sede(None, body, sedes)
+    except SedeNoPermitida as e:
+        return jsonify({"msg": str(e)}), 403
+
     # ✅ Mantener identity simple (string) para no romper otros lugares
     # Lo ideal: usar el codigo ERP (AUXCODAUX) si existe
     identity = str(user.get("codigo") or user.get("id_usuario") or user.get("username") or "")
@@ -31,6 +40,9 @@ def login():
             "username": user.get("username") or "",
             "nombre": user.get("nombre") or "",
             "codigo": user.get("codigo") or "",
+            "codcia": codcia,
+            "codsuc": codsuc,
+            "sedes": claim_sedes(sedes),
 
             # opcionales (si no existen, no rompen)
             "area": user.get("area") or "",
@@ -40,7 +52,9 @@ def login():
 
     resp = jsonify({
         "msg": "login ok",
-        "user": user
+        "user": user,
+        "sede": {"codcia": codcia, "codsuc": codsuc},
+        "sedes": claim_sedes(sedes),
     })
 
     set_access_cookies(resp, access_token)
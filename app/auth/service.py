@@ -1,5 +1,6 @@
 # app/auth/service.py
 from sqlalchemy import text
+from ..config import Config
 from ..db import engine
 
 from sqlalchemy import text
@@ -50,3 +51,25 @@ def autenticar_usuario(username: str, password: str):
         "area": None,
         "cargo": None,
     }
+
+
+def sedes_de_usuario(codigo: str):
+    """
+    Sedes (codcia, codsuc) en las que trabaja el usuario, según
+    dbo.PICKING_USUARIO_SEDE, dentro de Config.SEDES y en ese orden.
+    Sin filas para el usuario -> solo Config.SEDE_DEFECTO.
+    """
+    sql = text("""
+        SELECT LTRIM(RTRIM(CIA_CODCIA)) AS CIA_CODCIA,
+               LTRIM(RTRIM(SUC_CODSUC)) AS SUC_CODSUC
+        FROM dbo.PICKING_USUARIO_SEDE
+        WHERE LTRIM(RTRIM(AUX_CODAUX)) = :c
+    """)
+
+    with engine.begin() as conn:
+        rows = conn.execute(sql, {"c": (codigo or "").strip()}).fetchall()
+
+    if not rows:
+        return [Config.SEDE_DEFECTO]
+    suyas = {(r[0], r[1]) for r in rows}
+    return [s for s in Config.SEDES if s in suyas]
@@ -47,7 +47,8 @@ class Config:
     SQL_DRIVER   = os.getenv("SQL_DRIVER", "ODBC Driver 17 for SQL Server")
     SQL_TRUST    = os.getenv("SQL_TRUST_CERT", "yes")  # yes/no
 
-    SQLALCHEMY_DATABASE_URI = (
+    # DATABASE_URL reemplaza la conexión armada (ej. el stand-in de benchmarks/)
+    SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL") or (
         "mssql+pyodbc://"
         f"{SQL_USER}:{SQL_PASSWORD}@{SQL_SERVER}/{SQL_DATABASE}"
         f"?driver={SQL_DRIVER.replace(' ', '+')}"
@@ -55,3 +56,139 @@ class Config:
     )
 
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # =========================
+    # Servidor de producción (serve.py) y pool de conexiones
+    # =========================
+    WEB_BIND    = os.getenv("WEB_BIND", "0.0.0.0:80")
+    WEB_WORKERS = int(os.getenv("WEB_WORKERS", "2"))   # procesos (gunicorn)
+    WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))   # hilos por proceso
+    WEB_TIMEOUT = int(os.getenv("WEB_TIMEOUT", "60"))
+
+    # El pool es por proceso: a lo más un hilo = una conexión, así que por
+    # defecto pool_size = WEB_THREADS y un margen de desborde para picos.
+    # Conexiones máx. al servidor = WEB_WORKERS * (SQL_POOL_SIZE + SQL_MAX_OVERFLOW)
+    SQL_POOL_SIZE    = int(os.getenv("SQL_POOL_SIZE", str(WEB_THREADS)))
+    SQL_MAX_OVERFLOW = int(os.getenv("SQL_MAX_OVERFLOW", str(max(2, WEB_THREADS // 2))))
+    SQL_POOL_RECYCLE = int(os.getenv("SQL_POOL_RECYCLE", "1800"))  # seg
+    SQL_POOL_TIMEOUT = int(os.getenv("SQL_POOL_TIMEOUT", "10"))    # seg esperando conexión libre
+    SQL_CONNECT_TIMEOUT = int(os.getenv("SQL_CONNECT_TIMEOUT", "15"))  # login ODBC
+
+    # Esquema (app/esquema.py, app/migraciones) al arrancar la app:
+    # "verificar" = revisa en segundo plano que estén los índices que usa el
+    #               servicio y avisa en el log (y en /metrics) lo que falte,
+    # "migrar"    = aplica las migraciones pendientes antes de atender,
+    # "no"        = nada (flask esquema migrar / verificar a mano).
+    ESQUEMA_AL_ARRANCAR = os.getenv("ESQUEMA_AL_ARRANCAR", "verificar").strip().lower()
+
+    # Capa ASGI (app/asgi.py, WEB_SERVIDOR=asgi): las llamadas a BD corren en
+    # ASGI_HILOS hilos (por defecto = pool, nunca esperan conexión) y se
+    # aceptan hasta ASGI_EN_CURSO requests a la vez; el resto recibe 503.
+    WEB_SERVIDOR  = os.getenv("WEB_SERVIDOR", "wsgi").strip().lower()   # wsgi | asgi
+    ASGI_HILOS    = int(os.getenv("ASGI_HILOS", str(SQL_POOL_SIZE)))
+    ASGI_EN_CURSO = int(os.getenv("ASGI_EN_CURSO", "1000"))
+
+    # (Opcional) si se define, /metrics exige "Authorization: Bearer <token>"
+    METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+
+    # Log de SQL lento (logger "app.sql.lento"): umbral en ms, 0 = apagado
+    SQL_SLOW_MS = int(os.getenv("SQL_SLOW_MS", "0"))
+
+    # =========================
+    # Despachos
+    # =========================
+    # Sedes (compañía-sucursal) que atiende este despliegue: "01-01,01-02,02-01".
+    # La primera es la sede por defecto. Cada request usa la de su token
+    # (login) o la que pida con codcia/codsuc, si está en la lista y entre
+    # las del usuario (PICKING_USUARIO_SEDE, ver app/sedes.py).
+    SEDES = [
+        tuple(p.strip() for p in s.split("-", 1))
+        for s in os.getenv("SEDES", "01-01").split(",") if "-" in s
+    ] or [("01", "01")]
+    SEDE_DEFECTO = SEDES[0]
+
+    # Segundos que se reutiliza el resultado del SP de despachos (0 = sin cache)
+    DESPACHOS_CACHE_TTL = int(os.getenv("DESPACHOS_CACHE_TTL", "30"))
+
+    # (Opcional) SELECT de UN pedido con las mismas columnas que el SP de despachos,
+    # parámetros :cia, :suc, :ppc, :odc. Se usa si el pedido no está en el índice.
+    DESPACHOS_SQL_CABECERA = os.getenv("DESPACHOS_SQL_CABECERA")
+
+    # Pedidos buscados que no existen (cabecera 404): segundos que se recuerdan
+    # sin volver al ERP, y cuántos por sede
+    CABECERA_AUSENTE_TTL = int(os.getenv("CABECERA_AUSENTE_TTL", "60"))
+    CABECERA_AUSENTE_MAX = int(os.getenv("CABECERA_AUSENTE_MAX", "5000"))
+
+    # Serialización de respuestas: "auto" (orjson si está instalado), "orjson" o "json"
+    JSON_MOTOR = os.getenv("JSON_MOTOR", "auto").strip().lower()
+
+    # Máximo de lecturas por POST /detalle/scan/batch (4 parámetros c/u, tope ODBC 2100)
+    SCAN_LOTE_MAX = int(os.getenv("SCAN_LOTE_MAX", "200"))
+
+    # Etiquetas QR ya aplicadas que cada proceso recuerda (rechazo sin ir a BD)
+    ETIQUETAS_CACHE_TTL = int(os.getenv("ETIQUETAS_CACHE_TTL", "43200"))
+    ETIQUETAS_CACHE_MAX = int(os.getenv("ETIQUETAS_CACHE_MAX", "200000"))
+
+    # Espera máxima (ms) por el lock de generación de snapshot de un pedido
+    SNAPSHOT_LOCK_TIMEOUT_MS = int(os.getenv("SNAPSHOT_LOCK_TIMEOUT_MS", "30000"))
+
+    # Estado del pedido (inicio/fin/asignados) cacheado por proceso; lo
+    # invalidan los eventos de los demás workers (EVENTOS_BACKEND=broker)
+    ESTADO_PEDIDO_TTL = int(os.getenv("ESTADO_PEDIDO_TTL", "5"))
+    ESTADO_PEDIDO_MAX = int(os.getenv("ESTADO_PEDIDO_MAX", "2000"))
+
+    # Motor del listado de despachos: "cache" (SP cacheado, página en Python)
+    # o "sql" (tabla temporal + COUNT/OFFSET/FETCH en SQL Server)
+    DESPACHOS_LISTADO_MOTOR = os.getenv("DESPACHOS_LISTADO_MOTOR", "cache").strip().lower()
+
+    # Eventos en vivo (SSE /api/despachos/stream):
+    # "memoria" = un solo proceso; "broker" = varios workers vía broker local
+    #   (python -m app.despachos.eventos)
+    EVENTOS_BACKEND = os.getenv("EVENTOS_BACKEND", "memoria").strip().lower()
+    EVENTOS_BROKER_HOST = os.getenv("EVENTOS_BROKER_HOST", "127.0.0.1")
+    EVENTOS_BROKER_PORT = int(os.getenv("EVENTOS_BROKER_PORT", "8765"))
+    # Cada cuántos segundos se manda un comentario de keep-alive
+    EVENTOS_HEARTBEAT_S = int(os.getenv("EVENTOS_HEARTBEAT_S", "15"))
+    # Bajo WSGI (gthread / waitress) cada stream retiene un hilo del worker
+    # mientras está abierto: se aceptan hasta EVENTOS_STREAMS_WSGI por proceso
+    # (0 = ninguno) y el resto recibe 503 + Retry-After; el front pasa a
+    # consultar cada EVENTOS_POLLING_S. Con WEB_SERVIDOR=asgi el stream lo
+    # atiende app/asgi.py en el event loop y este tope no aplica.
+    EVENTOS_STREAMS_WSGI = int(os.getenv("EVENTOS_STREAMS_WSGI", "0"))
+    EVENTOS_POLLING_S = int(os.getenv("EVENTOS_POLLING_S", "10"))
+
+    # Precarga de snapshots: al servir el listado se generan en segundo plano
+    # los detalles de los primeros PRECARGA_PEDIDOS pedidos sin iniciar de la
+    # página (0 = desactivado). Con PRECARGA_HILOS hilos, a lo sumo
+    # PRECARGA_POR_MINUTO por minuto y solo si quedan
+    # PRECARGA_CONEXIONES_LIBRES conexiones libres en el pool.
+    PRECARGA_PEDIDOS = int(os.getenv("PRECARGA_PEDIDOS", "5"))
+    PRECARGA_HILOS = int(os.getenv("PRECARGA_HILOS", "1"))
+    PRECARGA_POR_MINUTO = int(os.getenv("PRECARGA_POR_MINUTO", "30"))
+    PRECARGA_CONEXIONES_LIBRES = int(os.getenv("PRECARGA_CONEXIONES_LIBRES", "2"))
+    PRECARGA_COLA_MAX = int(os.getenv("PRECARGA_COLA_MAX", "20"))
+    PRECARGA_RECORDAR_S = int(os.getenv("PRECARGA_RECORDAR_S", "600"))
+
+    # Ruta de picking: layout del almacén (JSON) con el que se ordenan las
+    # líneas de cada snapshot; ver app/despachos/ruta.py
+    RUTA_LAYOUT = os.getenv(
+        "RUTA_LAYOUT", os.path.join(os.path.dirname(__file__), "despachos", "ruta_layout.json")
+    )
+
+    # Oleadas (app/despachos/oleadas.py): máximo de pedidos que se preparan
+    # juntos con una sola lista de picking
+    OLEADA_MAX_PEDIDOS = int(os.getenv("OLEADA_MAX_PEDIDOS", "10"))
+
+    # Compactación: cada cuántos segundos se archivan pedidos finalizados que
+    # sigan en PICKING_DETALLE (0 = desactivado) y cuántos por vuelta
+    COMPACTACION_INTERVALO_S = int(os.getenv("COMPACTACION_INTERVALO_S", "300"))
+    COMPACTACION_LOTE = int(os.getenv("COMPACTACION_LOTE", "50"))
+
+    # Directorio de trabajadores del ERP en memoria: refresco (seg) y
+    # compañías que se precargan al arrancar
+    DIRECTORIO_REFRESCO_S = int(os.getenv("DIRECTORIO_REFRESCO_S", "600"))
+    DIRECTORIO_CIAS = [
+        c.strip()
+        for c in os.getenv("DIRECTORIO_CIAS", ",".join(sorted({cia for cia, _ in SEDES}))).split(",")
+        if c.strip()
+    ]
@@ -1,14 +1,151 @@
-from sqlalchemy import create_engine
+import logging
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from .config import Config
+from . import metricas
+
+_espera_pool = metricas.histograma(
+    "picking_pool_espera_segundos",
+    "Tiempo esperando una conexión libre del pool"
+)
+_timeouts_pool = metricas.contador(
+    "picking_pool_timeouts_total",
+    "Veces que no hubo conexión libre en SQL_POOL_TIMEOUT"
+)
+_duracion_sql = metricas.histograma(
+    "picking_sql_duracion_segundos",
+    "Duración de cada sentencia/lote SQL por nombre"
+)
+_filas_sql = metricas.histograma(
+    "picking_sql_filas",
+    "Filas devueltas (o afectadas) por sentencia",
+    buckets=(0, 1, 5, 10, 50, 100, 500, 1000, 5000, 20000)
+)
+
+log_sql_lento = logging.getLogger("app.sql.lento")
+
+
+class PoolMedido(QueuePool):
+    """QueuePool que mide cuánto espera cada checkout (para dimensionar el pool)."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            _timeouts_pool.inc()
+            raise
+        finally:
+            _espera_pool.observar(time.perf_counter() - t0)
+
+
+_url = make_url(Config.SQLALCHEMY_DATABASE_URI)
+_opciones = {}
+if _url.get_backend_name() == "mssql":
+    _opciones = {
+        "fast_executemany": True,
+        "connect_args": {"timeout": Config.SQL_CONNECT_TIMEOUT},
+    }
 
 engine = create_engine(
-    Config.SQLALCHEMY_DATABASE_URI,
+    _url,
+    poolclass=PoolMedido,
+    pool_size=Config.SQL_POOL_SIZE,
+    max_overflow=Config.SQL_MAX_OVERFLOW,
+    pool_timeout=Config.SQL_POOL_TIMEOUT,
+    pool_recycle=Config.SQL_POOL_RECYCLE,
     pool_pre_ping=True,
-    pool_recycle=180,
-    fast_executemany=True
+    **_opciones
 )
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 
+def _estado_pool():
+    p = engine.pool
+    return {
+        (("estado", "en_uso"),): p.checkedout(),
+        (("estado", "libres"),): p.checkedin(),
+        (("estado", "desborde"),): max(p.overflow(), 0),
+        (("estado", "tamano"),): p.size(),
+    }
+
+
+metricas.indicador("picking_pool_conexiones", "Conexiones del pool por estado", _estado_pool)
+
+
+# =========================================================
+# Medición de SQL
+# =========================================================
+_RE_MARCA = re.compile(r"--\s*picking:([\w.-]+)")
+_RE_EXEC = re.compile(r"\bEXEC(?:UTE)?\s+(?:@\w+\s*=\s*)?(?:dbo\.)?(\w+)", re.I)
+_RE_VERBO = re.compile(r"\b(SELECT|INSERT|UPDATE|DELETE|MERGE)\b", re.I)
+_RE_TABLA = re.compile(r"\bdbo\.(\w+)", re.I)
+
+
+@lru_cache(maxsize=512)
+def nombre_sentencia(sql: str) -> str:
+    """
+    Etiqueta estable (baja cardinalidad) para métricas:
+    marca "-- picking:<nombre>", o el SP del EXEC, o "<verbo> <tabla>".
+    """
+    m = _RE_MARCA.search(sql)
+    if m:
+        return m.group(1)
+    m = _RE_EXEC.search(sql)
+    if m and m.group(1).lower() != "sp_getapplock":
+        return m.group(1)
+    verbo = _RE_VERBO.search(sql)
+    tabla = _RE_TABLA.search(sql)
+    return " ".join(x.group(1) for x in (verbo, tabla) if x).lower() or "otro"
+
+
+def _registrar_sql(nombre: str, segundos: float, filas, sql: str):
+    _duracion_sql.observar(segundos, sentencia=nombre)
+    if filas is not None and filas >= 0:
+        _filas_sql.observar(filas, sentencia=nombre)
+    if Config.SQL_SLOW_MS > 0 and segundos * 1000 >= Config.SQL_SLOW_MS:
+        log_sql_lento.warning(
+            "SQL lento %.0f ms [%s] filas=%s: %s",
+            segundos * 1000, nombre, filas, " ".join((sql or "").split())[:500]
+        )
+
+
+@contextmanager
+def medir_sql(nombre: str, sql: str = None):
+    """
+    Para los caminos con cursor crudo (engine.raw_connection), que no pasan
+    por los eventos del engine. Quien llama puede poner m["filas"].
+
+        with medir_sql("sp_despachos") as m:
+            cur.execute(...)
+            filas = cur.fetchall()
+            m["filas"] = len(filas)
+    """
+    m = {"filas": None}
+    t0 = time.perf_counter()
+    try:
+        yield m
+    finally:
+        _registrar_sql(nombre, time.perf_counter() - t0, m["filas"], sql or nombre)
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _antes_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info["_t_sql"] = time.perf_counter()
+
 
+@event.listens_for(engine, "after_cursor_execute")
+def _despues_sql(conn, cursor, statement, parameters, context, executemany):
+    t0 = conn.info.pop("_t_sql", None)
+    if t0 is None:
+        return
+    _registrar_sql(
+        nombre_sentencia(statement), time.perf_counter() - t0,
+        getattr(cursor, "rowcount", -1), statement
+    )
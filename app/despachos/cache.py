@@ -0,0 +1,166 @@
+# app/despachos/cache.py
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+_FALTA = object()
+
+
+class CandadosPorClave:
+    """
+    Un lock por clave (ej. por despacho). Las entradas se liberan solas
+    cuando ya nadie las está usando, así el dict no crece sin límite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._candados = {}  # clave -> [Lock, referencias]
+
+    @contextmanager
+    def bloquear(self, clave):
+        with self._lock:
+            entrada = self._candados.get(clave)
+            if entrada is None:
+                entrada = self._candados[clave] = [threading.Lock(), 0]
+            entrada[1] += 1
+        try:
+            with entrada[0]:
+                yield
+        finally:
+            with self._lock:
+                entrada[1] -= 1
+                if entrada[1] == 0:
+                    self._candados.pop(clave, None)
+
+
+class CacheTTL:
+    """
+    Cache en memoria con vencimiento (TTL) y single-flight:
+    si varios hilos piden la misma clave vencida, solo UNO ejecuta `cargar`
+    y el resto espera y reutiliza ese resultado.
+
+    ttl <= 0 desactiva el cache (pero se mantiene el single-flight).
+    """
+
+    def __init__(self, ttl: float, max_items: int = None):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._datos = OrderedDict()  # clave -> (expira, valor)
+        self._lock = threading.Lock()
+        self._candados = CandadosPorClave()
+        self._generacion = 0
+
+    def _leer(self, clave):
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return _FALTA
+            expira, valor = item
+            if expira < time.monotonic():
+                self._datos.pop(clave, None)
+                return _FALTA
+            self._datos.move_to_end(clave)
+            return valor
+
+    def _guardar(self, clave, valor, generacion):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            # si invalidaron mientras cargábamos, el valor ya nace viejo
+            if generacion != self._generacion:
+                return
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            if self.max_items:
+                while len(self._datos) > self.max_items:
+                    self._datos.popitem(last=False)
+
+    def obtener(self, clave, cargar):
+        valor = self._leer(clave)
+        if valor is not _FALTA:
+            return valor
+
+        with self._candados.bloquear(clave):
+            # otro hilo pudo haberlo cargado mientras esperábamos
+            valor = self._leer(clave)
+            if valor is not _FALTA:
+                return valor
+
+            with self._lock:
+                generacion = self._generacion
+            valor = cargar()
+            self._guardar(clave, valor, generacion)
+            return valor
+
+    def contiene(self, clave) -> bool:
+        return self._leer(clave) is not _FALTA
+
+    def poner(self, clave, valor):
+        with self._lock:
+            generacion = self._generacion
+        self._guardar(clave, valor, generacion)
+
+    def vigentes(self, filtro=None):
+        """Valores aún no vencidos (opcionalmente filtrando por clave). No carga nada."""
+        ahora = time.monotonic()
+        with self._lock:
+            return [
+                valor for clave, (expira, valor) in self._datos.items()
+                if expira >= ahora and (filtro is None or filtro(clave))
+            ]
+
+    def invalidar(self, filtro=None):
+        """
+        Sin filtro: vacía todo.
+        Con filtro: función clave -> bool, borra solo las que cumplan.
+        """
+        with self._lock:
+            self._generacion += 1
+            if filtro is None:
+                self._datos.clear()
+                return
+            for clave in [k for k in self._datos if filtro(k)]:
+                self._datos.pop(clave, None)
+
+
+class CachePorSede:
+    """
+    Un CacheTTL por sede: la clave empieza con (codcia, codsuc). TTL y
+    max_items valen para cada sede, así una sucursal con mucho movimiento
+    no desaloja las entradas de otra. Misma interfaz que CacheTTL.
+    """
+
+    def __init__(self, ttl: float, max_items: int = None):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._sedes = {}  # (codcia, codsuc) -> CacheTTL
+
+    def _de(self, clave) -> CacheTTL:
+        sede = tuple(clave[:2])
+        with self._lock:
+            cache = self._sedes.get(sede)
+            if cache is None:
+                cache = self._sedes[sede] = CacheTTL(self.ttl, max_items=self.max_items)
+            return cache
+
+    def _todas(self):
+        with self._lock:
+            return list(self._sedes.values())
+
+    def obtener(self, clave, cargar):
+        return self._de(clave).obtener(clave, cargar)
+
+    def contiene(self, clave) -> bool:
+        return self._de(clave).contiene(clave)
+
+    def poner(self, clave, valor):
+        self._de(clave).poner(clave, valor)
+
+    def vigentes(self, filtro=None):
+        return [v for cache in self._todas() for v in cache.vigentes(filtro)]
+
+    def invalidar(self, filtro=None):
+        for cache in self._todas():
+            cache.invalidar(filtro)
@@ -0,0 +1,138 @@
+# app/despachos/directorio.py
+"""
+Directorio de trabajadores del ERP (STROBBE_V13) en memoria, por compañía.
+
+Una sola consulta trae a los empleados con su nombre y si son preparadores
+(TRABAJADOR_USUARIO_TRU.tru_predes = 1). Se carga al arrancar y se refresca
+en segundo plano (DIRECTORIO_REFRESCO_S). Con eso:
+  - el modal de PREPARADO POR se sirve sin ir a BD (y con ETag),
+  - los nombres se resuelven con un dict; los códigos que no son empleados
+    caen a una consulta puntual que también se recuerda.
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+
+from ..config import Config
+from ..db import engine
+from .cache import CacheTTL
+
+log = logging.getLogger(__name__)
+
+_SQL_DIRECTORIO = """
+    SELECT
+      LTRIM(RTRIM(a.aux_codaux)) AS CODIGO,
+      LEFT(a.aux_nomaux, 60) AS NOMBRE,
+      a.aux_indest AS ACTIVO,
+      CASE WHEN t.aux_codaux IS NULL THEN 0 ELSE 1 END AS PREPARADOR
+    FROM STROBBE_V13.dbo.V_Auxiliares a
+    LEFT JOIN (
+        SELECT DISTINCT x.aux_codaux
+        FROM STROBBE_V13.dbo.TRABAJADOR_USUARIO_TRU x
+        WHERE x.cia_codcia = :codcia
+          AND x.tru_predes = 1
+    ) t ON t.aux_codaux = a.aux_codaux
+    WHERE a.cia_codcia = :codcia
+      AND a.aux_indemp = '1'
+    ORDER BY LEFT(a.aux_nomaux, 60)
+"""
+
+_directorios: Dict[str, Dict[str, Any]] = {}   # codcia -> directorio
+_lock = threading.Lock()
+_carga_lock = threading.Lock()
+
+# códigos que no están en el directorio (no empleados): consulta puntual recordada
+_nombres_sueltos = CacheTTL(Config.DIRECTORIO_REFRESCO_S, max_items=5000)
+
+
+def _cargar(codcia: str) -> Dict[str, Any]:
+    with engine.begin() as conn:
+        filas = conn.execute(text(_SQL_DIRECTORIO), {"codcia": codcia}).mappings().all()
+
+    preparadores = [
+        {"CODIGO": f["CODIGO"], "NOMBRE": f["NOMBRE"]}
+        for f in filas
+        if f["PREPARADOR"] and str(f["ACTIVO"] or "").strip() == "1"
+    ]
+    cuerpo = json.dumps(preparadores, sort_keys=True, default=str).encode("utf-8")
+    return {
+        "preparadores": preparadores,
+        "nombres": {f["CODIGO"]: f["NOMBRE"] for f in filas},
+        "etag": hashlib.sha1(cuerpo).hexdigest(),
+    }
+
+
+def refrescar_directorio(codcia: str) -> Dict[str, Any]:
+    with _carga_lock:
+        d = _cargar(codcia)
+        with _lock:
+            _directorios[codcia] = d
+        return d
+
+
+def refrescar_directorios():
+    """Tarea de fondo: recarga las compañías configuradas y las ya usadas."""
+    with _lock:
+        cias = set(_directorios)
+    cias.update(Config.DIRECTORIO_CIAS)
+    for codcia in sorted(cias):
+        try:
+            refrescar_directorio(codcia)
+        except Exception:
+            # se sigue sirviendo la copia anterior
+            log.exception("no se pudo refrescar el directorio de %s", codcia)
+    _nombres_sueltos.invalidar()
+
+
+def obtener_directorio(codcia: str) -> Dict[str, Any]:
+    with _lock:
+        d = _directorios.get(codcia)
+    if d is not None:
+        return d
+    # primera vez (la precarga aún no terminó o es otra compañía)
+    with _carga_lock:
+        with _lock:
+            d = _directorios.get(codcia)
+        if d is not None:
+            return d
+        d = _cargar(codcia)
+        with _lock:
+            _directorios[codcia] = d
+        return d
+
+
+def listar_preparadores(codcia: str) -> List[Dict[str, Any]]:
+    """[{CODIGO, NOMBRE}] ordenados por nombre. No modificar (es compartida)."""
+    return obtener_directorio(codcia)["preparadores"]
+
+
+def _consultar_nombre(codcia: str, codaux: str) -> Optional[str]:
+    with engine.begin() as conn:
+        r = conn.execute(text("""
+            SELECT TOP 1 LEFT(a.aux_nomaux, 60) AS NOMBRE
+            FROM STROBBE_V13.dbo.V_Auxiliares a
+            WHERE a.cia_codcia = :codcia
+              AND a.aux_codaux = :codaux
+        """), {
+            "codcia": codcia,
+            "codaux": codaux
+        }).mappings().first()
+
+        return r["NOMBRE"] if r else None
+
+
+def nombre_trabajador(codcia: str, codaux) -> Optional[str]:
+    if not codaux:
+        return None
+    codaux = str(codaux).strip()
+
+    nombre = obtener_directorio(codcia)["nombres"].get(codaux)
+    if nombre is not None:
+        return nombre
+    return _nombres_sueltos.obtener(
+        (codcia, codaux), lambda: _consultar_nombre(codcia, codaux)
+    )
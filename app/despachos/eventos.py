@@ -0,0 +1,235 @@
+# app/despachos/eventos.py
+"""
+Pub/sub de eventos de despachos (scan, inicio, fin, asignacion) para el
+stream SSE (/api/despachos/stream).
+
+Backends (EVENTOS_BACKEND):
+  - "memoria": dentro del proceso (un solo worker).
+  - "broker":  varios workers/procesos comparten eventos a través de un
+               broker local TCP (JSON por línea) que reenvía a todos:
+                   python -m app.despachos.eventos --host 127.0.0.1 --port 8765
+"""
+import argparse
+import json
+import logging
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from ..config import Config
+
+log = logging.getLogger(__name__)
+
+
+class BackendMemoria:
+    """Reparte cada evento a las colas de los suscriptores de este proceso."""
+
+    def __init__(self, max_cola: int = 1000):
+        self.max_cola = max_cola
+        self._subs = set()
+        self._lock = threading.Lock()
+
+    def publicar(self, evento: dict):
+        self._repartir(evento)
+
+    def _repartir(self, evento: dict):
+        with self._lock:
+            subs = list(self._subs)
+        for q in subs:
+            try:
+                q.put_nowait(evento)
+            except queue.Full:
+                # cliente lento: pierde eventos, no frena a los demás
+                pass
+
+    def suscribir(self, cola=None) -> queue.Queue:
+        """cola: cualquier objeto con put_nowait (que lance queue.Full si está llena)."""
+        q = cola if cola is not None else queue.Queue(maxsize=self.max_cola)
+        with self._lock:
+            self._subs.add(q)
+        return q
+
+    def desuscribir(self, q: queue.Queue):
+        with self._lock:
+            self._subs.discard(q)
+
+
+class BackendBroker(BackendMemoria):
+    """
+    Publica al broker y recibe de él (incluidos los eventos propios), así
+    todos los workers reparten lo mismo a sus suscriptores locales.
+    Si el broker no está, los eventos se pierden (el front sigue
+    funcionando con sus lecturas normales) y se reintenta la conexión.
+    """
+
+    def __init__(self, host: str, port: int, max_cola: int = 1000):
+        super().__init__(max_cola)
+        self.host = host
+        self.port = port
+        self._sock = None
+        self._sock_lock = threading.Lock()
+        threading.Thread(target=self._leer, name="eventos-broker", daemon=True).start()
+
+    def _conectar(self):
+        s = socket.create_connection((self.host, self.port), timeout=5)
+        s.settimeout(None)
+        with self._sock_lock:
+            self._sock = s
+        return s
+
+    def _leer(self):
+        while True:
+            try:
+                s = self._conectar()
+                with s.makefile("r", encoding="utf-8") as f:
+                    for linea in f:
+                        try:
+                            self._repartir(json.loads(linea))
+                        except ValueError:
+                            continue
+            except OSError as e:
+                log.warning("broker de eventos no disponible (%s:%s): %s", self.host, self.port, e)
+            with self._sock_lock:
+                self._sock = None
+            time.sleep(2)
+
+    def publicar(self, evento: dict):
+        datos = (json.dumps(evento, default=str) + "\n").encode("utf-8")
+        with self._sock_lock:
+            s = self._sock
+            if s is None:
+                return
+            try:
+                s.sendall(datos)
+            except OSError as e:
+                log.warning("no se pudo publicar evento: %s", e)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def obtener_backend() -> BackendMemoria:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if Config.EVENTOS_BACKEND == "broker":
+                _backend = BackendBroker(Config.EVENTOS_BROKER_HOST, Config.EVENTOS_BROKER_PORT)
+            else:
+                _backend = BackendMemoria()
+        return _backend
+
+
+def publicar_evento(tipo: str, codcia, codsuc, codppc, cododc, **datos):
+    """
+    tipo: scan | inicio | fin | asignacion.
+    Nunca rompe la operación que lo llama.
+    """
+    evento = {
+        "tipo": tipo,
+        "codcia": codcia,
+        "codsuc": codsuc,
+        "codppc": str(codppc or "").strip(),
+        "cododc": str(cododc or "").strip(),
+        "ts": time.time(),
+        **datos,
+    }
+    try:
+        obtener_backend().publicar(evento)
+    except Exception:
+        log.exception("error publicando evento %s", tipo)
+
+
+def suscribir(cola=None) -> queue.Queue:
+    return obtener_backend().suscribir(cola)
+
+
+def desuscribir(q: queue.Queue):
+    obtener_backend().desuscribir(q)
+
+
+class _Llamada:
+    """Suscriptor que, en vez de encolar, llama a fn(evento) al repartir."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def put_nowait(self, evento: dict):
+        try:
+            self.fn(evento)
+        except Exception:
+            log.exception("error atendiendo evento %s", evento.get("tipo"))
+
+
+def al_recibir(fn):
+    """
+    Llama a fn(evento) con cada evento que reparte este proceso: con el
+    backend "broker", también los publicados por otros workers. Sirve para
+    invalidar lo que cada worker tiene en memoria.
+    """
+    return suscribir(_Llamada(fn))
+
+
+def coincide(evento: dict, codcia, codsuc, codppc="", cododc="") -> bool:
+    """Filtro del stream: misma cia/suc y, si se pidió, el mismo pedido."""
+    if evento.get("codcia") != codcia or evento.get("codsuc") != codsuc:
+        return False
+    if codppc and (evento.get("codppc") != codppc or evento.get("cododc") != cododc):
+        return False
+    return True
+
+
+def formato_sse(evento: dict) -> str:
+    return f"event: {evento['tipo']}\ndata: {json.dumps(evento, default=str)}\n\n"
+
+
+# =========================================================
+# Broker local (para varios workers de Gunicorn)
+# =========================================================
+class _Broker(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, direccion):
+        super().__init__(direccion, _ClienteBroker)
+        self.clientes = set()
+        self.lock = threading.Lock()
+
+    def reenviar(self, datos: bytes):
+        with self.lock:
+            clientes = list(self.clientes)
+        for c in clientes:
+            try:
+                c.sendall(datos)
+            except OSError:
+                with self.lock:
+                    self.clientes.discard(c)
+
+
+class _ClienteBroker(socketserver.StreamRequestHandler):
+    def handle(self):
+        with self.server.lock:
+            self.server.clientes.add(self.request)
+        try:
+            for linea in self.rfile:
+                self.server.reenviar(linea)
+        finally:
+            with self.server.lock:
+                self.server.clientes.discard(self.request)
+
+
+def servir_broker(host: str, port: int):
+    with _Broker((host, port)) as srv:
+        log.info("broker de eventos en %s:%s", host, port)
+        srv.serve_forever()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Broker local de eventos de despachos")
+    ap.add_argument("--host", default=Config.EVENTOS_BROKER_HOST)
+    ap.add_argument("--port", type=int, default=Config.EVENTOS_BROKER_PORT)
+    args = ap.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    servir_broker(args.host, args.port)
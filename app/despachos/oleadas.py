@@ -0,0 +1,595 @@
+# app/despachos/oleadas.py
+"""
+Oleadas (picking por lotes): varios pedidos se preparan en un solo
+recorrido.
+
+Sin oleadas cada pedido se recorre por separado y la misma ubicación se
+visita una vez por pedido. Una oleada junta N pedidos (OLEADA_MAX_PEDIDOS
+como máximo) y arma UNA lista de picking: las líneas de todos agregadas por
+producto + ubicación, en orden de ruta (ruta.py), con el reparto por pedido
+de cada renglón.
+
+Cada lectura de la oleada se reparte en el mismo batch (una transacción,
+_SQL_OLEADA_SCAN) entre las líneas con saldo de los pedidos miembros, en
+orden de la oleada: nunca más de lo abastecido por línea (sin sobrepicking)
+y todo o nada. El avance, ESTADO, detalle_ver y el FIN siguen siendo por
+pedido en PICKING_ASIGNACION, igual que el scan de un pedido: el detalle
+de cada pedido, el listado y el stream lo ven como cualquier otro scan.
+
+Las etiquetas (QR) leídas en la oleada se registran en PICKING_SCAN_ETIQUETA
+con la clave de CADA pedido miembro (el mismo registro que el scan por
+pedido): una etiqueta cuenta una sola vez, se lea primero en la oleada o en
+el detalle de cualquiera de sus pedidos. El archivado de cada pedido borra
+sus filas.
+"""
+import hashlib
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import bindparam, text
+
+from ..config import Config
+from ..db import engine, medir_sql
+from .eventos import publicar_evento
+from .ruta import ordenar_ruta
+from .service import (
+    _clave_pedido,
+    _filas_cursor,
+    asignar_usuarios_preparacion,
+    esta_finalizado,
+    generar_detalle_si_no_existe,
+    marcar_fin_preparacion,
+    marcar_inicio_preparacion,
+)
+
+def _recurso_oleadas(codcia, codsuc) -> str:
+    """applock de creación: dos oleadas a la vez no toman el mismo pedido."""
+    return f"PICKING_OLEADA:{codcia}|{codsuc}"
+
+
+# =========================================================
+# CREACIÓN
+# =========================================================
+_SQL_APPLOCK_OLEADAS = """
+-- picking:applock
+SET NOCOUNT ON;
+DECLARE @r INT;
+EXEC @r = sp_getapplock
+     @Resource = :recurso,
+     @LockMode = 'Exclusive',
+     @LockOwner = 'Transaction',
+     @LockTimeout = :timeout;
+SELECT @r;
+"""
+
+_SQL_PEDIDOS_EN_OLEADA = """
+    SELECT op.PPC_NUMPPC, op.ODC_NUMODC, op.OLEADA_ID
+    FROM dbo.PICKING_OLEADA_PEDIDO op
+    JOIN dbo.PICKING_OLEADA o ON o.OLEADA_ID = op.OLEADA_ID
+    WHERE op.CIA_CODCIA = :cia
+      AND op.SUC_CODSUC = :suc
+      AND op.PPC_NUMPPC IN :ppcs
+      AND o.estado = 'A'
+"""
+
+_SQL_CREAR_OLEADA = """
+-- picking:oleada_crear
+SET NOCOUNT ON;
+INSERT INTO dbo.PICKING_OLEADA (CIA_CODCIA, SUC_CODSUC, creado_cod)
+VALUES (:cia, :suc, :creado);
+SELECT CAST(SCOPE_IDENTITY() AS INT);
+"""
+
+_SQL_AGREGAR_PEDIDO = """
+    INSERT INTO dbo.PICKING_OLEADA_PEDIDO (OLEADA_ID, CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, orden)
+    VALUES (:id, :cia, :suc, :ppc, :odc, :orden)
+"""
+
+
+def crear_oleada(codcia, codsuc, pedidos: List[Dict[str, Any]], creado_por=None, preparado_id=None) -> Dict[str, Any]:
+    """
+    pedidos: [{"codppc", "cododc"}] en el orden en que se reparten las lecturas.
+    Genera el snapshot de cada pedido (si falta) y los registra en una
+    oleada nueva. Con preparado_id lo asigna como PREPARADO POR de todos.
+    -> {"ok": True, "oleada_id", "pedidos"} o {"ok": False, "msg"}.
+    """
+    claves = []
+    for p in pedidos:
+        clave = _clave_pedido(p.get("codppc"), p.get("cododc"))
+        if not clave[0] or not clave[1]:
+            return {"ok": False, "msg": "Cada pedido necesita codppc y cododc."}
+        if clave not in claves:
+            claves.append(clave)
+    if len(claves) < 2:
+        return {"ok": False, "msg": "Una oleada necesita al menos 2 pedidos."}
+    if len(claves) > Config.OLEADA_MAX_PEDIDOS:
+        return {"ok": False, "msg": f"Máximo {Config.OLEADA_MAX_PEDIDOS} pedidos por oleada."}
+
+    finalizados = [f"{ppc}/{odc}" for ppc, odc in claves if esta_finalizado(codcia, codsuc, ppc, odc)]
+    if finalizados:
+        return {"ok": False, "msg": f"Pedidos ya finalizados: {', '.join(finalizados)}"}
+
+    # snapshot de cada pedido antes de la oleada (la lista sale de PICKING_DETALLE)
+    for ppc, odc in claves:
+        generar_detalle_si_no_existe(codcia, codsuc, ppc, odc)
+
+    with engine.begin() as conn:
+        r = conn.execute(text(_SQL_APPLOCK_OLEADAS), {
+            "recurso": _recurso_oleadas(codcia, codsuc),
+            "timeout": Config.SNAPSHOT_LOCK_TIMEOUT_MS,
+        }).scalar()
+        if r is None or r < 0:
+            raise TimeoutError("No se obtuvo el lock de oleadas")
+
+        ocupados = conn.execute(text(_SQL_PEDIDOS_EN_OLEADA).bindparams(bindparam("ppcs", expanding=True)), {
+            "cia": codcia, "suc": codsuc, "ppcs": sorted({ppc for ppc, _ in claves}),
+        }).fetchall()
+        ocupados = [
+            f"{ppc}/{odc} (oleada {oid})" for ppc, odc, oid in ocupados
+            if _clave_pedido(ppc, odc) in claves
+        ]
+        if ocupados:
+            return {"ok": False, "msg": f"Pedidos en otra oleada abierta: {', '.join(ocupados)}"}
+
+        oleada_id = conn.execute(text(_SQL_CREAR_OLEADA), {
+            "cia": codcia, "suc": codsuc, "creado": creado_por,
+        }).scalar()
+        conn.execute(text(_SQL_AGREGAR_PEDIDO), [
+            {"id": oleada_id, "cia": codcia, "suc": codsuc, "ppc": ppc, "odc": odc, "orden": n}
+            for n, (ppc, odc) in enumerate(claves, start=1)
+        ])
+
+    if preparado_id:
+        for ppc, odc in claves:
+            asignar_usuarios_preparacion(codcia, codsuc, ppc, odc, preparado_id=preparado_id)
+
+    return {
+        "ok": True,
+        "oleada_id": oleada_id,
+        "pedidos": [{"codppc": ppc, "cododc": odc} for ppc, odc in claves],
+    }
+
+
+# =========================================================
+# CONSULTA: miembros y lista de picking
+# =========================================================
+_SQL_OLEADAS_ABIERTAS = """
+    SELECT o.OLEADA_ID, o.creado_cod, o.creado_dt, COUNT(*) AS pedidos
+    FROM dbo.PICKING_OLEADA o
+    JOIN dbo.PICKING_OLEADA_PEDIDO op ON op.OLEADA_ID = o.OLEADA_ID
+    WHERE o.CIA_CODCIA = :cia
+      AND o.SUC_CODSUC = :suc
+      AND o.estado = 'A'
+    GROUP BY o.OLEADA_ID, o.creado_cod, o.creado_dt
+    ORDER BY o.OLEADA_ID
+"""
+
+_SQL_MIEMBROS = """
+    SELECT o.estado, o.creado_dt, o.cerrado_dt,
+           op.PPC_NUMPPC, op.ODC_NUMODC, op.orden,
+           a.inicio_dt, a.fin_dt, a.updated_at, a.detalle_ver,
+           a.lineas_total AS lineas, a.lineas_completas,
+           a.unidades_abastecidas, a.unidades_escaneadas
+    FROM dbo.PICKING_OLEADA o
+    JOIN dbo.PICKING_OLEADA_PEDIDO op ON op.OLEADA_ID = o.OLEADA_ID
+    LEFT JOIN dbo.PICKING_ASIGNACION a
+      ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+     AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+    WHERE o.OLEADA_ID = :id
+      AND o.CIA_CODCIA = :cia
+      AND o.SUC_CODSUC = :suc
+    ORDER BY op.orden
+"""
+
+_SQL_LINEAS_OLEADA = """
+    SELECT d.PPC_NUMPPC, d.ODC_NUMODC, d.ITEM, d.Cod_Producto_Pedido,
+           d.Descripcion_pedido, d.CodigoParte, d.UM, d.Ubicacion,
+           d.Cantidd_abastecida, d.Cantidad_Scaneada, op.orden
+    FROM dbo.PICKING_OLEADA_PEDIDO op
+    JOIN dbo.PICKING_DETALLE d
+      ON d.CIA_CODCIA = op.CIA_CODCIA AND d.SUC_CODSUC = op.SUC_CODSUC
+     AND d.PPC_NUMPPC = op.PPC_NUMPPC AND d.ODC_NUMODC = op.ODC_NUMODC
+    WHERE op.OLEADA_ID = :id
+      AND op.CIA_CODCIA = :cia
+      AND op.SUC_CODSUC = :suc
+    ORDER BY op.orden, d.ITEM
+"""
+
+
+def listar_oleadas(codcia, codsuc) -> List[Dict[str, Any]]:
+    with engine.begin() as conn:
+        rows = conn.execute(text(_SQL_OLEADAS_ABIERTAS), {"cia": codcia, "suc": codsuc}).mappings().all()
+    return [{
+        "oleada_id": r["OLEADA_ID"],
+        "creado_cod": r["creado_cod"],
+        "creado_dt": r["creado_dt"],
+        "pedidos": r["pedidos"],
+    } for r in rows]
+
+
+def miembros_oleada(codcia, codsuc, oleada_id) -> List[Dict[str, Any]]:
+    """Pedidos de la oleada (en orden) con su estado y avance; [] si no existe en la sede."""
+    with engine.begin() as conn:
+        rows = conn.execute(text(_SQL_MIEMBROS), {
+            "id": int(oleada_id), "cia": codcia, "suc": codsuc
+        }).mappings().all()
+    return [dict(r) for r in rows]
+
+
+def version_oleada(miembros: List[Dict[str, Any]]) -> Optional[str]:
+    """Token (ETag) de la oleada: estado + versión de cada pedido (sube con cada scan)."""
+    if not miembros:
+        return None
+    base = repr([
+        (m["estado"], m["PPC_NUMPPC"], m["ODC_NUMODC"], str(m["updated_at"]), m["detalle_ver"])
+        for m in miembros
+    ])
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()
+
+
+def _num(v) -> float:
+    return float(v or 0)
+
+
+def lista_picking(codcia, codsuc, oleada_id) -> List[Dict[str, Any]]:
+    """
+    Líneas activas de los pedidos agregadas por producto + ubicación, en
+    orden de ruta. Cada renglón trae "pedidos": el reparto por pedido/ITEM.
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(text(_SQL_LINEAS_OLEADA), {
+            "id": int(oleada_id), "cia": codcia, "suc": codsuc
+        }).mappings().all()
+
+    renglones = {}
+    for r in rows:
+        clave = (r["Cod_Producto_Pedido"], r["Ubicacion"])
+        ren = renglones.get(clave)
+        if ren is None:
+            ren = renglones[clave] = {
+                "Cod_Producto_Pedido": r["Cod_Producto_Pedido"],
+                "Descripcion_pedido": r["Descripcion_pedido"],
+                "CodigoParte": r["CodigoParte"],
+                "UM": r["UM"],
+                "Ubicacion": r["Ubicacion"],
+                "ITEM": r["ITEM"],   # desempate de la ruta
+                "Cantidd_abastecida": 0.0,
+                "Cantidad_Scaneada": 0.0,
+                "pedidos": [],
+            }
+        ren["Cantidd_abastecida"] += _num(r["Cantidd_abastecida"])
+        ren["Cantidad_Scaneada"] += _num(r["Cantidad_Scaneada"])
+        ren["pedidos"].append({
+            "codppc": r["PPC_NUMPPC"],
+            "cododc": r["ODC_NUMODC"],
+            "ITEM": r["ITEM"],
+            "abastecida": _num(r["Cantidd_abastecida"]),
+            "escaneada": _num(r["Cantidad_Scaneada"]),
+        })
+
+    lista = ordenar_ruta(list(renglones.values()))
+    for n, ren in enumerate(lista, start=1):
+        del ren["ITEM"]
+        ren["Orden_Ruta"] = n
+        ren["completo"] = ren["Cantidad_Scaneada"] >= ren["Cantidd_abastecida"]
+    return lista
+
+
+# =========================================================
+# INICIO / CIERRE
+# =========================================================
+def marcar_inicio_oleada(codcia, codsuc, oleada_id) -> Dict[str, Any]:
+    """INICIO de cada pedido de la oleada que no lo tenga. -> {"ok", "pedidos": [{codppc, cododc, ok, msg}]}."""
+    miembros = miembros_oleada(codcia, codsuc, oleada_id)
+    if not miembros:
+        return {"ok": False, "msg": "No existe la oleada."}
+    if miembros[0]["estado"] != "A":
+        return {"ok": False, "msg": "La oleada está cerrada."}
+
+    pedidos = []
+    for m in miembros:
+        ppc, odc = m["PPC_NUMPPC"], m["ODC_NUMODC"]
+        if m["inicio_dt"] is not None:
+            pedidos.append({"codppc": ppc, "cododc": odc, "ok": True, "msg": "Ya iniciado"})
+            continue
+        r = marcar_inicio_preparacion(codcia, codsuc, ppc, odc)
+        pedidos.append({"codppc": ppc, "cododc": odc, "ok": r["ok"], "msg": r["msg"]})
+    return {"ok": all(p["ok"] for p in pedidos), "pedidos": pedidos}
+
+
+_SQL_CERRAR_OLEADA = """
+    UPDATE dbo.PICKING_OLEADA
+    SET estado = 'C',
+        cerrado_dt = GETDATE()
+    WHERE OLEADA_ID = :id
+      AND CIA_CODCIA = :cia
+      AND SUC_CODSUC = :suc
+      AND estado = 'A'
+"""
+
+def cerrar_oleada(codcia, codsuc, oleada_id) -> Dict[str, Any]:
+    """
+    FIN de cada pedido de la oleada (los completos se archivan como siempre).
+    La oleada se cierra cuando todos quedan finalizados; si falta alguno
+    sigue abierta y se informa cuál.
+    -> {"ok", "cerrada", "pedidos": [{codppc, cododc, ok, msg}]}
+    """
+    miembros = miembros_oleada(codcia, codsuc, oleada_id)
+    if not miembros:
+        return {"ok": False, "msg": "No existe la oleada."}
+    if miembros[0]["estado"] != "A":
+        return {"ok": True, "cerrada": True, "pedidos": []}
+
+    pedidos = []
+    for m in miembros:
+        ppc, odc = m["PPC_NUMPPC"], m["ODC_NUMODC"]
+        if m["fin_dt"] is not None:
+            pedidos.append({"codppc": ppc, "cododc": odc, "ok": True, "msg": "Ya finalizado"})
+            continue
+        r = marcar_fin_preparacion(codcia, codsuc, ppc, odc)
+        pedidos.append({"codppc": ppc, "cododc": odc, "ok": r["ok"], "msg": r["msg"]})
+
+    cerrada = all(p["ok"] for p in pedidos)
+    if cerrada:
+        with engine.begin() as conn:
+            conn.execute(text(_SQL_CERRAR_OLEADA), {"id": int(oleada_id), "cia": codcia, "suc": codsuc})
+    return {"ok": cerrada, "cerrada": cerrada, "pedidos": pedidos}
+
+
+# =========================================================
+# ESCANEO
+# =========================================================
+# Un batch (una transacción) por lectura:
+#   1) oleada abierta y etiqueta no registrada en ningún pedido miembro,
+#   2) saldo de cada línea del producto en los pedidos iniciados (UPDLOCK),
+#      acumulado con SUM() OVER en orden de la oleada / ITEM: cada línea
+#      toma lo que falta hasta cubrir la cantidad, nunca más que su saldo,
+#   3) si el saldo total no alcanza no se aplica nada (sobrepicking),
+#   4) por pedido tocado: contadores de avance, detalle_ver y ESTADO, como
+#      el scan de un pedido (contadores NULL -> se cuentan una vez),
+#   5) devuelve: motivo, reparto (pedido, ITEM, cantidad) y totales +
+#      versión de cada pedido tocado.
+_SQL_OLEADA_SCAN = """
+-- picking:oleada_scan
+SET NOCOUNT ON;
+DECLARE @oleada INT = ?, @cia NVARCHAR(10) = ?, @suc NVARCHAR(10) = ?,
+        @prod NVARCHAR(60) = ?, @cant DECIMAL(18,4) = ?, @etiqueta NVARCHAR(100) = ?,
+        @ubicacion NVARCHAR(60) = ?;
+DECLARE @motivo VARCHAR(20), @tomado DECIMAL(18,4);
+DECLARE @reparto TABLE (
+    ppc NVARCHAR(30), odc NVARCHAR(30), item NVARCHAR(50),
+    antes DECIMAL(18,4), abast DECIMAL(18,4), toma DECIMAL(18,4),
+    PRIMARY KEY (ppc, odc, item)
+);
+DECLARE @pedidos TABLE (
+    ppc NVARCHAR(30), odc NVARCHAR(30), d_lineas INT, d_unidades DECIMAL(18,4),
+    PRIMARY KEY (ppc, odc)
+);
+
+IF NOT EXISTS (
+    SELECT 1 FROM dbo.PICKING_OLEADA
+    WHERE OLEADA_ID=@oleada AND CIA_CODCIA=@cia AND SUC_CODSUC=@suc AND estado='A'
+)
+    SET @motivo = 'cerrada';
+ELSE IF @etiqueta IS NOT NULL AND EXISTS (
+    SELECT 1
+    FROM dbo.PICKING_OLEADA_PEDIDO op
+    JOIN dbo.PICKING_SCAN_ETIQUETA e WITH (UPDLOCK, HOLDLOCK)
+      ON e.CIA_CODCIA = op.CIA_CODCIA AND e.SUC_CODSUC = op.SUC_CODSUC
+     AND e.PPC_NUMPPC = op.PPC_NUMPPC AND e.ODC_NUMODC = op.ODC_NUMODC
+    WHERE op.OLEADA_ID = @oleada
+      AND e.ETIQUETA = @etiqueta
+)
+    SET @motivo = 'duplicado';
+ELSE
+BEGIN
+    ;WITH pendiente AS (
+        SELECT op.orden, d.ITEM AS item_orden,
+               d.PPC_NUMPPC, d.ODC_NUMODC, CAST(d.ITEM AS NVARCHAR(50)) AS item,
+               ISNULL(d.Cantidad_Scaneada,0) AS antes,
+               ISNULL(d.Cantidd_abastecida,0) AS abast,
+               ISNULL(d.Cantidd_abastecida,0) - ISNULL(d.Cantidad_Scaneada,0) AS saldo
+        FROM dbo.PICKING_OLEADA_PEDIDO op
+        JOIN dbo.PICKING_ASIGNACION a
+          ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+         AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+         AND a.inicio_dt IS NOT NULL AND a.fin_dt IS NULL
+        JOIN dbo.PICKING_DETALLE d WITH (UPDLOCK, ROWLOCK)
+          ON d.CIA_CODCIA = op.CIA_CODCIA AND d.SUC_CODSUC = op.SUC_CODSUC
+         AND d.PPC_NUMPPC = op.PPC_NUMPPC AND d.ODC_NUMODC = op.ODC_NUMODC
+        WHERE op.OLEADA_ID = @oleada
+          AND d.Cod_Producto_Pedido = @prod
+          AND (@ubicacion IS NULL OR d.Ubicacion = @ubicacion)
+          AND ISNULL(d.Cantidd_abastecida,0) > ISNULL(d.Cantidad_Scaneada,0)
+    ), acumulado AS (
+        SELECT *, SUM(saldo) OVER (ORDER BY orden, item_orden ROWS UNBOUNDED PRECEDING) AS hasta
+        FROM pendiente
+    )
+    INSERT INTO @reparto (ppc, odc, item, antes, abast, toma)
+    SELECT PPC_NUMPPC, ODC_NUMODC, item, antes, abast,
+           CASE WHEN hasta <= @cant THEN saldo ELSE @cant - (hasta - saldo) END
+    FROM acumulado
+    WHERE hasta - saldo < @cant;
+
+    SELECT @tomado = ISNULL(SUM(toma), 0) FROM @reparto;
+
+    IF @tomado < @cant
+    BEGIN
+        DELETE FROM @reparto;
+        SET @motivo = CASE
+            WHEN EXISTS (
+                SELECT 1
+                FROM dbo.PICKING_OLEADA_PEDIDO op
+                JOIN dbo.PICKING_DETALLE d
+                  ON d.CIA_CODCIA = op.CIA_CODCIA AND d.SUC_CODSUC = op.SUC_CODSUC
+                 AND d.PPC_NUMPPC = op.PPC_NUMPPC AND d.ODC_NUMODC = op.ODC_NUMODC
+                LEFT JOIN dbo.PICKING_ASIGNACION a
+                  ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+                 AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+                WHERE op.OLEADA_ID = @oleada
+                  AND d.Cod_Producto_Pedido = @prod
+                  AND (@ubicacion IS NULL OR d.Ubicacion = @ubicacion)
+                  AND ISNULL(d.Cantidd_abastecida,0) > ISNULL(d.Cantidad_Scaneada,0)
+                  AND a.inicio_dt IS NULL
+            ) THEN 'sin_inicio'
+            WHEN EXISTS (
+                SELECT 1
+                FROM dbo.PICKING_OLEADA_PEDIDO op
+                JOIN dbo.PICKING_DETALLE d
+                  ON d.CIA_CODCIA = op.CIA_CODCIA AND d.SUC_CODSUC = op.SUC_CODSUC
+                 AND d.PPC_NUMPPC = op.PPC_NUMPPC AND d.ODC_NUMODC = op.ODC_NUMODC
+                WHERE op.OLEADA_ID = @oleada
+                  AND d.Cod_Producto_Pedido = @prod
+                  AND (@ubicacion IS NULL OR d.Ubicacion = @ubicacion)
+            ) THEN 'sobrepicking'
+            ELSE 'no_encontrado' END;
+    END
+    ELSE
+    BEGIN
+        SET @motivo = 'ok';
+
+        UPDATE d
+        SET Cantidad_Scaneada = ISNULL(d.Cantidad_Scaneada,0) + r.toma,
+            Diferencia = ISNULL(d.Cantidad_Scaneada,0) + r.toma - ISNULL(d.Cantidd_abastecida,0)
+        FROM dbo.PICKING_DETALLE d
+        JOIN @reparto r
+          ON d.CIA_CODCIA = @cia AND d.SUC_CODSUC = @suc
+         AND d.PPC_NUMPPC = r.ppc AND d.ODC_NUMODC = r.odc
+         AND CAST(d.ITEM AS NVARCHAR(50)) = r.item;
+
+        INSERT INTO @pedidos (ppc, odc, d_lineas, d_unidades)
+        SELECT ppc, odc,
+               SUM(CASE WHEN antes < abast AND antes + toma >= abast THEN 1 ELSE 0 END),
+               SUM(toma)
+        FROM @reparto
+        GROUP BY ppc, odc;
+
+        UPDATE a
+        SET lineas_completas = a.lineas_completas + p.d_lineas,
+            unidades_escaneadas = a.unidades_escaneadas + p.d_unidades,
+            detalle_ver = a.detalle_ver + 1
+        FROM dbo.PICKING_ASIGNACION a
+        JOIN @pedidos p
+          ON a.CIA_CODCIA = @cia AND a.SUC_CODSUC = @suc
+         AND a.PPC_NUMPPC = p.ppc AND a.ODC_NUMODC = p.odc;
+
+        -- sin inicializar (snapshot anterior a los contadores): se cuenta una vez
+        UPDATE a
+        SET lineas_total = c.lineas,
+            lineas_completas = c.completas,
+            unidades_abastecidas = c.abastecidas,
+            unidades_escaneadas = c.escaneadas
+        FROM dbo.PICKING_ASIGNACION a
+        JOIN @pedidos p
+          ON a.CIA_CODCIA = @cia AND a.SUC_CODSUC = @suc
+         AND a.PPC_NUMPPC = p.ppc AND a.ODC_NUMODC = p.odc
+        CROSS APPLY (
+            SELECT COUNT(*) AS lineas,
+                   ISNULL(SUM(CASE WHEN ISNULL(d.Cantidad_Scaneada,0) >= ISNULL(d.Cantidd_abastecida,0) THEN 1 ELSE 0 END), 0) AS completas,
+                   ISNULL(SUM(ISNULL(d.Cantidd_abastecida,0)), 0) AS abastecidas,
+                   ISNULL(SUM(ISNULL(d.Cantidad_Scaneada,0)), 0) AS escaneadas
+            FROM dbo.PICKING_DETALLE d
+            WHERE d.CIA_CODCIA = a.CIA_CODCIA AND d.SUC_CODSUC = a.SUC_CODSUC
+              AND d.PPC_NUMPPC = a.PPC_NUMPPC AND d.ODC_NUMODC = a.ODC_NUMODC
+        ) c
+        WHERE a.lineas_total IS NULL;
+
+        -- ESTADO de las líneas = pedido completo; solo se reescribe donde cambia
+        UPDATE d
+        SET ESTADO = CASE WHEN a.lineas_completas >= a.lineas_total THEN '1' ELSE '0' END
+        FROM dbo.PICKING_DETALLE d
+        JOIN @pedidos p
+          ON d.CIA_CODCIA = @cia AND d.SUC_CODSUC = @suc
+         AND d.PPC_NUMPPC = p.ppc AND d.ODC_NUMODC = p.odc
+        JOIN dbo.PICKING_ASIGNACION a
+          ON a.CIA_CODCIA = d.CIA_CODCIA AND a.SUC_CODSUC = d.SUC_CODSUC
+         AND a.PPC_NUMPPC = d.PPC_NUMPPC AND a.ODC_NUMODC = d.ODC_NUMODC
+        WHERE ISNULL(d.ESTADO,'') <> CASE WHEN a.lineas_completas >= a.lineas_total THEN '1' ELSE '0' END;
+
+        -- la etiqueta queda en el registro de cada pedido abierto de la oleada
+        -- (Cantidad = lo que le tocó): el scan por pedido la ve como duplicada
+        IF @etiqueta IS NOT NULL
+            INSERT INTO dbo.PICKING_SCAN_ETIQUETA (
+                CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC,
+                ETIQUETA, Cod_Producto_Pedido, Cantidad, fecha
+            )
+            SELECT op.CIA_CODCIA, op.SUC_CODSUC, op.PPC_NUMPPC, op.ODC_NUMODC,
+                   @etiqueta, @prod, ISNULL(p.d_unidades, 0), GETDATE()
+            FROM dbo.PICKING_OLEADA_PEDIDO op
+            JOIN dbo.PICKING_ASIGNACION a
+              ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+             AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+             AND a.fin_dt IS NULL
+            LEFT JOIN @pedidos p
+              ON p.ppc = op.PPC_NUMPPC AND p.odc = op.ODC_NUMODC
+            WHERE op.OLEADA_ID = @oleada;
+    END
+END
+
+SELECT @motivo AS motivo;
+
+SELECT ppc AS PPC_NUMPPC, odc AS ODC_NUMODC, item AS ITEM, toma AS cantidad
+FROM @reparto
+ORDER BY ppc, odc, item;
+
+SELECT a.PPC_NUMPPC, a.ODC_NUMODC,
+       ISNULL((
+           SELECT CAST(MAX(d.RowVer) AS BIGINT)
+           FROM dbo.PICKING_DETALLE d
+           WHERE d.CIA_CODCIA = a.CIA_CODCIA AND d.SUC_CODSUC = a.SUC_CODSUC
+             AND d.PPC_NUMPPC = a.PPC_NUMPPC AND d.ODC_NUMODC = a.ODC_NUMODC
+       ), 0) AS version,
+       a.lineas_total AS lineas, a.lineas_completas,
+       a.unidades_abastecidas, a.unidades_escaneadas
+FROM dbo.PICKING_ASIGNACION a
+JOIN @pedidos p
+  ON a.CIA_CODCIA = @cia AND a.SUC_CODSUC = @suc
+ AND a.PPC_NUMPPC = p.ppc AND a.ODC_NUMODC = p.odc
+ORDER BY a.PPC_NUMPPC, a.ODC_NUMODC;
+"""
+
+
+def escanear_oleada(codcia, codsuc, oleada_id, codprod, cantidad, etiqueta=None, ubicacion=None) -> Dict[str, Any]:
+    """
+    Reparte una lectura entre los pedidos de la oleada (ver _SQL_OLEADA_SCAN).
+    ubicacion: opcional, limita el reparto (y el motivo si no alcanza) a las
+    líneas de esa ubicación: fuera de ella el producto es no_encontrado.
+
+    Devuelve:
+      {"motivo": ok | sin_inicio | no_encontrado | sobrepicking | duplicado | cerrada,
+       "reparto": [{"codppc", "cododc", "ITEM", "cantidad"}],
+       "pedidos": [{"codppc", "cododc", "version", "totales"}]}  # solo los tocados
+    """
+    etiqueta = str(etiqueta or "").strip() or None
+    ubicacion = str(ubicacion or "").strip() or None
+    params = (int(oleada_id), codcia, codsuc, str(codprod).strip(), float(cantidad), etiqueta, ubicacion)
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        with medir_sql("oleada_scan") as m:
+            cur.execute(_SQL_OLEADA_SCAN, params)
+            motivo = cur.fetchone()[0]
+            cur.nextset()
+            reparto = _filas_cursor(cur)
+            cur.nextset()
+            tocados = _filas_cursor(cur)
+            m["filas"] = len(reparto)
+        conn.commit()
+    finally:
+        conn.close()
+
+    pedidos = []
+    for t in tocados:
+        ppc, odc = t.pop("PPC_NUMPPC"), t.pop("ODC_NUMODC")
+        version = t.pop("version")
+        pedidos.append({"codppc": ppc, "cododc": odc, "version": version, "totales": t})
+        publicar_evento("scan", codcia, codsuc, ppc, odc, version=version, totales=t, oleada=int(oleada_id))
+
+    return {
+        "motivo": motivo,
+        "reparto": [
+            {"codppc": r["PPC_NUMPPC"], "cododc": r["ODC_NUMODC"], "ITEM": r["ITEM"], "cantidad": r["cantidad"]}
+            for r in reparto
+        ],
+        "pedidos": pedidos,
+    }
@@ -0,0 +1,143 @@
+# app/despachos/precarga.py
+"""
+Precarga de snapshots de detalle para los pedidos que se ven en el listado.
+
+Al servir GET /api/despachos/ se encolan los primeros PRECARGA_PEDIDOS
+pedidos sin iniciar de la página. Un pool chico de hilos (PRECARGA_HILOS)
+corre el SP de detalle + la carga masiva de PICKING_DETALLE antes de que el
+preparador abra el pedido: /detalle/generar ya lo encuentra hecho.
+Como el pedido puede seguir en abastecimiento, el snapshot queda marcado
+(PICKING_ASIGNACION.precarga_hash) y la primera apertura sin inicio lo
+compara con el SP y lo rehace si cambió (service._generar_snapshot).
+
+Nunca le quita lugar a los scans:
+  - a lo sumo PRECARGA_POR_MINUTO generaciones por minuto (por proceso),
+  - solo arranca si en el pool de BD quedan PRECARGA_CONEXIONES_LIBRES
+    conexiones; si no, espera un poco y, si sigue ocupado, la suelta
+    (el próximo listado la vuelve a encolar),
+  - cola acotada: lo que no entra se descarta.
+Los pedidos ya vistos se recuerdan PRECARGA_RECORDAR_S para no reintentar.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from .. import metricas
+from ..config import Config
+from ..db import engine
+from .cache import CachePorSede
+from .service import _clave_pedido, precargar_detalle
+
+log = logging.getLogger(__name__)
+
+_resultados = metricas.contador(
+    "picking_precarga_total",
+    "Pedidos precargados por resultado (generado, existente, finalizado, omitido, error)"
+)
+
+_ESPERA_PASO_S = 0.2
+_ESPERA_MAX_S = 5.0
+
+_ejecutor = None
+_lock = threading.Lock()
+_en_cola = set()
+_proximo_turno = 0.0
+
+# pedidos ya precargados (o que ya tenían detalle), por sede
+_vistos = CachePorSede(Config.PRECARGA_RECORDAR_S, max_items=5000)
+
+
+def _obtener_ejecutor() -> ThreadPoolExecutor:
+    global _ejecutor
+    with _lock:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(
+                max_workers=max(1, Config.PRECARGA_HILOS), thread_name_prefix="precarga"
+            )
+        return _ejecutor
+
+
+def _sin_iniciar(fila: Dict[str, Any]) -> bool:
+    """Pedido que todavía nadie abrió: sin inicio ni fin y sin detalle generado."""
+    if fila.get("avance") is not None or fila.get("pdd_horini"):
+        return False
+    estado = str(fila.get("c_sit_orddes") or "").upper()
+    return "INICIADA" not in estado and "PREPARADO" not in estado
+
+
+def _tomar_turno():
+    """Limitador: una generación cada 60 / PRECARGA_POR_MINUTO segundos."""
+    global _proximo_turno
+    intervalo = 60.0 / max(1, Config.PRECARGA_POR_MINUTO)
+    with _lock:
+        ahora = time.monotonic()
+        turno = max(ahora, _proximo_turno)
+        _proximo_turno = turno + intervalo
+    if turno > ahora:
+        time.sleep(turno - ahora)
+
+
+def _hay_holgura() -> bool:
+    libres = Config.SQL_POOL_SIZE - engine.pool.checkedout()
+    return libres >= Config.PRECARGA_CONEXIONES_LIBRES
+
+
+def _esperar_holgura() -> bool:
+    limite = time.monotonic() + _ESPERA_MAX_S
+    while not _hay_holgura():
+        if time.monotonic() >= limite:
+            return False
+        time.sleep(_ESPERA_PASO_S)
+    return True
+
+
+def _precargar(clave):
+    codcia, codsuc, codppc, cododc = clave
+    resultado = "error"
+    try:
+        _tomar_turno()
+        if not _esperar_holgura():
+            resultado = "omitido"
+            return
+        resultado = precargar_detalle(codcia, codsuc, codppc, cododc)
+        _vistos.poner(clave, True)
+    except Exception:
+        log.exception("no se pudo precargar %s/%s", codppc, cododc)
+    finally:
+        with _lock:
+            _en_cola.discard(clave)
+        _resultados.inc(resultado=resultado, sede=f"{codcia}-{codsuc}")
+
+
+def programar_precarga(codcia, codsuc, filas: List[Dict[str, Any]]) -> int:
+    """
+    Encola (sin esperar) la generación del detalle de los primeros
+    PRECARGA_PEDIDOS pedidos sin iniciar de `filas`, en su orden.
+    Devuelve cuántos se encolaron.
+    """
+    if Config.PRECARGA_PEDIDOS <= 0:
+        return 0
+
+    encolados, candidatos = 0, 0
+    for fila in filas:
+        if candidatos >= Config.PRECARGA_PEDIDOS:
+            break
+        if not _sin_iniciar(fila):
+            continue
+        codppc, cododc = _clave_pedido(fila.get("ppc_numppc"), fila.get("odc_numodc"))
+        if not codppc or not cododc:
+            continue
+        candidatos += 1
+
+        clave = (codcia, codsuc, codppc, cododc)
+        if _vistos.contiene(clave):
+            continue
+        with _lock:
+            if clave in _en_cola or len(_en_cola) >= Config.PRECARGA_COLA_MAX:
+                continue
+            _en_cola.add(clave)
+        _obtener_ejecutor().submit(_precargar, clave)
+        encolados += 1
+    return encolados
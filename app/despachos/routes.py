@@ -1,22 +1,71 @@
-from flask import Blueprint, request, jsonify, render_template
+import math
+import queue
+import threading
+from typing import Any, Dict, Optional, Tuple
+from flask import Blueprint, g, request, jsonify, render_template, Response, make_response, stream_with_context
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import get_jwt_identity
+from ..config import Config
+from ..sedes import sede_actual, etiqueta_sede
+from .eventos import suscribir, desuscribir, coincide, formato_sse
+from .serializacion import responder, variante
 from .service import (
     listar_despachos_sp,
     generar_detalle_si_no_existe,
     terminar_detalle,
     listar_detalle_tabla,
-    actualizar_scan,
+    leer_detalle_delta,
+    version_detalle,
+    actualizar_scan_lote,
     obtener_cabecera_pedido,
+    version_pedido,
+    version_cabecera,
+    version_listado,
+    con_avance,
     listar_usuarios_preparacion,
+    version_usuarios_preparacion,
     asignar_usuarios_preparacion,
     marcar_inicio_preparacion,
-    marcar_fin_preparacion,
-    tiene_inicio
+    marcar_fin_preparacion
+)
+from .precarga import programar_precarga
+from .oleadas import (
+    listar_oleadas,
+    crear_oleada,
+    miembros_oleada,
+    version_oleada,
+    lista_picking,
+    marcar_inicio_oleada,
+    escanear_oleada,
+    cerrar_oleada,
 )
 
 despachos_bp = Blueprint("despachos", __name__)
 
+
+def _condicional(etag, construir):
+    """
+    GET condicional: si el cliente ya tiene `etag` -> 304 sin cuerpo (ni
+    trabajo de BD/serialización); si no, construir() y se marca con el ETag.
+    Con no-cache el navegador revalida siempre, el front no cambia.
+    """
+    if etag and variante():
+        etag = f"{etag};{variante()}"
+    if etag and g.get("sede"):
+        # mismo pedido/versión en otra sede es otra representación
+        etag = f"{etag};{etiqueta_sede(g.sede)}"
+    if etag and request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = make_response(construir())
+        if resp.status_code != 200:
+            return resp
+    if etag:
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
+
+
 @despachos_bp.get("/")
 @jwt_required()
 def listar():
@@ -26,22 +75,38 @@ def listar():
     fecha_hasta = q.get("fecha_hasta")
     page        = int(q.get("page", 1))
     page_size   = int(q.get("page_size", 20))
-
-    data, total = listar_despachos_sp(
-        codcia="01",
-        codsuc="01",
-        fecha_desde=fecha_desde,
-        fecha_hasta=fecha_hasta,
-        page=page,
-        page_size=page_size
-    )
-
-    return jsonify({
-        "page": page,
-        "page_size": page_size,
-        "total": total,
-        "items": data
-    }), 200
+    estado      = q.get("estado")
+    codcia, codsuc = sede_actual()
+
+    # sello del resultado cacheado del SP + último evento de la sede (antes
+    # que los datos: si cambia en medio, el ETag queda viejo y el próximo GET
+    # trae todo de nuevo). Con él alcanza para el 304.
+    sello = version_listado(codcia, codsuc, fecha_desde, fecha_hasta)
+
+    def construir():
+        data, total = listar_despachos_sp(
+            codcia=codcia,
+            codsuc=codsuc,
+            fecha_desde=fecha_desde,
+            fecha_hasta=fecha_hasta,
+            page=page,
+            page_size=page_size,
+            estado=estado
+        )
+        # avance de cada pedido de la página (una lectura por PK)
+        data = con_avance(codcia, codsuc, data)
+        # los que se ven y nadie abrió: snapshot en segundo plano
+        programar_precarga(codcia, codsuc, data)
+        return responder({
+            "page": page,
+            "page_size": page_size,
+            "total": total,
+            "items": data
+        }, listas=("items",))
+
+    # + parámetros de la página
+    etag = sello and f"{sello}-{page}-{page_size}-{(estado or '').strip().upper()}"
+    return _condicional(etag, construir)
 
 
 @despachos_bp.post("/detalle/generar")
@@ -54,16 +119,15 @@ def generar_detalle():
     if not codppc or not cododc:
         return jsonify({"msg": "Falta codppc o cododc"}), 400
 
-    codcia = "01"
-    codsuc = "01"
+    codcia, codsuc = sede_actual()
 
     detalle = generar_detalle_si_no_existe(codcia, codsuc, codppc, cododc)
 
-    return jsonify({
+    return responder({
         "msg": "Detalle listo (usando snapshot existente o SP)",
         "total": len(detalle),
         "detalle": detalle
-    }), 200
+    })
 
 
 @despachos_bp.post("/detalle/terminar")
@@ -76,7 +140,7 @@ def terminar():
     if not codppc or not cododc:
         return jsonify({"msg": "Falta codppc o cododc"}), 400
 
-    terminar_detalle("01", "01", codppc, cododc)
+    terminar_detalle(*sede_actual(), codppc, cododc)
     return jsonify({"msg": "Detalle eliminado (Terminado)"}), 200
 
 
@@ -95,42 +159,196 @@ def leer_detalle():
     if not codppc or not cododc:
         return jsonify({"msg": "Falta codppc o cododc"}), 400
 
-    detalle = generar_detalle_si_no_existe("01", "01", codppc, cododc)
+    codcia, codsuc = sede_actual()
+
+    # ✅ ?desde=<version>: solo las líneas que cambiaron (RowVer)
+    desde = request.args.get("desde", type=int)
+    if desde is not None:
+        detalle, version, es_delta = leer_detalle_delta(codcia, codsuc, codppc, cododc, desde)
+        return responder({
+            "detalle": detalle,
+            "total": len(detalle),
+            "version": version,
+            "delta": es_delta
+        })
+
+    def construir():
+        detalle = generar_detalle_si_no_existe(codcia, codsuc, codppc, cododc)
+
+        return responder({
+            "detalle": detalle,
+            "total": len(detalle),
+            "version": version_detalle(detalle),
+            "delta": False
+        })
+
+    # token leído ANTES de los datos: si algo cambia en medio, el próximo
+    # GET no coincide y se manda completo (nunca un 304 con datos viejos)
+    etag = version_pedido(codcia, codsuc, codppc, cododc)
+    return _condicional(etag and f"d-{etag}", construir)
+
+
+# ---------------------------------------------------------
+# Scans: validación y armado de la respuesta sin depender del request,
+# los usa también la capa ASGI (app/asgi.py).
+# ---------------------------------------------------------
+def _version_cliente(version) -> Optional[int]:
+    try:
+        return int(version) if version is not None else None
+    except (TypeError, ValueError):
+        return None
 
-    return jsonify({
-        "detalle": detalle,
-        "total": len(detalle)
-    }), 200
 
+def _cantidad_valida(cantidad: float) -> bool:
+    """Un scan suma unidades: > 0 y finita (float() acepta "nan" e "inf")."""
+    return math.isfinite(cantidad) and cantidad > 0
 
-@despachos_bp.post("/detalle/scan")
-@jwt_required()
-def scan_item():
-    body = request.get_json() or {}
-    codppc   = body.get("codppc")
+
+def preparar_scan(body: Dict[str, Any]):
+    """-> (None, (payload, status)) si es inválido; (lectura, None) si no."""
     cododc   = body.get("cododc")
     codprod  = body.get("codprod")
     cantidad = body.get("cantidad", 1)
 
     if not cododc or not codprod:
-        return jsonify({"msg": "Datos incompletos"}), 400
-    if not tiene_inicio("01", "01", codppc, cododc):
-        return jsonify({"ok": False, "msg": "Debe presionar INICIO antes de escanear."}), 409
+        return None, ({"msg": "Datos incompletos"}, 400)
     try:
         cantidad = float(cantidad)
     except (TypeError, ValueError):
-        return jsonify({"msg": "Cantidad inválida"}), 400
+        return None, ({"msg": "Cantidad inválida"}, 400)
+    if not _cantidad_valida(cantidad):
+        return None, ({"msg": "Cantidad inválida"}, 400)
+
+    return {
+        "codppc": body.get("codppc"),
+        "cododc": cododc,
+        "version": _version_cliente(body.get("version")),   # última versión que tiene el front
+        "items": [{"codprod": codprod, "cantidad": cantidad, "etiqueta": body.get("etiqueta")}],
+    }, None
+
 
-    filas, motivo = actualizar_scan("01", "01", codppc, cododc, codprod, cantidad)
+def respuesta_scan(codprod, r: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """r: resultado de actualizar_scan_lote con una sola lectura."""
+    motivo = r["resultados"][0]["motivo"]
+
+    if motivo == "sin_inicio":
+        return {"ok": False, "msg": "Debe presionar INICIO antes de escanear."}, 409
 
     if motivo == "no_encontrado":
-        return jsonify({"msg": f"No se encontró ítem para producto {codprod} en ese despacho."}), 404
+        return {"msg": f"No se encontró ítem para producto {codprod} en ese despacho."}, 404
 
     if motivo == "sobrepicking":
-        return jsonify({"msg": "El escaneo excede la cantidad abastecida. No se permite sobrepicking."}), 400
+        return {"msg": "El escaneo excede la cantidad abastecida. No se permite sobrepicking."}, 400
+
+    if motivo == "duplicado":
+        return {"msg": "Esta etiqueta ya fue escaneada en el despacho."}, 409
+
+    # ✅ delta: solo líneas cambiadas + totales (el front parcha esas filas)
+    return {
+        "msg": "OK",
+        "detalle": r["lineas"],
+        "version": r["version"],
+        "totales": r["totales"],
+        "delta": True
+    }, 200
+
+
+def preparar_lote(body: Dict[str, Any]):
+    """
+    -> (None, (payload, status)) si el lote no sirve; si no, (lote, None) con
+    lote["items"] = lecturas válidas y lote["resultados"] = motivo "invalido"
+    ya puesto para las que no viajan a BD (None en las demás).
+    """
+    cododc = body.get("cododc")
+    items  = body.get("items") or []
+
+    if not cododc or not isinstance(items, list) or not items:
+        return None, ({"msg": "Datos incompletos"}, 400)
+    if len(items) > Config.SCAN_LOTE_MAX:
+        return None, ({"msg": f"Máximo {Config.SCAN_LOTE_MAX} lecturas por lote."}, 413)
+
+    # validar cada lectura; las inválidas no viajan a BD
+    validos, resultados = [], []
+    for it in items:
+        it = it if isinstance(it, dict) else {}
+        codprod  = str(it.get("codprod") or "").strip()
+        etiqueta = it.get("etiqueta")
+        try:
+            cantidad = float(it.get("cantidad", 1))
+        except (TypeError, ValueError):
+            cantidad = None
+
+        if not codprod or cantidad is None or not _cantidad_valida(cantidad):
+            resultados.append({"codprod": codprod, "etiqueta": etiqueta, "motivo": "invalido"})
+            continue
+        validos.append({"codprod": codprod, "cantidad": cantidad, "etiqueta": etiqueta})
+        resultados.append(None)  # se llena con lo que diga la BD
+
+    return {
+        "codppc": body.get("codppc"),
+        "cododc": cododc,
+        "version": _version_cliente(body.get("version")),
+        "items": validos,
+        "resultados": resultados,
+    }, None
+
+
+def respuesta_lote(lote: Dict[str, Any], r: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], int]:
+    """r: resultado de actualizar_scan_lote (None si no hubo lecturas válidas)."""
+    if r is None:
+        return {"msg": "OK", "resultados": lote["resultados"], "detalle": [], "delta": True}, 200
+
+    if all(x["motivo"] == "sin_inicio" for x in r["resultados"]):
+        return {"ok": False, "msg": "Debe presionar INICIO antes de escanear."}, 409
+
+    desde_bd = iter(r["resultados"])
+    resultados = [x if x is not None else next(desde_bd) for x in lote["resultados"]]
+
+    return {
+        "msg": "OK",
+        "resultados": resultados,
+        "detalle": r["lineas"],
+        "version": r["version"],
+        "totales": r["totales"],
+        "delta": True
+    }, 200
+
+
+@despachos_bp.post("/detalle/scan")
+@jwt_required()
+def scan_item():
+    body = request.get_json() or {}
+    lectura, error = preparar_scan(body)
+    if error:
+        return responder(*error)
 
-    detalle = listar_detalle_tabla("01", "01", codppc, cododc)
-    return jsonify({"msg": "OK", "detalle": detalle}), 200
+    r = actualizar_scan_lote(
+        *sede_actual(), lectura["codppc"], lectura["cododc"], lectura["items"],
+        desde_version=lectura["version"]
+    )
+    return responder(*respuesta_scan(body.get("codprod"), r))
+
+
+@despachos_bp.post("/detalle/scan/batch")
+@jwt_required()
+def scan_batch():
+    """
+    Varias lecturas en orden (cola del front / replay del service worker):
+    { codppc, cododc, version?, items: [{codprod, cantidad, etiqueta}] }
+    Resultado por lectura: ok / sobrepicking / no_encontrado / duplicado / invalido.
+    Reenviar el mismo lote es seguro: las etiquetas ya aplicadas vuelven como duplicado.
+    """
+    lote, error = preparar_lote(request.get_json() or {})
+    if error:
+        return responder(*error)
+
+    r = None
+    if lote["items"]:
+        r = actualizar_scan_lote(
+            *sede_actual(), lote["codppc"], lote["cododc"], lote["items"],
+            desde_version=lote["version"]
+        )
+    return responder(*respuesta_lote(lote, r))
 
 
 # =========================
@@ -144,25 +362,34 @@ def cabecera():
     usuario_id = get_jwt_identity()  # 👈 ESTE ES EL USUARIO LOGUEADO
     if not codppc or not cododc:
         return jsonify({"msg": "Falta codppc o cododc"}), 400
+    codcia, codsuc = sede_actual()
 
-    cab = obtener_cabecera_pedido(
-        codcia="01",
-        codsuc="01",
-        codppc=codppc,
-        cododc=cododc,
-        usuario_id=usuario_id
-    )
+    def construir():
+        cab = obtener_cabecera_pedido(
+            codcia=codcia,
+            codsuc=codsuc,
+            codppc=codppc,
+            cododc=cododc,
+            usuario_id=usuario_id
+        )
 
-    if not cab:
-        return jsonify({"msg": "No se encontró cabecera"}), 404
+        if not cab:
+            return jsonify({"msg": "No se encontró cabecera"}), 404
 
-    return jsonify({"cabecera": cab}), 200
+        return responder({"cabecera": cab})
+
+    etag = version_cabecera(codcia, codsuc, codppc, cododc)
+    return _condicional(etag and f"c-{etag}", construir)
 
 @despachos_bp.get("/usuarios")
 @jwt_required()
 def usuarios():
-    usuarios = listar_usuarios_preparacion(codcia="01")
-    return jsonify({"usuarios": usuarios}), 200
+    # la lista casi no cambia: con ETag la tablet revalida y recibe 304 sin cuerpo
+    codcia, _ = sede_actual()
+    return _condicional(
+        version_usuarios_preparacion(codcia=codcia),
+        lambda: jsonify({"usuarios": listar_usuarios_preparacion(codcia=codcia)})
+    )
 
 
 @despachos_bp.post("/detalle/asignar")
@@ -177,8 +404,7 @@ def asignar():
     if not codppc or not cododc:
         return jsonify({"msg": "Falta codppc o cododc"}), 400
 
-    codcia = "01"
-    codsuc = "01"
+    codcia, codsuc = sede_actual()
 
     cab = asignar_usuarios_preparacion(
         codcia, codsuc, codppc, cododc,
@@ -186,7 +412,7 @@ def asignar():
         preparado_id=preparado_id
     )
 
-    return jsonify({"cabecera": cab, "msg": "OK"}), 200
+    return responder({"cabecera": cab, "msg": "OK"})
 
 @despachos_bp.post("/detalle/inicio")
 @jwt_required()
@@ -198,7 +424,7 @@ def inicio():
     if not codppc or not cododc:
         return jsonify({"ok": False, "msg": "Faltan parámetros codppc/cododc"}), 400
 
-    r = marcar_inicio_preparacion("01", "01", codppc, cododc)
+    r = marcar_inicio_preparacion(*sede_actual(), codppc, cododc)
 
     if not r.get("ok"):
         return jsonify({"ok": False, "msg": r.get("msg")}), 409
@@ -216,7 +442,7 @@ def fin():
     if not codppc or not cododc:
         return jsonify({"ok": False, "msg": "Faltan parámetros"}), 400
 
-    r = marcar_fin_preparacion("01", "01", codppc, cododc)
+    r = marcar_fin_preparacion(*sede_actual(), codppc, cododc)
 
     # ✅ Si el service bloquea (pendientes o sin inicio)
     if not r.get("ok"):
@@ -232,4 +458,166 @@ def fin():
             "tprep_min": r.get("tprep_min")
         },
         "msg": r.get("msg", "Fin OK")
-    }), 200
\ No newline at end of file
+    }), 200
+
+
+# =========================
+# Oleadas: varios pedidos con una sola lista de picking
+# =========================
+@despachos_bp.get("/oleadas")
+@jwt_required()
+def oleadas():
+    return responder({"oleadas": listar_oleadas(*sede_actual())})
+
+
+@despachos_bp.post("/oleadas")
+@jwt_required()
+def crear_oleada_route():
+    """{ pedidos: [{codppc, cododc}], preparado_id? } -> la oleada creada."""
+    body = request.get_json() or {}
+    pedidos = body.get("pedidos")
+    if not isinstance(pedidos, list) or not all(isinstance(p, dict) for p in pedidos):
+        return jsonify({"ok": False, "msg": "pedidos debe ser una lista de {codppc, cododc}"}), 400
+
+    r = crear_oleada(
+        *sede_actual(), pedidos,
+        creado_por=get_jwt_identity(),
+        preparado_id=body.get("preparado_id")
+    )
+    if not r.get("ok"):
+        return jsonify(r), 409
+    return responder(r, 201)
+
+
+@despachos_bp.get("/oleadas/<int:oleada_id>")
+@jwt_required()
+def ver_oleada(oleada_id):
+    codcia, codsuc = sede_actual()
+    miembros = miembros_oleada(codcia, codsuc, oleada_id)
+    if not miembros:
+        return jsonify({"msg": "No existe la oleada"}), 404
+
+    def construir():
+        return responder({
+            "oleada_id": oleada_id,
+            "estado": miembros[0]["estado"],
+            "pedidos": [{
+                "codppc": m["PPC_NUMPPC"],
+                "cododc": m["ODC_NUMODC"],
+                "inicio_dt": m["inicio_dt"],
+                "fin_dt": m["fin_dt"],
+                "totales": {
+                    "lineas": m["lineas"],
+                    "lineas_completas": m["lineas_completas"],
+                    "unidades_abastecidas": m["unidades_abastecidas"],
+                    "unidades_escaneadas": m["unidades_escaneadas"],
+                },
+            } for m in miembros],
+            "lista": lista_picking(codcia, codsuc, oleada_id),
+        })
+
+    etag = version_oleada(miembros)
+    return _condicional(etag and f"o-{etag}", construir)
+
+
+@despachos_bp.post("/oleadas/<int:oleada_id>/inicio")
+@jwt_required()
+def inicio_oleada(oleada_id):
+    r = marcar_inicio_oleada(*sede_actual(), oleada_id)
+    return jsonify(r), 200 if r.get("ok") else 409
+
+
+@despachos_bp.post("/oleadas/<int:oleada_id>/scan")
+@jwt_required()
+def scan_oleada(oleada_id):
+    """{ codprod, cantidad?, etiqueta?, ubicacion? } -> reparto por pedido + totales de cada uno."""
+    body = request.get_json() or {}
+    codprod = body.get("codprod")
+    if not codprod:
+        return responder({"msg": "Datos incompletos"}, 400)
+    try:
+        cantidad = float(body.get("cantidad", 1))
+    except (TypeError, ValueError):
+        return responder({"msg": "Cantidad inválida"}, 400)
+    if not _cantidad_valida(cantidad):
+        return responder({"msg": "Cantidad inválida"}, 400)
+
+    r = escanear_oleada(
+        *sede_actual(), oleada_id, codprod, cantidad,
+        etiqueta=body.get("etiqueta"), ubicacion=body.get("ubicacion")
+    )
+    motivo = r["motivo"]
+
+    if motivo == "cerrada":
+        return responder({"msg": "La oleada no existe o ya está cerrada."}, 404)
+    if motivo == "sin_inicio":
+        return responder({"ok": False, "msg": "Debe presionar INICIO antes de escanear."}, 409)
+    if motivo == "no_encontrado":
+        donde = f"en la ubicación {body['ubicacion']}" if body.get("ubicacion") else "en la oleada"
+        return responder({"msg": f"No se encontró ítem para producto {codprod} {donde}."}, 404)
+    if motivo == "sobrepicking":
+        return responder({"msg": "El escaneo excede lo pendiente en la oleada. No se permite sobrepicking."}, 400)
+    if motivo == "duplicado":
+        return responder({"msg": "Esta etiqueta ya fue escaneada en la oleada."}, 409)
+
+    return responder({"msg": "OK", "reparto": r["reparto"], "pedidos": r["pedidos"]})
+
+
+@despachos_bp.post("/oleadas/<int:oleada_id>/cerrar")
+@jwt_required()
+def cerrar_oleada_route(oleada_id):
+    """FIN de cada pedido; la oleada se cierra si todos quedan finalizados."""
+    r = cerrar_oleada(*sede_actual(), oleada_id)
+    return jsonify(r), 200 if r.get("ok") else 409
+
+
+# Streams abiertos en este proceso (solo WSGI: bajo ASGI /stream no llega acá)
+_cupos_stream = threading.BoundedSemaphore(Config.EVENTOS_STREAMS_WSGI)
+
+
+@despachos_bp.get("/stream")
+@jwt_required()
+def stream():
+    """
+    SSE: eventos scan | inicio | fin | asignacion.
+    ?codppc=&cododc= filtra a un pedido; sin filtro llegan todos (supervisor).
+
+    Bajo WSGI cada stream retiene un hilo: sin cupo (EVENTOS_STREAMS_WSGI)
+    responde 503 y el front consulta cada EVENTOS_POLLING_S.
+    """
+    if not _cupos_stream.acquire(blocking=False):
+        resp = jsonify({"msg": "Stream no disponible en este servidor", "polling_s": Config.EVENTOS_POLLING_S})
+        resp.status_code = 503
+        resp.headers["Retry-After"] = str(Config.EVENTOS_POLLING_S)
+        return resp
+
+    codppc = (request.args.get("codppc") or "").strip()
+    cododc = (request.args.get("cododc") or "").strip()
+    codcia, codsuc = sede_actual()
+    cola = suscribir()
+
+    def generar():
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                ev = cola.get(timeout=Config.EVENTOS_HEARTBEAT_S)
+            except queue.Empty:
+                # mantiene viva la conexión (proxies / Wi-Fi)
+                yield ": ping\n\n"
+                continue
+
+            if coincide(ev, codcia, codsuc, codppc, cododc):
+                yield formato_sse(ev)
+
+    def cerrar():
+        # el servidor WSGI cierra la respuesta aunque el generador no haya arrancado
+        desuscribir(cola)
+        _cupos_stream.release()
+
+    resp = Response(
+        stream_with_context(generar()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    resp.call_on_close(cerrar)
+    return resp
@@ -0,0 +1,152 @@
+# app/despachos/ruta.py
+"""
+Ruta de picking: orden en que el preparador recorre las líneas del pedido.
+
+"ORDER BY Ubicacion" es orden de texto: con códigos pasillo-rack-nivel
+(A01-R05-N3) el preparador va y viene por el mismo pasillo. Acá cada
+Ubicacion se convierte en coordenadas del almacén y las líneas se ordenan
+por un recorrido:
+  - "serpentina": pasillos en orden, subiendo por uno y bajando por el
+    siguiente (entre los pasillos que el pedido visita),
+  - "vecino": siempre a la ubicación pendiente más cercana, saliendo del
+    frente del primer pasillo; se cruza de pasillo por el frente o por el
+    fondo, lo que sea más corto.
+Se calcula una vez al generar el snapshot (Orden_Ruta en PICKING_DETALLE);
+leer el detalle no cuesta nada extra.
+
+Layout: JSON en Config.RUTA_LAYOUT (por defecto ruta_layout.json junto a
+este archivo):
+  patron             regex con grupos pasillo, rack y nivel (nivel opcional)
+  recorrido          "serpentina" | "vecino"
+  pasillos           {pasillo: posición} opcional; si falta, los pasillos se
+                     ordenan por código (letras y luego número)
+  ancho_pasillo      metros entre pasillos contiguos
+  largo_rack         metros por rack a lo largo del pasillo
+  racks_por_pasillo  largo del pasillo en racks (para cruzar por el fondo)
+Las ubicaciones que no calzan con el patrón (o vacías) van al final, por
+texto. Sin layout válido queda el orden por Ubicacion de siempre.
+"""
+import json
+import logging
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..config import Config
+
+log = logging.getLogger(__name__)
+
+_RE_NUMERO = re.compile(r"^(\D*)(\d+)$")
+
+
+@lru_cache(maxsize=None)
+def cargar_layout(ruta: Optional[str] = None) -> Dict[str, Any]:
+    """Layout del almacén ({} si no hay archivo o no es válido)."""
+    ruta = ruta or Config.RUTA_LAYOUT
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            layout = json.load(f)
+        layout["_patron"] = re.compile(layout["patron"], re.I)
+    except (OSError, ValueError, KeyError, re.error):
+        log.warning("layout de ruta no disponible (%s): se ordena por Ubicacion", ruta, exc_info=True)
+        return {}
+    if layout.get("recorrido", "serpentina") not in ("serpentina", "vecino"):
+        log.warning("recorrido %r desconocido en %s: se usa serpentina", layout.get("recorrido"), ruta)
+        layout["recorrido"] = "serpentina"
+    return layout
+
+
+def _natural(codigo: str) -> Tuple[str, int, str]:
+    """'A01' -> ('A', 1, 'A01'): A2 antes que A10."""
+    m = _RE_NUMERO.match(codigo)
+    return (m.group(1), int(m.group(2)), codigo) if m else (codigo, -1, codigo)
+
+
+def _texto(fila) -> str:
+    return str(fila.get("Ubicacion") or "").strip().upper()
+
+
+def ubicar(codigo: str, layout: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+    """(pasillo, rack, nivel) de un código de ubicación; None si no calza con el patrón."""
+    patron = layout.get("_patron")
+    m = patron.match(codigo) if patron and codigo else None
+    if not m:
+        return None
+    grupos = m.groupdict()
+    return grupos["pasillo"].upper(), int(grupos["rack"]), int(grupos.get("nivel") or 0)
+
+
+def _posiciones_pasillo(pasillos, layout) -> Dict[str, float]:
+    """x (metros) de cada pasillo: la del layout o, si no está, su rango por código."""
+    fijos = {str(k).upper(): float(v) for k, v in (layout.get("pasillos") or {}).items()}
+    ancho = float(layout.get("ancho_pasillo", 1.0))
+    rango = {p: i for i, p in enumerate(sorted(set(pasillos), key=_natural))}
+    return {p: fijos[p] * ancho if p in fijos else rango[p] * ancho for p in rango}
+
+
+def _serpentina(puntos) -> List[int]:
+    """puntos: [(i, x, rack, nivel, desempate)] -> índices en orden de recorrido."""
+    por_pasillo = {}
+    for p in puntos:
+        por_pasillo.setdefault(p[1], []).append(p)
+    orden = []
+    for k, x in enumerate(sorted(por_pasillo)):
+        subiendo = k % 2 == 0
+        tramo = sorted(por_pasillo[x], key=lambda p: (p[2] if subiendo else -p[2], p[3], p[4]))
+        orden.extend(p[0] for p in tramo)
+    return orden
+
+
+def _vecino(puntos, largo: float, largo_rack: float) -> List[int]:
+    """Vecino más cercano desde el frente (y=0) del pasillo de menor x."""
+
+    def distancia(a, b):
+        ya, yb = a[2] * largo_rack, b[2] * largo_rack
+        if a[1] == b[1]:
+            return abs(ya - yb)
+        return abs(a[1] - b[1]) + min(ya + yb, 2 * largo - ya - yb)
+
+    pendientes = sorted(puntos, key=lambda p: (p[1], p[2], p[3], p[4]))
+    actual = (None, pendientes[0][1], 0, 0, None)
+    orden = []
+    while pendientes:
+        j = min(
+            range(len(pendientes)),
+            key=lambda i: (distancia(actual, pendientes[i]), pendientes[i][3], pendientes[i][4])
+        )
+        actual = pendientes.pop(j)
+        orden.append(actual[0])
+    return orden
+
+
+def ordenar_ruta(filas: List[Dict[str, Any]], layout: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Las filas en orden de recorrido (no las modifica)."""
+    layout = cargar_layout() if layout is None else layout
+    ubicadas = [(i, ubicar(_texto(f), layout)) for i, f in enumerate(filas)]
+    puntos = [(i, u) for i, u in ubicadas if u is not None]
+    resto = sorted(
+        (i for i, u in ubicadas if u is None),
+        key=lambda i: (_texto(filas[i]), str(filas[i].get("ITEM") or ""))
+    )
+    if not puntos:
+        return [filas[i] for i in resto]
+
+    x = _posiciones_pasillo([u[0] for _, u in puntos], layout)
+    # desempate estable: mismo lugar -> por ITEM
+    puntos = [(i, x[u[0]], u[1], u[2], _natural(str(filas[i].get("ITEM") or ""))) for i, u in puntos]
+
+    if layout.get("recorrido") == "vecino":
+        largo_rack = float(layout.get("largo_rack", 1.0))
+        largo = float(layout.get("racks_por_pasillo") or max(p[2] for p in puntos)) * largo_rack
+        orden = _vecino(puntos, largo, largo_rack)
+    else:
+        orden = _serpentina(puntos)
+    return [filas[i] for i in orden + resto]
+
+
+def numerar_ruta(filas: List[Dict[str, Any]], layout: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Pone Orden_Ruta = 1..n según el recorrido y devuelve las filas en ese orden."""
+    ordenadas = ordenar_ruta(filas, layout)
+    for n, f in enumerate(ordenadas, start=1):
+        f["Orden_Ruta"] = n
+    return ordenadas
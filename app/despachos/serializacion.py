@@ -0,0 +1,141 @@
+# app/despachos/serializacion.py
+"""
+Respuestas JSON del blueprint de despachos.
+
+- orjson si está instalado (JSON_MOTOR=auto|orjson|json); si no, json de la
+  librería estándar con separadores compactos.
+- Decimal -> número (el front ya hace toNum); datetime/date -> ISO 8601.
+  Las fechas sin zona se marcan "Z": es el mismo instante que mandaba
+  jsonify (http_date en GMT), el front las sigue formateando igual.
+- ?columnas=ITEM,UM,...  solo esas columnas en las listas de filas.
+- ?format=columnar       cada lista de filas va como
+                         {"columnas": [...], "filas": [[...], ...]}:
+                         los nombres viajan una vez, no en cada fila.
+"""
+import json
+import re
+from datetime import date, datetime, time as dtime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from flask import Response, request
+
+from ..config import Config
+
+try:
+    import orjson
+except ImportError:  # dependencia opcional
+    orjson = None
+
+_USAR_ORJSON = orjson is not None and Config.JSON_MOTOR in ("auto", "orjson")
+
+_COLUMNA_VALIDA = re.compile(r"^\w{1,64}$")
+_MAX_COLUMNAS = 64
+
+
+# =========================================================
+# Codificación
+# =========================================================
+def _por_defecto(o):
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, (bytes, bytearray)):
+        return o.hex()
+    if not _USAR_ORJSON:
+        if isinstance(o, datetime):
+            if o.tzinfo is None or o.utcoffset() == timedelta(0):
+                return o.replace(tzinfo=None).isoformat() + "Z"
+            return o.isoformat()
+        if isinstance(o, (date, dtime)):
+            return o.isoformat()
+    raise TypeError(f"{type(o).__name__} no es serializable a JSON")
+
+
+if _USAR_ORJSON:
+    _OPCIONES = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+
+    def a_json(obj) -> bytes:
+        return orjson.dumps(obj, default=_por_defecto, option=_OPCIONES)
+else:
+    _encoder = json.JSONEncoder(
+        default=_por_defecto, ensure_ascii=False, separators=(",", ":")
+    )
+
+    def a_json(obj) -> bytes:
+        return _encoder.encode(obj).encode("utf-8")
+
+
+def motor_json() -> str:
+    return "orjson" if _USAR_ORJSON else "json"
+
+
+# =========================================================
+# Forma de las listas de filas
+# =========================================================
+def columnas_pedidas(args=None) -> Optional[List[str]]:
+    """?columnas=a,b,c -> ['a','b','c'] (nombres válidos, sin repetir) o None."""
+    crudo = (request.args if args is None else args).get("columnas")
+    if not crudo:
+        return None
+    vistas, columnas = set(), []
+    for c in crudo.split(","):
+        c = c.strip()
+        if c and c not in vistas and _COLUMNA_VALIDA.match(c):
+            vistas.add(c)
+            columnas.append(c)
+    return columnas[:_MAX_COLUMNAS] or None
+
+
+def es_columnar(args=None) -> bool:
+    formato = (request.args if args is None else args).get("format")
+    return (formato or "").strip().lower() == "columnar"
+
+
+def variante() -> str:
+    """Sufijo para el ETag: misma versión, distinta representación."""
+    partes = []
+    if es_columnar():
+        partes.append("col")
+    columnas = columnas_pedidas()
+    if columnas:
+        partes.append(",".join(columnas))
+    return ";".join(partes)
+
+
+def _forma_filas(filas: List[Dict[str, Any]], columnas: Optional[List[str]], columnar: bool):
+    if columnas is not None and filas:
+        columnas = [c for c in columnas if c in filas[0]]
+    if columnar:
+        if columnas is None:
+            columnas = list(filas[0]) if filas else []
+        return {
+            "columnas": columnas,
+            "filas": [[f.get(c) for c in columnas] for f in filas],
+        }
+    if columnas is None:
+        return filas
+    return [{c: f.get(c) for c in columnas} for f in filas]
+
+
+def cuerpo_json(payload: Dict[str, Any], listas: Iterable[str] = ("detalle",), args=None) -> bytes:
+    """
+    JSON con las listas de filas (`listas`) en la forma que pidió el
+    cliente (args: los parámetros de la URL; por defecto los del request).
+    El resto del payload no se toca.
+    """
+    columnas = columnas_pedidas(args)
+    columnar = es_columnar(args)
+    if columnas is not None or columnar:
+        payload = dict(payload)
+        for clave in listas:
+            filas = payload.get(clave)
+            if isinstance(filas, list):
+                payload[clave] = _forma_filas(filas, columnas, columnar)
+        if columnar:
+            payload["formato"] = "columnar"
+    return a_json(payload)
+
+
+def responder(payload: Dict[str, Any], status: int = 200,
+              listas: Iterable[str] = ("detalle",)) -> Response:
+    return Response(cuerpo_json(payload, listas), status=status, mimetype="application/json")
@@ -1,32 +1,149 @@
+import hashlib
+import json
+import threading
 from typing import List, Dict, Any, Tuple, Optional
-from datetime import datetime, date
-from sqlalchemy import text
-from ..db import engine
-
-from datetime import datetime
-from sqlalchemy import text
-from ..db import engine
-from datetime import datetime
-from typing import Optional
-from sqlalchemy import text
-from ..db import engine
+from datetime import datetime, date, time as dtime
+from decimal import Decimal
+from functools import lru_cache
+from flask import g, has_app_context
+from sqlalchemy import bindparam, text
+from ..db import engine, medir_sql
+from ..config import Config
+from .cache import CachePorSede, CandadosPorClave
+from .eventos import publicar_evento, al_recibir
+from .directorio import listar_preparadores, obtener_directorio, nombre_trabajador
+from .ruta import numerar_ruta
+
 # =========================================================
-# Helpers fechas
+# ESTADO DEL PEDIDO (PICKING_ASIGNACION)
+# =========================================================
+# Una sola lectura trae inicio/fin/asignados. Se memoriza:
+#  - por request (flask.g): tiene_inicio + esta_finalizado + obtener_asignacion
+#    en el mismo endpoint = 1 viaje,
+#  - en un LRU corto del proceso, que inicio/fin/asignar invalidan (en los
+#    demás workers, vía sus eventos: ver _al_evento).
+_cache_estado_pedido = CachePorSede(Config.ESTADO_PEDIDO_TTL, max_items=Config.ESTADO_PEDIDO_MAX)
+
+
+_SQL_ESTADO_PEDIDO = """
+    SELECT
+      registrado_cod, registrado_nom,
+      preparado_cod,  preparado_nom,
+      inicio_dt, fin_dt, tprep_min
+    FROM dbo.PICKING_ASIGNACION
+    WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
+      AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
+"""
+
+
+def _cargar_estado_pedido(codcia, codsuc, codppc, cododc) -> Dict[str, Any]:
+    with engine.begin() as conn:
+        r = conn.execute(text(_SQL_ESTADO_PEDIDO), {
+            "cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc
+        }).mappings().first()
+        return dict(r) if r else {}
+
+
+def _memo_request() -> Optional[Dict]:
+    if not has_app_context():
+        return None
+    if "estado_pedidos" not in g:
+        g.estado_pedidos = {}
+    return g.estado_pedidos
+
+
+def obtener_estado_pedido(codcia, codsuc, codppc, cododc) -> Dict[str, Any]:
+    """
+    Fila de PICKING_ASIGNACION del pedido (valores crudos, {} si no existe):
+    registrado_cod/nom, preparado_cod/nom, inicio_dt, fin_dt, tprep_min.
+    No modificar el dict devuelto (es compartido).
+    """
+    clave = (codcia, codsuc) + _clave_pedido(codppc, cododc)
+
+    memo = _memo_request()
+    if memo is not None and clave in memo:
+        return memo[clave]
+
+    _escuchar_eventos()
+    estado = _cache_estado_pedido.obtener(
+        clave, lambda: _cargar_estado_pedido(codcia, codsuc, codppc, cododc)
+    )
+    if memo is not None:
+        memo[clave] = estado
+    return estado
+
+
+def invalidar_estado_pedido(codcia, codsuc, codppc, cododc):
+    clave = (codcia, codsuc) + _clave_pedido(codppc, cododc)
+    _cache_estado_pedido.invalidar(lambda k: k == clave)
+    memo = _memo_request()
+    if memo is not None:
+        memo.pop(clave, None)
+
+
+# =========================================================
+# EVENTOS DE LOS DEMÁS WORKERS
 # =========================================================
-from sqlalchemy import text
-from ..db import engine
+# Lo que cada worker tiene en memoria lo invalidan también los eventos que
+# publican los demás (inicio, fin, asignación, scan; con EVENTOS_BACKEND
+# "broker" llegan de todos los workers):
+#  - el estado cacheado del pedido (_cache_estado_pedido),
+#  - la marca de la sede para el sello del listado (version_listado).
+# Si el broker se cae, el TTL (ESTADO_PEDIDO_TTL) sigue acotando lo viejo.
+_marca_eventos: Dict[Tuple[str, str], str] = {}
+_escucha = {"activa": False}
+_escucha_lock = threading.Lock()
+
+_EVENTOS_ESTADO = ("inicio", "fin", "asignacion")
+
+
+def _al_evento(evento: Dict[str, Any]):
+    codcia, codsuc = evento.get("codcia"), evento.get("codsuc")
+    _marca_eventos[(codcia, codsuc)] = repr(evento.get("ts"))
+    if evento.get("tipo") in _EVENTOS_ESTADO:
+        clave = (codcia, codsuc) + _clave_pedido(evento.get("codppc"), evento.get("cododc"))
+        _cache_estado_pedido.invalidar(lambda k: k == clave)
+
+
+def _escuchar_eventos():
+    if _escucha["activa"]:
+        return
+    with _escucha_lock:
+        if not _escucha["activa"]:
+            al_recibir(_al_evento)
+            _escucha["activa"] = True
+
 
 def tiene_inicio(codcia, codsuc, codppc, cododc) -> bool:
+    return obtener_estado_pedido(codcia, codsuc, codppc, cododc).get("inicio_dt") is not None
+
+
+_SQL_VERSION_PEDIDO = """
+    SELECT updated_at, detalle_ver
+    FROM dbo.PICKING_ASIGNACION
+    WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
+      AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
+"""
+
+
+def version_pedido(codcia, codsuc, codppc, cododc) -> Optional[str]:
+    """
+    Token (ETag) del pedido: updated_at (inicio/fin/asignados) + detalle_ver
+    (cambios del detalle). Lectura puntual por PK, sin el cache de estado:
+    un token atrasado daría un 304 con datos viejos.
+    None si el pedido aún no tiene fila en PICKING_ASIGNACION.
+    """
     with engine.begin() as conn:
-        inicio = conn.execute(text("""
-            SELECT inicio_dt
-            FROM dbo.PICKING_ASIGNACION
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
+        r = conn.execute(text(_SQL_VERSION_PEDIDO), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).first()
+    if r is None:
+        return None
+    base = "|".join((codcia, codsuc) + _clave_pedido(codppc, cododc) + (str(r[0]), str(r[1])))
+    return hashlib.sha1(base.encode("utf-8")).hexdigest()
 
-        return inicio is not None
 
+# =========================================================
+# Helpers fechas
+# =========================================================
 def _fecha_a_periodo(fecha: str) -> Optional[str]:
     """
     Convierte '2025-11-14' -> '202511' (formato yyyymm) para el SP.
@@ -57,55 +174,369 @@ def _periodos_por_defecto_4_meses() -> Tuple[str, str]:
 # =========================================================
 # LISTAR DESPACHOS (SP)
 # =========================================================
+# Resultado completo del SP por (codcia, codsuc, per_ini, per_fin).
+# Paginación y filtros se sirven desde aquí; inicio/fin/asignar lo invalidan.
+_cache_despachos = CachePorSede(Config.DESPACHOS_CACHE_TTL)
+
+
+def _ejecutar_sp_despachos(codcia, codsuc, per_ini, per_fin) -> List[Dict[str, Any]]:
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        with medir_sql("sp_despachos") as m:
+            cur.execute("""
+                EXEC pa_Preparacion_Despacho_Local_por_atender
+                     @codcia=?,
+                     @codsuc=?,
+                     @perini=?,
+                     @perfin=?
+            """, (codcia, codsuc, per_ini, per_fin))
+
+            cols = [c[0] for c in cur.description]
+            rows = cur.fetchall()
+            m["filas"] = len(rows)
+        data = [dict(zip(cols, r)) for r in rows]
+
+        conn.commit()
+        return data
+    finally:
+        conn.close()
+
+
+def _clave_pedido(codppc, cododc) -> Tuple[str, str]:
+    return str(codppc or "").strip(), str(cododc or "").strip()
+
+
+def _cargar_despachos(codcia, codsuc, per_ini, per_fin) -> Dict[str, Any]:
+    """
+    Ejecuta el SP y arma, de una vez, el índice de cabeceras
+    (ppc, odc) -> fila. Índice y filas viven y vencen juntos en el cache.
+    "sello": hash del contenido (igual en todos los workers si el SP
+    devolvió lo mismo) -> ETag del listado.
+    """
+    filas = _ejecutar_sp_despachos(codcia, codsuc, per_ini, per_fin)
+    indice = {}
+    for r in filas:
+        # como el for original: gana la primera coincidencia
+        indice.setdefault(_clave_pedido(r.get("ppc_numppc"), r.get("odc_numodc")), r)
+    sello = hashlib.sha1(
+        json.dumps(filas, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return {"filas": filas, "indice": indice, "sello": sello}
+
+
+def _despachos_cacheados(codcia, codsuc, per_ini, per_fin) -> Dict[str, Any]:
+    return _cache_despachos.obtener(
+        (codcia, codsuc, per_ini, per_fin),
+        lambda: _cargar_despachos(codcia, codsuc, per_ini, per_fin)
+    )
+
+
+def invalidar_cache_despachos(codcia, codsuc):
+    """Olvida los listados cacheados de esa cia/suc (todos los periodos)."""
+    _cache_despachos.invalidar(lambda k: k[0] == codcia and k[1] == codsuc)
+
+
+def _filtrar_estado(data, estado):
+    """
+    Filtra por c_sit_orddes (ABASTECIMIENTO, PREPARACION INICIADA, ...).
+    Mismo criterio que el front (estadoToClass): contiene, sin importar mayúsculas.
+    """
+    est = (estado or "").strip().upper()
+    if not est:
+        return data
+    return [r for r in data if est in str(r.get("c_sit_orddes") or "").upper()]
+
+
+# ---------------------------------------------------------
+# Motor "sql" (DESPACHOS_LISTADO_MOTOR=sql): el SP se vuelca a una tabla
+# temporal y SQL Server hace COUNT, filtro de estado y OFFSET/FETCH.
+# Solo la página viaja a Python. Sirve para comparar (A/B) contra el
+# motor "cache" con volúmenes reales.
+# ---------------------------------------------------------
+_forma_despachos = {}          # columnas del SP (se aprende una vez por proceso)
+_forma_despachos_lock = threading.Lock()
+
+
+def _tipo_sql(desc) -> str:
+    """Tipo T-SQL para una columna a partir de cursor.description de pyodbc."""
+    _, tipo, _, tam, prec, escala, _ = desc
+    if tipo is str:
+        return f"NVARCHAR({tam})" if tam and 0 < tam <= 4000 else "NVARCHAR(MAX)"
+    if tipo is Decimal:
+        return f"DECIMAL({prec or 18},{escala or 0})"
+    if tipo is bool:
+        return "BIT"
+    if tipo is int:
+        return "BIGINT"
+    if tipo is float:
+        return "FLOAT"
+    if tipo is datetime:
+        return "DATETIME2"
+    if tipo is date:
+        return "DATE"
+    if tipo is dtime:
+        return "TIME"
+    if tipo in (bytes, bytearray):
+        return "VARBINARY(MAX)"
+    return "NVARCHAR(MAX)"
+
+
+def _columnas_sp_despachos(codcia, codsuc, per_ini, per_fin) -> List[Tuple[str, str]]:
+    """
+    [(columna, tipo T-SQL)] del resultado del SP. INSERT ... EXEC necesita
+    la tabla creada de antemano. Un SP con tablas temporales no se deja
+    describir con sys.dm_exec_describe_first_result_set, así que se toma
+    cursor.description de una ejecución real, una sola vez.
+    """
+    with _forma_despachos_lock:
+        if "columnas" in _forma_despachos:
+            return _forma_despachos["columnas"]
+
+        conn = engine.raw_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                EXEC pa_Preparacion_Despacho_Local_por_atender
+                     @codcia=?,
+                     @codsuc=?,
+                     @perini=?,
+                     @perfin=?
+            """, (codcia, codsuc, per_ini, per_fin))
+            columnas = [(d[0], _tipo_sql(d)) for d in cur.description]
+            conn.commit()
+        finally:
+            conn.close()
+
+        _forma_despachos["columnas"] = columnas
+        return columnas
+
+
+def _sql_despachos_pagina(columnas) -> str:
+    """
+    Lote de una página del SP: parámetros (estado, codcia, codsuc, perini,
+    perfin, offset, tamaño); devuelve el total filtrado y la página.
+    """
+    nombres = ", ".join("[" + c.replace("]", "]]") + "]" for c, _ in columnas)
+    ddl = ",\n    ".join("[" + c.replace("]", "]]") + "] " + t + " NULL" for c, t in columnas)
+
+    filtro = ""
+    if any(c == "c_sit_orddes" for c, _ in columnas):
+        filtro = "WHERE (@estado IS NULL OR UPPER(c_sit_orddes) LIKE '%' + @estado + '%')"
+
+    return f"""
+-- picking:despachos_pagina
+SET NOCOUNT ON;
+DECLARE @estado NVARCHAR(60) = ?;
+CREATE TABLE #desp (
+    _fila INT IDENTITY(1,1) PRIMARY KEY,
+    {ddl}
+);
+INSERT INTO #desp ({nombres})
+EXEC pa_Preparacion_Despacho_Local_por_atender
+     @codcia=?,
+     @codsuc=?,
+     @perini=?,
+     @perfin=?;
+
+SELECT COUNT(*) FROM #desp {filtro};
+
+SELECT {nombres}
+FROM #desp
+{filtro}
+ORDER BY _fila
+OFFSET ? ROWS FETCH NEXT ? ROWS ONLY;
+
+DROP TABLE #desp;
+"""
+
+
+def _listar_despachos_sql(codcia, codsuc, per_ini, per_fin, page, page_size, estado):
+    sql = _sql_despachos_pagina(_columnas_sp_despachos(codcia, codsuc, per_ini, per_fin))
+    est = (estado or "").strip().upper() or None
+    offset = max(page - 1, 0) * page_size
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        with medir_sql("sp_despachos_pagina") as m:
+            cur.execute(sql, (est, codcia, codsuc, per_ini, per_fin, offset, page_size))
+
+            total = cur.fetchone()[0]
+            cur.nextset()
+            cols = [c[0] for c in cur.description]
+            rows = cur.fetchall()
+            m["filas"] = len(rows)
+        data_page = [dict(zip(cols, r)) for r in rows]
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    return data_page, total
+
+
+def _periodos_listado(fecha_desde, fecha_hasta) -> Tuple[Optional[str], Optional[str]]:
+    if fecha_desde or fecha_hasta:
+        per_ini = _fecha_a_periodo(fecha_desde) if fecha_desde else None
+        per_fin = _fecha_a_periodo(fecha_hasta) if fecha_hasta else None
+        return per_ini, per_fin
+    return _periodos_por_defecto_4_meses()
+
+
+# Los scans no cambian el SP pero sí el avance de las tarjetas: la marca del
+# último evento de la sede (_marca_eventos) entra en el sello del listado y
+# el 304 sale sin leer PICKING_ASIGNACION.
+def version_listado(codcia, codsuc, fecha_desde=None, fecha_hasta=None) -> Optional[str]:
+    """
+    Sello del resultado cacheado del SP para ese rango (carga el cache si
+    venció) + marca del último evento de la sede. Motor "sql": None (no hay
+    copia en memoria de la que sacarlo).
+    """
+    if Config.DESPACHOS_LISTADO_MOTOR == "sql":
+        return None
+    _escuchar_eventos()
+    per_ini, per_fin = _periodos_listado(fecha_desde, fecha_hasta)
+    sello = _despachos_cacheados(codcia, codsuc, per_ini, per_fin)["sello"]
+    marca = _marca_eventos.get((codcia, codsuc), "")
+    return f"{sello[:20]}-{hashlib.sha1(marca.encode('utf-8')).hexdigest()[:12]}"
+
+
 def listar_despachos_sp(
-    codcia: str = "01",
-    codsuc: str = "01",
+    codcia: str = Config.SEDE_DEFECTO[0],
+    codsuc: str = Config.SEDE_DEFECTO[1],
     fecha_desde: str = None,   # '2025-08-01'
     fecha_hasta: str = None,   # '2025-11-30'
     page: int = 1,
-    page_size: int = 20
+    page_size: int = 20,
+    estado: str = None         # 'ABASTECIMIENTO' / 'PREPARACION INICIADA' / None = todos
 ) -> Tuple[List[Dict[str, Any]], int]:
     """
     Llama a pa_Preparacion_Despacho_Local_por_atender usando periodos yyyymm.
-    Paginamos en Python (el SP no tiene page/page_size).
+    Motor "cache" (defecto): el resultado del SP se cachea (DESPACHOS_CACHE_TTL);
+    estado y página se resuelven en Python (el SP no tiene page/page_size).
+    Motor "sql": COUNT, estado y página los resuelve SQL Server.
     """
 
-    if fecha_desde or fecha_hasta:
-        per_ini = _fecha_a_periodo(fecha_desde) if fecha_desde else None
-        per_fin = _fecha_a_periodo(fecha_hasta) if fecha_hasta else None
-    else:
-        per_ini, per_fin = _periodos_por_defecto_4_meses()
+    per_ini, per_fin = _periodos_listado(fecha_desde, fecha_hasta)
 
-    conn = engine.raw_connection()
-    try:
-        cur = conn.cursor()
-        cur.execute("""
-            EXEC pa_Preparacion_Despacho_Local_por_atender
-                 @codcia=?,
-                 @codsuc=?,
-                 @perini=?,
-                 @perfin=?
-        """, (codcia, codsuc, per_ini, per_fin))
+    if Config.DESPACHOS_LISTADO_MOTOR == "sql":
+        return _listar_despachos_sql(codcia, codsuc, per_ini, per_fin, page, page_size, estado)
 
-        cols = [c[0] for c in cur.description]
-        rows = cur.fetchall()
-        data = [dict(zip(cols, r)) for r in rows]
+    data = _despachos_cacheados(codcia, codsuc, per_ini, per_fin)["filas"]
+    data = _filtrar_estado(data, estado)
 
-        total = len(data)
+    total = len(data)
 
-        start = (page - 1) * page_size
-        end = start + page_size
-        data_page = data[start:end]
+    start = (page - 1) * page_size
+    end = start + page_size
+    data_page = data[start:end]
 
-        conn.commit()
-        return data_page, total
-    finally:
-        conn.close()
+    return data_page, total
+
+
+# =========================================================
+# AVANCE DEL PEDIDO EN EL LISTADO
+# =========================================================
+# Las tarjetas muestran el avance que mantiene el lote de scan en
+# PICKING_ASIGNACION: una lectura por PK para toda la página, sin tocar
+# PICKING_DETALLE.
+_COLUMNAS_AVANCE = ("lineas", "lineas_completas", "unidades_abastecidas", "unidades_escaneadas")
+
+_SQL_AVANCE_LISTADO = """
+    SELECT PPC_NUMPPC, ODC_NUMODC,
+           lineas_total AS lineas, lineas_completas,
+           unidades_abastecidas, unidades_escaneadas
+    FROM dbo.PICKING_ASIGNACION
+    WHERE CIA_CODCIA = :cia
+      AND SUC_CODSUC = :suc
+      AND PPC_NUMPPC IN :ppcs
+"""
+
+
+def con_avance(codcia, codsuc, filas: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Copia de las filas del listado con "avance": {lineas, lineas_completas,
+    unidades_abastecidas, unidades_escaneadas} (None si el pedido no tiene
+    detalle generado).
+    """
+    claves = [_clave_pedido(r.get("ppc_numppc"), r.get("odc_numodc")) for r in filas]
+    ppcs = sorted({ppc for ppc, _ in claves if ppc})
+
+    avances = {}
+    if ppcs:
+        with engine.begin() as conn:
+            rows = conn.execute(text(_SQL_AVANCE_LISTADO).bindparams(bindparam("ppcs", expanding=True)), {
+                "cia": codcia, "suc": codsuc, "ppcs": ppcs
+            }).mappings().all()
+        en_pagina = set(claves)
+        for r in rows:
+            clave = _clave_pedido(r["PPC_NUMPPC"], r["ODC_NUMODC"])
+            if clave in en_pagina and r["lineas"] is not None:
+                avances[clave] = {c: r[c] for c in _COLUMNAS_AVANCE}
+
+    return [dict(r, avance=avances.get(c)) for r, c in zip(filas, claves)]
 
 
 # =========================================================
 # DETALLE
 # =========================================================
+def _fila_detalle(cols, r) -> Dict[str, Any]:
+    """dict de una fila de PICKING_DETALLE; RowVer (rowversion, 8 bytes) -> int."""
+    d = dict(zip(cols, r))
+    rv = d.get("RowVer")
+    if isinstance(rv, (bytes, bytearray)):
+        d["RowVer"] = int.from_bytes(rv, "big")
+    return d
+
+
+def _filas_cursor(cur) -> List[Dict[str, Any]]:
+    cols = [c[0] for c in cur.description]
+    return [_fila_detalle(cols, r) for r in cur.fetchall()]
+
+
+def version_detalle(filas, desde_version: Optional[int] = None) -> int:
+    """Mayor RowVer visto (o la versión de la que partió el cliente)."""
+    return max([r.get("RowVer") or 0 for r in filas] + [desde_version or 0])
+
+
+# {filtro_version}: "" (todo el pedido) o _FILTRO_DESDE_VERSION (solo lo cambiado)
+_SQL_LEER_DETALLE = """
+    SELECT *
+    FROM dbo.PICKING_DETALLE
+    WHERE CIA_CODCIA = :CIA_CODCIA
+      AND SUC_CODSUC = :SUC_CODSUC
+      AND PPC_NUMPPC = :PPC_NUMPPC
+      AND ODC_NUMODC = :ODC_NUMODC
+      {filtro_version}
+    ORDER BY Orden_Ruta ASC, Ubicacion ASC
+"""
+_FILTRO_DESDE_VERSION = "AND RowVer > CAST(CAST(:desde AS BIGINT) AS BINARY(8))"
+
+
+def _leer_detalle_activo(codcia, codsuc, codppc, cododc, desde_version: Optional[int] = None):
+    """
+    SELECT sobre PICKING_DETALLE (sin revisar finalizado).
+    Con desde_version: solo las líneas cambiadas después de esa versión.
+    """
+    filtro_version = ""
+    params = {
+        "CIA_CODCIA": codcia,
+        "SUC_CODSUC": codsuc,
+        "PPC_NUMPPC": codppc,
+        "ODC_NUMODC": cododc,
+    }
+    if desde_version is not None:
+        filtro_version = _FILTRO_DESDE_VERSION
+        params["desde"] = int(desde_version)
+
+    with engine.begin() as conn:
+        result = conn.execute(text(_SQL_LEER_DETALLE.format(filtro_version=filtro_version)), params)
+        cols = list(result.keys())
+        rows = result.fetchall()
+        return [_fila_detalle(cols, r) for r in rows]
+
+
 def listar_detalle_tabla(codcia, codsuc, codppc, cododc):
     """
     Lee el detalle desde:
@@ -116,32 +547,26 @@ def listar_detalle_tabla(codcia, codsuc, codppc, cododc):
         return listar_detalle_historico(codcia, codsuc, codppc, cododc)
 
     # Activo: tabla detalle
-    with engine.begin() as conn:
-        result = conn.execute(text("""
-            SELECT *
-            FROM dbo.PICKING_DETALLE
-            WHERE CIA_CODCIA = :CIA_CODCIA
-              AND SUC_CODSUC = :SUC_CODSUC
-              AND PPC_NUMPPC = :PPC_NUMPPC
-              AND ODC_NUMODC = :ODC_NUMODC
-            ORDER BY Ubicacion ASC
-        """), {
-            "CIA_CODCIA": codcia,
-            "SUC_CODSUC": codsuc,
-            "PPC_NUMPPC": codppc,
-            "ODC_NUMODC": cododc,
-        })
-        cols = result.keys()
-        rows = result.fetchall()
-        return [dict(zip(cols, r)) for r in rows]
+    return _leer_detalle_activo(codcia, codsuc, codppc, cododc)
+
 
+def leer_detalle_delta(codcia, codsuc, codppc, cododc, desde_version: int):
+    """
+    Lectura incremental para el front: solo líneas con RowVer > desde_version.
+    Si el pedido ya está finalizado (histórico, sin RowVer) devuelve todo.
 
+    Retorna (filas, version, es_delta).
+    """
+    if esta_finalizado(codcia, codsuc, codppc, cododc):
+        return listar_detalle_historico(codcia, codsuc, codppc, cododc), 0, False
 
-def listar_detalle_sp(codcia, codsuc, codppc, cododc):
-    """Llama al SP detalle y devuelve la lista de dicts."""
-    conn = engine.raw_connection()
-    try:
-        cur = conn.cursor()
+    filas = _leer_detalle_activo(codcia, codsuc, codppc, cododc, desde_version)
+    return filas, version_detalle(filas, desde_version), True
+
+
+
+def _ejecutar_sp_detalle(cur, codcia, codsuc, codppc, cododc) -> List[Dict[str, Any]]:
+    with medir_sql("sp_detalle") as m:
         cur.execute("""
             EXEC dbo.pa_Preparacion_Despacho_Local_por_atender_detalle
                 @codcia=?,
@@ -152,7 +577,16 @@ def listar_detalle_sp(codcia, codsuc, codppc, cododc):
 
         cols = [c[0] for c in cur.description]
         rows = cur.fetchall()
-        data = [dict(zip(cols, r)) for r in rows]
+        m["filas"] = len(rows)
+    return [dict(zip(cols, r)) for r in rows]
+
+
+def listar_detalle_sp(codcia, codsuc, codppc, cododc):
+    """Llama al SP detalle y devuelve la lista de dicts."""
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        data = _ejecutar_sp_detalle(cur, codcia, codsuc, codppc, cododc)
 
         conn.commit()
         return data
@@ -160,66 +594,317 @@ def listar_detalle_sp(codcia, codsuc, codppc, cododc):
         conn.close()
 
 
+# Columnas del snapshot (mismo orden en el INSERT y en las tuplas)
+_COLUMNAS_SNAPSHOT = (
+    "CIA_CODCIA", "SUC_CODSUC", "PPC_NUMPPC", "ODC_NUMODC",
+    "ITEM", "It_D", "L", "Cod_Producto_Pedido",
+    "Descripcion_pedido", "CodigoParte", "UM",
+    "UE", "Indica_Cierre", "Cantidad_a_Despachar",
+    "Cantidd_abastecida", "Caja", "Peso_Neto",
+    "Cantidad_Scaneada", "Diferencia", "Ubicacion",
+    "Orden_Ruta",
+)
+
+# el snapshot también fija ESTADO (pedido completo '1' / no '0'); después
+# solo lo reescribe el lote de scan que completa el pedido
+_COLUMNAS_INSERT_SNAPSHOT = _COLUMNAS_SNAPSHOT + ("ESTADO",)
+
+_SQL_INSERT_SNAPSHOT = (
+    f"INSERT INTO dbo.PICKING_DETALLE ({', '.join(_COLUMNAS_INSERT_SNAPSHOT)}) "
+    f"VALUES ({', '.join(['?'] * len(_COLUMNAS_INSERT_SNAPSHOT))})"
+)
+
+
+# Un solo generador de snapshot por pedido:
+#  - dentro del proceso: lock por pedido (los demás hilos esperan sin tomar conexión),
+#  - entre workers/servidores: sp_getapplock atado a la transacción.
+# El segundo en llegar espera y reutiliza lo que insertó el primero.
+_candados_snapshot = CandadosPorClave()
+
+def _recurso_pedido(codcia, codsuc, codppc, cododc) -> str:
+    """Nombre del applock del pedido (generar snapshot / archivar)."""
+    return "PICKING_DETALLE:" + "|".join((codcia, codsuc) + _clave_pedido(codppc, cododc))
+
+
+_SQL_APPLOCK = """
+-- picking:applock
+SET NOCOUNT ON;
+DECLARE @r INT;
+EXEC @r = sp_getapplock
+     @Resource = ?,
+     @LockMode = 'Exclusive',
+     @LockOwner = 'Transaction',
+     @LockTimeout = ?;
+SELECT @r;
+"""
+
+_SQL_FIN_PEDIDO = """
+    SELECT fin_dt, inicio_dt, precarga_hash
+    FROM dbo.PICKING_ASIGNACION
+    WHERE CIA_CODCIA = ?
+      AND SUC_CODSUC = ?
+      AND PPC_NUMPPC = ?
+      AND ODC_NUMODC = ?
+"""
+
+# avance inicial del pedido (si todavía no hay fila de asignación, el primer
+# lote de scan lo calcula) y precarga_hash: hash del SP con el que la
+# precarga armó el snapshot, NULL si lo armó (o revisó) la apertura
+_SQL_AVANCE_SNAPSHOT = """
+    UPDATE dbo.PICKING_ASIGNACION
+    SET lineas_total = ?,
+        lineas_completas = ?,
+        unidades_abastecidas = ?,
+        unidades_escaneadas = ?,
+        precarga_hash = ?,
+        detalle_ver = detalle_ver + 1
+    WHERE CIA_CODCIA = ?
+      AND SUC_CODSUC = ?
+      AND PPC_NUMPPC = ?
+      AND ODC_NUMODC = ?
+"""
+
+# la precarga deja la fila de asignación para poder anotar su hash
+_SQL_BASE_ASIGNACION = """
+    MERGE dbo.PICKING_ASIGNACION AS T
+    USING (SELECT ? AS CIA_CODCIA, ? AS SUC_CODSUC, ? AS PPC_NUMPPC, ? AS ODC_NUMODC) AS S
+    ON (T.CIA_CODCIA=S.CIA_CODCIA AND T.SUC_CODSUC=S.SUC_CODSUC AND T.PPC_NUMPPC=S.PPC_NUMPPC AND T.ODC_NUMODC=S.ODC_NUMODC)
+    WHEN NOT MATCHED THEN
+      INSERT (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC)
+      VALUES (?, ?, ?, ?);
+"""
+
+_SQL_PRECARGA_REVISADA = """
+    UPDATE dbo.PICKING_ASIGNACION
+    SET precarga_hash = NULL
+    WHERE CIA_CODCIA = ?
+      AND SUC_CODSUC = ?
+      AND PPC_NUMPPC = ?
+      AND ODC_NUMODC = ?
+"""
+
+_SQL_BORRAR_DETALLE = """
+    DELETE FROM dbo.PICKING_DETALLE
+    WHERE CIA_CODCIA = ?
+      AND SUC_CODSUC = ?
+      AND PPC_NUMPPC = ?
+      AND ODC_NUMODC = ?
+"""
+
+_SQL_DETALLE_ACTIVO = """
+    SELECT *
+    FROM dbo.PICKING_DETALLE
+    WHERE CIA_CODCIA = ?
+      AND SUC_CODSUC = ?
+      AND PPC_NUMPPC = ?
+      AND ODC_NUMODC = ?
+    ORDER BY Orden_Ruta ASC, Ubicacion ASC
+"""
+
+
+def _avance_filas(filas: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Avance del pedido a partir de sus líneas (mismo criterio que el lote de scan)."""
+    lineas = completas = 0
+    abastecidas = escaneadas = 0
+    for f in filas:
+        abast = f.get("Cantidd_abastecida") or 0
+        scan = f.get("Cantidad_Scaneada") or 0
+        lineas += 1
+        completas += 1 if scan >= abast else 0
+        abastecidas += abast
+        escaneadas += scan
+    return {
+        "lineas": lineas,
+        "lineas_completas": completas,
+        "unidades_abastecidas": abastecidas,
+        "unidades_escaneadas": escaneadas,
+    }
+
+
+def _hash_detalle(data: List[Dict[str, Any]]) -> str:
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _generar_snapshot(codcia, codsuc, codppc, cododc, precarga: bool = False) -> List[Dict[str, Any]]:
+    """
+    En UNA transacción con applock del pedido:
+      - si otro worker ya lo generó -> devolver lo existente,
+      - si no -> SP detalle + carga masiva con pyodbc fast_executemany
+        (arreglo de parámetros en un solo viaje).
+    Un snapshot de la precarga (precarga_hash) se revisa en la primera
+    apertura sin inicio: se precarga mientras el pedido sigue en
+    abastecimiento, y si el SP ya no da lo mismo (Cantidd_abastecida) se
+    rehace con los datos nuevos.
+    Devuelve las filas insertadas sin volver a leer la tabla. RowVer de cada
+    fila = @@DBTS tras el insert (cota superior: versión de partida para deltas).
+    """
+    pedido = (codcia, codsuc, codppc, cododc)
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(_SQL_APPLOCK, (_recurso_pedido(codcia, codsuc, codppc, cododc),
+                                   Config.SNAPSHOT_LOCK_TIMEOUT_MS))
+        if cur.fetchone()[0] < 0:
+            raise TimeoutError(f"No se obtuvo el lock de generación para {codppc}/{cododc}")
+
+        # el cache de estado puede estar atrasado: si ya finalizó (y se archivó)
+        # no se vuelve a generar, se sirve el histórico
+        cur.execute(_SQL_FIN_PEDIDO, pedido)
+        fin = cur.fetchone()
+        if fin and fin[0] is not None:
+            conn.commit()
+            invalidar_estado_pedido(codcia, codsuc, codppc, cododc)
+            return listar_detalle_historico(codcia, codsuc, codppc, cododc)
+
+        cur.execute(_SQL_DETALLE_ACTIVO, pedido)
+        existente = _filas_cursor(cur)
+        revisar = existente and not precarga and fin and fin[1] is None and fin[2] is not None
+        if existente and not revisar:
+            conn.commit()
+            return existente
+
+        data = _ejecutar_sp_detalle(cur, codcia, codsuc, codppc, cododc)
+        if revisar:
+            if _hash_detalle(data) == fin[2].strip():
+                cur.execute(_SQL_PRECARGA_REVISADA, pedido)
+                conn.commit()
+                return existente
+            # sin inicio no hay scans que perder
+            cur.execute(_SQL_BORRAR_DETALLE, pedido)
+        if not data:
+            cur.execute(_SQL_PRECARGA_REVISADA, pedido)
+            conn.commit()
+            return []
+        if precarga:
+            cur.execute(_SQL_BASE_ASIGNACION, pedido + pedido)
+
+        filas = []
+        for row in data:
+            fila = {c: row.get(c) for c in _COLUMNAS_SNAPSHOT}
+            fila["CIA_CODCIA"] = row.get("CIA_CODCIA", codcia)
+            fila["SUC_CODSUC"] = row.get("SUC_CODSUC", codsuc)
+            fila["PPC_NUMPPC"] = row.get("PPC_NUMPPC", codppc)
+            fila["ODC_NUMODC"] = row.get("ODC_NUMODC", cododc)
+            filas.append(fila)
+        # orden de recorrido (Orden_Ruta): se calcula una vez, acá
+        filas = numerar_ruta(filas)
+
+        avance = _avance_filas(filas)
+        estado = "1" if avance["lineas_completas"] >= avance["lineas"] else "0"
+        for f in filas:
+            f["ESTADO"] = estado
+
+        cur.fast_executemany = True
+        with medir_sql("snapshot_insert") as m:
+            cur.executemany(
+                _SQL_INSERT_SNAPSHOT,
+                [tuple(f[c] for c in _COLUMNAS_INSERT_SNAPSHOT) for f in filas]
+            )
+            m["filas"] = len(filas)
+        cur.execute("SELECT CAST(@@DBTS AS BIGINT)")
+        version = cur.fetchone()[0]
+        cur.execute(_SQL_AVANCE_SNAPSHOT, (
+            avance["lineas"], avance["lineas_completas"],
+            avance["unidades_abastecidas"], avance["unidades_escaneadas"],
+            _hash_detalle(data) if precarga else None,
+            codcia, codsuc, codppc, cododc,
+        ))
+
+        conn.commit()  # libera el applock
+    finally:
+        conn.close()
+
+    for f in filas:
+        f["RowVer"] = version
+    return filas
+
+
 def generar_detalle_si_no_existe(codcia, codsuc, codppc, cododc):
     """
     Si ya finalizó: retornar histórico y NO volver a generar detalle.
     Si está activo:
-      - si existe detalle -> devolverlo
-      - si no existe -> generar desde SP e insertar
+      - si existe detalle -> devolverlo (sin inicio, revisando antes el de
+        la precarga contra el SP)
+      - si no existe -> generar desde SP e insertar (carga masiva, un
+        solo generador por pedido aunque lo abran varias tablets)
     """
     # ✅ Si ya está finalizado, siempre servir histórico
     if esta_finalizado(codcia, codsuc, codppc, cododc):
         return listar_detalle_historico(codcia, codsuc, codppc, cododc)
 
-    existente = listar_detalle_tabla(codcia, codsuc, codppc, cododc)
-    if existente:
-        return existente
-
-    data = listar_detalle_sp(codcia, codsuc, codppc, cododc)
-    if not data:
-        return []
-
-    insert_sql = text("""
-        INSERT INTO dbo.PICKING_DETALLE (
-            CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC,
-            ITEM, It_D, L, Cod_Producto_Pedido,
-            Descripcion_pedido, CodigoParte, UM,
-            UE, Indica_Cierre, Cantidad_a_Despachar,
-            Cantidd_abastecida, Caja, Peso_Neto,
-            Cantidad_Scaneada, Diferencia,Ubicacion
-        )
-        VALUES (
-            :CIA_CODCIA, :SUC_CODSUC, :PPC_NUMPPC, :ODC_NUMODC,
-            :ITEM, :It_D, :L, :Cod_Producto_Pedido,
-            :Descripcion_pedido, :CodigoParte, :UM,
-            :UE, :Indica_Cierre, :Cantidad_a_Despachar,
-            :Cantidd_abastecida, :Caja, :Peso_Neto,
-            :Cantidad_Scaneada, :Diferencia,:Ubicacion
-        )
-    """)
+    # iniciado: el snapshot ya no cambia, directo a PICKING_DETALLE. Sin
+    # inicio puede ser de la precarga y se revisa bajo el lock.
+    if tiene_inicio(codcia, codsuc, codppc, cododc):
+        existente = _leer_detalle_activo(codcia, codsuc, codppc, cododc)
+        if existente:
+            return existente
 
-    for row in data:
-        row["CIA_CODCIA"] = row.get("CIA_CODCIA", codcia)
-        row["SUC_CODSUC"] = row.get("SUC_CODSUC", codsuc)
-        row["PPC_NUMPPC"] = row.get("PPC_NUMPPC", codppc)
-        row["ODC_NUMODC"] = row.get("ODC_NUMODC", cododc)
+    with _candados_snapshot.bloquear((codcia, codsuc) + _clave_pedido(codppc, cododc)):
+        return _generar_snapshot(codcia, codsuc, codppc, cododc)
 
 
-    with engine.begin() as conn:
-        conn.execute(insert_sql, data)
+_SQL_HAY_DETALLE = """
+    SELECT TOP 1 1
+    FROM dbo.PICKING_DETALLE
+    WHERE CIA_CODCIA = ?
+      AND SUC_CODSUC = ?
+      AND PPC_NUMPPC = ?
+      AND ODC_NUMODC = ?
+"""
+
+
+def precargar_detalle(codcia, codsuc, codppc, cododc) -> str:
+    """
+    Para la precarga en segundo plano (precarga.py): genera el snapshot si
+    falta, sin leer las líneas si ya existe.
+    Devuelve "generado" | "existente" | "finalizado".
+    """
+    if esta_finalizado(codcia, codsuc, codppc, cododc):
+        return "finalizado"
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(_SQL_HAY_DETALLE, (codcia, codsuc, codppc, cododc))
+        existe = cur.fetchone() is not None
+        conn.commit()
+    finally:
+        conn.close()
+    if existe:
+        return "existente"
 
-    return listar_detalle_tabla(codcia, codsuc, codppc, cododc)
+    with _candados_snapshot.bloquear((codcia, codsuc) + _clave_pedido(codppc, cododc)):
+        _generar_snapshot(codcia, codsuc, codppc, cododc, precarga=True)
+    return "generado"
 
 
 def terminar_detalle(codcia, codsuc, codppc, cododc):
-    """Borra SOLO el detalle de ese despacho de PICKING_DETALLE."""
+    """Borra SOLO el detalle de ese despacho de PICKING_DETALLE (y sus etiquetas)."""
     with engine.begin() as conn:
         conn.execute(text("""
             DELETE FROM dbo.PICKING_DETALLE
             WHERE CIA_CODCIA = :CIA_CODCIA
               AND SUC_CODSUC = :SUC_CODSUC
               AND PPC_NUMPPC = :PPC_NUMPPC
-              AND ODC_NUMODC = :ODC_NUMODC
+              AND ODC_NUMODC = :ODC_NUMODC;
+
+            DELETE FROM dbo.PICKING_SCAN_ETIQUETA
+            WHERE CIA_CODCIA = :CIA_CODCIA
+              AND SUC_CODSUC = :SUC_CODSUC
+              AND PPC_NUMPPC = :PPC_NUMPPC
+              AND ODC_NUMODC = :ODC_NUMODC;
+
+            UPDATE dbo.PICKING_ASIGNACION
+            SET detalle_ver = detalle_ver + 1,
+                lineas_total = NULL,
+                lineas_completas = NULL,
+                unidades_abastecidas = NULL,
+                unidades_escaneadas = NULL,
+                precarga_hash = NULL
+            WHERE CIA_CODCIA = :CIA_CODCIA
+              AND SUC_CODSUC = :SUC_CODSUC
+              AND PPC_NUMPPC = :PPC_NUMPPC
+              AND ODC_NUMODC = :ODC_NUMODC;
         """), {
             "CIA_CODCIA": codcia,
             "SUC_CODSUC": codsuc,
@@ -227,101 +912,537 @@ def terminar_detalle(codcia, codsuc, codppc, cododc):
             "ODC_NUMODC": cododc,
         })
 
+    _olvidar_etiquetas(codcia, codsuc, codppc, cododc)
+
 
 # =========================================================
-# ESCANEO (ya lo tenías)
+# ARCHIVADO (PICKING_DETALLE -> PICKING_HISTORICO)
 # =========================================================
-def actualizar_scan(codcia, codsuc, codppc, cododc, codprod, cantidad_sumar):
+# Mismo applock que la generación del snapshot: no se archiva un pedido
+# mientras otro worker lo está generando (ni al revés).
+# Copia también ESTADO. Una línea que ya estaba en el histórico se
+# sobrescribe con la del detalle (gana el último archivado) en vez de
+# saltearse: UPDATE + INSERT de las que faltan, bajo el applock.
+_COLUMNAS_HISTORICO = _COLUMNAS_INSERT_SNAPSHOT
+_CLAVE_HISTORICO = ("CIA_CODCIA", "SUC_CODSUC", "PPC_NUMPPC", "ODC_NUMODC", "ITEM")
+
+_SQL_ARCHIVAR = f"""
+-- picking:archivar_pedido
+SET NOCOUNT ON;
+DECLARE @r INT, @n INT;
+EXEC @r = sp_getapplock
+     @Resource = :recurso,
+     @LockMode = 'Exclusive',
+     @LockOwner = 'Transaction',
+     @LockTimeout = :timeout;
+IF @r < 0
+    THROW 51000, 'No se obtuvo el lock del pedido para archivar.', 1;
+
+UPDATE h
+SET {', '.join(f'{c} = d.{c}' for c in _COLUMNAS_HISTORICO if c not in _CLAVE_HISTORICO)}
+FROM dbo.PICKING_HISTORICO h
+JOIN dbo.PICKING_DETALLE d
+  ON d.CIA_CODCIA = h.CIA_CODCIA AND d.SUC_CODSUC = h.SUC_CODSUC
+ AND d.PPC_NUMPPC = h.PPC_NUMPPC AND d.ODC_NUMODC = h.ODC_NUMODC
+ AND d.ITEM = h.ITEM
+WHERE d.CIA_CODCIA = :cia AND d.SUC_CODSUC = :suc
+  AND d.PPC_NUMPPC = :ppc AND d.ODC_NUMODC = :odc;
+SET @n = @@ROWCOUNT;
+
+INSERT INTO dbo.PICKING_HISTORICO ({', '.join(_COLUMNAS_HISTORICO)})
+SELECT {', '.join('d.' + c for c in _COLUMNAS_HISTORICO)}
+FROM dbo.PICKING_DETALLE d
+WHERE d.CIA_CODCIA = :cia AND d.SUC_CODSUC = :suc
+  AND d.PPC_NUMPPC = :ppc AND d.ODC_NUMODC = :odc
+  AND NOT EXISTS (
+      SELECT 1 FROM dbo.PICKING_HISTORICO h
+      WHERE h.CIA_CODCIA = d.CIA_CODCIA AND h.SUC_CODSUC = d.SUC_CODSUC
+        AND h.PPC_NUMPPC = d.PPC_NUMPPC AND h.ODC_NUMODC = d.ODC_NUMODC
+        AND h.ITEM = d.ITEM
+  );
+SET @n += @@ROWCOUNT;
+
+DELETE FROM dbo.PICKING_DETALLE
+WHERE CIA_CODCIA = :cia AND SUC_CODSUC = :suc
+  AND PPC_NUMPPC = :ppc AND ODC_NUMODC = :odc;
+
+DELETE FROM dbo.PICKING_SCAN_ETIQUETA
+WHERE CIA_CODCIA = :cia AND SUC_CODSUC = :suc
+  AND PPC_NUMPPC = :ppc AND ODC_NUMODC = :odc;
+
+UPDATE dbo.PICKING_ASIGNACION
+SET detalle_ver = detalle_ver + 1
+WHERE CIA_CODCIA = :cia AND SUC_CODSUC = :suc
+  AND PPC_NUMPPC = :ppc AND ODC_NUMODC = :odc;
+
+SELECT @n;
+"""
+
+
+def _archivar_pedido(conn, codcia, codsuc, codppc, cododc) -> int:
+    """
+    Mueve las líneas del pedido a PICKING_HISTORICO y las borra de
+    PICKING_DETALLE (y su registro de etiquetas) dentro de la transacción
+    de `conn`. Devuelve cuántas líneas se escribieron en el histórico
+    (insertadas o sobrescritas).
+    """
+    return conn.execute(text(_SQL_ARCHIVAR), {
+        "recurso": _recurso_pedido(codcia, codsuc, codppc, cododc),
+        "timeout": Config.SNAPSHOT_LOCK_TIMEOUT_MS,
+        "cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc,
+    }).scalar() or 0
+
+
+_SQL_PEDIDOS_A_COMPACTAR = """
+    SELECT DISTINCT TOP (:n)
+           d.CIA_CODCIA, d.SUC_CODSUC, d.PPC_NUMPPC, d.ODC_NUMODC
+    FROM dbo.PICKING_DETALLE d
+    JOIN dbo.PICKING_ASIGNACION a
+      ON a.CIA_CODCIA = d.CIA_CODCIA AND a.SUC_CODSUC = d.SUC_CODSUC
+     AND a.PPC_NUMPPC = d.PPC_NUMPPC AND a.ODC_NUMODC = d.ODC_NUMODC
+    WHERE a.fin_dt IS NOT NULL
+"""
+
+
+def compactar_detalle_finalizado(max_pedidos: int = None) -> int:
     """
-    Suma cantidad_sumar a Cantidad_Scaneada SIN permitir sobrepicking.
-    Además, actualiza ESTADO:
-      - '1' si completo,
-      - '0' si pendiente.
+    Tarea de fondo: archiva pedidos ya finalizados que siguen en
+    PICKING_DETALLE (finalizados antes de existir el archivado en el FIN,
+    o cuyo archivado falló). Un pedido por transacción para no retener
+    locks largos. Devuelve cuántos pedidos archivó.
     """
+    max_pedidos = max_pedidos or Config.COMPACTACION_LOTE
+
     with engine.begin() as conn:
-        row = conn.execute(text("""
-            SELECT Cantidad_Scaneada, Cantidd_abastecida
-            FROM PICKING_DETALLE
-            WHERE CIA_CODCIA = :cia
-              AND SUC_CODSUC = :suc
-              AND PPC_NUMPPC = :ppc
-              AND ODC_NUMODC = :odc
-              AND Cod_Producto_Pedido = :codprod
-        """), {
-            "cia": codcia,
-            "suc": codsuc,
-            "ppc": codppc,
-            "odc": cododc,
-            "codprod": codprod,
-        }).mappings().first()
+        pedidos = conn.execute(text(_SQL_PEDIDOS_A_COMPACTAR), {"n": int(max_pedidos)}).fetchall()
 
-        if not row:
-            return 0, "no_encontrado"
+    archivados = 0
+    for cia, suc, ppc, odc in pedidos:
+        with engine.begin() as conn:
+            _archivar_pedido(conn, cia, suc, ppc, odc)
+        _olvidar_etiquetas(cia, suc, ppc, odc)
+        archivados += 1
+    return archivados
 
-        actual_raw     = row["Cantidad_Scaneada"]
-        abastecida_raw = row["Cantidd_abastecida"]
 
-        actual     = float(actual_raw) if actual_raw is not None else 0.0
-        abastecida = float(abastecida_raw) if abastecida_raw is not None else 0.0
-        cantidad   = float(cantidad_sumar)
+# =========================================================
+# ESCANEO
+# =========================================================
+# Un solo batch (un viaje a SQL Server, una transacción) para 1..N lecturas:
+#   1) valida INICIO,
+#   2) descarta etiquetas (QR) ya registradas en PICKING_SCAN_ETIQUETA,
+#   3) por cada lectura suma con UPDLOCK sobre la línea y el tope de abastecida
+#      en el mismo UPDATE (dos pistolas sobre el mismo pedido ya no se pisan).
+#      Si el producto está en varias líneas, la lectura va a UNA sola: la
+#      primera por ITEM donde entra sin pasar lo abastecido. (El UPDATE
+#      original escribía en todas las líneas del producto el total de la
+#      primera + la cantidad: una unidad contaba en cada línea.)
+#      Las cantidades llegan siempre > 0 (routes._cantidad_valida),
+#   4) lleva el avance del pedido en PICKING_ASIGNACION (líneas completas y
+#      unidades: suma lo que cambió, sin contar PICKING_DETALLE) y reescribe
+#      ESTADO solo cuando el pedido pasa a completo,
+#   5) devuelve: resultado por lectura, líneas modificadas (o todo lo cambiado
+#      desde la versión del cliente) y totales (el avance) + versión del pedido.
+_SQL_SCAN_CABECERA = """
+-- picking:scan_lote
+SET NOCOUNT ON;
+DECLARE @cia NVARCHAR(10) = ?, @suc NVARCHAR(10) = ?,
+        @ppc NVARCHAR(30) = ?, @odc NVARCHAR(30) = ?,
+        @desde BIGINT = ?;
+DECLARE @items TABLE (n INT PRIMARY KEY, prod NVARCHAR(60), cant DECIMAL(18,4), etiqueta NVARCHAR(100));
+DECLARE @res TABLE (n INT PRIMARY KEY, motivo VARCHAR(20));
+DECLARE @tocados TABLE (item NVARCHAR(50) PRIMARY KEY);
+DECLARE @n INT = 1, @total INT, @prod NVARCHAR(60), @cant DECIMAL(18,4),
+        @etiqueta NVARCHAR(100), @motivo VARCHAR(20), @item NVARCHAR(50),
+        @aplicados INT = 0, @antes DECIMAL(18,4), @abast DECIMAL(18,4),
+        @d_lineas INT = 0, @d_unidades DECIMAL(18,4) = 0,
+        @lineas INT, @completas INT, @abastecidas DECIMAL(18,4), @escaneadas DECIMAL(18,4),
+        @estado CHAR(1);
+"""
+
+_SQL_SCAN_CUERPO = """
+SELECT @total = COUNT(*) FROM @items;
+
+IF NOT EXISTS (
+    SELECT 1
+    FROM dbo.PICKING_ASIGNACION
+    WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+      AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+      AND inicio_dt IS NOT NULL
+)
+    INSERT INTO @res (n, motivo) SELECT n, 'sin_inicio' FROM @items;
+ELSE
+BEGIN
+    WHILE @n <= @total
+    BEGIN
+        SELECT @prod = prod, @cant = cant, @etiqueta = etiqueta FROM @items WHERE n = @n;
+        SET @item = NULL;
+
+        -- etiqueta (QR) ya registrada en el pedido: no se vuelve a sumar
+        IF @etiqueta IS NOT NULL AND EXISTS (
+            SELECT 1
+            FROM dbo.PICKING_SCAN_ETIQUETA WITH (UPDLOCK, HOLDLOCK)
+            WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+              AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+              AND ETIQUETA=@etiqueta
+        )
+        BEGIN
+            INSERT INTO @res (n, motivo) VALUES (@n, 'duplicado');
+            SET @n += 1;
+            CONTINUE;
+        END
+
+        ;WITH objetivo AS (
+            SELECT TOP (1) *
+            FROM dbo.PICKING_DETALLE WITH (UPDLOCK, ROWLOCK)
+            WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+              AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+              AND Cod_Producto_Pedido=@prod
+              AND ISNULL(Cantidad_Scaneada,0) + @cant <= ISNULL(Cantidd_abastecida,0)
+            ORDER BY ITEM
+        )
+        UPDATE objetivo
+        SET @item = CAST(ITEM AS NVARCHAR(50)),
+            @antes = ISNULL(Cantidad_Scaneada,0),
+            @abast = ISNULL(Cantidd_abastecida,0),
+            Cantidad_Scaneada = ISNULL(Cantidad_Scaneada,0) + @cant,
+            Diferencia = ISNULL(Cantidad_Scaneada,0) + @cant - ISNULL(Cantidd_abastecida,0);
+
+        IF @@ROWCOUNT = 0
+            SET @motivo = CASE WHEN EXISTS (
+                    SELECT 1
+                    FROM dbo.PICKING_DETALLE
+                    WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+                      AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+                      AND Cod_Producto_Pedido=@prod
+                ) THEN 'sobrepicking' ELSE 'no_encontrado' END;
+        ELSE
+        BEGIN
+            SET @motivo = 'ok';
+            SET @aplicados += 1;
+            SET @d_unidades += @cant;
+            -- la línea pasa a "completa"
+            IF @antes < @abast AND @antes + @cant >= @abast
+                SET @d_lineas += 1;
+            IF NOT EXISTS (SELECT 1 FROM @tocados WHERE item = @item)
+                INSERT INTO @tocados (item) VALUES (@item);
+
+            IF @etiqueta IS NOT NULL
+                INSERT INTO dbo.PICKING_SCAN_ETIQUETA (
+                    CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC,
+                    ETIQUETA, Cod_Producto_Pedido, Cantidad, fecha
+                )
+                VALUES (@cia, @suc, @ppc, @odc, @etiqueta, @prod, @cant, GETDATE());
+        END
+
+        INSERT INTO @res (n, motivo) VALUES (@n, @motivo);
+        SET @n += 1;
+    END
+END
+
+-- avance del pedido: una fila por PK. Con lecturas aplicadas se suma lo que
+-- cambió (y sube el ETag del pedido, version_pedido)
+IF @aplicados > 0
+    UPDATE dbo.PICKING_ASIGNACION
+    SET @lineas = lineas_total,
+        @completas = lineas_completas = lineas_completas + @d_lineas,
+        @abastecidas = unidades_abastecidas,
+        @escaneadas = unidades_escaneadas = unidades_escaneadas + @d_unidades,
+        detalle_ver = detalle_ver + 1
+    WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+      AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc;
+ELSE
+    SELECT @lineas = lineas_total, @completas = lineas_completas,
+           @abastecidas = unidades_abastecidas, @escaneadas = unidades_escaneadas
+    FROM dbo.PICKING_ASIGNACION
+    WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+      AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc;
+
+-- sin inicializar (snapshot anterior a los contadores): se cuenta una vez
+IF @lineas IS NULL
+BEGIN
+    SELECT @lineas = COUNT(*),
+           @completas = ISNULL(SUM(CASE WHEN ISNULL(Cantidad_Scaneada,0) >= ISNULL(Cantidd_abastecida,0) THEN 1 ELSE 0 END), 0),
+           @abastecidas = ISNULL(SUM(ISNULL(Cantidd_abastecida,0)), 0),
+           @escaneadas = ISNULL(SUM(ISNULL(Cantidad_Scaneada,0)), 0)
+    FROM dbo.PICKING_DETALLE
+    WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+      AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc;
+
+    IF @aplicados > 0
+        UPDATE dbo.PICKING_ASIGNACION
+        SET lineas_total = @lineas,
+            lineas_completas = @completas,
+            unidades_abastecidas = @abastecidas,
+            unidades_escaneadas = @escaneadas
+        WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+          AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc;
+
+    -- no se sabe el ESTADO anterior: se normaliza abajo
+    SET @d_lineas = NULL;
+END
+
+-- ESTADO de las líneas = pedido completo; solo se reescribe cuando cambia
+SET @estado = CASE WHEN @completas >= @lineas THEN '1' ELSE '0' END;
+IF @aplicados > 0 AND (
+       @d_lineas IS NULL
+    OR @estado <> CASE WHEN @completas - @d_lineas >= @lineas THEN '1' ELSE '0' END
+)
+    UPDATE dbo.PICKING_DETALLE
+    SET ESTADO = @estado
+    WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+      AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+      AND ISNULL(ESTADO,'') <> @estado;
+
+SELECT n, motivo FROM @res ORDER BY n;
+
+-- sin @desde: solo las líneas escaneadas; con @desde: todo lo cambiado desde esa versión
+SELECT *
+FROM dbo.PICKING_DETALLE
+WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+  AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+  AND (
+        (@desde IS NULL AND CAST(ITEM AS NVARCHAR(50)) IN (SELECT item FROM @tocados))
+     OR (@desde IS NOT NULL AND RowVer > CAST(@desde AS BINARY(8)))
+  )
+ORDER BY Orden_Ruta ASC, Ubicacion ASC;
+
+SELECT
+    ISNULL((
+        SELECT CAST(MAX(RowVer) AS BIGINT)
+        FROM dbo.PICKING_DETALLE
+        WHERE CIA_CODCIA=@cia AND SUC_CODSUC=@suc
+          AND PPC_NUMPPC=@ppc AND ODC_NUMODC=@odc
+    ), 0) AS version,
+    @lineas AS lineas,
+    @completas AS lineas_completas,
+    @abastecidas AS unidades_abastecidas,
+    @escaneadas AS unidades_escaneadas;
+"""
+
+
+@lru_cache(maxsize=None)
+def _sql_scan(n_items: int) -> str:
+    """Batch de scan para n lecturas (mismo texto para el mismo n -> plan reutilizable)."""
+    valores = ", ".join(["(?, ?, ?, ?)"] * n_items)
+    return (
+        _SQL_SCAN_CABECERA
+        + f"INSERT INTO @items (n, prod, cant, etiqueta) VALUES {valores};\n"
+        + _SQL_SCAN_CUERPO
+    )
 
-        nuevo_total = actual + cantidad
 
-        if nuevo_total > abastecida:
-            return 0, "sobrepicking"
+# Etiquetas ya aplicadas (por pedido) que este proceso conoce: los reintentos
+# y dobles lecturas se rechazan sin ir a BD. La tabla PICKING_SCAN_ETIQUETA
+# sigue siendo la verdad (otros workers, reinicios).
+_etiquetas_vistas = CachePorSede(Config.ETIQUETAS_CACHE_TTL, max_items=Config.ETIQUETAS_CACHE_MAX)
 
-        conn.execute(text("""
-            UPDATE PICKING_DETALLE
-            SET 
-                Cantidad_Scaneada = :nuevo,
-                Diferencia = :nuevo - ISNULL(Cantidd_abastecida, 0)
-            WHERE CIA_CODCIA = :cia
-              AND SUC_CODSUC = :suc
-              AND PPC_NUMPPC = :ppc
-              AND ODC_NUMODC = :odc
-              AND Cod_Producto_Pedido = :codprod
-        """), {
-            "nuevo": nuevo_total,
-            "cia": codcia,
-            "suc": codsuc,
-            "ppc": codppc,
-            "odc": cododc,
-            "codprod": codprod,
-        })
 
-        pendientes = conn.execute(text("""
-            SELECT COUNT(*) AS pendientes
-            FROM PICKING_DETALLE
-            WHERE CIA_CODCIA = :cia
-              AND SUC_CODSUC = :suc
-              AND PPC_NUMPPC = :ppc
-              AND ODC_NUMODC = :odc
-              AND ISNULL(Cantidad_Scaneada,0) < ISNULL(Cantidd_abastecida,0)
-        """), {
-            "cia": codcia,
-            "suc": codsuc,
-            "ppc": codppc,
-            "odc": cododc,
-        }).scalar()
+def _clave_etiqueta(codcia, codsuc, codppc, cododc, etiqueta):
+    return (codcia, codsuc) + _clave_pedido(codppc, cododc) + (str(etiqueta).strip(),)
 
-        nuevo_estado = '1' if pendientes == 0 else '0'
 
-        conn.execute(text("""
-            UPDATE PICKING_DETALLE
-            SET ESTADO = :estado
-            WHERE CIA_CODCIA = :cia
-              AND SUC_CODSUC = :suc
-              AND PPC_NUMPPC = :ppc
-              AND ODC_NUMODC = :odc
-        """), {
-            "estado": nuevo_estado,
-            "cia": codcia,
-            "suc": codsuc,
-            "ppc": codppc,
-            "odc": cododc,
+def _olvidar_etiquetas(codcia, codsuc, codppc, cododc):
+    pedido = (codcia, codsuc) + _clave_pedido(codppc, cododc)
+    _etiquetas_vistas.invalidar(lambda k: k[:4] == pedido)
+
+
+def actualizar_scan_lote(
+    codcia, codsuc, codppc, cododc, items: List[Dict[str, Any]],
+    desde_version: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Aplica varias lecturas, en orden, en UNA transacción (ver _SQL_SCAN_CUERPO).
+    items: [{"codprod", "cantidad", "etiqueta"}] ya validados (máx. SCAN_LOTE_MAX).
+
+    Devuelve:
+      {"resultados": [{"codprod", "etiqueta", "motivo"}],  # motivo por lectura:
+                      # ok | sin_inicio | no_encontrado | sobrepicking | duplicado
+       "lineas": [...],   # líneas escaneadas, o lo cambiado desde desde_version
+       "version": int,    # mayor RowVer del pedido (None si no se fue a BD)
+       "totales": {lineas, lineas_completas, unidades_abastecidas, unidades_escaneadas}}
+    """
+    desde = int(desde_version) if desde_version is not None else None
+
+    resultados = []
+    for it in items:
+        etiqueta = (str(it.get("etiqueta") or "").strip() or None)
+        it["etiqueta"] = etiqueta
+        vista = etiqueta and _etiquetas_vistas.contiene(
+            _clave_etiqueta(codcia, codsuc, codppc, cododc, etiqueta)
+        )
+        resultados.append({
+            "codprod": it["codprod"],
+            "etiqueta": etiqueta,
+            "motivo": "duplicado" if vista else None,
         })
 
-        return 1, "ok"
+    # solo viaja a BD lo que no se sabe duplicado
+    enviar = [it for it, res in zip(items, resultados) if res["motivo"] is None]
+    if not enviar:
+        return {"resultados": resultados, "lineas": [], "version": None, "totales": None}
+
+    params = [codcia, codsuc, codppc, cododc, desde]
+    for n, it in enumerate(enviar, start=1):
+        params += [n, it["codprod"], float(it["cantidad"]), it["etiqueta"]]
+
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        with medir_sql("scan_lote") as m:
+            cur.execute(_sql_scan(len(enviar)), params)
+
+            motivos = [r["motivo"] for r in _filas_cursor(cur)]
+            cur.nextset()
+            lineas = _filas_cursor(cur)
+            cur.nextset()
+            totales = _filas_cursor(cur)[0]
+            m["filas"] = len(lineas)
+
+        conn.commit()
+    finally:
+        conn.close()
+
+    motivos = iter(motivos)
+    for res in resultados:
+        if res["motivo"] is None:
+            res["motivo"] = next(motivos)
+        if res["etiqueta"] and res["motivo"] in ("ok", "duplicado"):
+            _etiquetas_vistas.poner(
+                _clave_etiqueta(codcia, codsuc, codppc, cododc, res["etiqueta"]), True
+            )
+
+    version = totales.pop("version")
+    if any(r["motivo"] == "ok" for r in resultados):
+        publicar_evento(
+            "scan", codcia, codsuc, codppc, cododc,
+            version=version, totales=totales
+        )
+    return {
+        "resultados": resultados,
+        "lineas": lineas,
+        "version": version,
+        "totales": totales,
+    }
+
+
+def actualizar_scan(
+    codcia, codsuc, codppc, cododc, codprod, cantidad_sumar,
+    desde_version: Optional[int] = None, etiqueta: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Suma cantidad_sumar a Cantidad_Scaneada SIN permitir sobrepicking
+    (una lectura = lote de 1).
+
+    Devuelve:
+      {"motivo": "ok" | "sin_inicio" | "no_encontrado" | "sobrepicking",
+       "lineas": [...], "version": int, "totales": {...}}
+    """
+    r = actualizar_scan_lote(
+        codcia, codsuc, codppc, cododc,
+        [{"codprod": codprod, "cantidad": cantidad_sumar, "etiqueta": etiqueta}],
+        desde_version=desde_version
+    )
+    return {
+        "motivo": r["resultados"][0]["motivo"],
+        "lineas": r["lineas"],
+        "version": r["version"],
+        "totales": r["totales"],
+    }
+
+
+def _consultar_cabecera_puntual(codcia, codsuc, codppc, cododc) -> Optional[Dict[str, Any]]:
+    """
+    Consulta de UN pedido (DESPACHOS_SQL_CABECERA) para cuando no está indexado.
+    Debe devolver las mismas columnas que el SP. Si no está configurada -> None.
+    """
+    if not Config.DESPACHOS_SQL_CABECERA:
+        return None
+
+    with engine.begin() as conn:
+        r = conn.execute(text(Config.DESPACHOS_SQL_CABECERA), {
+            "cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc
+        }).mappings().first()
+        return dict(r) if r else None
+
+
+def _pedido_existe(codcia, codsuc, codppc, cododc) -> bool:
+    """
+    ¿Existe el pedido? Consulta de UN pedido: su snapshot en PICKING_DETALLE
+    o, si no tiene, el SP de detalle (por pedido, no el listado de 4 meses).
+    Un pedido sin líneas tampoco tiene nada que preparar.
+    """
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(_SQL_HAY_DETALLE, (codcia, codsuc, codppc, cododc))
+        existe = cur.fetchone() is not None
+        if not existe:
+            existe = bool(_ejecutar_sp_detalle(cur, codcia, codsuc, codppc, cododc))
+        conn.commit()
+    finally:
+        conn.close()
+    return existe
+
+
+# Pedidos buscados que no aparecieron: un número mal tipeado en la tablet no
+# vuelve a ir al ERP (ni a refrescar el listado) en cada reintento.
+_cabeceras_ausentes = CachePorSede(Config.CABECERA_AUSENTE_TTL, max_items=Config.CABECERA_AUSENTE_MAX)
+
+
+def buscar_fila_despacho(codcia, codsuc, codppc, cododc) -> Optional[Dict[str, Any]]:
+    """
+    Fila del SP de despachos para un pedido, vía índice (ppc, odc):
+      1) índices de los listados ya cacheados de esa cia/suc (sin tocar BD),
+      2) ausente hace poco -> None sin tocar BD,
+      3) consulta puntual del pedido (si está configurada),
+      4) si el pedido existe (_pedido_existe), SP de los últimos 4 meses
+         (compartido con el listado por defecto).
+    Lo que no se encuentra queda como ausente CABECERA_AUSENTE_TTL segundos.
+    """
+    clave = _clave_pedido(codppc, cododc)
+
+    for res in _cache_despachos.vigentes(lambda k: k[0] == codcia and k[1] == codsuc):
+        fila = res["indice"].get(clave)
+        if fila:
+            return fila
+
+    clave_ausente = (codcia, codsuc) + clave
+    if _cabeceras_ausentes.contiene(clave_ausente):
+        return None
+
+    fila = _consultar_cabecera_puntual(codcia, codsuc, codppc, cododc)
+    if fila:
+        return fila
+
+    if _pedido_existe(codcia, codsuc, *clave):
+        per_ini, per_fin = _periodos_por_defecto_4_meses()
+        clave_cache = (codcia, codsuc, per_ini, per_fin)
+        # si el listado por defecto ya estaba cacheado y no lo tiene, puede ser
+        # un pedido nuevo: se fuerza una lectura fresca del SP
+        _cache_despachos.invalidar(lambda k: k == clave_cache)
+        fila = _despachos_cacheados(codcia, codsuc, per_ini, per_fin)["indice"].get(clave)
+        if fila:
+            return fila
+
+    _cabeceras_ausentes.poner(clave_ausente, True)
+    return None
+
+
+def version_cabecera(codcia, codsuc, codppc, cododc) -> Optional[str]:
+    """
+    Token (ETag) de la cabecera: version_pedido + hash de la fila del ERP
+    (cliente, dirección, estado... cambian sin tocar PICKING_ASIGNACION).
+    None si falta cualquiera de las dos.
+    """
+    fila = buscar_fila_despacho(codcia, codsuc, codppc, cododc)
+    version = version_pedido(codcia, codsuc, codppc, cododc)
+    if not fila or not version:
+        return None
+    sello = hashlib.sha1(
+        json.dumps(fila, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    return f"{version}-{sello[:16]}"
 
 
 def obtener_cabecera_pedido(
@@ -329,18 +1450,7 @@ def obtener_cabecera_pedido(
     usuario_id: Optional[str] = None   # 👈 nuevo
 ) -> Optional[Dict[str, Any]]:
 
-    data, _ = listar_despachos_sp(
-        codcia=codcia, codsuc=codsuc,
-        fecha_desde=None, fecha_hasta=None,
-        page=1, page_size=5000
-    )
-
-    fila = None
-    for r in data:
-        if str(r.get("ppc_numppc", "")).strip() == str(codppc).strip() and \
-           str(r.get("odc_numodc", "")).strip() == str(cododc).strip():
-            fila = r
-            break
+    fila = buscar_fila_despacho(codcia, codsuc, codppc, cododc)
 
     if not fila:
         return None
@@ -413,6 +1523,7 @@ def obtener_cabecera_pedido(
             })
 
         # refrescar
+        invalidar_estado_pedido(codcia, codsuc, codppc, cododc)
         asi = obtener_asignacion(codcia, codsuc, codppc, cododc)
 
     cab.update({
@@ -426,29 +1537,15 @@ def obtener_cabecera_pedido(
     })
     return cab
 
-from sqlalchemy import text
-from ..db import engine
 
 def listar_usuarios_preparacion(codcia="01"):
-    with engine.begin() as conn:
-        r = conn.execute(text("""
-            SELECT
-              a.aux_codaux AS CODIGO,
-              LEFT(a.aux_nomaux, 60) AS NOMBRE
-            FROM STROBBE_V13.dbo.V_Auxiliares a
-            WHERE a.cia_codcia = :codcia
-              AND a.aux_indest = '1'
-              AND a.aux_indemp = '1'
-              AND a.aux_codaux IN (
-                  SELECT x.aux_codaux
-                  FROM STROBBE_V13.dbo.TRABAJADOR_USUARIO_TRU x
-                  WHERE x.cia_codcia = :codcia
-                    AND x.tru_predes = 1
-              )
-            ORDER BY LEFT(a.aux_nomaux, 60)
-        """), {"codcia": codcia})
-
-        return [dict(row) for row in r.mappings()]
+    """Preparadores activos [{CODIGO, NOMBRE}] desde el directorio en memoria."""
+    return listar_preparadores(codcia)
+
+
+def version_usuarios_preparacion(codcia="01") -> str:
+    """ETag de la lista de preparadores (cambia solo si cambia la lista)."""
+    return obtener_directorio(codcia)["etag"]
 
 def _fmt_hhmmss(segundos: int) -> str:
     if segundos is None:
@@ -484,99 +1581,68 @@ def marcar_inicio_preparacion(codcia, codsuc, codppc, cododc):
         """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc})
 
         # 2) ✅ VALIDAR preparado_cod
-        preparado_cod = conn.execute(text("""
-            SELECT NULLIF(LTRIM(RTRIM(preparado_cod)), '') AS preparado_cod
+        row = conn.execute(text("""
+            SELECT NULLIF(LTRIM(RTRIM(preparado_cod)), '') AS preparado_cod, fin_dt
             FROM dbo.PICKING_ASIGNACION
             WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
               AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
+        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).mappings().first()
 
-        if not preparado_cod:
+        # finalizado = detalle ya archivado: reiniciar regeneraría el snapshot
+        # y perdería lo escaneado
+        if row["fin_dt"] is not None:
+            return {"ok": False, "msg": "El pedido ya fue finalizado: no se puede iniciar de nuevo."}
+
+        if not row["preparado_cod"]:
             # 👇 importante: NO actualiza inicio_dt
             return {"ok": False, "msg": "Debe seleccionar PREPARADO POR antes de iniciar."}
 
         # 3) actualizar inicio (solo si pasó validación)
-        conn.execute(text("""
+        res = conn.execute(text("""
             UPDATE dbo.PICKING_ASIGNACION
             SET inicio_dt = GETDATE(),
-                fin_dt = NULL,
-                tprep_min = NULL,
                 updated_at = GETDATE()
             WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
               AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
+              AND fin_dt IS NULL
         """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc})
 
-        return {"ok": True, "msg": "Inicio OK"}
-
+        if res.rowcount == 0:
+            # un FIN entró entre la lectura y el UPDATE
+            return {"ok": False, "msg": "El pedido ya fue finalizado: no se puede iniciar de nuevo."}
 
+    # ya con commit: el SP ve el nuevo estado
+    invalidar_estado_pedido(codcia, codsuc, codppc, cododc)
+    invalidar_cache_despachos(codcia, codsuc)
+    publicar_evento("inicio", codcia, codsuc, codppc, cododc)
+    return {"ok": True, "msg": "Inicio OK"}
 
 
-'''def marcar_fin_preparacion(codcia, codsuc, codppc, cododc):
+def marcar_fin_preparacion(codcia, codsuc, codppc, cododc):
     with engine.begin() as conn:
 
-        # ✅ 1) validar pendientes
-        pendientes = conn.execute(text("""
-            SELECT COUNT(*) AS pendientes
-            FROM dbo.PICKING_DETALLE
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-              AND ISNULL(Cantidad_Scaneada,0) <> ISNULL(Cantidd_abastecida,0)
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
-
-        if pendientes and int(pendientes) > 0:
-            return {"ok": False, "msg": f"No se puede finalizar: faltan {pendientes} ítems por completar."}
-
-        # ✅ 2) validar inicio existe (tu lógica actual)
         row = conn.execute(text("""
-            SELECT inicio_dt
+            SELECT inicio_dt, lineas_total, lineas_completas
             FROM dbo.PICKING_ASIGNACION
             WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
               AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
         """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).mappings().first()
 
-        if not row or row["inicio_dt"] is None:
-            return {"ok": False, "msg": "No existe inicio", "tprep_min": None}
-
-        # ✅ 3) finalizar y calcular tiempo
-        conn.execute(text("""
-            UPDATE dbo.PICKING_ASIGNACION
-            SET fin_dt = GETDATE(),
-                tprep_min = CAST(DATEDIFF(SECOND, inicio_dt, GETDATE()) / 60.0 AS DECIMAL(10,2)),
-                updated_at = GETDATE()
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc})
-
-        mins = conn.execute(text("""
-            SELECT tprep_min
-            FROM dbo.PICKING_ASIGNACION
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
-
-        return {"ok": True, "msg": "Fin OK", "tprep_min": mins}
-'''
-def marcar_fin_preparacion(codcia, codsuc, codppc, cododc):
-    with engine.begin() as conn:
-
-        pendientes = conn.execute(text("""
-            SELECT COUNT(*) AS pendientes
-            FROM dbo.PICKING_DETALLE
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-              AND ISNULL(Cantidad_Scaneada,0) <> ISNULL(Cantidd_abastecida,0)
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
+        # avance mantenido por el scan; sin inicializar -> se cuenta
+        if row and row["lineas_total"] is not None:
+            pendientes = row["lineas_total"] - row["lineas_completas"]
+        else:
+            pendientes = conn.execute(text("""
+                SELECT COUNT(*) AS pendientes
+                FROM dbo.PICKING_DETALLE
+                WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
+                  AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
+                  AND ISNULL(Cantidad_Scaneada,0) <> ISNULL(Cantidd_abastecida,0)
+            """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
 
         if pendientes and int(pendientes) > 0:
             return {"ok": False, "msg": f"No se puede finalizar: faltan {pendientes} ítems por completar."}
 
-        row = conn.execute(text("""
-            SELECT inicio_dt
-            FROM dbo.PICKING_ASIGNACION
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).mappings().first()
-
         if not row or row["inicio_dt"] is None:
             return {"ok": False, "msg": "No existe inicio"}
 
@@ -599,7 +1665,14 @@ def marcar_fin_preparacion(codcia, codsuc, codppc, cododc):
               AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
         """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).mappings().first()
 
-        return {"ok": True, "msg": "Fin OK", "fin_dt": cab["fin_dt"], "tprep_min": cab["tprep_min"]}
+        # mismo commit que el FIN: el detalle pasa al histórico
+        _archivar_pedido(conn, codcia, codsuc, codppc, cododc)
+
+    _olvidar_etiquetas(codcia, codsuc, codppc, cododc)
+    invalidar_estado_pedido(codcia, codsuc, codppc, cododc)
+    invalidar_cache_despachos(codcia, codsuc)
+    publicar_evento("fin", codcia, codsuc, codppc, cododc, tprep_min=cab["tprep_min"])
+    return {"ok": True, "msg": "Fin OK", "fin_dt": cab["fin_dt"], "tprep_min": cab["tprep_min"]}
 
 def _fmt_dt_lima(dt) -> Optional[str]:
     """Convierte datetime -> 'YYYY-MM-DD HH:MM:SS' (hora tal cual viene de SQL Server)."""
@@ -610,48 +1683,22 @@ def _fmt_dt_lima(dt) -> Optional[str]:
     return str(dt)
 
 def obtener_asignacion(codcia, codsuc, codppc, cododc):
-    with engine.begin() as conn:
-        r = conn.execute(text("""
-            SELECT
-              registrado_cod, registrado_nom,
-              preparado_cod,  preparado_nom,
-              inicio_dt, fin_dt, tprep_min
-            FROM dbo.PICKING_ASIGNACION
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {
-            "cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc
-        }).mappings().first()
+    r = obtener_estado_pedido(codcia, codsuc, codppc, cododc)
+    if not r:
+        return {}
 
-        if not r:
-            return {}
-
-        d = dict(r)
-        d["inicio_dt"] = _fmt_dt_lima(d.get("inicio_dt"))
-        d["fin_dt"]    = _fmt_dt_lima(d.get("fin_dt"))
-        return d
+    d = dict(r)
+    d["inicio_dt"] = _fmt_dt_lima(d.get("inicio_dt"))
+    d["fin_dt"]    = _fmt_dt_lima(d.get("fin_dt"))
+    return d
 
 
 def obtener_nombre_usuario_erp(codcia, codaux):
     """
     Devuelve el nombre del usuario desde el ERP (STROBBE_V13)
-    usando aux_codaux.
+    usando aux_codaux (directorio en memoria; si no es empleado, consulta).
     """
-    if not codaux:
-        return None
-
-    with engine.begin() as conn:
-        r = conn.execute(text("""
-            SELECT TOP 1 LEFT(a.aux_nomaux, 60) AS NOMBRE
-            FROM STROBBE_V13.dbo.V_Auxiliares a
-            WHERE a.cia_codcia = :codcia
-              AND a.aux_codaux = :codaux
-        """), {
-            "codcia": codcia,
-            "codaux": codaux
-        }).mappings().first()
-
-        return r["NOMBRE"] if r else None
+    return nombre_trabajador(codcia, codaux)
 
 def asignar_usuarios_preparacion(
     codcia,
@@ -731,33 +1778,36 @@ def asignar_usuarios_preparacion(
             "odc": cododc
         }).mappings().first()
 
+    invalidar_estado_pedido(codcia, codsuc, codppc, cododc)
+    invalidar_cache_despachos(codcia, codsuc)
+    publicar_evento(
+        "asignacion", codcia, codsuc, codppc, cododc,
+        registradoPor=row["registrado_nom"] if row else None,
+        preparadoPor=row["preparado_nom"] if row else None
+    )
     return {
         "registradoPor": row["registrado_nom"] if row else None,
         "preparadoPor": row["preparado_nom"] if row else None
     }
 
 def esta_finalizado(codcia, codsuc, codppc, cododc) -> bool:
-    with engine.begin() as conn:
-        fin = conn.execute(text("""
-            SELECT fin_dt
-            FROM dbo.PICKING_ASIGNACION
-            WHERE CIA_CODCIA=:cia AND SUC_CODSUC=:suc
-              AND PPC_NUMPPC=:ppc AND ODC_NUMODC=:odc
-        """), {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}).scalar()
-        return fin is not None
+    return obtener_estado_pedido(codcia, codsuc, codppc, cododc).get("fin_dt") is not None
+
+_SQL_LEER_HISTORICO = """
+    SELECT *
+    FROM dbo.PICKING_HISTORICO
+    WHERE CIA_CODCIA = :CIA_CODCIA
+      AND SUC_CODSUC = :SUC_CODSUC
+      AND PPC_NUMPPC = :PPC_NUMPPC
+      AND ODC_NUMODC = :ODC_NUMODC
+    ORDER BY Orden_Ruta ASC, Ubicacion ASC, ITEM ASC
+"""
+
 
 def listar_detalle_historico(codcia, codsuc, codppc, cododc):
     """Lee el detalle desde la tabla PICKING_HISTORICO."""
     with engine.begin() as conn:
-        result = conn.execute(text("""
-            SELECT *
-            FROM dbo.PICKING_HISTORICO
-            WHERE CIA_CODCIA = :CIA_CODCIA
-              AND SUC_CODSUC = :SUC_CODSUC
-              AND PPC_NUMPPC = :PPC_NUMPPC
-              AND ODC_NUMODC = :ODC_NUMODC
-            ORDER BY Ubicacion ASC, ITEM ASC
-        """), {
+        result = conn.execute(text(_SQL_LEER_HISTORICO), {
             "CIA_CODCIA": codcia,
             "SUC_CODSUC": codsuc,
             "PPC_NUMPPC": codppc,
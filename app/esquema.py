@@ -0,0 +1,462 @@
+# app/esquema.py
+"""
+Esquema de las tablas PICKING_*: migraciones versionadas, verificación de
+índices y planes de ejecución de las consultas del servicio.
+
+    flask --app run esquema migrar [--hasta N] [--dry-run]
+    flask --app run esquema verificar
+    flask --app run esquema showplan [--salida planes/] [--codppc X --cododc Y]
+
+Migraciones: app/migraciones/NNNN_<nombre>.sql, idempotentes, con lotes
+separados por GO. Las aplicadas quedan en dbo.PICKING_ESQUEMA_VERSION
+(versión, nombre, sha1). Cada una corre en su transacción bajo
+sp_getapplock('PICKING_ESQUEMA'): dos workers que arrancan a la vez no la
+aplican dos veces.
+
+Índices: INDICES_REQUERIDOS describe los accesos de despachos/service.py
+y despachos/oleadas.py (todo filtra por pedido; el scan agrega el
+producto, la lectura delta el RowVer). verificar_indices() los busca en el catálogo por columnas, no por
+nombre: sirve cualquier índice equivalente que ya tenga la base.
+Al arrancar se verifica (o se migra) según Config.ESQUEMA_AL_ARRANCAR.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from . import metricas
+from .config import Config
+from .db import engine
+
+log = logging.getLogger(__name__)
+
+DIRECTORIO_MIGRACIONES = os.path.join(os.path.dirname(__file__), "migraciones")
+
+_RE_MIGRACION = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+_RE_GO = re.compile(r"^\s*GO\s*$", re.I | re.M)
+
+
+def _es_mssql() -> bool:
+    return engine.dialect.name == "mssql"
+
+
+# =========================================================
+# MIGRACIONES
+# =========================================================
+_SQL_TABLA_VERSION = """
+IF OBJECT_ID('dbo.PICKING_ESQUEMA_VERSION') IS NULL
+    CREATE TABLE dbo.PICKING_ESQUEMA_VERSION (
+        version     INT          NOT NULL PRIMARY KEY,
+        nombre      NVARCHAR(200) NOT NULL,
+        sha1        CHAR(40)     NOT NULL,
+        aplicado_dt DATETIME     NOT NULL DEFAULT GETDATE()
+    );
+"""
+
+_SQL_APPLOCK_ESQUEMA = """
+SET NOCOUNT ON;
+DECLARE @r INT;
+EXEC @r = sp_getapplock
+     @Resource = 'PICKING_ESQUEMA',
+     @LockMode = 'Exclusive',
+     @LockOwner = 'Transaction',
+     @LockTimeout = :timeout;
+SELECT @r;
+"""
+
+# espera por el lock de migración (otro worker aplicando la misma)
+_MIGRACION_LOCK_TIMEOUT_MS = 10 * 60 * 1000
+
+
+def migraciones() -> List[Tuple[int, str, str]]:
+    """[(versión, nombre de archivo, texto SQL)] en orden de versión."""
+    out = []
+    for archivo in sorted(os.listdir(DIRECTORIO_MIGRACIONES)):
+        m = _RE_MIGRACION.match(archivo)
+        if not m:
+            continue
+        with open(os.path.join(DIRECTORIO_MIGRACIONES, archivo), encoding="utf-8") as f:
+            out.append((int(m.group(1)), archivo, f.read()))
+    return out
+
+
+def lotes(sql: str) -> List[str]:
+    """Divide el script en lotes por las líneas GO (como sqlcmd)."""
+    return [l.strip() for l in _RE_GO.split(sql) if l.strip()]
+
+
+def _sha1(sql: str) -> str:
+    return hashlib.sha1(sql.encode("utf-8")).hexdigest()
+
+
+def _aplicadas(conn) -> Dict[int, str]:
+    """{versión: sha1} de las migraciones ya aplicadas ({} si no existe la tabla)."""
+    if conn.execute(text("SELECT OBJECT_ID('dbo.PICKING_ESQUEMA_VERSION')")).scalar() is None:
+        return {}
+    rows = conn.execute(text("SELECT version, sha1 FROM dbo.PICKING_ESQUEMA_VERSION")).fetchall()
+    return {int(v): s for v, s in rows}
+
+
+def migrar(hasta: Optional[int] = None, simular: bool = False) -> List[str]:
+    """
+    Aplica, en orden, las migraciones pendientes (hasta la versión `hasta`).
+    simular=True solo las lista. Devuelve los archivos aplicados (o pendientes).
+    """
+    if not _es_mssql():
+        log.info("esquema: migraciones solo para SQL Server (dialecto %s)", engine.dialect.name)
+        return []
+
+    with engine.begin() as conn:
+        aplicadas = _aplicadas(conn)
+
+    hechas = []
+    for version, archivo, sql in migraciones():
+        if hasta is not None and version > hasta:
+            break
+        if version in aplicadas:
+            if aplicadas[version] != _sha1(sql):
+                log.warning("esquema: %s cambió después de aplicarse (no se vuelve a correr)", archivo)
+            continue
+        if simular:
+            hechas.append(archivo)
+            continue
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql(_SQL_TABLA_VERSION)
+            r = conn.execute(text(_SQL_APPLOCK_ESQUEMA), {"timeout": _MIGRACION_LOCK_TIMEOUT_MS}).scalar()
+            if r is None or r < 0:
+                raise RuntimeError(f"No se obtuvo el lock de esquema para {archivo} ({r})")
+            # otro worker pudo aplicarla mientras esperábamos el lock
+            if version in _aplicadas(conn):
+                continue
+            for lote in lotes(sql):
+                conn.exec_driver_sql(lote)
+            conn.execute(text("""
+                INSERT INTO dbo.PICKING_ESQUEMA_VERSION (version, nombre, sha1)
+                VALUES (:version, :nombre, :sha1)
+            """), {"version": version, "nombre": archivo, "sha1": _sha1(sql)})
+        log.info("esquema: aplicada %s", archivo)
+        hechas.append(archivo)
+    return hechas
+
+
+# =========================================================
+# ÍNDICES REQUERIDOS
+# =========================================================
+_PEDIDO = ("CIA_CODCIA", "SUC_CODSUC", "PPC_NUMPPC", "ODC_NUMODC")
+
+# (tabla, columnas de igualdad (en cualquier orden), columnas que siguen (en
+#  orden), para qué). Un índice sirve si sus primeras columnas clave son
+# esas: las de igualdad como prefijo y después las siguientes.
+INDICES_REQUERIDOS = (
+    ("PICKING_DETALLE", _PEDIDO, (), "lectura del detalle, snapshot y archivado"),
+    ("PICKING_DETALLE", _PEDIDO, ("Cod_Producto_Pedido",), "scan por producto"),
+    ("PICKING_DETALLE", _PEDIDO, ("RowVer",), "lectura delta (RowVer > versión del cliente)"),
+    ("PICKING_HISTORICO", _PEDIDO, ("ITEM",), "lectura de finalizados y NOT EXISTS del archivado"),
+    ("PICKING_ASIGNACION", _PEDIDO, (), "estado, versión (ETag) y avance del pedido"),
+    ("PICKING_SCAN_ETIQUETA", _PEDIDO, ("ETIQUETA",), "etiquetas ya aplicadas"),
+    ("PICKING_OLEADA_PEDIDO", ("OLEADA_ID",), (), "miembros de la oleada (lista y scan)"),
+    ("PICKING_OLEADA_PEDIDO", _PEDIDO, (), "pedido ya en otra oleada (al crear)"),
+)
+
+# columnas clave de los índices de las tablas PICKING_* (sin filtrados,
+# deshabilitados ni hipotéticos). El stand-in lo responde desde PRAGMA.
+_SQL_INDICES = """
+-- picking:esquema_indices
+SELECT t.name AS tabla, i.name AS indice, c.name AS columna, ic.key_ordinal
+FROM sys.indexes i
+JOIN sys.tables t ON t.object_id = i.object_id
+JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE SCHEMA_NAME(t.schema_id) = 'dbo'
+  AND t.name LIKE 'PICKING[_]%'
+  AND i.is_disabled = 0 AND i.is_hypothetical = 0 AND i.has_filter = 0
+  AND ic.key_ordinal > 0
+ORDER BY t.name, i.name, ic.key_ordinal
+"""
+
+_faltantes = {"n": None}
+
+
+def _indices_existentes() -> Dict[str, Dict[str, List[str]]]:
+    """{tabla (mayúsculas): {índice: [columnas clave en orden (mayúsculas)]}}."""
+    with engine.begin() as conn:
+        rows = conn.exec_driver_sql(_SQL_INDICES).fetchall()
+    out = {}
+    for tabla, indice, columna, orden in sorted(rows, key=lambda r: (r[0], r[1], r[3])):
+        out.setdefault(tabla.upper(), {}).setdefault(indice, []).append(columna.upper())
+    return out
+
+
+def _sirve(claves: List[str], igualdad, siguientes) -> bool:
+    n = len(igualdad)
+    if set(claves[:n]) != {c.upper() for c in igualdad}:
+        return False
+    return claves[n:n + len(siguientes)] == [c.upper() for c in siguientes]
+
+
+def verificar_indices() -> List[Dict[str, Any]]:
+    """
+    Un dict por requisito: {tabla, columnas, uso, indice} (indice None si
+    ninguno sirve). Deja la cantidad de faltantes en /metrics.
+    """
+    existentes = _indices_existentes()
+    out = []
+    for tabla, igualdad, siguientes, uso in INDICES_REQUERIDOS:
+        indices = existentes.get(tabla.upper(), {})
+        indice = next(
+            (nombre for nombre, claves in sorted(indices.items()) if _sirve(claves, igualdad, siguientes)),
+            None
+        )
+        out.append({
+            "tabla": tabla,
+            "columnas": list(igualdad) + list(siguientes),
+            "uso": uso,
+            "indice": indice,
+        })
+    _faltantes["n"] = sum(1 for r in out if r["indice"] is None)
+    return out
+
+
+def _n_faltantes():
+    if _faltantes["n"] is None:
+        raise LookupError("sin verificar")
+    return _faltantes["n"]
+
+
+metricas.indicador(
+    "picking_esquema_indices_faltantes",
+    "Índices requeridos por el servicio que no están en la base (última verificación)",
+    _n_faltantes
+)
+
+
+def _avisar_faltantes():
+    try:
+        resultado = verificar_indices()
+    except Exception:
+        log.exception("esquema: no se pudieron verificar los índices")
+        return
+    for r in resultado:
+        if r["indice"] is None:
+            log.warning(
+                "esquema: falta índice en %s (%s) para %s; ver app/migraciones y `flask esquema migrar`",
+                r["tabla"], ", ".join(r["columnas"]), r["uso"]
+            )
+
+
+def al_arrancar():
+    """Según Config.ESQUEMA_AL_ARRANCAR: migrar (antes de atender), verificar (en segundo plano) o nada."""
+    modo = Config.ESQUEMA_AL_ARRANCAR
+    if modo == "migrar":
+        migrar()
+        _avisar_faltantes()
+    elif modo == "verificar":
+        threading.Thread(target=_avisar_faltantes, name="esquema-verificar", daemon=True).start()
+
+
+# =========================================================
+# SHOWPLAN
+# =========================================================
+# Plan estimado (SET SHOWPLAN_XML ON: no ejecuta nada, tampoco los UPDATE)
+# de cada consulta del servicio sobre un pedido real. Los parámetros van
+# como literales: el plan puede diferir del de la consulta parametrizada,
+# pero alcanza para ver si usa los índices.
+_NS_PLAN = {"p": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
+_OPERADORES_AVISO = ("Table Scan", "Index Scan", "Clustered Index Scan", "RID Lookup", "Key Lookup")
+
+_RE_NOMBRADO = re.compile(r"(?<![:\w]):(\w+)")
+
+
+def _literal(v) -> str:
+    if v is None:
+        return "NULL"
+    if isinstance(v, bool):
+        return "1" if v else "0"
+    if isinstance(v, (int, float)):
+        return repr(v)
+    if isinstance(v, (list, tuple)):
+        return "(" + ", ".join(_literal(x) for x in v) + ")"
+    return "N'" + str(v).replace("'", "''") + "'"
+
+
+def con_literales(sql: str, params) -> str:
+    """Reemplaza los parámetros (? en orden, o :nombre) por literales T-SQL."""
+    if isinstance(params, dict):
+        return _RE_NOMBRADO.sub(
+            lambda m: _literal(params[m.group(1)]) if m.group(1) in params else m.group(0), sql
+        )
+    valores = list(params)
+    if sql.count("?") != len(valores):
+        raise ValueError(f"{sql.count('?')} marcadores y {len(valores)} parámetros")
+    valores = iter(valores)
+    return re.sub(r"\?", lambda m: _literal(next(valores)), sql)
+
+
+def consultas_servicio(codcia, codsuc, codppc, cododc, codprod="") -> List[Tuple[str, str, Any]]:
+    """[(nombre, sql, parámetros)] de las consultas de despachos/service.py para un pedido."""
+    from .despachos import service as s
+
+    pos = (codcia, codsuc, codppc, cododc)
+    corto = {"cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc}
+    largo = {"CIA_CODCIA": codcia, "SUC_CODSUC": codsuc, "PPC_NUMPPC": codppc, "ODC_NUMODC": cododc}
+    return [
+        ("estado_pedido", s._SQL_ESTADO_PEDIDO, corto),
+        ("version_pedido", s._SQL_VERSION_PEDIDO, corto),
+        ("avance_listado", s._SQL_AVANCE_LISTADO, {"cia": codcia, "suc": codsuc, "ppcs": [codppc]}),
+        ("hay_detalle", s._SQL_HAY_DETALLE, pos),
+        ("fin_pedido", s._SQL_FIN_PEDIDO, pos),
+        ("detalle_activo", s._SQL_DETALLE_ACTIVO, pos),
+        ("leer_detalle", s._SQL_LEER_DETALLE.format(filtro_version=""), largo),
+        ("leer_detalle_delta", s._SQL_LEER_DETALLE.format(filtro_version=s._FILTRO_DESDE_VERSION),
+         dict(largo, desde=0)),
+        ("leer_historico", s._SQL_LEER_HISTORICO, largo),
+        ("avance_snapshot", s._SQL_AVANCE_SNAPSHOT, (0, 0, 0, 0) + pos),
+        ("scan_lote", s._sql_scan(1), pos + (None, 1, codprod, 1.0, "SHOWPLAN")),
+        ("archivar_pedido", s._SQL_ARCHIVAR, dict(
+            corto, recurso=s._recurso_pedido(*pos), timeout=Config.SNAPSHOT_LOCK_TIMEOUT_MS
+        )),
+        ("pedidos_a_compactar", s._SQL_PEDIDOS_A_COMPACTAR, {"n": Config.COMPACTACION_LOTE}),
+    ]
+
+
+_SQL_PEDIDO_MUESTRA = """
+    SELECT TOP 1 CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, Cod_Producto_Pedido
+    FROM dbo.PICKING_DETALLE
+    WHERE (:cia IS NULL OR CIA_CODCIA = :cia)
+      AND (:suc IS NULL OR SUC_CODSUC = :suc)
+      AND (:ppc IS NULL OR PPC_NUMPPC = :ppc)
+      AND (:odc IS NULL OR ODC_NUMODC = :odc)
+"""
+
+
+def _pedido_muestra(codcia, codsuc, codppc, cododc):
+    """Pedido (y un producto) para los planes: el indicado, o uno que tenga detalle."""
+    with engine.begin() as conn:
+        r = conn.execute(text(_SQL_PEDIDO_MUESTRA), {
+            "cia": codcia, "suc": codsuc, "ppc": codppc, "odc": cododc
+        }).first()
+    if r is not None:
+        return tuple(r)
+    return (codcia or Config.SEDE_DEFECTO[0], codsuc or Config.SEDE_DEFECTO[1], codppc or "", cododc or "", "")
+
+
+def _avisos_plan(xml: str) -> Tuple[float, List[str]]:
+    """(costo estimado, ["<operador> <tabla>.<índice>"]) de los accesos completos a PICKING_*."""
+    raiz = ET.fromstring(xml)
+    costo = sum(
+        float(st.get("StatementSubTreeCost") or 0)
+        for st in raiz.iterfind(".//p:StmtSimple", _NS_PLAN)
+    )
+    avisos = []
+    for op in raiz.iterfind(".//p:RelOp", _NS_PLAN):
+        fisico = op.get("PhysicalOp")
+        if fisico not in _OPERADORES_AVISO:
+            continue
+        for obj in op.iterfind("./*/p:Object", _NS_PLAN):
+            tabla = (obj.get("Table") or "").strip("[]")
+            if tabla.upper().startswith("PICKING_"):
+                indice = (obj.get("Index") or "").strip("[]")
+                avisos.append(f"{fisico} {tabla}" + (f".{indice}" if indice else ""))
+    return costo, avisos
+
+
+def showplan(codcia=None, codsuc=None, codppc=None, cododc=None, salida: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Plan estimado de cada consulta del servicio. Con `salida` deja
+    <nombre>.sqlplan por consulta (se abren en SSMS).
+    Devuelve [{nombre, costo, avisos, archivo}]. Solo SQL Server.
+    """
+    if not _es_mssql():
+        raise RuntimeError(f"showplan solo para SQL Server (dialecto {engine.dialect.name})")
+
+    cia, suc, ppc, odc, prod = _pedido_muestra(codcia, codsuc, codppc, cododc)
+    consultas = consultas_servicio(cia, suc, ppc, odc, prod or "")
+    if salida:
+        os.makedirs(salida, exist_ok=True)
+
+    out = []
+    conn = engine.raw_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SET SHOWPLAN_XML ON")
+        try:
+            for nombre, sql, params in consultas:
+                cur.execute(con_literales(sql, params))
+                planes = []
+                while True:
+                    if cur.description is not None:
+                        planes.extend(r[0] for r in cur.fetchall())
+                    if not cur.nextset():
+                        break
+
+                costo, avisos = 0.0, []
+                for xml in planes:
+                    c, a = _avisos_plan(xml)
+                    costo += c
+                    avisos += a
+
+                archivo = None
+                if salida:
+                    # un .sqlplan por documento ShowPlanXML (nombre, nombre_2, ...)
+                    for i, xml in enumerate(planes, start=1):
+                        ruta = os.path.join(salida, f"{nombre}.sqlplan" if i == 1 else f"{nombre}_{i}.sqlplan")
+                        with open(ruta, "w", encoding="utf-8") as f:
+                            f.write(xml)
+                        archivo = archivo or ruta
+                out.append({"nombre": nombre, "costo": round(costo, 4), "avisos": avisos, "archivo": archivo})
+        finally:
+            cur.execute("SET SHOWPLAN_XML OFF")
+    finally:
+        conn.close()
+    return out
+
+
+# =========================================================
+# COMANDOS (flask esquema ...)
+# =========================================================
+def registrar_comandos(app):
+    import click
+    from flask.cli import AppGroup
+
+    grupo = AppGroup("esquema", help="Migraciones, índices y planes de las tablas PICKING_*.")
+
+    @grupo.command("migrar")
+    @click.option("--hasta", type=int, default=None, help="Aplicar hasta esta versión (incluida).")
+    @click.option("--dry-run", "simular", is_flag=True, help="Solo listar las pendientes.")
+    def _migrar(hasta, simular):
+        hechas = migrar(hasta, simular)
+        for archivo in hechas:
+            click.echo(("pendiente " if simular else "aplicada  ") + archivo)
+        if not hechas:
+            click.echo("sin migraciones pendientes")
+
+    @grupo.command("verificar")
+    def _verificar():
+        faltan = 0
+        for r in verificar_indices():
+            columnas = ", ".join(r["columnas"])
+            if r["indice"] is None:
+                faltan += 1
+                click.echo(f"FALTA  {r['tabla']} ({columnas}) -- {r['uso']}")
+            else:
+                click.echo(f"ok     {r['tabla']} ({columnas}) -> {r['indice']}")
+        if faltan:
+            raise SystemExit(1)
+
+    @grupo.command("showplan")
+    @click.option("--salida", default=None, help="Directorio para los .sqlplan.")
+    @click.option("--codcia", default=None)
+    @click.option("--codsuc", default=None)
+    @click.option("--codppc", default=None)
+    @click.option("--cododc", default=None)
+    def _showplan(salida, codcia, codsuc, codppc, cododc):
+        for r in showplan(codcia, codsuc, codppc, cododc, salida):
+            click.echo(f"{r['nombre']:<22} costo {r['costo']:>10}  " + ("; ".join(r["avisos"]) or "ok"))
+
+    app.cli.add_command(grupo)
@@ -0,0 +1,170 @@
+# app/metricas.py
+"""
+Métricas en memoria del proceso, expuestas en formato Prometheus (/metrics).
+Con varios workers cada proceso tiene las suyas (la etiqueta `pid` las
+distingue).
+"""
+import os
+import threading
+
+# segundos
+BUCKETS_DEFECTO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_metricas = {}  # nombre -> metrica (en orden de registro)
+
+
+def _etiquetas(etiquetas: dict) -> tuple:
+    return tuple(sorted((etiquetas or {}).items()))
+
+
+def _formato(etiquetas: tuple, extra: tuple = ()) -> str:
+    todas = (("pid", str(os.getpid())),) + etiquetas + extra
+    cuerpo = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+        for k, v in todas
+    )
+    return "{" + cuerpo + "}"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda):
+        self.nombre, self.ayuda = nombre, ayuda
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor=1, **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def lineas(self):
+        with self._lock:
+            items = list(self._valores.items())
+        return [f"{self.nombre}{_formato(k)} {v}" for k, v in items]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, buckets=BUCKETS_DEFECTO):
+        self.nombre, self.ayuda = nombre, ayuda
+        self.buckets = tuple(buckets)
+        self._valores = {}  # etiquetas -> [conteos por bucket, suma, total]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, **etiquetas):
+        clave = _etiquetas(etiquetas)
+        with self._lock:
+            v = self._valores.get(clave)
+            if v is None:
+                v = self._valores[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    v[0][i] += 1
+            v[1] += valor
+            v[2] += 1
+
+    def lineas(self):
+        with self._lock:
+            items = [(k, (list(v[0]), v[1], v[2])) for k, v in self._valores.items()]
+        out = []
+        for k, (conteos, suma, total) in items:
+            for limite, c in zip(self.buckets, conteos):
+                out.append(f"{self.nombre}_bucket{_formato(k, (('le', limite),))} {c}")
+            out.append(f"{self.nombre}_bucket{_formato(k, (('le', '+Inf'),))} {total}")
+            out.append(f"{self.nombre}_sum{_formato(k)} {suma}")
+            out.append(f"{self.nombre}_count{_formato(k)} {total}")
+        return out
+
+
+class Indicador:
+    """
+    Gauge calculado al leer /metrics. fn() devuelve un número, o un dict
+    {((etiqueta, valor), ...): número} para varias series.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, fn):
+        self.nombre, self.ayuda, self.fn = nombre, ayuda, fn
+
+    def lineas(self):
+        try:
+            valor = self.fn()
+        except Exception:
+            return []
+        if isinstance(valor, dict):
+            return [f"{self.nombre}{_formato(_etiquetas(dict(k)))} {v}" for k, v in valor.items()]
+        return [f"{self.nombre}{_formato(())} {valor}"]
+
+
+def _registrar(metrica):
+    with _lock:
+        return _metricas.setdefault(metrica.nombre, metrica)
+
+
+def contador(nombre, ayuda) -> Contador:
+    return _registrar(Contador(nombre, ayuda))
+
+
+def histograma(nombre, ayuda, buckets=BUCKETS_DEFECTO) -> Histograma:
+    return _registrar(Histograma(nombre, ayuda, buckets))
+
+
+def indicador(nombre, ayuda, fn) -> Indicador:
+    return _registrar(Indicador(nombre, ayuda, fn))
+
+
+def exponer() -> str:
+    """Texto en formato de exposición de Prometheus (0.0.4)."""
+    with _lock:
+        metricas = list(_metricas.values())
+    out = []
+    for m in metricas:
+        out.append(f"# HELP {m.nombre} {m.ayuda}")
+        out.append(f"# TYPE {m.nombre} {m.tipo}")
+        out.extend(m.lineas())
+    return "\n".join(out) + "\n"
+
+
+# =========================================================
+# Latencia por endpoint (Flask)
+# =========================================================
+def instrumentar_app(app):
+    """Histograma de duración por ruta (regla de URL, no la URL concreta) y sede."""
+    import time
+    from flask import g, request
+
+    duracion = histograma(
+        "picking_http_duracion_segundos",
+        "Duración de cada request por ruta, método, status y sede"
+    )
+
+    @app.before_request
+    def _inicio_request():
+        g._t_request = time.perf_counter()
+
+    def _observar(status):
+        t0 = g.pop("_t_request", None)
+        if t0 is None:
+            return
+        regla = request.url_rule.rule if request.url_rule else "sin_ruta"
+        sede = g.get("sede")
+        duracion.observar(
+            time.perf_counter() - t0,
+            ruta=regla, metodo=request.method, status=str(status),
+            sede="-".join(sede) if sede else "-"
+        )
+
+    @app.after_request
+    def _fin_request(response):
+        _observar(response.status_code)
+        return response
+
+    @app.teardown_request
+    def _error_request(error):
+        # excepción no manejada: after_request no corre
+        if error is not None:
+            _observar(500)
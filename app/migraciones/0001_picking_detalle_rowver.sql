@@ -0,0 +1,7 @@
+-- Versión por línea para las respuestas delta del detalle
+-- (POST /detalle/scan con "version", GET /detalle/leer?desde=).
+-- ROWVERSION es única y creciente en toda la BD: el front guarda el mayor
+-- valor que ya pintó y pide solo lo que cambió después.
+IF COL_LENGTH('dbo.PICKING_DETALLE', 'RowVer') IS NULL
+    ALTER TABLE dbo.PICKING_DETALLE ADD RowVer ROWVERSION;
+GO
@@ -0,0 +1,16 @@
+-- Registro de etiquetas (QR) aplicadas por pedido: hace idempotentes los
+-- reintentos y el replay de la cola de escaneos.
+IF OBJECT_ID('dbo.PICKING_SCAN_ETIQUETA', 'U') IS NULL
+    CREATE TABLE dbo.PICKING_SCAN_ETIQUETA (
+        CIA_CODCIA           NVARCHAR(10)  NOT NULL,
+        SUC_CODSUC           NVARCHAR(10)  NOT NULL,
+        PPC_NUMPPC           NVARCHAR(30)  NOT NULL,
+        ODC_NUMODC           NVARCHAR(30)  NOT NULL,
+        ETIQUETA             NVARCHAR(100) NOT NULL,
+        Cod_Producto_Pedido  NVARCHAR(60)  NULL,
+        Cantidad             DECIMAL(18,4) NULL,
+        fecha                DATETIME      NOT NULL DEFAULT GETDATE(),
+        CONSTRAINT PK_PICKING_SCAN_ETIQUETA
+            PRIMARY KEY (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, ETIQUETA)
+    );
+GO
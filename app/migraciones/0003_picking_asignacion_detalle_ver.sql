@@ -0,0 +1,8 @@
+-- Contador de cambios del detalle por pedido. Junto con updated_at forma
+-- el ETag de /detalle/leer y /detalle/cabecera (304 si no cambió nada).
+-- Lo suben: el snapshot, cada lote de scan con lecturas aplicadas,
+-- terminar_detalle y el archivado.
+IF COL_LENGTH('dbo.PICKING_ASIGNACION', 'detalle_ver') IS NULL
+    ALTER TABLE dbo.PICKING_ASIGNACION ADD detalle_ver BIGINT NOT NULL
+        CONSTRAINT DF_PICKING_ASIGNACION_detalle_ver DEFAULT 0;
+GO
@@ -0,0 +1,14 @@
+-- Avance del pedido, mantenido por cada lote de scan dentro de su
+-- transacción: líneas totales / completas y unidades abastecidas /
+-- escaneadas. El FIN, los totales del scan y el listado lo leen por PK
+-- sin contar PICKING_DETALLE.
+-- Los fija el snapshot; terminar_detalle los deja en NULL.
+-- NULL = sin inicializar (snapshot anterior a esta migración): el primer
+-- lote de scan los calcula una vez desde PICKING_DETALLE.
+IF COL_LENGTH('dbo.PICKING_ASIGNACION', 'lineas_total') IS NULL
+    ALTER TABLE dbo.PICKING_ASIGNACION ADD
+        lineas_total INT NULL,
+        lineas_completas INT NULL,
+        unidades_abastecidas DECIMAL(18,4) NULL,
+        unidades_escaneadas DECIMAL(18,4) NULL;
+GO
@@ -0,0 +1,97 @@
+-- Índices para los accesos de app/despachos/service.py. Todas las consultas
+-- filtran por pedido (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC); el
+-- scan agrega Cod_Producto_Pedido (TOP 1 ... ORDER BY ITEM), las lecturas
+-- delta RowVer > @desde y la lectura completa ORDER BY Ubicacion (unas
+-- decenas de filas: el orden sale barato si el pedido es un rango).
+-- Sin ellos cada scan y cada lectura recorre la tabla entera.
+-- app/esquema.py (INDICES_REQUERIDOS) verifica lo mismo al arrancar;
+-- `flask esquema showplan` muestra el plan de cada consulta.
+--
+-- "Ya hay un índice por pedido" = algún índice cuyas 4 primeras columnas
+-- clave son las del pedido (en cualquier orden): no se duplica la PK.
+
+-- ---------------------------------------------------------
+-- PICKING_DETALLE
+-- ---------------------------------------------------------
+-- heap -> agrupado por pedido + ITEM (lectura y archivado = un rango)
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_DETALLE') AND type = 1
+)
+    CREATE CLUSTERED INDEX CX_PICKING_DETALLE_PEDIDO
+        ON dbo.PICKING_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, ITEM);
+ELSE IF NOT EXISTS (
+    SELECT 1
+    FROM sys.index_columns ic
+    JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+    WHERE ic.object_id = OBJECT_ID('dbo.PICKING_DETALLE')
+      AND ic.key_ordinal BETWEEN 1 AND 4
+      AND c.name IN ('CIA_CODCIA', 'SUC_CODSUC', 'PPC_NUMPPC', 'ODC_NUMODC')
+    GROUP BY ic.index_id
+    HAVING COUNT(*) = 4
+)
+    CREATE INDEX IX_PICKING_DETALLE_PEDIDO
+        ON dbo.PICKING_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, Ubicacion, ITEM);
+GO
+
+-- scan: primera línea del producto con saldo (cubre el filtro de cantidades)
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_DETALLE') AND name = 'IX_PICKING_DETALLE_PEDIDO_PRODUCTO'
+)
+    CREATE INDEX IX_PICKING_DETALLE_PEDIDO_PRODUCTO
+        ON dbo.PICKING_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, Cod_Producto_Pedido, ITEM)
+        INCLUDE (Cantidad_Scaneada, Cantidd_abastecida);
+GO
+
+-- lecturas delta: líneas cambiadas desde la versión del cliente
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_DETALLE') AND name = 'IX_PICKING_DETALLE_PEDIDO_ROWVER'
+)
+    CREATE INDEX IX_PICKING_DETALLE_PEDIDO_ROWVER
+        ON dbo.PICKING_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, RowVer);
+GO
+
+-- ---------------------------------------------------------
+-- PICKING_HISTORICO: lectura por pedido y NOT EXISTS por ITEM del archivado
+-- ---------------------------------------------------------
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_HISTORICO') AND type = 1
+)
+    CREATE CLUSTERED INDEX CX_PICKING_HISTORICO_PEDIDO
+        ON dbo.PICKING_HISTORICO (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, ITEM);
+ELSE IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_HISTORICO') AND name = 'IX_PICKING_HISTORICO_PEDIDO'
+)
+    CREATE INDEX IX_PICKING_HISTORICO_PEDIDO
+        ON dbo.PICKING_HISTORICO (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, ITEM)
+        INCLUDE (Ubicacion);
+GO
+
+-- ---------------------------------------------------------
+-- PICKING_ASIGNACION: estado, versión (ETag) y avance por pedido
+-- ---------------------------------------------------------
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_ASIGNACION') AND type = 1
+)
+    CREATE CLUSTERED INDEX CX_PICKING_ASIGNACION_PEDIDO
+        ON dbo.PICKING_ASIGNACION (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC);
+ELSE IF NOT EXISTS (
+    SELECT 1
+    FROM sys.index_columns ic
+    JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+    WHERE ic.object_id = OBJECT_ID('dbo.PICKING_ASIGNACION')
+      AND ic.key_ordinal BETWEEN 1 AND 4
+      AND c.name IN ('CIA_CODCIA', 'SUC_CODSUC', 'PPC_NUMPPC', 'ODC_NUMODC')
+    GROUP BY ic.index_id
+    HAVING COUNT(*) = 4
+)
+    CREATE INDEX IX_PICKING_ASIGNACION_PEDIDO
+        ON dbo.PICKING_ASIGNACION (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC)
+        INCLUDE (inicio_dt, fin_dt, updated_at, detalle_ver,
+                 lineas_total, lineas_completas, unidades_abastecidas, unidades_escaneadas);
+GO
@@ -0,0 +1,12 @@
+-- Posición de cada línea en la ruta de picking (1..n dentro del pedido).
+-- La calcula app/despachos/ruta.py una vez al generar el snapshot, según el
+-- layout del almacén (Config.RUTA_LAYOUT); las lecturas ordenan por ella.
+-- NULL = snapshot anterior a esta migración: se ordena por Ubicacion.
+-- El archivado la copia a PICKING_HISTORICO.
+IF COL_LENGTH('dbo.PICKING_DETALLE', 'Orden_Ruta') IS NULL
+    ALTER TABLE dbo.PICKING_DETALLE ADD Orden_Ruta INT NULL;
+GO
+
+IF COL_LENGTH('dbo.PICKING_HISTORICO', 'Orden_Ruta') IS NULL
+    ALTER TABLE dbo.PICKING_HISTORICO ADD Orden_Ruta INT NULL;
+GO
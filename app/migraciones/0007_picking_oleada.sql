@@ -0,0 +1,44 @@
+-- Oleadas (picking por lotes): varios pedidos se recorren juntos con una
+-- sola lista de picking agregada por producto / ubicación. Cada lectura se
+-- reparte entre las líneas de los pedidos miembros (app/despachos/oleadas.py);
+-- el avance y el FIN siguen siendo por pedido (PICKING_ASIGNACION).
+-- Las etiquetas (QR) leídas en la oleada se registran en
+-- PICKING_SCAN_ETIQUETA con PPC_NUMPPC = 'OLEADA', ODC_NUMODC = OLEADA_ID.
+IF OBJECT_ID('dbo.PICKING_OLEADA', 'U') IS NULL
+    CREATE TABLE dbo.PICKING_OLEADA (
+        OLEADA_ID   INT IDENTITY(1,1) NOT NULL,
+        CIA_CODCIA  NVARCHAR(10) NOT NULL,
+        SUC_CODSUC  NVARCHAR(10) NOT NULL,
+        estado      CHAR(1)      NOT NULL
+            CONSTRAINT DF_PICKING_OLEADA_estado DEFAULT 'A',   -- A abierta / C cerrada
+        creado_cod  NVARCHAR(30) NULL,
+        creado_dt   DATETIME     NOT NULL
+            CONSTRAINT DF_PICKING_OLEADA_creado_dt DEFAULT GETDATE(),
+        cerrado_dt  DATETIME     NULL,
+        CONSTRAINT PK_PICKING_OLEADA PRIMARY KEY (OLEADA_ID)
+    );
+GO
+
+-- miembros; orden = prioridad al repartir una lectura entre los pedidos
+IF OBJECT_ID('dbo.PICKING_OLEADA_PEDIDO', 'U') IS NULL
+    CREATE TABLE dbo.PICKING_OLEADA_PEDIDO (
+        OLEADA_ID   INT          NOT NULL,
+        CIA_CODCIA  NVARCHAR(10) NOT NULL,
+        SUC_CODSUC  NVARCHAR(10) NOT NULL,
+        PPC_NUMPPC  NVARCHAR(30) NOT NULL,
+        ODC_NUMODC  NVARCHAR(30) NOT NULL,
+        orden       INT          NOT NULL,
+        CONSTRAINT PK_PICKING_OLEADA_PEDIDO
+            PRIMARY KEY (OLEADA_ID, CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC)
+    );
+GO
+
+-- ¿el pedido ya está en otra oleada abierta? (al crear)
+IF NOT EXISTS (
+    SELECT 1 FROM sys.indexes
+    WHERE object_id = OBJECT_ID('dbo.PICKING_OLEADA_PEDIDO') AND name = 'IX_PICKING_OLEADA_PEDIDO_PEDIDO'
+)
+    CREATE INDEX IX_PICKING_OLEADA_PEDIDO_PEDIDO
+        ON dbo.PICKING_OLEADA_PEDIDO (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC)
+        INCLUDE (OLEADA_ID);
+GO
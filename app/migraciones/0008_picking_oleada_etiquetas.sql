@@ -0,0 +1,31 @@
+-- Las etiquetas (QR) leídas en una oleada pasan al registro de cada pedido
+-- miembro (PICKING_SCAN_ETIQUETA con su PPC/ODC), el mismo que usa el scan
+-- por pedido: así una etiqueta cuenta una sola vez en los dos modos.
+-- Las filas con la clave anterior (PPC_NUMPPC = 'OLEADA', ODC_NUMODC =
+-- OLEADA_ID) se copian a los pedidos abiertos de su oleada y se borran.
+INSERT INTO dbo.PICKING_SCAN_ETIQUETA (
+    CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC,
+    ETIQUETA, Cod_Producto_Pedido, Cantidad, fecha
+)
+SELECT op.CIA_CODCIA, op.SUC_CODSUC, op.PPC_NUMPPC, op.ODC_NUMODC,
+       e.ETIQUETA, e.Cod_Producto_Pedido, 0, e.fecha
+FROM dbo.PICKING_SCAN_ETIQUETA e
+JOIN dbo.PICKING_OLEADA_PEDIDO op
+  ON op.CIA_CODCIA = e.CIA_CODCIA AND op.SUC_CODSUC = e.SUC_CODSUC
+ AND CAST(op.OLEADA_ID AS NVARCHAR(30)) = e.ODC_NUMODC
+JOIN dbo.PICKING_ASIGNACION a
+  ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+ AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+ AND a.fin_dt IS NULL
+WHERE e.PPC_NUMPPC = 'OLEADA'
+  AND NOT EXISTS (
+      SELECT 1 FROM dbo.PICKING_SCAN_ETIQUETA x
+      WHERE x.CIA_CODCIA = op.CIA_CODCIA AND x.SUC_CODSUC = op.SUC_CODSUC
+        AND x.PPC_NUMPPC = op.PPC_NUMPPC AND x.ODC_NUMODC = op.ODC_NUMODC
+        AND x.ETIQUETA = e.ETIQUETA
+  );
+GO
+
+DELETE FROM dbo.PICKING_SCAN_ETIQUETA
+WHERE PPC_NUMPPC = 'OLEADA';
+GO
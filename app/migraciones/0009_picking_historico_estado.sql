@@ -0,0 +1,5 @@
+-- El archivado copia también ESTADO (pedido completo '1' / no '0') de
+-- PICKING_DETALLE a PICKING_HISTORICO.
+IF COL_LENGTH('dbo.PICKING_HISTORICO', 'ESTADO') IS NULL
+    ALTER TABLE dbo.PICKING_HISTORICO ADD ESTADO CHAR(1) NULL;
+GO
@@ -0,0 +1,8 @@
+-- Hash del resultado del SP de detalle con el que la precarga armó el
+-- snapshot. La precarga corre mientras el pedido sigue en abastecimiento:
+-- la primera apertura sin inicio vuelve a llamar al SP y, si el hash
+-- cambió (p. ej. Cantidd_abastecida), rehace el snapshot. NULL = armado o
+-- ya revisado al abrir.
+IF COL_LENGTH('dbo.PICKING_ASIGNACION', 'precarga_hash') IS NULL
+    ALTER TABLE dbo.PICKING_ASIGNACION ADD precarga_hash CHAR(40) NULL;
+GO
@@ -0,0 +1,12 @@
+-- Sedes (compañía-sucursal) en las que trabaja cada usuario (AUX_CODAUX
+-- de SYS_TABLA_USUARIOS_S10). El login las pone en el token y cada request
+-- se valida contra ellas. Un usuario sin filas solo trabaja en la sede por
+-- defecto del despliegue (la primera de SEDES).
+IF OBJECT_ID('dbo.PICKING_USUARIO_SEDE', 'U') IS NULL
+    CREATE TABLE dbo.PICKING_USUARIO_SEDE (
+        AUX_CODAUX  NVARCHAR(20) NOT NULL,
+        CIA_CODCIA  NVARCHAR(10) NOT NULL,
+        SUC_CODSUC  NVARCHAR(10) NOT NULL,
+        CONSTRAINT PK_PICKING_USUARIO_SEDE PRIMARY KEY (AUX_CODAUX, CIA_CODCIA, SUC_CODSUC)
+    );
+GO
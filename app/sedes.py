@@ -0,0 +1,105 @@
+# app/sedes.py
+"""
+Sede (compañía, sucursal) de cada request.
+
+Un mismo despliegue atiende todas las sedes de Config.SEDES; caches,
+índices y métricas van separados por sede. La sede sale de, en orden:
+  1) codcia / codsuc del request (query string o cuerpo JSON),
+  2) los claims codcia / codsuc del token (los pone el login),
+  3) la primera sede permitida al usuario.
+Cada usuario solo trabaja en sus sedes (PICKING_USUARIO_SEDE): el login las
+deja en el claim "sedes" del token y cada request se valida contra él.
+Si lo que resulta no es una sede configurada o del usuario -> 403.
+"""
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+from flask import abort, g, jsonify, make_response, request
+from flask_jwt_extended import get_jwt
+
+from .config import Config
+
+Sede = Tuple[str, str]
+
+
+class SedeNoPermitida(ValueError):
+    pass
+
+
+def _texto(v) -> str:
+    return str(v or "").strip()
+
+
+def es_sede(codcia, codsuc) -> bool:
+    return (_texto(codcia), _texto(codsuc)) in Config.SEDES
+
+
+def etiqueta_sede(sede: Optional[Sede]) -> str:
+    """'01-01' (para métricas y logs); '-' si no hay sede."""
+    return "-".join(sede) if sede else "-"
+
+
+def claim_sedes(sedes: Iterable[Sede]) -> List[str]:
+    """[('01', '01'), ...] -> ['01-01', ...] (claim "sedes" del token)."""
+    return ["-".join(s) for s in sedes]
+
+
+def sedes_permitidas(claims: Optional[Mapping[str, Any]]) -> List[Sede]:
+    """
+    Sedes del usuario según su token: el claim "sedes"; un token anterior
+    (sin ese claim) solo vale para la sede con la que se hizo el login.
+    """
+    claims = claims or {}
+    if "sedes" in claims:
+        sedes = [tuple(_texto(p) for p in s.split("-", 1)) for s in claims["sedes"] or [] if "-" in s]
+    elif claims.get("codcia") and claims.get("codsuc"):
+        sedes = [(_texto(claims["codcia"]), _texto(claims["codsuc"]))]
+    else:
+        sedes = []
+    return [s for s in sedes if s in Config.SEDES]
+
+
+def resolver_sede(
+    claims: Optional[Mapping[str, Any]],
+    pedidos: Optional[Mapping[str, Any]] = None,
+    permitidas: Optional[List[Sede]] = None,
+) -> Sede:
+    """
+    claims: del token; pedidos: parámetros del request (args o cuerpo);
+    permitidas: sedes del usuario (por defecto, las de sus claims).
+    Lanza SedeNoPermitida si la sede no está en Config.SEDES o no es del usuario.
+    """
+    claims = claims or {}
+    pedidos = pedidos or {}
+    if permitidas is None:
+        permitidas = sedes_permitidas(claims)
+    defecto = permitidas[0] if permitidas else Config.SEDE_DEFECTO
+    codcia = _texto(pedidos.get("codcia")) or _texto(claims.get("codcia")) or defecto[0]
+    codsuc = _texto(pedidos.get("codsuc")) or _texto(claims.get("codsuc")) or defecto[1]
+    if (codcia, codsuc) not in Config.SEDES:
+        raise SedeNoPermitida(f"Sede {codcia}-{codsuc} no habilitada")
+    if (codcia, codsuc) not in permitidas:
+        raise SedeNoPermitida(f"Sede {codcia}-{codsuc} no permitida para el usuario")
+    return codcia, codsuc
+
+
+def sede_actual() -> Sede:
+    """
+    Sede del request en curso (después de @jwt_required). Se resuelve una
+    vez por request; 403 si no está habilitada o no es del usuario.
+    """
+    sede = g.get("sede")
+    if sede is not None:
+        return sede
+
+    pedidos = {}
+    cuerpo = request.get_json(silent=True) if request.is_json else None
+    if isinstance(cuerpo, dict):
+        pedidos.update({k: cuerpo[k] for k in ("codcia", "codsuc") if cuerpo.get(k)})
+    pedidos.update({k: request.args[k] for k in ("codcia", "codsuc") if request.args.get(k)})
+
+    try:
+        sede = resolver_sede(get_jwt(), pedidos)
+    except SedeNoPermitida as e:
+        abort(make_response(jsonify({"msg": str(e)}), 403))
+    g.sede = sede
+    return sede
@@ -0,0 +1,144 @@
+// =========================
+// Cola de escaneos (IndexedDB)
+// =========================
+// Se usa desde la página de detalle y desde sw.js (importScripts).
+// Cada lectura se guarda primero aquí y luego se envía en lotes a
+// POST /api/despachos/detalle/scan/batch. Si no hay red, queda en cola
+// y el service worker la reenvía cuando vuelve la conexión.
+(function (global) {
+  const DB_NAME  = "stb-picking";
+  const DB_VER   = 1;
+  const STORE    = "scans";
+  const LOTE_MAX = 50;
+  const SYNC_TAG = "cola-scans";
+
+  let dbPromise = null;
+
+  function abrir() {
+    if (dbPromise) return dbPromise;
+    dbPromise = new Promise((resolve, reject) => {
+      const req = indexedDB.open(DB_NAME, DB_VER);
+      req.onupgradeneeded = () => {
+        const db = req.result;
+        if (!db.objectStoreNames.contains(STORE)) {
+          const st = db.createObjectStore(STORE, { keyPath: "id", autoIncrement: true });
+          st.createIndex("pedido", "pedido", { unique: false });
+        }
+      };
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => { dbPromise = null; reject(req.error); };
+    });
+    return dbPromise;
+  }
+
+  function tx(modo, fn) {
+    return abrir().then(db => new Promise((resolve, reject) => {
+      const t = db.transaction(STORE, modo);
+      const st = t.objectStore(STORE);
+      let out;
+      Promise.resolve(fn(st)).then(v => { out = v; });
+      t.oncomplete = () => resolve(out);
+      t.onerror = () => reject(t.error);
+      t.onabort = () => reject(t.error);
+    }));
+  }
+
+  function reqAPromesa(req) {
+    return new Promise((resolve, reject) => {
+      req.onsuccess = () => resolve(req.result);
+      req.onerror = () => reject(req.error);
+    });
+  }
+
+  function clavePedido(codppc, cododc) {
+    return `${codppc ?? ""}|${cododc ?? ""}`;
+  }
+
+  // { codppc, cododc, codprod, cantidad, etiqueta }
+  function encolar(scan) {
+    const item = {
+      ...scan,
+      pedido: clavePedido(scan.codppc, scan.cododc),
+      ts: Date.now()
+    };
+    return tx("readwrite", st => reqAPromesa(st.add(item)));
+  }
+
+  // lecturas de un pedido, en orden de llegada
+  function pendientes(codppc, cododc, max = LOTE_MAX) {
+    return tx("readonly", st =>
+      reqAPromesa(st.index("pedido").getAll(clavePedido(codppc, cododc)))
+        .then(lista => lista.sort((a, b) => a.id - b.id).slice(0, max))
+    );
+  }
+
+  // pedidos que tienen algo en cola -> [{codppc, cododc}]
+  function pedidosEnCola() {
+    return tx("readonly", st => reqAPromesa(st.getAll())).then(lista => {
+      const vistos = new Map();
+      (lista || []).forEach(s => {
+        if (!vistos.has(s.pedido)) vistos.set(s.pedido, { codppc: s.codppc, cododc: s.cododc });
+      });
+      return Array.from(vistos.values());
+    });
+  }
+
+  function contar(codppc, cododc) {
+    return tx("readonly", st => reqAPromesa(st.index("pedido").count(clavePedido(codppc, cododc))));
+  }
+
+  function quitar(ids) {
+    return tx("readwrite", st => { (ids || []).forEach(id => st.delete(id)); });
+  }
+
+  // Evita que la página y el service worker envíen el mismo lote a la vez
+  function conCandado(fn) {
+    const locks = global.navigator && global.navigator.locks;
+    if (locks && locks.request) return locks.request("cola-scans", fn);
+    return fn();
+  }
+
+  // Envía UN lote del pedido. Devuelve { status, ok, json, enviados }
+  //  - error de red -> lanza (la cola queda intacta)
+  //  - 2xx / 4xx   -> se sacan de la cola (4xx no se arregla reintentando)
+  //  - 401 / 5xx   -> quedan en cola para reintentar
+  // `consulta`: query string opcional para la forma de la respuesta
+  // (p.ej. "columnas=...&format=columnar" desde la página de detalle)
+  async function enviarLote(codppc, cododc, version, consulta) {
+    const lote = await pendientes(codppc, cododc);
+    if (!lote.length) return { status: 204, ok: true, json: null, enviados: [] };
+
+    const payload = {
+      codppc,
+      cododc,
+      items: lote.map(s => ({ codprod: s.codprod, cantidad: s.cantidad, etiqueta: s.etiqueta }))
+    };
+    if (version !== undefined && version !== null) payload.version = version;
+
+    const url = "/api/despachos/detalle/scan/batch" + (consulta ? `?${consulta}` : "");
+    const r = await fetch(url, {
+      method: "POST",
+      credentials: "include",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(payload)
+    });
+
+    const j = await r.json().catch(() => ({}));
+    const reintentar = (r.status === 401 || r.status >= 500);
+    if (!reintentar) await quitar(lote.map(s => s.id));
+
+    return { status: r.status, ok: r.ok, json: j, enviados: lote };
+  }
+
+  global.ColaScans = {
+    LOTE_MAX,
+    SYNC_TAG,
+    encolar,
+    pendientes,
+    pedidosEnCola,
+    contar,
+    quitar,
+    conCandado,
+    enviarLote
+  };
+})(self);
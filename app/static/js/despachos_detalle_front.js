@@ -286,13 +286,14 @@ document.addEventListener("DOMContentLoaded", () => {
     //setFinEnabled(iniciado && total > 0 && completos);
     setFinEnabled(iniciado && total > 0);
   }
-function pintarTabla(detalle) {
-  tablaBody.innerHTML = "";
-
-  if (!detalle || !detalle.length) {
-    tablaBody.innerHTML = `<tr><td colspan="10">No hay detalle.</td></tr>`;
-    refreshFinState([]);
-    return;
+  // ✅ copia local del detalle + versión (RowVer) que tenemos pintada.
+  // El scan / leer?desde= devuelven solo las líneas cambiadas y se parchan.
+  let detalleActual = [];
+  let versionDetalle = null;
+  const filasPorClave = new Map();   // clave -> <tr>
+
+  function claveFila(row) {
+    return `${row?.ITEM ?? ""}|${row?.Cod_Producto_Pedido ?? ""}`;
   }
 
   // helper: tomar el 1er valor existente de varias llaves posibles
@@ -304,7 +305,7 @@ function pintarTabla(detalle) {
     return fallback;
   };
 
-  detalle.forEach((row, idx) => {
+  function crearFila(row, idx) {
     const tr = document.createElement("tr");
 
     const item      = pick(row, ["ITEM"], idx + 1);
@@ -331,6 +332,7 @@ function pintarTabla(detalle) {
 
     const ok = (objetivo > 0) ? (esc === objetivo) : true;
     tr.classList.add(ok ? "row-ok" : "row-pend");
+    tr.dataset.key = claveFila(row);
 
     tr.innerHTML = `
       <td>${escapeHtml(item)}</td>
@@ -344,14 +346,82 @@ function pintarTabla(detalle) {
       <td>${escapeHtml(ubicacion)}</td>
     `;
 
-    tablaBody.appendChild(tr);
+    return tr;
+  }
+
+function pintarTabla(detalle) {
+  detalleActual = (detalle || []).slice();
+  filasPorClave.clear();
+  tablaBody.innerHTML = "";
+
+  if (!detalle || !detalle.length) {
+    tablaBody.innerHTML = `<tr><td colspan="10">No hay detalle.</td></tr>`;
+    refreshFinState([]);
+    return;
+  }
+
+  const frag = document.createDocumentFragment();
+  detalleActual.forEach((row, idx) => {
+    const tr = crearFila(row, idx);
+    filasPorClave.set(tr.dataset.key, tr);
+    frag.appendChild(tr);
   });
+  tablaBody.appendChild(frag);
 
-  refreshFinState(detalle);
+  refreshFinState(detalleActual);
 }
 
-  async function cargarDetalle() {
-    const params = new URLSearchParams({ codppc, cododc });
+  // ✅ Reemplaza solo las filas que vinieron en el delta
+  function parcharFilas(lineas) {
+    if (!lineas || !lineas.length) return;
+    if (!detalleActual.length) { pintarTabla(lineas); return; }
+
+    lineas.forEach(row => {
+      const key = claveFila(row);
+      const idx = detalleActual.findIndex(r => claveFila(r) === key);
+      const tr  = crearFila(row, idx >= 0 ? idx : detalleActual.length);
+
+      if (idx >= 0) detalleActual[idx] = row;
+      else detalleActual.push(row);
+
+      const prev = filasPorClave.get(key);
+      if (prev) prev.replaceWith(tr);
+      else tablaBody.appendChild(tr);
+      filasPorClave.set(key, tr);
+    });
+
+    refreshFinState(detalleActual);
+  }
+
+  // ✅ solo las columnas que pinta la tabla, en formato columnar
+  // (nombres una vez + arreglos de valores): pedidos grandes pesan mucho menos
+  const COLUMNAS_DETALLE = [
+    "ITEM", "Cod_Producto_Pedido", "Descripcion_pedido", "UM", "Caja", "UE",
+    "Cantidad_a_Despachar", "Cantidd_abastecida", "Cantidad_Scaneada", "Ubicacion", "RowVer"
+  ];
+
+  function filasDe(lista) {
+    if (!lista || Array.isArray(lista)) return lista || [];
+    const cols = lista.columnas || [];
+    return (lista.filas || []).map(valores => {
+      const row = {};
+      cols.forEach((c, i) => { row[c] = valores[i]; });
+      return row;
+    });
+  }
+
+  function aplicarRespuestaDetalle(j) {
+    const detalle = filasDe(j.detalle);
+    if (j.delta) parcharFilas(detalle);
+    else pintarTabla(detalle);
+    if (j.version !== undefined && j.version !== null) versionDetalle = j.version;
+  }
+
+  async function cargarDetalle(desde = null) {
+    const params = new URLSearchParams({
+      codppc, cododc, columnas: COLUMNAS_DETALLE.join(","), format: "columnar"
+    });
+    if (desde !== null && desde !== undefined) params.append("desde", String(desde));
 
     const r = await fetch(`/api/despachos/detalle/leer?${params.toString()}`, {
       method: "GET",
@@ -366,7 +436,7 @@ function pintarTabla(detalle) {
       return;
     }
 
-    pintarTabla(j.detalle || []);
+    aplicarRespuestaDetalle(j);
   }
 
   // =========================
@@ -688,6 +758,23 @@ async function enviarScan({ codprod, cantidad, etiqueta, ppcQr }) {
     if (!ok) return;
   }
 
+  // doble lectura del mismo QR: ni siquiera sale de la tablet
+  if (etiqueta && etiquetasEscaneadas.has(`${codprod}|${etiqueta}`)) {
+    showToast(`Producto ${codprod}: etiqueta ya escaneada`, "warning");
+    return;
+  }
+
+  // ✅ Con IndexedDB: la lectura va a la cola y se envía en lotes
+  if (colaDisponible) {
+    try {
+      await ColaScans.encolar({ codppc, cododc, codprod, cantidad, etiqueta });
+      programarEnvioCola();
+      return;
+    } catch (err) {
+      console.warn("[COLA] no se pudo encolar, envío directo", err);
+    }
+  }
+
   const r = await fetch("/api/despachos/detalle/scan", {
     method: "POST",
     credentials: "include",
@@ -697,7 +784,8 @@ async function enviarScan({ codprod, cantidad, etiqueta, ppcQr }) {
       cododc,
       codprod,
       cantidad,
-      etiqueta
+      etiqueta,
+      version: versionDetalle
     })
   });
 
@@ -710,10 +798,164 @@ async function enviarScan({ codprod, cantidad, etiqueta, ppcQr }) {
     return;
   }
 
-  pintarTabla(j.detalle || []);
+  aplicarRespuestaDetalle(j);
   focusScanner();
 }
 
+  // =========================
+  // Cola de escaneos (ráfagas de la pistola / zonas sin Wi-Fi)
+  // =========================
+  const colaDisponible = !!(window.ColaScans && window.indexedDB);
+  const MOTIVOS_SCAN = {
+    sobrepicking: "excede la cantidad abastecida",
+    no_encontrado: "no está en este despacho",
+    duplicado: "etiqueta ya escaneada",
+    invalido: "lectura inválida"
+  };
+  let envioTimer = null;
+  let enviandoCola = false;
+
+  function programarEnvioCola(ms = 150) {
+    clearTimeout(envioTimer);
+    envioTimer = setTimeout(enviarCola, ms);
+  }
+
+  function claveEtiqueta(codprod, etiqueta) {
+    return `${codprod}|${etiqueta}`;
+  }
+
+  function avisarResultados(resultados) {
+    (resultados || []).forEach(x => {
+      if (x && x.etiqueta && (x.motivo === "ok" || x.motivo === "duplicado")) {
+        etiquetasEscaneadas.add(claveEtiqueta(x.codprod, x.etiqueta));
+      }
+    });
+
+    const errores = (resultados || []).filter(x => x && x.motivo && x.motivo !== "ok");
+    if (!errores.length) return;
+
+    const e = errores[0];
+    const extra = errores.length > 1 ? ` (+${errores.length - 1} más)` : "";
+    showToast(`Producto ${e.codprod}: ${MOTIVOS_SCAN[e.motivo] || e.motivo}${extra}`, "error");
+  }
+
+  async function pedirReenvioEnSegundoPlano() {
+    if (!("serviceWorker" in navigator)) return;
+    try {
+      const reg = await navigator.serviceWorker.ready;
+      if (reg.sync) await reg.sync.register(ColaScans.SYNC_TAG);
+    } catch (_) {}
+  }
+
+  async function enviarCola() {
+    if (enviandoCola) return;
+    enviandoCola = true;
+
+    try {
+      await ColaScans.conCandado(async () => {
+        while (true) {
+          let r;
+          try {
+            r = await ColaScans.enviarLote(
+            codppc, cododc, versionDetalle,
+            new URLSearchParams({ columnas: COLUMNAS_DETALLE.join(","), format: "columnar" }).toString()
+          );
+          } catch (err) {
+            // sin red: queda en IndexedDB, el SW lo reenvía al reconectar
+            const n = await ColaScans.contar(codppc, cododc);
+            showToast(`Sin conexión: ${n} escaneo(s) en cola.`, "warning");
+            await pedirReenvioEnSegundoPlano();
+            return;
+          }
+
+          if (!r.enviados.length) return;
+
+          if (r.status === 401) { window.location.href = "/login"; return; }
+          if (r.status >= 500) {
+            showToast((r.json && r.json.msg) || "Error del servidor, se reintentará.", "error");
+            programarEnvioCola(3000);
+            return;
+          }
+          if (!r.ok) {
+            showToast((r.json && r.json.msg) || "Error en escaneo", "error");
+            continue;
+          }
+
+          aplicarRespuestaDetalle(r.json);
+          avisarResultados(r.json.resultados);
+        }
+      });
+    } finally {
+      enviandoCola = false;
+      focusScanner();
+    }
+  }
+
+  if (colaDisponible) {
+    window.addEventListener("online", () => programarEnvioCola(0));
+
+    // el SW avisa cuando reenvió lecturas de este pedido
+    navigator.serviceWorker?.addEventListener("message", (e) => {
+      const m = e.data || {};
+      if (m.tipo !== "cola-scans" || m.codppc !== codppc || m.cododc !== cododc) return;
+      avisarResultados(m.resultados);
+      cargarDetalle(versionDetalle);
+    });
+  }
+
+  // =========================
+  // Progreso en vivo (SSE): lecturas de otras tablets / supervisor
+  // Sin stream (servidor WSGI: 503, o navegador sin EventSource) se consulta
+  // cada POLLING_MS; detalle delta y cabecera con ETag, casi siempre 304.
+  // =========================
+  const POLLING_MS = 10000;
+  let timerPolling = null;
+
+  const iniciarPolling = () => {
+    if (timerPolling) return;
+    timerPolling = setInterval(() => {
+      if (document.hidden) return;
+      cargarDetalle(versionDetalle);
+      cargarCabecera();
+    }, POLLING_MS);
+    window.addEventListener("pagehide", () => clearInterval(timerPolling));
+  };
+
+  if (!("EventSource" in window)) {
+    iniciarPolling();
+  } else {
+    const params = new URLSearchParams({ codppc, cododc });
+    const eventos = new EventSource(`/api/despachos/stream?${params.toString()}`);
+    let timerEvento = null;
+
+    // un 503 (o cualquier respuesta que no sea text/event-stream) cierra el
+    // EventSource sin reintentar: se pasa a polling
+    eventos.addEventListener("error", () => {
+      if (eventos.readyState === EventSource.CLOSED) iniciarPolling();
+    });
+
+    const leerEvento = (e) => {
+      try { return JSON.parse(e.data || "{}"); } catch { return {}; }
+    };
+
+    eventos.addEventListener("scan", (e) => {
+      const ev = leerEvento(e);
+      // nuestras propias lecturas ya vinieron en la respuesta del scan
+      if (ev.version !== undefined && versionDetalle !== null && ev.version <= versionDetalle) return;
+      clearTimeout(timerEvento);
+      timerEvento = setTimeout(() => cargarDetalle(versionDetalle), 300);
+    });
+
+    ["inicio", "fin", "asignacion"].forEach(tipo => {
+      eventos.addEventListener(tipo, () => {
+        cargarCabecera();
+        if (tipo === "fin") cargarDetalle();
+      });
+    });
+
+    window.addEventListener("pagehide", () => eventos.close());
+  }
+
   // =========================
   // scanInput (si existe)
   // =========================
@@ -843,6 +1085,9 @@ async function enviarScan({ codprod, cantidad, etiqueta, ppcQr }) {
   // Primera carga
   // =========================
   cargarCabecera();
-  cargarDetalle();
+  cargarDetalle().then(() => {
+    // si quedó algo en cola de una sesión anterior, enviarlo
+    if (colaDisponible) programarEnvioCola(0);
+  });
   focusScanner();
 });
\ No newline at end of file
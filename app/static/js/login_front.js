@@ -3,6 +3,7 @@ document.addEventListener("DOMContentLoaded", () => {
   const inputUser = document.querySelector("#username");
   const inputPass = document.querySelector("#password");
   const errorEl   = document.querySelector("#error");
+  const selSede   = document.querySelector("#sede");   // solo si hay varias sedes
 
   form.addEventListener("submit", async (e) => {
     e.preventDefault();
@@ -16,6 +17,12 @@ document.addEventListener("DOMContentLoaded", () => {
       return;
     }
 
+    const datos = { username, password };
+    if (selSede && selSede.value) {
+      const [codcia, codsuc] = selSede.value.split("-");
+      Object.assign(datos, { codcia, codsuc });
+    }
+
     try {
       const r = await fetch("/api/auth/login", {
         method: "POST",
@@ -24,7 +31,7 @@ document.addEventListener("DOMContentLoaded", () => {
         // ✅ CLAVE: permite recibir (Set-Cookie) y enviar cookies
         credentials: "include",
 
-        body: JSON.stringify({ username, password })
+        body: JSON.stringify(datos)
       });
 
       const j = await r.json().catch(() => ({}));
@@ -45,6 +52,10 @@ document.addEventListener("DOMContentLoaded", () => {
         localStorage.removeItem("usuario");
       }
 
+      if (j.sede) {
+        localStorage.setItem("sede", JSON.stringify(j.sede));
+      }
+
       // ✅ Redirección a menú (ya estará protegido por @jwt_required())
       window.location.href = "/menu";
 
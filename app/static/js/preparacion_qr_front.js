@@ -100,6 +100,20 @@ function escapeHtml(v) {
     .replaceAll("'", "&#039;");
 }
 
+// =========================
+// Avance del pedido (contadores del backend: líneas completas / totales)
+// =========================
+function avanceTexto(av) {
+  if (!av || !av.lineas) return "-";
+  const pct = Math.floor((Number(av.unidades_escaneadas) || 0) * 100 / (Number(av.unidades_abastecidas) || 1));
+  return `${av.lineas_completas}/${av.lineas} líneas · ${Math.min(pct, 100)}%`;
+}
+
+function avanceClase(av) {
+  if (!av || !av.lineas) return "verde";
+  return av.lineas_completas >= av.lineas ? "verde" : "ambar";
+}
+
 // =========================
 // Función que carga la grilla
 // =========================
@@ -165,7 +179,7 @@ async function cargar(resetToFirstPage = false) {
           <div class="meta-row">
             <div class="meta-left">
               <span class="badge almacen">Almacén</span>
-              <div class="sub-status verde">-</div>
+              <div class="sub-status ${avanceClase(row.avance)}">${escapeHtml(avanceTexto(row.avance))}</div>
             </div>
 
             <div class="meta-dates">
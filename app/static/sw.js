@@ -1,7 +1,49 @@
+importScripts("/static/js/cola_scans.js");
+
 self.addEventListener("install", (event) => {
   self.skipWaiting();
 });
 
 self.addEventListener("activate", (event) => {
   clients.claim();
-});
\ No newline at end of file
+});
+
+// =========================
+// Replay de la cola de escaneos al volver la conexión
+// =========================
+async function reenviarCola() {
+  const pedidos = await ColaScans.pedidosEnCola();
+
+  for (const { codppc, cododc } of pedidos) {
+    await ColaScans.conCandado(async () => {
+      // vaciar la cola del pedido lote por lote
+      while (true) {
+        const r = await ColaScans.enviarLote(codppc, cododc);
+        if (!r.enviados.length) break;
+        if (r.status === 401 || r.status >= 500) throw new Error(`replay ${r.status}`);
+
+        const lista = await clients.matchAll({ type: "window" });
+        lista.forEach(c => c.postMessage({
+          tipo: "cola-scans",
+          codppc,
+          cododc,
+          status: r.status,
+          resultados: (r.json && r.json.resultados) || []
+        }));
+      }
+    });
+  }
+}
+
+self.addEventListener("sync", (event) => {
+  if (event.tag === ColaScans.SYNC_TAG) {
+    // si falla, el navegador vuelve a disparar el sync más tarde
+    event.waitUntil(reenviarCola());
+  }
+});
+
+self.addEventListener("message", (event) => {
+  if (event.data && event.data.tipo === "reenviar-cola") {
+    event.waitUntil(reenviarCola().catch(() => {}));
+  }
+});
@@ -0,0 +1,32 @@
+# app/tareas.py
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+def iniciar_tarea_periodica(nombre: str, intervalo_s: float, fn, *args, inmediato: bool = False, **kwargs):
+    """
+    Ejecuta fn(*args, **kwargs) cada intervalo_s segundos en un hilo daemon
+    (inmediato=True: también una vez al arrancar).
+    Un error se registra en el log y la tarea sigue en la siguiente vuelta.
+    intervalo_s <= 0 no inicia nada. Devuelve el Event que la detiene.
+    """
+    detener = threading.Event()
+    if not intervalo_s or intervalo_s <= 0:
+        return detener
+
+    def _bucle():
+        if inmediato:
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                log.exception("tarea %s falló", nombre)
+        while not detener.wait(intervalo_s):
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                log.exception("tarea %s falló", nombre)
+
+    threading.Thread(target=_bucle, name=f"tarea-{nombre}", daemon=True).start()
+    return detener
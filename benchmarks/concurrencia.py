@@ -0,0 +1,222 @@
+"""
+Prueba de carga de escaneos concurrentes: WSGI con hilos vs capa ASGI.
+
+    python -m benchmarks.concurrencia --clientes 64 --pedidos 16 --latencia-ms 10
+    python -m benchmarks.concurrencia --modo asgi --salida conc-asgi.json
+
+Cada cliente es una tablet que manda POST /detalle/scan de a uno y espera
+la respuesta antes del siguiente. Los clientes se reparten entre los
+pedidos (varios preparadores por pedido, como en una oleada).
+
+  wsgi: la app Flask atendida por WEB_THREADS hilos (lo que hace gunicorn
+        gthread por proceso): un scan ocupa un hilo mientras espera a BD.
+  asgi: app/asgi.py con ASGI_HILOS = WEB_THREADS hilos para BD, llamada
+        en proceso (sin servidor HTTP de por medio).
+
+--latencia-ms agrega una espera por sentencia en el stand-in (el viaje a
+SQL Server); sin ella todo es CPU de Python y ambos modos empatan.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.despachos import percentil, _commit_actual, _imprimir_standin
+from benchmarks.standin import contrato
+
+
+def _lecturas_por_cliente(detalles, pedidos, clientes):
+    """Reparte las unidades de cada pedido (una etiqueta por unidad) entre sus clientes."""
+    por_cliente = [[] for _ in range(clientes)]
+    for p, (ppc, odc) in enumerate(pedidos):
+        suyos = [c for c in range(clientes) if c % len(pedidos) == p]
+        unidades = []
+        for fila in detalles[p]:
+            for u in range(int(fila.get("Cantidd_abastecida") or 0)):
+                unidades.append({
+                    "codppc": ppc, "cododc": odc, "codprod": fila["Cod_Producto_Pedido"],
+                    "cantidad": 1, "etiqueta": f"{ppc}-{fila['ITEM']}-{u}",
+                })
+        for i, lectura in enumerate(unidades):
+            por_cliente[suyos[i % len(suyos)]].append(lectura)
+    return por_cliente
+
+
+def _preparar(args):
+    from benchmarks.standin import registrar, URL, dbapi
+    from benchmarks.standin.esquema import sembrar, pedidos_sinteticos, USUARIO, PREPARADORES
+
+    tmp = tempfile.mkdtemp(prefix="bench-conc-")
+    ruta = os.path.join(tmp, "picking.db")
+    sembrar(ruta, args.pedidos, args.lineas, args.semilla)
+
+    registrar()
+    os.environ["DATABASE_URL"] = URL.format(ruta=ruta)
+    os.environ["COMPACTACION_INTERVALO_S"] = "0"
+    os.environ["EVENTOS_BACKEND"] = "memoria"
+    os.environ["WEB_THREADS"] = str(args.hilos)
+    os.environ["ASGI_HILOS"] = str(args.hilos)
+
+    from app import create_app
+    app = create_app()
+    cliente = app.test_client()
+    r = cliente.post("/api/auth/login", json={"username": USUARIO, "password": "1234"})
+    if r.status_code != 200:
+        raise SystemExit(f"login falló: {r.status_code}")
+    token = cliente.get_cookie(app.config["JWT_ACCESS_COOKIE_NAME"]).value
+
+    pedidos = pedidos_sinteticos(args.pedidos)
+    detalles = []
+    for i, (ppc, odc) in enumerate(pedidos):
+        pedido = {"codppc": ppc, "cododc": odc}
+        cliente.post("/api/despachos/detalle/asignar",
+                     json={**pedido, "preparado_id": PREPARADORES[i % len(PREPARADORES)]})
+        cliente.post("/api/despachos/detalle/inicio", json=pedido)
+        detalles.append(cliente.get(f"/api/despachos/detalle/leer?codppc={ppc}&cododc={odc}").get_json()["detalle"])
+
+    # la latencia solo para la parte medida
+    dbapi.LATENCIA_S = args.latencia_ms / 1000
+    return app, token, _lecturas_por_cliente(detalles, pedidos, args.clientes)
+
+
+def _correr_wsgi(app, token, lecturas, hilos):
+    """Cada cliente en su hilo; el 'servidor' atiende con `hilos` hilos."""
+    servidor = ThreadPoolExecutor(max_workers=hilos)
+    nombre_cookie = app.config["JWT_ACCESS_COOKIE_NAME"]
+    tiempos, estados, lock = [], {}, threading.Lock()
+
+    def atender(lectura):
+        c = app.test_client()
+        c.set_cookie(nombre_cookie, token)
+        return c.post("/api/despachos/detalle/scan", json=lectura).status_code
+
+    def tablet(mias):
+        for lectura in mias:
+            t0 = time.perf_counter()
+            status = servidor.submit(atender, lectura).result()
+            ms = (time.perf_counter() - t0) * 1000
+            with lock:
+                tiempos.append(ms)
+                estados[status] = estados.get(status, 0) + 1
+
+    tablets = [threading.Thread(target=tablet, args=(mias,)) for mias in lecturas]
+    t0 = time.perf_counter()
+    for t in tablets:
+        t.start()
+    for t in tablets:
+        t.join()
+    duracion = time.perf_counter() - t0
+    servidor.shutdown()
+    return tiempos, estados, duracion
+
+
+async def _post_asgi(asgi, token, nombre_cookie, ruta, cuerpo: bytes):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": ruta, "root_path": "",
+        "query_string": b"", "server": ("localhost", 80), "client": ("127.0.0.1", 0),
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"cookie", f"{nombre_cookie}={token}".encode("latin-1")),
+        ],
+    }
+    entregado = False
+
+    async def receive():
+        nonlocal entregado
+        if not entregado:
+            entregado = True
+            return {"type": "http.request", "body": cuerpo, "more_body": False}
+        await asyncio.Event().wait()
+
+    status = {}
+
+    async def send(m):
+        if m["type"] == "http.response.start":
+            status["v"] = m["status"]
+
+    await asgi(scope, receive, send)
+    return status.get("v")
+
+
+def _correr_asgi(app, token, lecturas):
+    from app.asgi import AppASGI
+
+    asgi = AppASGI(app)
+    nombre_cookie = app.config["JWT_ACCESS_COOKIE_NAME"]
+    tiempos, estados = [], {}
+
+    async def tablet(mias):
+        for lectura in mias:
+            t0 = time.perf_counter()
+            status = await _post_asgi(
+                asgi, token, nombre_cookie, "/api/despachos/detalle/scan",
+                json.dumps(lectura).encode("utf-8")
+            )
+            tiempos.append((time.perf_counter() - t0) * 1000)
+            estados[status] = estados.get(status, 0) + 1
+
+    async def todas():
+        await asyncio.gather(*(tablet(mias) for mias in lecturas))
+
+    t0 = time.perf_counter()
+    asyncio.run(todas())
+    return tiempos, estados, time.perf_counter() - t0
+
+
+def ejecutar(args):
+    app, token, lecturas = _preparar(args)
+    with contrato.Registro() as registro:
+        if args.modo == "wsgi":
+            tiempos, estados, duracion = _correr_wsgi(app, token, lecturas, args.hilos)
+        else:
+            tiempos, estados, duracion = _correr_asgi(app, token, lecturas)
+
+    return {
+        "commit": _commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": {
+            "modo": args.modo, "clientes": args.clientes, "pedidos": args.pedidos,
+            "lineas": args.lineas, "hilos": args.hilos, "latencia_ms": args.latencia_ms,
+            "semilla": args.semilla,
+        },
+        "scans": len(tiempos),
+        "estados": {str(k): v for k, v in sorted(estados.items(), key=lambda kv: str(kv[0]))},
+        "duracion_s": round(duracion, 3),
+        "scans_por_s": round(len(tiempos) / duracion, 1) if duracion else None,
+        "p50_ms": round(percentil(tiempos, 50), 3),
+        "p95_ms": round(percentil(tiempos, 95), 3),
+        "p99_ms": round(percentil(tiempos, 99), 3),
+        "standin": contrato.descripcion(registro),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--modo", choices=("wsgi", "asgi"), default="wsgi")
+    ap.add_argument("--clientes", type=int, default=64, help="tablets escaneando a la vez")
+    ap.add_argument("--pedidos", type=int, default=16)
+    ap.add_argument("--lineas", type=int, default=30, help="líneas por pedido")
+    ap.add_argument("--hilos", type=int, default=8, help="WEB_THREADS / ASGI_HILOS")
+    ap.add_argument("--latencia-ms", type=float, default=10.0, help="espera por sentencia en el stand-in")
+    ap.add_argument("--semilla", type=int, default=7)
+    ap.add_argument("--salida", help="archivo JSON con el resultado")
+    args = ap.parse_args()
+
+    res = ejecutar(args)
+    print(f"{res['parametros']['modo']}: {res['scans']} scans en {res['duracion_s']} s "
+          f"-> {res['scans_por_s']} scans/s  p50 {res['p50_ms']:.1f} ms  "
+          f"p95 {res['p95_ms']:.1f} ms  p99 {res['p99_ms']:.1f} ms  estados {res['estados']}")
+    _imprimir_standin(res["standin"])
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
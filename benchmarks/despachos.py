@@ -0,0 +1,222 @@
+"""
+Benchmark del servicio de despachos contra el stand-in local (SQLite).
+
+    python -m benchmarks.despachos --pedidos 20 --lineas 40 --salida bench.json
+    python -m benchmarks.despachos --motor sql --lote 10 --salida bench-sql.json
+    python -m benchmarks.despachos --lineas 300 --columnar
+
+Siembra pedidos sintéticos y recorre la app con el test client de Flask,
+como lo haría una tablet: listado (paginado), abrir pedido (cabecera,
+asignar, inicio, detalle), ráfagas de escaneo (con relecturas de etiqueta
+y lecturas delta) y fin. Escribe throughput y p50/p95/p99 por endpoint en
+un JSON para comparar entre commits.
+
+Los lotes T-SQL marcados (scan, archivado, página SQL, oleadas) corren como
+copia Python en el stand-in: su T-SQL no se mide. La salida lo avisa y
+trae el chequeo de contrato de esas llamadas (benchmarks/standin/contrato.py).
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+
+
+def percentil(valores, p):
+    """Percentil por rango más cercano (p en 0..100)."""
+    if not valores:
+        return None
+    orden = sorted(valores)
+    k = max(0, min(len(orden) - 1, int(round(p / 100 * len(orden) + 0.5)) - 1))
+    return orden[k]
+
+
+def _commit_actual():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Medidor:
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.tiempos = defaultdict(list)
+        self.errores = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def llamar(self, nombre, metodo, url, esperado=(200,), **kw):
+        t0 = time.perf_counter()
+        r = getattr(self.cliente, metodo)(url, **kw)
+        self.tiempos[nombre].append((time.perf_counter() - t0) * 1000)
+        self.bytes[nombre] += len(r.data)
+        if r.status_code not in esperado:
+            self.errores[nombre] += 1
+        return r
+
+
+# las columnas que pinta la tabla del detalle (despachos_detalle_front.js)
+COLUMNAS_FRONT = (
+    "ITEM,Cod_Producto_Pedido,Descripcion_pedido,UM,Caja,UE,"
+    "Cantidad_a_Despachar,Cantidd_abastecida,Cantidad_Scaneada,Ubicacion,RowVer"
+)
+
+
+def _flujo_pedido(m, ppc, odc, args, rnd, pagina):
+    pedido = {"codppc": ppc, "cododc": odc}
+    q = f"codppc={ppc}&cododc={odc}"
+    forma = f"&columnas={COLUMNAS_FRONT}&format=columnar" if args.columnar else ""
+
+    m.llamar("listar", "get", f"/api/despachos/?page={pagina}&page_size=20")
+    m.llamar("cabecera", "get", f"/api/despachos/detalle/cabecera?{q}")
+    m.llamar("asignar", "post", "/api/despachos/detalle/asignar",
+             json={**pedido, "preparado_id": rnd.choice(args.preparadores)})
+    m.llamar("inicio", "post", "/api/despachos/detalle/inicio", json=pedido)
+
+    r = m.llamar("leer", "get", f"/api/despachos/detalle/leer?{q}")
+    j = r.get_json() or {}
+    version = j.get("version")
+    if args.columnar:
+        m.llamar("leer_columnar", "get", f"/api/despachos/detalle/leer?{q}{forma}")
+
+    # una lectura por unidad, etiqueta única por unidad; algunas se releen
+    lecturas = []
+    for fila in j.get("detalle", []):
+        for u in range(int(fila.get("Cantidd_abastecida") or 0)):
+            etiqueta = f"{ppc}-{fila['ITEM']}-{u}"
+            lecturas.append({"codprod": fila["Cod_Producto_Pedido"], "cantidad": 1, "etiqueta": etiqueta})
+            if rnd.random() < args.relecturas:
+                lecturas.append({"codprod": fila["Cod_Producto_Pedido"], "cantidad": 1, "etiqueta": etiqueta})
+    rnd.shuffle(lecturas)
+
+    # duplicados y sobrepicking devuelven 409/400 a propósito
+    for i in range(0, len(lecturas), args.lote):
+        grupo = lecturas[i:i + args.lote]
+        if args.lote == 1:
+            r = m.llamar("scan", "post", "/api/despachos/detalle/scan",
+                         esperado=(200, 400, 409), json={**pedido, **grupo[0], "version": version})
+        else:
+            r = m.llamar("scan_batch", "post", f"/api/despachos/detalle/scan/batch?{forma[1:]}",
+                         esperado=(200, 409), json={**pedido, "items": grupo, "version": version})
+        version = (r.get_json() or {}).get("version") or version
+
+        if (i // args.lote) % args.delta_cada == args.delta_cada - 1:
+            r = m.llamar("leer_delta", "get", f"/api/despachos/detalle/leer?{q}&desde={version or 0}{forma}")
+            version = (r.get_json() or {}).get("version") or version
+
+    m.llamar("fin", "post", "/api/despachos/detalle/fin", json=pedido)
+    m.llamar("leer_historico", "get", f"/api/despachos/detalle/leer?{q}")
+
+
+def ejecutar(args):
+    from benchmarks.standin import registrar, URL, contrato
+    from benchmarks.standin.esquema import sembrar, pedidos_sinteticos, USUARIO, PREPARADORES
+
+    tmp = tempfile.mkdtemp(prefix="bench-despachos-")
+    ruta = os.path.join(tmp, "picking.db")
+    sembrar(ruta, args.pedidos, args.lineas, args.semilla)
+
+    # la configuración se lee al importar app.config
+    registrar()
+    os.environ["DATABASE_URL"] = URL.format(ruta=ruta)
+    os.environ["DESPACHOS_LISTADO_MOTOR"] = args.motor
+    os.environ["COMPACTACION_INTERVALO_S"] = "0"
+    os.environ["EVENTOS_BACKEND"] = "memoria"
+    os.environ["PRECARGA_PEDIDOS"] = str(args.precarga)
+
+    from app import create_app
+    from app.despachos.serializacion import motor_json
+    app = create_app()
+    cliente = app.test_client()
+
+    r = cliente.post("/api/auth/login", json={"username": USUARIO, "password": "1234"})
+    if r.status_code != 200:
+        raise SystemExit(f"login falló: {r.status_code} {r.get_data(as_text=True)[:200]}")
+
+    args.preparadores = PREPARADORES
+    rnd = random.Random(args.semilla)
+    m = Medidor(cliente)
+
+    t0 = time.perf_counter()
+    with contrato.Registro() as registro:
+        for i, (ppc, odc) in enumerate(pedidos_sinteticos(args.pedidos)):
+            _flujo_pedido(m, ppc, odc, args, rnd, pagina=i % 5 + 1)
+    duracion = time.perf_counter() - t0
+
+    total = sum(len(v) for v in m.tiempos.values())
+    endpoints = {}
+    for nombre, ms in m.tiempos.items():
+        endpoints[nombre] = {
+            "n": len(ms),
+            "errores": m.errores.get(nombre, 0),
+            "rps": round(len(ms) / (sum(ms) / 1000), 1) if sum(ms) else None,
+            "media_ms": round(statistics.fmean(ms), 3),
+            "p50_ms": round(percentil(ms, 50), 3),
+            "p95_ms": round(percentil(ms, 95), 3),
+            "p99_ms": round(percentil(ms, 99), 3),
+            "bytes_medio": round(m.bytes[nombre] / len(ms)),
+        }
+
+    return {
+        "commit": _commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": {
+            "pedidos": args.pedidos, "lineas": args.lineas, "lote": args.lote,
+            "motor": args.motor, "relecturas": args.relecturas,
+            "delta_cada": args.delta_cada, "semilla": args.semilla,
+            "columnar": args.columnar, "json": motor_json(), "precarga": args.precarga,
+        },
+        "requests": total,
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(total / duracion, 1) if duracion else None,
+        "endpoints": endpoints,
+        "standin": contrato.descripcion(registro),
+    }
+
+
+def _imprimir_standin(standin):
+    lotes = ", ".join(f"{n} x{c}" for n, c in standin["lotes"].items()) or "ninguno"
+    print(f"aviso: {standin['aviso']}. Lotes: {lotes}")
+    print(f"contrato de los lotes: {len(standin['problemas'])} problemas")
+    for p in standin["problemas"]:
+        print(f"  - {p}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pedidos", type=int, default=20)
+    ap.add_argument("--lineas", type=int, default=40, help="líneas por pedido")
+    ap.add_argument("--lote", type=int, default=1, help="lecturas por request (1 = /scan, >1 = /scan/batch)")
+    ap.add_argument("--motor", choices=("cache", "sql"), default="cache", help="DESPACHOS_LISTADO_MOTOR")
+    ap.add_argument("--relecturas", type=float, default=0.05, help="fracción de etiquetas leídas dos veces")
+    ap.add_argument("--delta-cada", type=int, default=10, help="lectura delta cada N requests de scan")
+    ap.add_argument("--columnar", action="store_true",
+                    help="lecturas con ?columnas=...&format=columnar, como el front")
+    ap.add_argument("--precarga", type=int, default=0,
+                    help="PRECARGA_PEDIDOS (0 = sin precarga, comparable con corridas anteriores)")
+    ap.add_argument("--semilla", type=int, default=7)
+    ap.add_argument("--salida", help="archivo JSON con el resultado")
+    args = ap.parse_args()
+
+    res = ejecutar(args)
+
+    print(f"{res['requests']} requests en {res['duracion_s']} s -> {res['throughput_rps']} req/s")
+    print(f"{'endpoint':<16}{'n':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>10}")
+    for nombre, e in res["endpoints"].items():
+        print(f"{nombre:<16}{e['n']:>7}{e['errores']:>5}{e['p50_ms']:>10.2f}{e['p95_ms']:>10.2f}"
+              f"{e['p99_ms']:>10.2f}{e['bytes_medio']:>10}")
+    _imprimir_standin(res["standin"])
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(res, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Bytes y tiempo por escaneo: respuesta completa (detalle entero) vs delta.
+
+    python -m benchmarks.scan_delta --lineas 300 --escaneos 200 --mbps 6
+
+Arma un pedido sintético con las mismas columnas que PICKING_DETALLE,
+simula escaneos y serializa cada respuesta con el JSON de Flask (igual que
+jsonify). El tiempo de red se estima con el ancho de banda indicado.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from flask import Flask
+
+
+def pedido_sintetico(lineas: int):
+    filas = []
+    for i in range(1, lineas + 1):
+        abastecida = Decimal(random.randint(1, 40))
+        filas.append({
+            "CIA_CODCIA": "01", "SUC_CODSUC": "01",
+            "PPC_NUMPPC": "0000123456", "ODC_NUMODC": "0000654321",
+            "ITEM": i, "It_D": i, "L": "1",
+            "Cod_Producto_Pedido": f"{100000 + i}",
+            "Descripcion_pedido": f"MANGUERA HIDRAULICA SAE 100R2 {i} MTS",
+            "CodigoParte": f"STB-{i:05d}", "UM": "UND",
+            "UE": Decimal("1.0000"), "Indica_Cierre": "0",
+            "Cantidad_a_Despachar": abastecida, "Cantidd_abastecida": abastecida,
+            "Caja": f"C{i % 20:02d}", "Peso_Neto": Decimal("2.3500"),
+            "Cantidad_Scaneada": Decimal(0), "Diferencia": -abastecida,
+            "Ubicacion": f"A{i % 12:02d}-R{i % 30:02d}-N{i % 5}",
+            "ESTADO": "0", "RowVer": 90000 + i,
+        })
+    return filas
+
+
+def medir(lineas: int, escaneos: int, mbps: float):
+    app = Flask(__name__)
+    filas = pedido_sintetico(lineas)
+    version = max(f["RowVer"] for f in filas)
+    totales = {"lineas": lineas, "lineas_completas": 0,
+               "unidades_abastecidas": 0, "unidades_escaneadas": 0}
+
+    res = {"completo": {"bytes": [], "ms": []}, "delta": {"bytes": [], "ms": []}}
+
+    with app.app_context():
+        for _ in range(escaneos):
+            fila = random.choice(filas)
+            fila["Cantidad_Scaneada"] += 1
+            version += 1
+            fila["RowVer"] = version
+
+            t0 = time.perf_counter()
+            cuerpo = app.json.dumps({"msg": "OK", "detalle": filas})
+            res["completo"]["ms"].append((time.perf_counter() - t0) * 1000)
+            res["completo"]["bytes"].append(len(cuerpo.encode("utf-8")))
+
+            t0 = time.perf_counter()
+            cuerpo = app.json.dumps({"msg": "OK", "detalle": [fila], "version": version,
+                                     "totales": totales, "delta": True})
+            res["delta"]["ms"].append((time.perf_counter() - t0) * 1000)
+            res["delta"]["bytes"].append(len(cuerpo.encode("utf-8")))
+
+    resumen = {}
+    for modo, m in res.items():
+        bytes_p50 = statistics.median(m["bytes"])
+        resumen[modo] = {
+            "bytes_p50": bytes_p50,
+            "serializar_ms_p50": round(statistics.median(m["ms"]), 4),
+            "red_ms_estimada": round(bytes_p50 * 8 / (mbps * 1_000_000) * 1000, 3),
+        }
+    return resumen
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--lineas", type=int, default=300)
+    ap.add_argument("--escaneos", type=int, default=200)
+    ap.add_argument("--mbps", type=float, default=6.0, help="ancho de banda Wi-Fi estimado")
+    ap.add_argument("--salida", help="archivo JSON con el resultado")
+    args = ap.parse_args()
+
+    random.seed(7)
+    resumen = medir(args.lineas, args.escaneos, args.mbps)
+
+    print(f"{'modo':<10}{'bytes p50':>12}{'serializar ms':>16}{'red ms (est.)':>16}")
+    for modo, r in resumen.items():
+        print(f"{modo:<10}{r['bytes_p50']:>12.0f}{r['serializar_ms_p50']:>16.3f}{r['red_ms_estimada']:>16.2f}")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"lineas": args.lineas, "escaneos": args.escaneos, "resultado": resumen}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Stand-in local de SQL Server para los benchmarks (SQLite, sin contenedor).
+
+    from benchmarks.standin import registrar, URL
+    registrar()
+    os.environ["DATABASE_URL"] = URL.format(ruta="bench.db")
+
+- dialecto.py: dialecto SQLAlchemy "sqlite+standin" (paramstyle named).
+- dbapi.py:    módulo DB-API que traduce el T-SQL del servicio (GETDATE,
+               ISNULL, MERGE, TOP, hints...) y atiende con Python los lotes
+               marcados "-- picking:<nombre>" y los SP de despachos.
+- esquema.py:  tablas, triggers de RowVer y datos sintéticos.
+- contrato.py: chequeo de contrato de los lotes marcados.
+
+No reproduce el plan ni los locks de SQL Server: sirve para comparar
+commits entre sí (costo del lado Python + viajes), no para dimensionar BD.
+Los lotes marcados corren como copia Python (dbapi._LOTES): su T-SQL no se
+ejecuta ni se mide; solo se verifica su contrato (contrato.py).
+"""
+from sqlalchemy.dialects import registry
+
+URL = "sqlite+standin:///{ruta}"
+
+
+def registrar():
+    registry.register("sqlite.standin", "benchmarks.standin.dialecto", "DialectoStandin")
@@ -0,0 +1,344 @@
+# benchmarks/standin/contrato.py
+"""
+Chequeo de contrato de los lotes T-SQL marcados "-- picking:<nombre>".
+
+El stand-in NO ejecuta esos lotes: los atiende una copia en Python
+(dbapi._LOTES). Su T-SQL no se mide ni se prueba contra un motor. Lo que
+sí se verifica sin SQL Server:
+  - sintaxis básica: paréntesis, comillas y BEGIN/CASE ... END
+    balanceados; toda @variable usada está declarada en el lote,
+  - parámetros: cada llamada manda tantos valores como "?" tiene el lote
+    (o todos los :nombre que usa),
+  - resultados: la copia Python devuelve tantos result sets como SELECT
+    de salida tiene el lote, con los mismos nombres de columna (las sin
+    alias o con * no se comparan).
+No verifica la semántica: una diferencia de lógica entre el T-SQL y su
+copia Python sigue pasando; eso solo lo ve una corrida contra SQL Server.
+
+    with Registro() as reg:
+        ...                      # tráfico contra el stand-in
+    reg.problemas                # [(lote, problema)]
+"""
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import dbapi
+
+_RE_BLOQUE = re.compile(r"/\*.*?\*/", re.S)
+_RE_TOKEN = re.compile(
+    r"'(?:[^']|'')*'"          # literal
+    r"|\[[^\]]*\]"             # [identificador]
+    r"|@@\w+|@\w+|#\w+|:\w+"
+    r"|\w+"
+    r"|\?"
+    r"|[^\s\w]"
+)
+
+# palabras que empiezan una sentencia (cortan un INSERT ... SELECT / lista de columnas)
+_SENTENCIAS = {
+    "INSERT", "UPDATE", "DELETE", "SET", "DECLARE", "IF", "ELSE", "WHILE", "EXEC", "EXECUTE",
+    "WITH", "MERGE", "BEGIN", "END", "CREATE", "DROP", "THROW", "RETURN", "SELECT",
+}
+
+
+def _sin_comentarios(sql: str) -> str:
+    sql = _RE_BLOQUE.sub(" ", sql)
+    # "--" fuera de literales
+    salida, en_literal, i = [], False, 0
+    while i < len(sql):
+        ch = sql[i]
+        if ch == "'":
+            en_literal = not en_literal
+        if not en_literal and sql.startswith("--", i):
+            fin = sql.find("\n", i)
+            i = len(sql) if fin < 0 else fin
+            continue
+        salida.append(ch)
+        i += 1
+    return "".join(salida)
+
+
+def tokens(sql: str) -> List[str]:
+    return _RE_TOKEN.findall(_sin_comentarios(sql))
+
+
+def _palabra(t: str) -> str:
+    return t.upper() if re.match(r"^\w+$", t) else ""
+
+
+def _nombre(t: str) -> str:
+    return t[1:-1] if t.startswith("[") else t
+
+
+# =========================================================
+# Sintaxis
+# =========================================================
+def problemas_sintaxis(sql: str) -> List[str]:
+    problemas = []
+    limpio = _sin_comentarios(sql)
+    if re.sub(r"'(?:[^']|'')*'", "", limpio).count("'"):
+        problemas.append("comilla sin cerrar")
+
+    toks = tokens(sql)
+    nivel, bloques = 0, []
+    declaradas, usadas = set(), []
+    i = 0
+    while i < len(toks):
+        t, p = toks[i], _palabra(toks[i])
+        if t == "(":
+            nivel += 1
+        elif t == ")":
+            nivel -= 1
+            if nivel < 0:
+                problemas.append("')' sin '(' ")
+                nivel = 0
+        elif p == "BEGIN" and _palabra(toks[i + 1] if i + 1 < len(toks) else "") in ("TRAN", "TRANSACTION"):
+            i += 1
+        elif p in ("BEGIN", "CASE"):
+            bloques.append(p)
+        elif p == "END":
+            if not bloques:
+                problemas.append("END sin BEGIN/CASE")
+            else:
+                bloques.pop()
+            # END TRY / END CATCH
+            if _palabra(toks[i + 1] if i + 1 < len(toks) else "") in ("TRY", "CATCH"):
+                i += 1
+        elif p == "DECLARE":
+            # DECLARE @a T [= x], @b T ... ;  (las comas dentro de () no separan)
+            j, prof, esperando = i + 1, 0, True
+            while j < len(toks) and not (toks[j] == ";" and prof == 0):
+                if toks[j] == "(":
+                    prof += 1
+                elif toks[j] == ")":
+                    prof -= 1
+                elif toks[j] == "," and prof == 0:
+                    esperando = True
+                elif esperando and toks[j].startswith("@") and not toks[j].startswith("@@"):
+                    declaradas.add(toks[j].lower())
+                    esperando = False
+                j += 1
+        elif p in ("EXEC", "EXECUTE"):
+            # EXEC [@r =] proc @param = valor, ... : @param son del SP, no variables
+            j = i + 1
+            if j + 1 < len(toks) and toks[j].startswith("@") and toks[j + 1] == "=":
+                usadas.append(toks[j])
+                j += 2
+            while j < len(toks) and toks[j] != ";" and _palabra(toks[j]) not in _SENTENCIAS - {"EXEC"}:
+                if toks[j].startswith("@") and j + 1 < len(toks) and toks[j + 1] == "=":
+                    j += 2
+                    continue
+                if toks[j].startswith("@"):
+                    usadas.append(toks[j])
+                j += 1
+            i = j
+            continue
+        elif t.startswith("@") and not t.startswith("@@"):
+            usadas.append(t)
+        i += 1
+
+    if nivel:
+        problemas.append("paréntesis sin cerrar")
+    if bloques:
+        problemas.append(f"{len(bloques)} BEGIN/CASE sin END")
+    faltan = sorted({u for u in usadas if u.lower() not in declaradas})
+    if faltan:
+        problemas.append("variables sin DECLARE: " + ", ".join(faltan))
+    return problemas
+
+
+# =========================================================
+# Result sets
+# =========================================================
+def _columnas(items: List[List[str]]) -> Optional[List[Optional[str]]]:
+    """Nombre de cada columna de la lista del SELECT; None si hay un *."""
+    nombres = []
+    for it in items:
+        if not it:
+            nombres.append(None)
+        elif it[-1] == "*":
+            return None
+        elif len(it) >= 2 and _palabra(it[-2]) == "AS":
+            nombres.append(_nombre(it[-1]))
+        elif len(it) == 1 and not it[0].startswith(("@", "'", ":")) and it[0] != "?" and _palabra(it[0]) != "NULL":
+            nombres.append(_nombre(it[0]))
+        elif len(it) == 3 and it[1] == ".":
+            nombres.append(_nombre(it[2]))
+        else:
+            nombres.append(None)
+    return nombres
+
+
+def result_sets(sql: str) -> List[Optional[List[Optional[str]]]]:
+    """
+    Un elemento por SELECT que devuelve filas al cliente (nivel 0, que no
+    asigna variables ni alimenta un INSERT): sus nombres de columna, o None
+    si lleva *.
+    """
+    toks = tokens(sql)
+    salida = []
+    nivel, en_insert = 0, False
+    i = 0
+    while i < len(toks):
+        t, p = toks[i], _palabra(toks[i])
+        if t == "(":
+            nivel += 1
+        elif t == ")":
+            nivel -= 1
+        elif nivel == 0 and t == ";":
+            en_insert = False
+        elif nivel == 0 and p == "INSERT":
+            en_insert = True
+        elif nivel == 0 and p == "SELECT":
+            j = i + 1
+            if _palabra(toks[j]) == "DISTINCT":
+                j += 1
+            if _palabra(toks[j]) == "TOP":
+                j += 1
+                if toks[j] == "(":
+                    while toks[j] != ")":
+                        j += 1
+                j += 1
+            asigna = toks[j].startswith("@") and j + 1 < len(toks) and toks[j + 1] == "="
+            # lista de columnas hasta FROM / fin de sentencia, separada por comas de nivel 0
+            items, actual, prof, k = [], [], 0, j
+            while k < len(toks):
+                tk, pk = toks[k], _palabra(toks[k])
+                if prof == 0 and (tk == ";" or pk in ("FROM", "INTO", "WHERE", "ORDER", "GROUP", "UNION")
+                                  or (pk in _SENTENCIAS and pk != "END")):
+                    break
+                if tk == "(":
+                    prof += 1
+                elif tk == ")":
+                    prof -= 1
+                    if prof < 0:
+                        break
+                if prof == 0 and tk == ",":
+                    items.append(actual)
+                    actual = []
+                else:
+                    actual.append(tk)
+                k += 1
+            items.append(actual)
+            if not asigna and not en_insert:
+                salida.append(_columnas(items))
+        elif nivel == 0 and p in _SENTENCIAS - {"SELECT", "INSERT", "END"}:
+            en_insert = False
+        i += 1
+    return salida
+
+
+# =========================================================
+# Llamadas
+# =========================================================
+def problemas_llamada(sql: str, params, resultados) -> List[str]:
+    """params: los que mandó el servicio; resultados: [(description, filas)] de la copia Python."""
+    problemas = []
+    toks = tokens(sql)
+    if isinstance(params, dict):
+        faltan = sorted({t[1:] for t in toks if t.startswith(":")} - set(params))
+        if faltan:
+            problemas.append("parámetros sin valor: " + ", ".join(faltan))
+    else:
+        n = toks.count("?")
+        if n != len(params or ()):
+            problemas.append(f"el lote tiene {n} '?' y se mandaron {len(params or ())} valores")
+
+    esperados = result_sets(sql)
+    obtenidos = [[d[0] for d in desc] for desc, _ in resultados]
+    if len(esperados) != len(obtenidos):
+        problemas.append(f"el lote devuelve {len(esperados)} result sets y la copia Python {len(obtenidos)}")
+    for n, (esp, obt) in enumerate(zip(esperados, obtenidos), start=1):
+        if esp is None:
+            continue
+        if len(esp) != len(obt):
+            problemas.append(f"result set {n}: {len(esp)} columnas en el lote, {len(obt)} en la copia Python")
+            continue
+        distintas = [(e, o) for e, o in zip(esp, obt) if e is not None and e != o]
+        if distintas:
+            problemas.append(f"result set {n}: columnas distintas {distintas}")
+    return problemas
+
+
+class Registro:
+    """Verifica cada lote marcado que atiende el stand-in mientras está activo."""
+
+    def __init__(self):
+        self.llamadas: Dict[str, int] = {}
+        self.problemas: List[Tuple[str, str]] = []
+        self._vistos = set()
+        self._anterior = None
+        self._lock = threading.Lock()
+
+    def _observar(self, nombre, sql, params, resultados):
+        with self._lock:
+            self.llamadas[nombre] = self.llamadas.get(nombre, 0) + 1
+            nuevo = sql not in self._vistos
+            self._vistos.add(sql)
+        encontrados = problemas_sintaxis(sql) if nuevo else []
+        encontrados += problemas_llamada(sql, params, resultados)
+        with self._lock:
+            for p in encontrados:
+                if (nombre, p) not in self.problemas:
+                    self.problemas.append((nombre, p))
+
+    def __enter__(self):
+        self._anterior = dbapi.OBSERVADOR
+        dbapi.OBSERVADOR = self._observar
+        return self
+
+    def __exit__(self, *exc):
+        dbapi.OBSERVADOR = self._anterior
+        return False
+
+
+# =========================================================
+# Lotes del código
+# =========================================================
+_RAIZ = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def marcas_en_codigo(raiz: str = None) -> Dict[str, List[str]]:
+    """{lote: [archivos]} de las marcas "-- picking:<nombre>" en app/."""
+    base = os.path.join(raiz or _RAIZ, "app")
+    out = {}
+    for carpeta, _, archivos in os.walk(base):
+        for archivo in archivos:
+            if not archivo.endswith(".py"):
+                continue
+            ruta = os.path.join(carpeta, archivo)
+            with open(ruta, encoding="utf-8") as f:
+                for nombre in re.findall(r'^--\s*picking:([\w.-]+)\s*$', f.read(), re.M):
+                    out.setdefault(nombre, []).append(os.path.relpath(ruta, raiz or _RAIZ))
+    return out
+
+
+def lotes_estaticos() -> List[Tuple[str, str, str]]:
+    """[(lote, origen, sql)] de los lotes marcados que son constantes de módulo."""
+    from app import esquema
+    from app.despachos import oleadas, service
+
+    out = []
+    for modulo in (service, oleadas, esquema):
+        for nombre, valor in sorted(vars(modulo).items()):
+            if isinstance(valor, str):
+                marca = dbapi._RE_MARCA.search(valor)
+                if marca:
+                    out.append((marca.group(1), f"{modulo.__name__}.{nombre}", valor))
+    # el lote de scan se arma por cantidad de lecturas
+    out.append(("scan_lote", "app.despachos.service._sql_scan(2)", service._sql_scan(2)))
+    return out
+
+
+def descripcion(registro: Registro) -> Dict[str, Any]:
+    """Resumen para la salida de los benchmarks."""
+    return {
+        "aviso": (
+            "los lotes marcados corren como copia Python en el stand-in: "
+            "su T-SQL no se ejecuta ni se mide (solo contrato)"
+        ),
+        "lotes": dict(sorted(registro.llamadas.items())),
+        "problemas": [f"{n}: {p}" for n, p in registro.problemas],
+    }
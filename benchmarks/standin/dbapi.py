@@ -0,0 +1,628 @@
+# benchmarks/standin/dbapi.py
+"""
+DB-API sobre sqlite3 que acepta el T-SQL que manda app/despachos/service.py.
+
+Tres caminos por sentencia:
+  1) lote marcado "-- picking:<nombre>"  -> manejador Python (_LOTES),
+  2) EXEC de un SP de despachos          -> SP de prueba (_SPS),
+  3) resto                               -> traducción por regex y sqlite3.
+Cada ejecución se materializa en una lista de resultados (nextset()).
+
+Límite: el T-SQL de los lotes marcados (scan_lote, archivar_pedido,
+despachos_pagina, oleada_scan, ...) NO se ejecuta acá; corre su copia en
+Python. Cambiar ese T-SQL no cambia el benchmark y un error de lógica en
+él no se ve. contrato.py verifica lo que sí se puede sin SQL Server
+(sintaxis básica, parámetros y result sets de cada llamada).
+"""
+import re
+import sqlite3
+import time
+from sqlite3 import *  # noqa: F401,F403  (errores, tipos, sqlite_version_info...)
+
+paramstyle = "named"
+
+# Espera por sentencia, fuera de cualquier lock (simula el viaje de red a
+# SQL Server; como pyodbc, suelta el GIL mientras espera). La fija el benchmark.
+LATENCIA_S = 0.0
+
+# (Opcional) fn(nombre, sql, params, resultados) por cada lote marcado que se
+# atiende con su copia Python; lo usa contrato.Registro.
+OBSERVADOR = None
+
+# =========================================================
+# Traducción T-SQL -> SQLite
+# =========================================================
+_RE_COMENTARIO = re.compile(r"--[^\n]*")
+_RE_MARCA = re.compile(r"--\s*picking:([\w.-]+)")
+_RE_EXEC = re.compile(r"^\s*EXEC(?:UTE)?\s+(?:dbo\.)?(\w+)", re.I | re.M)
+_RE_TOP = re.compile(r"\bSELECT\s+(DISTINCT\s+)?TOP\s*\(?\s*(:\w+|\d+)\s*\)?", re.I)
+
+_REEMPLAZOS = [
+    (re.compile(r"\bSET\s+NOCOUNT\s+ON\s*;?", re.I), ""),
+    (re.compile(r"\b\w+\.dbo\.", re.I), ""),
+    (re.compile(r"\bdbo\.", re.I), ""),
+    (re.compile(r"\bWITH\s*\(\s*(?:UPDLOCK|ROWLOCK|HOLDLOCK|NOLOCK|READPAST)(?:\s*,\s*\w+)*\s*\)", re.I), ""),
+    (re.compile(r"DATEDIFF\(\s*SECOND\s*,\s*(\w+)\s*,\s*GETDATE\(\)\s*\)", re.I),
+     r"(strftime('%s','now','localtime') - strftime('%s', \1))"),
+    (re.compile(r"\bGETDATE\(\)", re.I), "datetime('now','localtime')"),
+    (re.compile(r"\bISNULL\(", re.I), "IFNULL("),
+    (re.compile(r"\bLEFT\(\s*([\w.]+)\s*,\s*(\d+)\s*\)", re.I), r"SUBSTR(\1, 1, \2)"),
+    (re.compile(r"CAST\(\s*CAST\(\s*(\?|:\w+)\s+AS\s+BIGINT\s*\)\s+AS\s+BINARY\(8\)\s*\)", re.I), r"\1"),
+    (re.compile(r"SELECT\s+CAST\(\s*@@DBTS\s+AS\s+BIGINT\s*\)", re.I), "SELECT v FROM _dbts"),
+]
+
+_RE_MERGE = re.compile(
+    r"MERGE\s+(\w+)\s+AS\s+(\w+)\s+USING\s*\(.*?\)\s*(?:AS\s+)?\w+\s+"
+    r"ON\s*\((?P<on>.*?)\)\s*"
+    r"(?:WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(?P<set>.*?))?\s*"
+    r"WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((?P<cols>.*?)\)\s*VALUES\s*\((?P<vals>.*)\)\s*;?\s*$",
+    re.I | re.S
+)
+
+
+def _traducir_merge(sql: str) -> str:
+    m = _RE_MERGE.search(sql)
+    if not m:
+        return sql
+    tabla, alias = m.group(1), m.group(2)
+    claves = re.findall(rf"\b{alias}\.(\w+)\s*=", m.group("on"))
+    cols, vals = m.group("cols"), m.group("vals")
+    if m.group("set"):
+        return (
+            f"INSERT INTO {tabla} AS {alias} ({cols}) VALUES ({vals}) "
+            f"ON CONFLICT ({', '.join(claves)}) DO UPDATE SET {m.group('set')}"
+        )
+    return f"INSERT OR IGNORE INTO {tabla} ({cols}) VALUES ({vals})"
+
+
+def traducir(sql: str):
+    """T-SQL -> lista de sentencias SQLite."""
+    sql = _RE_COMENTARIO.sub("", sql)
+    for patron, reemplazo in _REEMPLAZOS:
+        sql = patron.sub(reemplazo, sql)
+
+    sentencias = []
+    for s in sql.split(";"):
+        s = s.strip()
+        if not s:
+            continue
+        if re.match(r"MERGE\b", s, re.I):
+            s = _traducir_merge(s)
+        top = _RE_TOP.search(s)
+        if top:
+            s = _RE_TOP.sub(lambda m: "SELECT " + (m.group(1) or ""), s, count=1) + f" LIMIT {top.group(2)}"
+        sentencias.append(s)
+    return sentencias
+
+
+# =========================================================
+# Resultados materializados
+# =========================================================
+def _desc(columnas):
+    return [(c, None, None, None, None, None, None) for c in columnas]
+
+
+def _desde_cursor(cur):
+    if cur.description is None:
+        return None
+    return (cur.description, cur.fetchall())
+
+
+def _filas(con, sql, params=()):
+    return _desde_cursor(con.execute(sql, params))
+
+
+# =========================================================
+# SP de prueba (mismas columnas que usa el servicio)
+# =========================================================
+_SQL_SP_DESPACHOS = """
+SELECT p.cia_codcia, p.suc_codsuc, p.ppc_numppc, p.odc_numodc, p.ppc_fecdoc,
+       p.aux_nomaux, p.ppc_obsped, p.dir_Despacho, p.ppc_ordcom,
+       CASE WHEN a.fin_dt IS NOT NULL THEN 'PREPARADO'
+            WHEN a.inicio_dt IS NOT NULL THEN 'PREPARACION INICIADA'
+            ELSE 'ABASTECIMIENTO' END AS c_sit_orddes
+FROM STUB_PEDIDOS p
+LEFT JOIN PICKING_ASIGNACION a
+  ON a.CIA_CODCIA = p.cia_codcia AND a.SUC_CODSUC = p.suc_codsuc
+ AND a.PPC_NUMPPC = p.ppc_numppc AND a.ODC_NUMODC = p.odc_numodc
+WHERE p.cia_codcia = ? AND p.suc_codsuc = ?
+  AND (? IS NULL OR p.periodo >= ?)
+  AND (? IS NULL OR p.periodo <= ?)
+ORDER BY p.ppc_fecdoc DESC, p.ppc_numppc
+"""
+
+_SQL_SP_DETALLE = """
+SELECT * FROM STUB_DETALLE
+WHERE CIA_CODCIA = ? AND SUC_CODSUC = ? AND PPC_NUMPPC = ? AND ODC_NUMODC = ?
+ORDER BY ITEM
+"""
+
+
+def _sp_despachos(con, params):
+    cia, suc, ini, fin = params
+    return [_filas(con, _SQL_SP_DESPACHOS, (cia, suc, ini, ini, fin, fin))]
+
+
+def _sp_detalle(con, params):
+    return [_filas(con, _SQL_SP_DETALLE, tuple(params))]
+
+
+_SPS = {
+    "pa_preparacion_despacho_local_por_atender": _sp_despachos,
+    "pa_preparacion_despacho_local_por_atender_detalle": _sp_detalle,
+}
+
+
+# =========================================================
+# Lotes T-SQL marcados (-- picking:<nombre>)
+# =========================================================
+def _lote_applock(con, params):
+    # SQLite serializa las escrituras: el lock siempre se concede
+    return [(_desc(["r"]), [(0,)])]
+
+
+def _lote_despachos_pagina(con, params):
+    est, cia, suc, ini, fin, offset, tam = params
+    desc, filas = _sp_despachos(con, (cia, suc, ini, fin))[0]
+    if est:
+        i = [d[0] for d in desc].index("c_sit_orddes")
+        filas = [f for f in filas if est in str(f[i] or "").upper()]
+    return [(_desc([""]), [(len(filas),)]), (desc, filas[offset:offset + tam])]
+
+
+_WHERE_PEDIDO = "CIA_CODCIA=? AND SUC_CODSUC=? AND PPC_NUMPPC=? AND ODC_NUMODC=?"
+
+
+def _lote_scan(con, params):
+    """Mismo contrato que _SQL_SCAN_CABECERA + _SQL_SCAN_CUERPO."""
+    cia, suc, ppc, odc, desde = params[:5]
+    pedido = (cia, suc, ppc, odc)
+    items = [params[i:i + 4] for i in range(5, len(params), 4)]
+
+    res, tocados, aplicados = [], [], 0
+    d_lineas, d_unidades = 0, 0
+    iniciado = con.execute(
+        f"SELECT 1 FROM PICKING_ASIGNACION WHERE {_WHERE_PEDIDO} AND inicio_dt IS NOT NULL", pedido
+    ).fetchone()
+
+    if not iniciado:
+        res = [(n, "sin_inicio") for n, _, _, _ in items]
+    else:
+        for n, prod, cant, etiqueta in items:
+            if etiqueta is not None and con.execute(
+                f"SELECT 1 FROM PICKING_SCAN_ETIQUETA WHERE {_WHERE_PEDIDO} AND ETIQUETA=?",
+                pedido + (etiqueta,)
+            ).fetchone():
+                res.append((n, "duplicado"))
+                continue
+
+            fila = con.execute(
+                f"""SELECT rowid, ITEM, IFNULL(Cantidad_Scaneada,0), IFNULL(Cantidd_abastecida,0)
+                    FROM PICKING_DETALLE
+                    WHERE {_WHERE_PEDIDO} AND Cod_Producto_Pedido=?
+                      AND IFNULL(Cantidad_Scaneada,0) + ? <= IFNULL(Cantidd_abastecida,0)
+                    ORDER BY ITEM LIMIT 1""",
+                pedido + (prod, cant)
+            ).fetchone()
+
+            if fila is None:
+                existe = con.execute(
+                    f"SELECT 1 FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO} AND Cod_Producto_Pedido=?",
+                    pedido + (prod,)
+                ).fetchone()
+                res.append((n, "sobrepicking" if existe else "no_encontrado"))
+                continue
+
+            con.execute(
+                """UPDATE PICKING_DETALLE
+                   SET Cantidad_Scaneada = IFNULL(Cantidad_Scaneada,0) + ?,
+                       Diferencia = IFNULL(Cantidad_Scaneada,0) + ? - IFNULL(Cantidd_abastecida,0)
+                   WHERE rowid = ?""",
+                (cant, cant, fila[0])
+            )
+            aplicados += 1
+            d_unidades += cant
+            if fila[2] < fila[3] <= fila[2] + cant:
+                d_lineas += 1
+            if str(fila[1]) not in tocados:
+                tocados.append(str(fila[1]))
+            if etiqueta is not None:
+                con.execute(
+                    """INSERT INTO PICKING_SCAN_ETIQUETA (
+                           CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC,
+                           ETIQUETA, Cod_Producto_Pedido, Cantidad, fecha)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now','localtime'))""",
+                    pedido + (etiqueta, prod, cant)
+                )
+            res.append((n, "ok"))
+
+    campos = "lineas_total, lineas_completas, unidades_abastecidas, unidades_escaneadas"
+    if aplicados:
+        con.execute(
+            f"""UPDATE PICKING_ASIGNACION
+                SET lineas_completas = lineas_completas + ?,
+                    unidades_escaneadas = unidades_escaneadas + ?,
+                    detalle_ver = detalle_ver + 1
+                WHERE {_WHERE_PEDIDO}""",
+            (d_lineas, d_unidades) + pedido
+        )
+    avance = con.execute(f"SELECT {campos} FROM PICKING_ASIGNACION WHERE {_WHERE_PEDIDO}", pedido).fetchone()
+
+    if avance is None or avance[0] is None:
+        avance = con.execute(
+            f"""SELECT COUNT(*),
+                       IFNULL(SUM(CASE WHEN IFNULL(Cantidad_Scaneada,0) >= IFNULL(Cantidd_abastecida,0)
+                                       THEN 1 ELSE 0 END), 0),
+                       IFNULL(SUM(IFNULL(Cantidd_abastecida,0)), 0),
+                       IFNULL(SUM(IFNULL(Cantidad_Scaneada,0)), 0)
+                FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO}""", pedido
+        ).fetchone()
+        if aplicados:
+            con.execute(
+                f"""UPDATE PICKING_ASIGNACION
+                    SET lineas_total=?, lineas_completas=?, unidades_abastecidas=?, unidades_escaneadas=?
+                    WHERE {_WHERE_PEDIDO}""", tuple(avance) + pedido
+            )
+        d_lineas = None
+
+    lineas_total, completas = avance[0], avance[1]
+    estado = "1" if completas >= lineas_total else "0"
+    if aplicados and (d_lineas is None or (completas - d_lineas >= lineas_total) != (estado == "1")):
+        con.execute(
+            f"UPDATE PICKING_DETALLE SET ESTADO=? WHERE {_WHERE_PEDIDO} AND IFNULL(ESTADO,'') <> ?",
+            (estado,) + pedido + (estado,)
+        )
+
+    if desde is None:
+        marcas = ",".join("?" * len(tocados)) or "NULL"
+        lineas = _filas(
+            con,
+            f"SELECT * FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO} "
+            f"AND CAST(ITEM AS TEXT) IN ({marcas}) ORDER BY Orden_Ruta, Ubicacion",
+            pedido + tuple(tocados)
+        )
+    else:
+        lineas = _filas(
+            con,
+            f"SELECT * FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO} AND RowVer > ? ORDER BY Orden_Ruta, Ubicacion",
+            pedido + (desde,)
+        )
+
+    version = con.execute(
+        f"SELECT IFNULL(MAX(RowVer), 0) FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO}", pedido
+    ).fetchone()[0]
+    totales = (
+        _desc(["version", "lineas", "lineas_completas", "unidades_abastecidas", "unidades_escaneadas"]),
+        [(version,) + tuple(avance)],
+    )
+    return [(_desc(["n", "motivo"]), res), lineas, totales]
+
+
+def _lote_archivar(con, params):
+    from app.despachos.service import _CLAVE_HISTORICO, _COLUMNAS_HISTORICO
+
+    pedido = (params["cia"], params["suc"], params["ppc"], params["odc"])
+    cols = ", ".join(_COLUMNAS_HISTORICO)
+    asignar = ", ".join(
+        f"{c} = d.{c}" for c in _COLUMNAS_HISTORICO if c not in _CLAVE_HISTORICO
+    )
+    n = con.execute(
+        f"""UPDATE PICKING_HISTORICO AS h SET {asignar}
+            FROM PICKING_DETALLE d
+            WHERE d.CIA_CODCIA = h.CIA_CODCIA AND d.SUC_CODSUC = h.SUC_CODSUC
+              AND d.PPC_NUMPPC = h.PPC_NUMPPC AND d.ODC_NUMODC = h.ODC_NUMODC
+              AND d.ITEM = h.ITEM
+              AND d.CIA_CODCIA = ? AND d.SUC_CODSUC = ?
+              AND d.PPC_NUMPPC = ? AND d.ODC_NUMODC = ?""",
+        pedido
+    ).rowcount
+    n += con.execute(
+        f"""INSERT INTO PICKING_HISTORICO ({cols})
+            SELECT {cols} FROM PICKING_DETALLE d
+            WHERE {_WHERE_PEDIDO}
+              AND NOT EXISTS (
+                  SELECT 1 FROM PICKING_HISTORICO h
+                  WHERE h.CIA_CODCIA = d.CIA_CODCIA AND h.SUC_CODSUC = d.SUC_CODSUC
+                    AND h.PPC_NUMPPC = d.PPC_NUMPPC AND h.ODC_NUMODC = d.ODC_NUMODC
+                    AND h.ITEM = d.ITEM)""",
+        pedido
+    ).rowcount
+    con.execute(f"DELETE FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO}", pedido)
+    con.execute(f"DELETE FROM PICKING_SCAN_ETIQUETA WHERE {_WHERE_PEDIDO}", pedido)
+    con.execute(f"UPDATE PICKING_ASIGNACION SET detalle_ver = detalle_ver + 1 WHERE {_WHERE_PEDIDO}", pedido)
+    return [(_desc([""]), [(n,)])]
+
+
+def _lote_esquema_indices(con, params):
+    # sys.indexes / sys.index_columns desde los PRAGMA (sin índices parciales)
+    tablas = [r[0] for r in con.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'PICKING\\_%' ESCAPE '\\'"
+    )]
+    filas = []
+    for tabla in tablas:
+        for _, indice, _unico, _origen, parcial in con.execute(f"PRAGMA index_list('{tabla}')").fetchall():
+            if parcial:
+                continue
+            for orden, _cid, columna in con.execute(f"PRAGMA index_info('{indice}')").fetchall():
+                filas.append((tabla, indice, columna, orden + 1))
+    return [(_desc(["tabla", "indice", "columna", "key_ordinal"]), filas)]
+
+
+def _lote_oleada_crear(con, params):
+    cur = con.execute(
+        "INSERT INTO PICKING_OLEADA (CIA_CODCIA, SUC_CODSUC, creado_cod) VALUES (?, ?, ?)",
+        (params["cia"], params["suc"], params["creado"])
+    )
+    return [(_desc([""]), [(cur.lastrowid,)])]
+
+
+def _lote_oleada_scan(con, params):
+    """Mismo contrato que oleadas._SQL_OLEADA_SCAN."""
+    oleada, cia, suc, prod, cant, etiqueta, ubicacion = params
+    reparto, tocados = [], []
+    desc_tocados = _desc([
+        "PPC_NUMPPC", "ODC_NUMODC", "version",
+        "lineas", "lineas_completas", "unidades_abastecidas", "unidades_escaneadas",
+    ])
+
+    def salida(motivo):
+        filas = []
+        for ppc, odc in sorted(tocados):
+            pedido = (cia, suc, ppc, odc)
+            version = con.execute(
+                f"SELECT IFNULL(MAX(RowVer), 0) FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO}", pedido
+            ).fetchone()[0]
+            avance = con.execute(
+                f"""SELECT lineas_total, lineas_completas, unidades_abastecidas, unidades_escaneadas
+                    FROM PICKING_ASIGNACION WHERE {_WHERE_PEDIDO}""", pedido
+            ).fetchone()
+            filas.append((ppc, odc, version) + tuple(avance))
+        return [
+            (_desc(["motivo"]), [(motivo,)]),
+            (_desc(["PPC_NUMPPC", "ODC_NUMODC", "ITEM", "cantidad"]), sorted(reparto)),
+            (desc_tocados, filas),
+        ]
+
+    if not con.execute(
+        "SELECT 1 FROM PICKING_OLEADA WHERE OLEADA_ID=? AND CIA_CODCIA=? AND SUC_CODSUC=? AND estado='A'",
+        (oleada, cia, suc)
+    ).fetchone():
+        return salida("cerrada")
+    if etiqueta is not None and con.execute(
+        """SELECT 1
+           FROM PICKING_OLEADA_PEDIDO op
+           JOIN PICKING_SCAN_ETIQUETA e
+             ON e.CIA_CODCIA = op.CIA_CODCIA AND e.SUC_CODSUC = op.SUC_CODSUC
+            AND e.PPC_NUMPPC = op.PPC_NUMPPC AND e.ODC_NUMODC = op.ODC_NUMODC
+           WHERE op.OLEADA_ID = ? AND e.ETIQUETA = ?""",
+        (oleada, etiqueta)
+    ).fetchone():
+        return salida("duplicado")
+
+    lineas = con.execute(
+        """SELECT d.rowid, d.PPC_NUMPPC, d.ODC_NUMODC, CAST(d.ITEM AS TEXT),
+                  IFNULL(d.Cantidad_Scaneada,0), IFNULL(d.Cantidd_abastecida,0),
+                  a.inicio_dt IS NOT NULL AND a.fin_dt IS NULL
+           FROM PICKING_OLEADA_PEDIDO op
+           JOIN PICKING_DETALLE d
+             ON d.CIA_CODCIA = op.CIA_CODCIA AND d.SUC_CODSUC = op.SUC_CODSUC
+            AND d.PPC_NUMPPC = op.PPC_NUMPPC AND d.ODC_NUMODC = op.ODC_NUMODC
+           LEFT JOIN PICKING_ASIGNACION a
+             ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+            AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+           WHERE op.OLEADA_ID = ? AND d.Cod_Producto_Pedido = ?
+             AND (? IS NULL OR d.Ubicacion = ?)
+           ORDER BY op.orden, d.ITEM""",
+        (oleada, prod, ubicacion, ubicacion)
+    ).fetchall()
+    if not lineas:
+        return salida("no_encontrado")
+
+    falta = cant
+    tomas = []
+    for rowid, ppc, odc, item, antes, abast, iniciado in lineas:
+        if falta <= 0:
+            break
+        if not iniciado or antes >= abast:
+            continue
+        toma = min(abast - antes, falta)
+        falta -= toma
+        tomas.append((rowid, ppc, odc, item, antes, abast, toma))
+    if falta > 0:
+        sin_inicio = any(not l[6] and l[4] < l[5] for l in lineas)
+        return salida("sin_inicio" if sin_inicio else "sobrepicking")
+
+    d_pedido = {}
+    for rowid, ppc, odc, item, antes, abast, toma in tomas:
+        con.execute(
+            """UPDATE PICKING_DETALLE
+               SET Cantidad_Scaneada = IFNULL(Cantidad_Scaneada,0) + ?,
+                   Diferencia = IFNULL(Cantidad_Scaneada,0) + ? - IFNULL(Cantidd_abastecida,0)
+               WHERE rowid = ?""",
+            (toma, toma, rowid)
+        )
+        reparto.append((ppc, odc, item, toma))
+        d = d_pedido.setdefault((ppc, odc), [0, 0])
+        d[0] += 1 if antes + toma >= abast else 0
+        d[1] += toma
+
+    for (ppc, odc), (d_lineas, d_unidades) in d_pedido.items():
+        pedido = (cia, suc, ppc, odc)
+        tocados.append((ppc, odc))
+        con.execute(
+            f"""UPDATE PICKING_ASIGNACION
+                SET lineas_completas = lineas_completas + ?,
+                    unidades_escaneadas = unidades_escaneadas + ?,
+                    detalle_ver = detalle_ver + 1
+                WHERE {_WHERE_PEDIDO}""",
+            (d_lineas, d_unidades) + pedido
+        )
+        con.execute(
+            f"""UPDATE PICKING_ASIGNACION
+                SET (lineas_total, lineas_completas, unidades_abastecidas, unidades_escaneadas) = (
+                    SELECT COUNT(*),
+                           IFNULL(SUM(CASE WHEN IFNULL(Cantidad_Scaneada,0) >= IFNULL(Cantidd_abastecida,0)
+                                           THEN 1 ELSE 0 END), 0),
+                           IFNULL(SUM(IFNULL(Cantidd_abastecida,0)), 0),
+                           IFNULL(SUM(IFNULL(Cantidad_Scaneada,0)), 0)
+                    FROM PICKING_DETALLE WHERE {_WHERE_PEDIDO})
+                WHERE {_WHERE_PEDIDO} AND lineas_total IS NULL""",
+            pedido + pedido
+        )
+        lineas_total, completas = con.execute(
+            f"SELECT lineas_total, lineas_completas FROM PICKING_ASIGNACION WHERE {_WHERE_PEDIDO}", pedido
+        ).fetchone()
+        estado = "1" if completas >= lineas_total else "0"
+        con.execute(
+            f"UPDATE PICKING_DETALLE SET ESTADO=? WHERE {_WHERE_PEDIDO} AND IFNULL(ESTADO,'') <> ?",
+            (estado,) + pedido + (estado,)
+        )
+
+    if etiqueta is not None:
+        abiertos = con.execute(
+            """SELECT op.PPC_NUMPPC, op.ODC_NUMODC
+               FROM PICKING_OLEADA_PEDIDO op
+               JOIN PICKING_ASIGNACION a
+                 ON a.CIA_CODCIA = op.CIA_CODCIA AND a.SUC_CODSUC = op.SUC_CODSUC
+                AND a.PPC_NUMPPC = op.PPC_NUMPPC AND a.ODC_NUMODC = op.ODC_NUMODC
+                AND a.fin_dt IS NULL
+               WHERE op.OLEADA_ID = ?""",
+            (oleada,)
+        ).fetchall()
+        con.executemany(
+            """INSERT INTO PICKING_SCAN_ETIQUETA (
+                   CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC,
+                   ETIQUETA, Cod_Producto_Pedido, Cantidad, fecha)
+               VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now','localtime'))""",
+            [(cia, suc, ppc, odc, etiqueta, prod, d_pedido.get((ppc, odc), (0, 0))[1])
+             for ppc, odc in abiertos]
+        )
+    return salida("ok")
+
+
+_LOTES = {
+    "applock": _lote_applock,
+    "despachos_pagina": _lote_despachos_pagina,
+    "scan_lote": _lote_scan,
+    "archivar_pedido": _lote_archivar,
+    "esquema_indices": _lote_esquema_indices,
+    "oleada_crear": _lote_oleada_crear,
+    "oleada_scan": _lote_oleada_scan,
+}
+
+
+def registrar_lote(nombre: str, fn):
+    """Para lotes T-SQL nuevos: fn(conexion_sqlite, params) -> [(description, filas)]."""
+    _LOTES[nombre] = fn
+
+
+# =========================================================
+# Conexión / cursor
+# =========================================================
+class Cursor:
+    arraysize = 1
+
+    def __init__(self, conexion):
+        self._con = conexion._raw
+        self._resultados = []
+        self._actual = None
+        self.rowcount = -1
+        self.lastrowid = None
+        self.fast_executemany = False
+
+    @property
+    def description(self):
+        return self._actual[0] if self._actual else None
+
+    def _poner(self, resultados):
+        self._resultados = [r for r in resultados if r is not None]
+        self._actual = self._resultados.pop(0) if self._resultados else None
+        self._filas = list(self._actual[1]) if self._actual else []
+
+    def execute(self, sql, params=()):
+        if LATENCIA_S:
+            time.sleep(LATENCIA_S)
+        params = params if params is not None else ()
+        marca = _RE_MARCA.search(sql)
+        if marca and marca.group(1) in _LOTES:
+            resultados = _LOTES[marca.group(1)](self._con, params)
+            if OBSERVADOR is not None:
+                OBSERVADOR(marca.group(1), sql, params, [r for r in resultados if r is not None])
+            self._poner(resultados)
+            return self
+
+        ex = _RE_EXEC.search(_RE_COMENTARIO.sub("", sql))
+        if ex and ex.group(1).lower() in _SPS:
+            self._poner(_SPS[ex.group(1).lower()](self._con, params))
+            return self
+
+        resultados = []
+        pendientes = list(params) if isinstance(params, (list, tuple)) else None
+        for s in traducir(sql):
+            if pendientes is not None:
+                k = s.count("?")
+                p, pendientes = pendientes[:k], pendientes[k:]
+            else:
+                p = params
+            cur = self._con.execute(s, p)
+            self.rowcount = cur.rowcount
+            self.lastrowid = cur.lastrowid
+            resultados.append(_desde_cursor(cur))
+        self._poner(resultados)
+        return self
+
+    def executemany(self, sql, seq):
+        sentencias = traducir(sql)
+        cur = self._con.executemany(sentencias[0], seq)
+        self.rowcount = cur.rowcount
+        self._poner([])
+
+    def fetchone(self):
+        return self._filas.pop(0) if self._filas else None
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        out, self._filas = self._filas[:size], self._filas[size:]
+        return out
+
+    def fetchall(self):
+        out, self._filas = self._filas, []
+        return out
+
+    def nextset(self):
+        if not self._resultados:
+            self._actual = None
+            return None
+        self._actual = self._resultados.pop(0)
+        self._filas = list(self._actual[1])
+        return True
+
+    def close(self):
+        self._resultados, self._filas, self._actual = [], [], None
+
+    def setinputsizes(self, *a):
+        pass
+
+    def setoutputsize(self, *a):
+        pass
+
+
+class Conexion:
+    def __init__(self, raw):
+        object.__setattr__(self, "_raw", raw)
+
+    def cursor(self):
+        return Cursor(self)
+
+    def __getattr__(self, nombre):
+        return getattr(self._raw, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self._raw, nombre, valor)
+
+
+def connect(*args, **kwargs):
+    kwargs.setdefault("timeout", 30)
+    kwargs["check_same_thread"] = False
+    raw = sqlite3.connect(*args, **kwargs)
+    return Conexion(raw)
@@ -0,0 +1,18 @@
+# benchmarks/standin/dialecto.py
+from sqlalchemy.dialects.sqlite.pysqlite import SQLiteDialect_pysqlite
+
+from . import dbapi
+
+
+class DialectoStandin(SQLiteDialect_pysqlite):
+    driver = "standin"
+    supports_statement_cache = True
+
+    def __init__(self, **kw):
+        # parámetros con nombre: el MERGE traducido reordena las columnas
+        kw.setdefault("paramstyle", "named")
+        super().__init__(**kw)
+
+    @classmethod
+    def import_dbapi(cls):
+        return dbapi
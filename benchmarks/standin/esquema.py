@@ -0,0 +1,159 @@
+# benchmarks/standin/esquema.py
+"""Tablas del stand-in (mismas columnas que usa el servicio) y datos sintéticos."""
+import random
+import sqlite3
+from datetime import date, datetime, timedelta
+
+_COLUMNAS_DETALLE = """
+    CIA_CODCIA TEXT, SUC_CODSUC TEXT, PPC_NUMPPC TEXT, ODC_NUMODC TEXT,
+    ITEM INTEGER, It_D INTEGER, L TEXT, Cod_Producto_Pedido TEXT,
+    Descripcion_pedido TEXT, CodigoParte TEXT, UM TEXT,
+    UE NUMERIC, Indica_Cierre TEXT, Cantidad_a_Despachar NUMERIC,
+    Cantidd_abastecida NUMERIC, Caja TEXT, Peso_Neto NUMERIC,
+    Cantidad_Scaneada NUMERIC, Diferencia NUMERIC, Ubicacion TEXT
+"""
+
+DDL = f"""
+CREATE TABLE _dbts (v INTEGER NOT NULL);
+INSERT INTO _dbts (v) VALUES (1000);
+
+CREATE TABLE PICKING_DETALLE (
+    {_COLUMNAS_DETALLE},
+    Orden_Ruta INTEGER,
+    ESTADO TEXT,
+    RowVer INTEGER
+);
+CREATE INDEX IX_PICKING_DETALLE_PEDIDO
+    ON PICKING_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, Cod_Producto_Pedido);
+CREATE INDEX IX_PICKING_DETALLE_PEDIDO_ROWVER
+    ON PICKING_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, RowVer);
+
+-- ROWVERSION: cada INSERT/UPDATE toma el siguiente valor de _dbts (@@DBTS)
+CREATE TRIGGER TR_PICKING_DETALLE_INS AFTER INSERT ON PICKING_DETALLE
+BEGIN
+    UPDATE _dbts SET v = v + 1;
+    UPDATE PICKING_DETALLE SET RowVer = (SELECT v FROM _dbts) WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER TR_PICKING_DETALLE_UPD
+AFTER UPDATE OF Cantidad_Scaneada, Diferencia, ESTADO, Cantidd_abastecida ON PICKING_DETALLE
+BEGIN
+    UPDATE _dbts SET v = v + 1;
+    UPDATE PICKING_DETALLE SET RowVer = (SELECT v FROM _dbts) WHERE rowid = NEW.rowid;
+END;
+
+CREATE TABLE PICKING_HISTORICO (
+    {_COLUMNAS_DETALLE},
+    Orden_Ruta INTEGER,
+    ESTADO TEXT
+);
+CREATE INDEX IX_PICKING_HISTORICO_PEDIDO
+    ON PICKING_HISTORICO (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, ITEM);
+
+CREATE TABLE PICKING_ASIGNACION (
+    CIA_CODCIA TEXT, SUC_CODSUC TEXT, PPC_NUMPPC TEXT, ODC_NUMODC TEXT,
+    registrado_cod TEXT, registrado_nom TEXT,
+    preparado_cod TEXT, preparado_nom TEXT,
+    inicio_dt TEXT, fin_dt TEXT, tprep_min NUMERIC,
+    updated_at TEXT,
+    detalle_ver INTEGER NOT NULL DEFAULT 0,
+    lineas_total INTEGER, lineas_completas INTEGER,
+    unidades_abastecidas NUMERIC, unidades_escaneadas NUMERIC,
+    precarga_hash TEXT,
+    PRIMARY KEY (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC)
+);
+
+CREATE TABLE PICKING_SCAN_ETIQUETA (
+    CIA_CODCIA TEXT, SUC_CODSUC TEXT, PPC_NUMPPC TEXT, ODC_NUMODC TEXT,
+    ETIQUETA TEXT, Cod_Producto_Pedido TEXT, Cantidad NUMERIC, fecha TEXT,
+    PRIMARY KEY (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC, ETIQUETA)
+);
+
+CREATE TABLE PICKING_USUARIO_SEDE (
+    AUX_CODAUX TEXT, CIA_CODCIA TEXT, SUC_CODSUC TEXT,
+    PRIMARY KEY (AUX_CODAUX, CIA_CODCIA, SUC_CODSUC)
+);
+
+CREATE TABLE PICKING_OLEADA (
+    OLEADA_ID INTEGER PRIMARY KEY,
+    CIA_CODCIA TEXT, SUC_CODSUC TEXT,
+    estado TEXT NOT NULL DEFAULT 'A',
+    creado_cod TEXT,
+    creado_dt TEXT NOT NULL DEFAULT (datetime('now','localtime')),
+    cerrado_dt TEXT
+);
+CREATE TABLE PICKING_OLEADA_PEDIDO (
+    OLEADA_ID INTEGER, CIA_CODCIA TEXT, SUC_CODSUC TEXT, PPC_NUMPPC TEXT, ODC_NUMODC TEXT,
+    orden INTEGER NOT NULL,
+    PRIMARY KEY (OLEADA_ID, CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC)
+);
+CREATE INDEX IX_PICKING_OLEADA_PEDIDO_PEDIDO
+    ON PICKING_OLEADA_PEDIDO (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC);
+
+-- ERP (STROBBE_V13)
+CREATE TABLE V_Auxiliares (
+    cia_codcia TEXT, aux_codaux TEXT, aux_nomaux TEXT, aux_indest TEXT, aux_indemp TEXT
+);
+CREATE TABLE TRABAJADOR_USUARIO_TRU (cia_codcia TEXT, aux_codaux TEXT, tru_predes INTEGER);
+CREATE TABLE SYS_TABLA_USUARIOS_S10 (S10_USUARIO TEXT, S10_NOMUSU TEXT, AUX_CODAUX TEXT);
+
+-- datos de los SP de prueba
+CREATE TABLE STUB_PEDIDOS (
+    cia_codcia TEXT, suc_codsuc TEXT, ppc_numppc TEXT, odc_numodc TEXT,
+    periodo TEXT, ppc_fecdoc TEXT, aux_nomaux TEXT, ppc_obsped TEXT,
+    dir_Despacho TEXT, ppc_ordcom TEXT
+);
+CREATE TABLE STUB_DETALLE (
+    {_COLUMNAS_DETALLE}
+);
+CREATE INDEX IX_STUB_DETALLE_PEDIDO ON STUB_DETALLE (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC);
+"""
+
+USUARIO = "BENCH"
+CODIGO_USUARIO = "B0001"
+PREPARADORES = [f"P{i:04d}" for i in range(1, 9)]
+
+
+def pedidos_sinteticos(cantidad: int):
+    """[(ppc, odc)] en el mismo orden en que se siembran."""
+    return [(f"{100000 + i:010d}", f"{500000 + i:010d}") for i in range(cantidad)]
+
+
+def sembrar(ruta: str, pedidos: int, lineas: int, semilla: int = 7):
+    """
+    Crea la BD y siembra `pedidos` pedidos de ~`lineas` líneas cada uno.
+    Abastecida de 1 a 5 unidades por línea; algunos productos se repiten
+    en dos líneas del mismo pedido (como en los pedidos reales).
+    """
+    rnd = random.Random(semilla)
+    con = sqlite3.connect(ruta)
+    con.executescript(DDL)
+
+    con.execute("INSERT INTO SYS_TABLA_USUARIOS_S10 VALUES (?, ?, ?)",
+                (USUARIO, "USUARIO BENCHMARK", CODIGO_USUARIO))
+    for cod in [CODIGO_USUARIO] + PREPARADORES:
+        con.execute("INSERT INTO V_Auxiliares VALUES ('01', ?, ?, '1', '1')", (cod, f"TRABAJADOR {cod}"))
+        con.execute("INSERT INTO TRABAJADOR_USUARIO_TRU VALUES ('01', ?, 1)", (cod,))
+
+    periodo = date.today().strftime("%Y%m")
+    hoy = datetime.now()
+    for i, (ppc, odc) in enumerate(pedidos_sinteticos(pedidos)):
+        con.execute(
+            "INSERT INTO STUB_PEDIDOS VALUES ('01', '01', ?, ?, ?, ?, ?, ?, ?, ?)",
+            (ppc, odc, periodo, (hoy - timedelta(hours=i)).strftime("%Y-%m-%d %H:%M:%S"),
+             f"CLIENTE {i % 50:03d} S.A.C.", "", f"AV. INDUSTRIAL {i}", f"OC-{i:06d}")
+        )
+        filas = []
+        for item in range(1, lineas + 1):
+            prod = f"{200000 + rnd.randint(1, 5000)}" if item % 17 else filas[-1][7]
+            abastecida = rnd.randint(1, 5)
+            filas.append((
+                "01", "01", ppc, odc, item, item, "1", prod,
+                f"PRODUCTO {prod} HIDRAULICO", f"STB-{prod}", "UND",
+                1, "0", abastecida, abastecida, f"C{item % 20:02d}", 1.25,
+                0, -abastecida,
+                f"A{rnd.randint(1, 12):02d}-R{rnd.randint(1, 30):02d}-N{rnd.randint(1, 5)}",
+            ))
+        con.executemany(f"INSERT INTO STUB_DETALLE VALUES ({','.join('?' * 20)})", filas)
+
+    con.commit()
+    con.close()
@@ -1,5 +1,6 @@
-from app import create_app
+from app import create_app, iniciar_tareas
 app = create_app()
 
 if __name__ == "__main__":
+    iniciar_tareas()
     app.run(host="0.0.0.0", port=80, debug=True)
\ No newline at end of file
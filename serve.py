@@ -0,0 +1,95 @@
+"""
+Arranque de producción (run.py queda para desarrollo).
+
+    python serve.py
+
+Linux: Gunicorn con workers gthread (WEB_WORKERS procesos x WEB_THREADS hilos).
+Windows o sin Gunicorn: waitress con WEB_THREADS hilos en un solo proceso.
+El pool de SQL (SQL_POOL_SIZE / SQL_MAX_OVERFLOW) se dimensiona por proceso
+a partir de WEB_THREADS; ver app/config.py.
+
+Cada stream SSE (/api/despachos/stream) ocuparía un hilo mientras está
+abierto, así que bajo WSGI el stream queda apagado por defecto
+(EVENTOS_STREAMS_WSGI=0): responde 503 y las tablets consultan cada
+EVENTOS_POLLING_S. Para tener eventos en vivo, WEB_SERVIDOR=asgi.
+
+WEB_SERVIDOR=asgi: Uvicorn con app/asgi.py (WEB_WORKERS procesos). Los scans
+y los streams se atienden en el event loop y la BD en ASGI_HILOS hilos;
+ver benchmarks/concurrencia.py.
+"""
+import sys
+from app.config import Config
+
+
+def opciones_gunicorn() -> dict:
+    return {
+        "bind": Config.WEB_BIND,
+        "workers": Config.WEB_WORKERS,
+        "worker_class": "gthread",
+        "threads": Config.WEB_THREADS,
+        "timeout": Config.WEB_TIMEOUT,
+        "graceful_timeout": 30,
+        "keepalive": 5,
+        # sin preload: cada worker crea su propio engine/pool después del fork
+        "preload_app": False,
+        "accesslog": "-",
+    }
+
+
+def _servir_gunicorn():
+    from gunicorn.app.base import BaseApplication
+
+    class _App(BaseApplication):
+        def load_config(self):
+            for k, v in opciones_gunicorn().items():
+                self.cfg.set(k, v)
+
+        def load(self):
+            from app import create_app
+            return create_app(tareas_de_fondo=True)
+
+    _App().run()
+
+
+def _servir_waitress():
+    from waitress import serve
+    from app import create_app
+
+    host, _, port = Config.WEB_BIND.rpartition(":")
+    serve(
+        create_app(tareas_de_fondo=True),
+        host=host or "0.0.0.0",
+        port=int(port),
+        threads=Config.WEB_THREADS,
+        channel_timeout=Config.WEB_TIMEOUT,
+    )
+
+
+def _servir_asgi():
+    import uvicorn
+
+    host, _, port = Config.WEB_BIND.rpartition(":")
+    uvicorn.run(
+        "app.asgi:app",
+        host=host or "0.0.0.0",
+        port=int(port),
+        workers=Config.WEB_WORKERS,
+        timeout_keep_alive=5,
+        lifespan="on",
+    )
+
+
+def main():
+    if Config.WEB_SERVIDOR == "asgi":
+        return _servir_asgi()
+    if sys.platform != "win32":
+        try:
+            import gunicorn  # noqa: F401
+            return _servir_gunicorn()
+        except ImportError:
+            pass
+    _servir_waitress()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# tests/conftest.py
+"""
+Los tests corren contra el stand-in local de SQL Server (benchmarks/standin,
+SQLite): una BD sembrada por sesión y la app apuntando a ella.
+
+Los lotes T-SQL marcados "-- picking:<nombre>" (scan, oleadas, archivado,
+applock, página de despachos) no se ejecutan: el stand-in responde con su
+copia Python (benchmarks/standin/dbapi._LOTES). Lo que estos tests prueban de
+esos lotes es la copia; la equivalencia con el T-SQL la cubre
+test_lotes_golden.py cuando hay un SQL Server (PICKING_TEST_MSSQL_URL).
+
+app.config lee el entorno al importarse: acá se fija antes de que cualquier
+test importe app.
+"""
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from benchmarks.standin import registrar, URL
+from benchmarks.standin.esquema import sembrar, pedidos_sinteticos, USUARIO
+
+PEDIDOS = 16
+LINEAS = 8
+
+_RUTA = os.path.join(tempfile.mkdtemp(prefix="tests-picking-"), "picking.db")
+sembrar(_RUTA, PEDIDOS, LINEAS)
+
+registrar()
+os.environ.update({
+    "DATABASE_URL": URL.format(ruta=_RUTA),
+    "ESQUEMA_AL_ARRANCAR": "no",
+    "COMPACTACION_INTERVALO_S": "0",
+    "EVENTOS_BACKEND": "memoria",
+    "PRECARGA_PEDIDOS": "0",
+    "JWT_SECRET_KEY": "tests-picking-" + "x" * 32,
+})
+
+
+class Pedidos:
+    """Reparte los pedidos sembrados: cada test toma los suyos, sin compartir estado."""
+
+    def __init__(self):
+        self._libres = list(pedidos_sinteticos(PEDIDOS))
+
+    def tomar(self, n: int = 1):
+        if len(self._libres) < n:
+            raise RuntimeError("faltan pedidos sembrados: subir PEDIDOS en conftest.py")
+        tomados, self._libres = self._libres[:n], self._libres[n:]
+        return tomados
+
+
+@pytest.fixture(scope="session")
+def pedidos():
+    return Pedidos()
+
+
+def _conectar():
+    return sqlite3.connect(_RUTA, timeout=30)
+
+
+@pytest.fixture
+def bd():
+    """Conexión sqlite directa a la BD del stand-in (para sembrar y verificar)."""
+    con = _conectar()
+    yield con
+    con.close()
+
+
+@pytest.fixture(scope="module")
+def bd_modulo():
+    """Como bd, para fixtures de módulo (sembrar antes de generar el detalle)."""
+    con = _conectar()
+    yield con
+    con.close()
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app
+    return create_app()
+
+
+def _cliente(app):
+    c = app.test_client()
+    r = c.post("/api/auth/login", json={"username": USUARIO, "password": "1234"})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    return c
+
+
+@pytest.fixture
+def cliente(app):
+    return _cliente(app)
+
+
+@pytest.fixture(scope="module")
+def cliente_modulo(app):
+    return _cliente(app)
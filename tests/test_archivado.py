@@ -0,0 +1,34 @@
+# tests/test_archivado.py
+"""
+FIN archiva el detalle en PICKING_HISTORICO (con ESTADO) y el pedido queda
+cerrado: un INICIO posterior no lo reabre ni regenera el snapshot.
+El lote de archivado corre como copia Python del stand-in (ver conftest.py).
+"""
+from app.despachos import service
+
+_DONDE = "CIA_CODCIA = '01' AND SUC_CODSUC = '01' AND PPC_NUMPPC = ? AND ODC_NUMODC = ?"
+
+
+def test_inicio_despues_de_fin_es_409(cliente, pedidos, bd):
+    ppc, odc = pedidos.tomar(1)[0]
+    pedido = {"codppc": ppc, "cododc": odc}
+    cliente.post("/api/despachos/detalle/generar", json=pedido)
+    cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+    assert cliente.post("/api/despachos/detalle/inicio", json=pedido).status_code == 200
+    for f in service.listar_detalle_tabla("01", "01", ppc, odc):
+        r = cliente.post("/api/despachos/detalle/scan", json={
+            **pedido, "codprod": f["Cod_Producto_Pedido"], "cantidad": f["Cantidd_abastecida"],
+        })
+        assert r.status_code == 200, r.get_data(as_text=True)
+    assert cliente.post("/api/despachos/detalle/fin", json=pedido).status_code == 200
+
+    historico = bd.execute(
+        f"SELECT ESTADO, Cantidad_Scaneada, Cantidd_abastecida FROM PICKING_HISTORICO WHERE {_DONDE}", (ppc, odc)
+    ).fetchall()
+    assert historico and all(e == "1" and s == a for e, s, a in historico)
+
+    r = cliente.post("/api/despachos/detalle/inicio", json=pedido)
+    assert r.status_code == 409
+    fin_dt, = bd.execute(f"SELECT fin_dt FROM PICKING_ASIGNACION WHERE {_DONDE}", (ppc, odc)).fetchone()
+    assert fin_dt is not None
+    assert bd.execute(f"SELECT COUNT(*) FROM PICKING_DETALLE WHERE {_DONDE}", (ppc, odc)).fetchone() == (0,)
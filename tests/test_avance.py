@@ -0,0 +1,74 @@
+# tests/test_avance.py
+"""
+Avance del pedido en PICKING_ASIGNACION: los contadores que suma el lote de
+scan tienen que coincidir con lo que diría un COUNT sobre PICKING_DETALLE.
+El lote corre como copia Python del stand-in (ver conftest.py).
+"""
+from app.despachos import service
+
+_DONDE = "CIA_CODCIA = '01' AND SUC_CODSUC = '01' AND PPC_NUMPPC = ? AND ODC_NUMODC = ?"
+
+
+def _iniciado(cliente, ppc, odc):
+    pedido = {"codppc": ppc, "cododc": odc}
+    cliente.post("/api/despachos/detalle/generar", json=pedido)
+    cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+    assert cliente.post("/api/despachos/detalle/inicio", json=pedido).status_code == 200
+    return pedido
+
+
+def _contado(bd, ppc, odc):
+    lineas, completas, abast, escan = bd.execute(
+        "SELECT COUNT(*), "
+        "SUM(CASE WHEN IFNULL(Cantidad_Scaneada,0) >= IFNULL(Cantidd_abastecida,0) THEN 1 ELSE 0 END), "
+        "SUM(IFNULL(Cantidd_abastecida,0)), SUM(IFNULL(Cantidad_Scaneada,0)) "
+        f"FROM PICKING_DETALLE WHERE {_DONDE}", (ppc, odc)
+    ).fetchone()
+    return {"lineas": lineas, "lineas_completas": completas,
+            "unidades_abastecidas": abast, "unidades_escaneadas": escan}
+
+
+def _completar(cliente, bd, pedido, de_a_uno=False):
+    ppc, odc = pedido["codppc"], pedido["cododc"]
+    for f in service.listar_detalle_tabla("01", "01", ppc, odc):
+        falta = (f["Cantidd_abastecida"] or 0) - (f["Cantidad_Scaneada"] or 0)
+        while falta > 0:
+            cant = 1 if de_a_uno else falta
+            r = cliente.post("/api/despachos/detalle/scan", json={**pedido, "codprod": f["Cod_Producto_Pedido"], "cantidad": cant})
+            assert r.status_code == 200, r.get_data(as_text=True)
+            assert r.get_json()["totales"] == _contado(bd, ppc, odc)
+            falta -= cant
+
+
+def test_contadores_siguen_al_detalle(cliente, pedidos, bd):
+    ppc, odc = pedidos.tomar(1)[0]
+    pedido = _iniciado(cliente, ppc, odc)
+
+    lineas = service.listar_detalle_tabla("01", "01", ppc, odc)
+    primera = lineas[0]["Cod_Producto_Pedido"]
+    r = cliente.post("/api/despachos/detalle/scan", json={**pedido, "codprod": primera, "cantidad": 1})
+    assert r.get_json()["totales"] == _contado(bd, ppc, odc)
+
+    # FIN con líneas pendientes: lo frenan los contadores
+    assert cliente.post("/api/despachos/detalle/fin", json=pedido).status_code == 409
+
+    _completar(cliente, bd, pedido, de_a_uno=True)
+    estados = {r[0] for r in bd.execute(f"SELECT ESTADO FROM PICKING_DETALLE WHERE {_DONDE}", (ppc, odc))}
+    assert estados == {"1"}
+    assert cliente.post("/api/despachos/detalle/fin", json=pedido).status_code == 200
+
+
+def test_contadores_nulos_se_calculan_una_vez(cliente, pedidos, bd):
+    ppc, odc = pedidos.tomar(1)[0]
+    pedido = _iniciado(cliente, ppc, odc)
+
+    # snapshot anterior a la migración: contadores sin inicializar
+    bd.execute(
+        "UPDATE PICKING_ASIGNACION SET lineas_total = NULL, lineas_completas = NULL, "
+        f"unidades_abastecidas = NULL, unidades_escaneadas = NULL WHERE {_DONDE}", (ppc, odc)
+    )
+    bd.commit()
+
+    _completar(cliente, bd, pedido)
+    fila = bd.execute(f"SELECT lineas_total, lineas_completas FROM PICKING_ASIGNACION WHERE {_DONDE}", (ppc, odc)).fetchone()
+    assert fila[0] == fila[1] == _contado(bd, ppc, odc)["lineas"]
@@ -0,0 +1,29 @@
+# tests/test_cabecera_etag.py
+"""
+ETag de /detalle/cabecera: un cambio en la fila del ERP (mismo pedido, sin
+tocar PICKING_ASIGNACION) tiene que dar 200 con la cabecera nueva, no 304.
+"""
+from app.despachos import service
+
+
+def test_cambio_en_erp_invalida_etag(cliente, pedidos, bd):
+    ppc, odc = pedidos.tomar(1)[0]
+    pedido = {"codppc": ppc, "cododc": odc}
+    r = cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+    assert r.status_code == 200, r.get_data(as_text=True)
+
+    r = cliente.get("/api/despachos/detalle/cabecera", query_string=pedido)
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    r = cliente.get("/api/despachos/detalle/cabecera", query_string=pedido, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+
+    bd.execute("UPDATE STUB_PEDIDOS SET ppc_obsped = 'entregar por la tarde' "
+               "WHERE ppc_numppc = ? AND odc_numodc = ?", (ppc, odc))
+    bd.commit()
+    service.invalidar_cache_despachos("01", "01")
+
+    r = cliente.get("/api/despachos/detalle/cabecera", query_string=pedido, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
+    assert r.get_json()["cabecera"]["obs"] == "entregar por la tarde"
@@ -0,0 +1,76 @@
+# tests/test_contrato_lotes.py
+"""
+Contrato de los lotes T-SQL marcados: el stand-in los atiende con una copia
+Python (benchmarks/standin/dbapi._LOTES), así que acá se verifica que el
+T-SQL y su copia sigan diciendo lo mismo (ver benchmarks/standin/contrato.py).
+"""
+import pytest
+
+from benchmarks.standin import contrato, dbapi
+
+
+def test_cada_lote_marcado_tiene_copia_en_el_standin():
+    assert set(contrato.marcas_en_codigo()) == set(dbapi._LOTES)
+
+
+@pytest.mark.parametrize(
+    "nombre,origen,sql", contrato.lotes_estaticos(), ids=lambda v: v if isinstance(v, str) and "." in v else None
+)
+def test_sintaxis_de_los_lotes(nombre, origen, sql):
+    assert contrato.problemas_sintaxis(sql) == []
+
+
+def test_el_chequeo_detecta_errores():
+    assert contrato.problemas_sintaxis("SELECT (1")
+    assert contrato.problemas_sintaxis("IF 1 = 1 BEGIN SELECT 1")
+    assert contrato.problemas_sintaxis("DECLARE @a INT = ?; SELECT @a + @b")
+    assert contrato.problemas_sintaxis("SELECT 'abc")
+    assert contrato.problemas_sintaxis(
+        "DECLARE @r INT; EXEC @r = sp_getapplock @Resource = ?, @LockMode = 'Exclusive'; SELECT @r;"
+    ) == []
+
+    sql = "DECLARE @a INT = ?; SELECT @a = 1; INSERT INTO t SELECT 1; SELECT @a AS a, x.b, c FROM t x;"
+    assert contrato.result_sets(sql) == [["a", "b", "c"]]
+    desc = dbapi._desc(["a", "b", "z"])
+    assert contrato.problemas_llamada(sql, (1,), [(desc, [])]) == ["result set 1: columnas distintas [('c', 'z')]"]
+    assert contrato.problemas_llamada(sql, (1, 2), [(desc, []), (desc, [])]) != []
+
+
+def test_contrato_de_las_llamadas(app, cliente, pedidos):
+    from app import esquema
+    from app.despachos import service
+
+    (p1, o1), (p2, o2) = pedidos.tomar(2)
+    with contrato.Registro() as reg:
+        for ppc, odc in ((p1, o1), (p2, o2)):
+            pedido = {"codppc": ppc, "cododc": odc}
+            cliente.post("/api/despachos/detalle/generar", json=pedido)
+            cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+
+        r = cliente.post("/api/despachos/oleadas", json={"pedidos": [
+            {"codppc": p1, "cododc": o1}, {"codppc": p2, "cododc": o2},
+        ]})
+        oleada = r.get_json()["oleada_id"]
+        cliente.post(f"/api/despachos/oleadas/{oleada}/inicio")
+
+        lineas = service.listar_detalle_tabla("01", "01", p1, o1)
+        prod = lineas[0]["Cod_Producto_Pedido"]
+        cliente.post(f"/api/despachos/oleadas/{oleada}/scan", json={"codprod": prod, "etiqueta": "C-1"})
+        cliente.post("/api/despachos/detalle/scan/batch", json={"codppc": p1, "cododc": o1, "items": [
+            {"codprod": f["Cod_Producto_Pedido"], "cantidad": 1, "etiqueta": f"C-{n}"}
+            for n, f in enumerate(lineas[1:3], start=2)
+        ]})
+
+        for f in service.listar_detalle_tabla("01", "01", p1, o1):
+            falta = (f["Cantidd_abastecida"] or 0) - (f["Cantidad_Scaneada"] or 0)
+            if falta > 0:
+                cliente.post("/api/despachos/detalle/scan", json={
+                    "codppc": p1, "cododc": o1, "codprod": f["Cod_Producto_Pedido"], "cantidad": falta,
+                })
+        assert cliente.post("/api/despachos/detalle/fin", json={"codppc": p1, "cododc": o1}).status_code == 200
+
+        service._listar_despachos_sql("01", "01", None, None, 1, 5, "ABAST")
+        esquema.verificar_indices()
+
+    assert reg.problemas == []
+    assert set(reg.llamadas) == set(dbapi._LOTES)
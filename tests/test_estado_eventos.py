@@ -0,0 +1,29 @@
+# tests/test_estado_eventos.py
+"""
+Estado del pedido cacheado por proceso: un INICIO hecho por otro worker
+(otra conexión, sin pasar por este proceso) lo invalida al llegar su
+evento por el broker, sin esperar el TTL.
+"""
+import time
+
+from app.despachos import eventos, service
+
+_DONDE = "CIA_CODCIA = '01' AND SUC_CODSUC = '01' AND PPC_NUMPPC = ? AND ODC_NUMODC = ?"
+
+
+def test_evento_de_otro_worker_invalida_estado(pedidos, bd):
+    ppc, odc = pedidos.tomar(1)[0]
+    bd.execute("INSERT INTO PICKING_ASIGNACION (CIA_CODCIA, SUC_CODSUC, PPC_NUMPPC, ODC_NUMODC) "
+               "VALUES ('01', '01', ?, ?)", (ppc, odc))
+    bd.commit()
+    assert not service.tiene_inicio("01", "01", ppc, odc)
+
+    # "otro worker": escribe en BD y publica; acá solo llega el evento
+    bd.execute(f"UPDATE PICKING_ASIGNACION SET inicio_dt = datetime('now') WHERE {_DONDE}", (ppc, odc))
+    bd.commit()
+    assert not service.tiene_inicio("01", "01", ppc, odc)   # cacheado
+
+    eventos.obtener_backend()._repartir({
+        "tipo": "inicio", "codcia": "01", "codsuc": "01", "codppc": ppc, "cododc": odc, "ts": time.time(),
+    })
+    assert service.tiene_inicio("01", "01", ppc, odc)
@@ -0,0 +1,45 @@
+# tests/test_listado_etag.py
+"""
+ETag del listado: el 304 sale del sello del SP cacheado y la marca de
+eventos de la sede, sin leer el SP, el avance ni programar precarga; un scan
+en la sede lo invalida.
+"""
+import pytest
+
+from app.despachos import routes
+
+URL = "/api/despachos/"
+
+
+def test_304_sin_trabajo_y_scan_invalida(cliente, pedidos, monkeypatch):
+    r = cliente.get(URL, query_string={"page_size": 5})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    def no_llamar(*args, **kwargs):
+        pytest.fail("el 304 no tiene que leer datos")
+
+    with monkeypatch.context() as m:
+        for nombre in ("listar_despachos_sp", "con_avance", "programar_precarga"):
+            m.setattr(routes, nombre, no_llamar)
+        r = cliente.get(URL, query_string={"page_size": 5}, headers={"If-None-Match": etag})
+        assert r.status_code == 304
+
+    ppc, odc = pedidos.tomar(1)[0]
+    pedido = {"codppc": ppc, "cododc": odc}
+    detalle = cliente.post("/api/despachos/detalle/generar", json=pedido).get_json()["detalle"]
+    cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+    r = cliente.get(URL, query_string={"page_size": 5}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    assert cliente.post("/api/despachos/detalle/inicio", json=pedido).status_code == 200
+    r = cliente.get(URL, query_string={"page_size": 5}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+
+    r = cliente.post("/api/despachos/detalle/scan", json={**pedido, "codprod": detalle[0]["Cod_Producto_Pedido"], "cantidad": 1})
+    assert r.status_code == 200
+    r = cliente.get(URL, query_string={"page_size": 5}, headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag
@@ -0,0 +1,326 @@
+# tests/test_lotes_golden.py
+"""
+Golden de cada lote T-SQL marcado "-- picking:<nombre>": un estado inicial
+chico, la llamada con los parámetros que arma el servicio, y los result sets
+y el estado de las tablas que tiene que dejar.
+
+Cada caso corre en dos motores:
+  - "standin" (siempre): SQLite del stand-in. Ahí NO corre el T-SQL sino su
+    copia Python (benchmarks/standin/dbapi._LOTES).
+  - "mssql" (con PICKING_TEST_MSSQL_URL, URL de SQLAlchemy a una base con las
+    migraciones aplicadas): el T-SQL real, en una transacción que se descarta.
+Con los dos, la copia y el T-SQL tienen que dar lo mismo; sin SQL Server el
+golden documenta lo que se espera del T-SQL y prueba solo la copia.
+"""
+import os
+import re
+import tempfile
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from app import esquema
+from app.despachos import oleadas, service
+from benchmarks.standin import URL
+from benchmarks.standin.esquema import sembrar
+
+CIA, SUC = "GD", "GD"
+INICIO = "2026-01-05 08:00:00"
+
+
+@pytest.fixture(scope="module", params=["standin", "mssql"])
+def motor(request):
+    if request.param == "mssql":
+        url = os.getenv("PICKING_TEST_MSSQL_URL")
+        if not url:
+            pytest.skip("sin PICKING_TEST_MSSQL_URL: el T-SQL de los lotes no se ejecuta")
+        eng = create_engine(url)
+    else:
+        ruta = os.path.join(tempfile.mkdtemp(prefix="tests-golden-"), "golden.db")
+        sembrar(ruta, 0, 0)
+        eng = create_engine(URL.format(ruta=ruta))
+    eng.nombre = request.param
+    yield eng
+    eng.dispose()
+
+
+@pytest.fixture
+def conn(motor):
+    """Conexión en una transacción que se descarta al final del caso."""
+    c = motor.connect()
+    tx = c.begin()
+    yield c
+    tx.rollback()
+    c.close()
+
+
+# =========================================================
+# Helpers
+# =========================================================
+def _valor(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, str):
+        return v.strip()
+    return v
+
+
+def ejecutar(conn, sql, params):
+    """
+    Corre el lote como lo hace el servicio (parámetros "?" en cursor crudo o
+    ":nombre" vía text()) y devuelve [(columnas, filas)] de todos sus result sets.
+    """
+    if isinstance(params, dict):
+        compilado = text(sql).compile(dialect=conn.dialect)
+        sql = str(compilado)
+        valores = compilado.construct_params(params)
+        if compilado.positiontup is not None:
+            params = tuple(valores[k] for k in compilado.positiontup)
+        else:
+            params = valores
+    cur = conn.connection.cursor()
+    cur.execute(sql, params)
+    salida = []
+    while True:
+        if cur.description is not None:
+            columnas = [d[0] for d in cur.description]
+            salida.append((columnas, [tuple(_valor(v) for v in f) for f in cur.fetchall()]))
+        if not cur.nextset():
+            break
+    return salida
+
+
+def elegir(result_set, *columnas):
+    """Las columnas pedidas de un result set, por nombre."""
+    nombres, filas = result_set
+    idx = [nombres.index(c) for c in columnas]
+    return [tuple(f[i] for i in idx) for f in filas]
+
+
+def insertar(conn, tabla, filas):
+    cur = conn.connection.cursor()
+    for fila in filas:
+        cols = list(fila)
+        cur.execute(
+            f"INSERT INTO dbo.{tabla} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+            tuple(fila[c] for c in cols)
+        )
+
+
+def consultar(conn, sql, params=()):
+    cur = conn.connection.cursor()
+    cur.execute(sql, params)
+    return [tuple(_valor(v) for v in f) for f in cur.fetchall()]
+
+
+def _asignacion(ppc, odc, lineas, abastecidas, detalle_ver=0):
+    return {
+        "CIA_CODCIA": CIA, "SUC_CODSUC": SUC, "PPC_NUMPPC": ppc, "ODC_NUMODC": odc,
+        "inicio_dt": INICIO, "detalle_ver": detalle_ver,
+        "lineas_total": lineas, "lineas_completas": 0,
+        "unidades_abastecidas": abastecidas, "unidades_escaneadas": 0,
+    }
+
+
+def _linea(ppc, odc, item, prod, abast, orden, ubicacion="A01", scan=0, estado="0"):
+    return {
+        "CIA_CODCIA": CIA, "SUC_CODSUC": SUC, "PPC_NUMPPC": ppc, "ODC_NUMODC": odc,
+        "ITEM": item, "Cod_Producto_Pedido": prod,
+        "Cantidad_a_Despachar": abast, "Cantidd_abastecida": abast,
+        "Cantidad_Scaneada": scan, "Diferencia": scan - abast,
+        "Ubicacion": ubicacion, "Orden_Ruta": orden, "ESTADO": estado,
+    }
+
+
+_DONDE = "CIA_CODCIA = ? AND SUC_CODSUC = ? AND PPC_NUMPPC = ? AND ODC_NUMODC = ?"
+
+
+# =========================================================
+# scan_lote (service._sql_scan)
+# =========================================================
+def test_scan_lote(conn):
+    ppc, odc = "GOLD-SCAN", "OD-1"
+    insertar(conn, "PICKING_ASIGNACION", [_asignacion(ppc, odc, lineas=3, abastecidas=4)])
+    insertar(conn, "PICKING_DETALLE", [
+        _linea(ppc, odc, 1, "A", 2, orden=1),
+        _linea(ppc, odc, 2, "A", 1, orden=2),   # producto repetido en dos líneas
+        _linea(ppc, odc, 3, "B", 1, orden=3),
+    ])
+
+    lecturas = [("A", 2, "E1"), ("A", 1, "E1"), ("A", 1, None), ("A", 1, None), ("Z", 1, None)]
+    params = [CIA, SUC, ppc, odc, None]
+    for n, (prod, cant, etiqueta) in enumerate(lecturas, start=1):
+        params += [n, prod, float(cant), etiqueta]
+    motivos, lineas, totales = ejecutar(conn, service._sql_scan(len(lecturas)), params)
+
+    assert motivos[1] == [(1, "ok"), (2, "duplicado"), (3, "ok"), (4, "sobrepicking"), (5, "no_encontrado")]
+    # sin desde: solo las líneas tocadas, en orden de ruta
+    assert elegir(lineas, "ITEM", "Cantidad_Scaneada", "Diferencia", "ESTADO") == [
+        (1, 2.0, 0.0, "0"), (2, 1.0, 0.0, "0"),
+    ]
+    assert elegir(totales, "lineas", "lineas_completas", "unidades_abastecidas", "unidades_escaneadas") == [
+        (3, 2, 4.0, 3.0),
+    ]
+    assert consultar(conn, f"""
+        SELECT detalle_ver, lineas_completas, unidades_escaneadas
+        FROM dbo.PICKING_ASIGNACION WHERE {_DONDE}""", (CIA, SUC, ppc, odc)) == [(1, 2, 3.0)]
+    assert consultar(conn, f"""
+        SELECT ETIQUETA, Cod_Producto_Pedido, Cantidad
+        FROM dbo.PICKING_SCAN_ETIQUETA WHERE {_DONDE}""", (CIA, SUC, ppc, odc)) == [("E1", "A", 2.0)]
+
+
+def test_scan_lote_sin_inicio(conn):
+    ppc, odc = "GOLD-SIN", "OD-1"
+    fila = _asignacion(ppc, odc, lineas=1, abastecidas=1)
+    fila["inicio_dt"] = None
+    insertar(conn, "PICKING_ASIGNACION", [fila])
+    insertar(conn, "PICKING_DETALLE", [_linea(ppc, odc, 1, "A", 1, orden=1)])
+
+    motivos, lineas, totales = ejecutar(conn, service._sql_scan(1), [CIA, SUC, ppc, odc, None, 1, "A", 1.0, None])
+    assert motivos[1] == [(1, "sin_inicio")]
+    assert lineas[1] == []
+    assert elegir(totales, "lineas", "lineas_completas") == [(1, 0)]
+
+
+# =========================================================
+# oleada_crear + oleada_scan (oleadas.py)
+# =========================================================
+def test_oleada_scan(conn):
+    p1, p2 = ("GOLD-OL1", "OD-1"), ("GOLD-OL2", "OD-1")
+    insertar(conn, "PICKING_ASIGNACION", [
+        _asignacion(*p1, lineas=1, abastecidas=2),
+        _asignacion(*p2, lineas=2, abastecidas=4),
+    ])
+    insertar(conn, "PICKING_DETALLE", [
+        _linea(*p1, 1, "X", 2, orden=1, ubicacion="U1"),
+        _linea(*p2, 1, "X", 3, orden=1, ubicacion="U1"),
+        _linea(*p2, 2, "X", 1, orden=2, ubicacion="U2"),
+    ])
+
+    (columnas, filas), = ejecutar(conn, oleadas._SQL_CREAR_OLEADA, {"cia": CIA, "suc": SUC, "creado": "GOLDEN"})
+    oleada = filas[0][0]
+    assert isinstance(oleada, int)
+    insertar(conn, "PICKING_OLEADA_PEDIDO", [
+        {"OLEADA_ID": oleada, "CIA_CODCIA": CIA, "SUC_CODSUC": SUC, "PPC_NUMPPC": ppc, "ODC_NUMODC": odc, "orden": n}
+        for n, (ppc, odc) in enumerate((p1, p2), start=1)
+    ])
+
+    def scan(prod, cant, etiqueta=None, ubicacion=None):
+        motivo, reparto, pedidos = ejecutar(
+            conn, oleadas._SQL_OLEADA_SCAN, (oleada, CIA, SUC, prod, float(cant), etiqueta, ubicacion)
+        )
+        return (
+            motivo[1][0][0],
+            elegir(reparto, "PPC_NUMPPC", "ODC_NUMODC", "ITEM", "cantidad"),
+            elegir(pedidos, "PPC_NUMPPC", "lineas", "lineas_completas", "unidades_abastecidas", "unidades_escaneadas"),
+        )
+
+    # 4 unidades: 2 completan la línea de p1, 2 van a la primera de p2
+    assert scan("X", 4, "Q1") == ("ok", [
+        (*p1, "1", 2.0), (*p2, "1", 2.0),
+    ], [
+        (p1[0], 1, 1, 2.0, 2.0), (p2[0], 2, 0, 4.0, 2.0),
+    ])
+    assert scan("X", 1, "Q1") == ("duplicado", [], [])
+    assert scan("X", 1, ubicacion="U9") == ("no_encontrado", [], [])
+    assert scan("X", 5) == ("sobrepicking", [], [])
+    assert scan("X", 1, ubicacion="U2") == ("ok", [(*p2, "2", 1.0)], [(p2[0], 2, 1, 4.0, 3.0)])
+
+    # la etiqueta queda en el registro de cada miembro, con lo que le tocó
+    assert sorted(consultar(conn, """
+        SELECT PPC_NUMPPC, Cantidad FROM dbo.PICKING_SCAN_ETIQUETA
+        WHERE CIA_CODCIA = ? AND SUC_CODSUC = ? AND ETIQUETA = 'Q1'""", (CIA, SUC))) == [
+        (p1[0], 2.0), (p2[0], 2.0),
+    ]
+    assert consultar(conn, f"SELECT ESTADO FROM dbo.PICKING_DETALLE WHERE {_DONDE}", (CIA, SUC) + p1) == [("1",)]
+
+
+# =========================================================
+# archivar_pedido (service._SQL_ARCHIVAR)
+# =========================================================
+def test_archivar_pedido(conn):
+    ppc, odc = "GOLD-ARCH", "OD-1"
+    insertar(conn, "PICKING_ASIGNACION", [_asignacion(ppc, odc, lineas=2, abastecidas=3, detalle_ver=5)])
+    insertar(conn, "PICKING_DETALLE", [
+        _linea(ppc, odc, 1, "A", 2, orden=1, scan=2, estado="1"),
+        _linea(ppc, odc, 2, "B", 1, orden=2, scan=1, estado="1"),
+    ])
+    # ITEM 1 ya archivado antes, con otro avance: se sobrescribe
+    insertar(conn, "PICKING_HISTORICO", [_linea(ppc, odc, 1, "A", 2, orden=1)])
+    insertar(conn, "PICKING_SCAN_ETIQUETA", [{
+        "CIA_CODCIA": CIA, "SUC_CODSUC": SUC, "PPC_NUMPPC": ppc, "ODC_NUMODC": odc,
+        "ETIQUETA": "E1", "Cod_Producto_Pedido": "A", "Cantidad": 2,
+    }])
+
+    (_, filas), = ejecutar(conn, service._SQL_ARCHIVAR, {
+        "recurso": service._recurso_pedido(CIA, SUC, ppc, odc), "timeout": 1000,
+        "cia": CIA, "suc": SUC, "ppc": ppc, "odc": odc,
+    })
+    assert filas == [(2,)]
+
+    clave = (CIA, SUC, ppc, odc)
+    assert consultar(conn, f"""
+        SELECT ITEM, Cantidad_Scaneada, Diferencia, ESTADO
+        FROM dbo.PICKING_HISTORICO WHERE {_DONDE} ORDER BY ITEM""", clave) == [
+        (1, 2.0, 0.0, "1"), (2, 1.0, 0.0, "1"),
+    ]
+    assert consultar(conn, f"SELECT COUNT(*) FROM dbo.PICKING_DETALLE WHERE {_DONDE}", clave) == [(0,)]
+    assert consultar(conn, f"SELECT COUNT(*) FROM dbo.PICKING_SCAN_ETIQUETA WHERE {_DONDE}", clave) == [(0,)]
+    assert consultar(conn, f"SELECT detalle_ver FROM dbo.PICKING_ASIGNACION WHERE {_DONDE}", clave) == [(6,)]
+
+
+# =========================================================
+# despachos_pagina (service._sql_despachos_pagina)
+# =========================================================
+def test_despachos_pagina(conn):
+    """Sin filas fijas (en SQL Server el SP es el del ERP): la página es un corte del SP."""
+    cia, suc = os.getenv("PICKING_TEST_SEDE", "GD/GD").split("/")
+    if conn.engine.nombre == "standin":
+        insertar(conn, "STUB_PEDIDOS", [
+            {"cia_codcia": cia, "suc_codsuc": suc, "ppc_numppc": f"GOLD-P{i}", "odc_numodc": "OD-1",
+             "periodo": "202601", "ppc_fecdoc": f"2026-01-0{i}"}
+            for i in range(1, 6)
+        ])
+    sp = ejecutar(conn, "EXEC pa_Preparacion_Despacho_Local_por_atender @codcia=?, @codsuc=?, @perini=?, @perfin=?",
+                  (cia, suc, None, None))[0]
+    columnas = [(c, "NVARCHAR(4000)") for c in sp[0]]
+    sql = service._sql_despachos_pagina(columnas)
+
+    for estado in (None, "ABAST"):
+        esperadas = [f for f in sp[1] if estado is None or estado in str(f[sp[0].index("c_sit_orddes")] or "").upper()]
+        for offset in (0, 2):
+            total, pagina = ejecutar(conn, sql, (estado, cia, suc, None, None, offset, 2))
+            assert total[1] == [(len(esperadas),)]
+            assert pagina[0] == sp[0]
+            assert [tuple(map(str, f)) for f in pagina[1]] == [tuple(map(str, f)) for f in esperadas[offset:offset + 2]]
+
+
+# =========================================================
+# applock / esquema_indices
+# =========================================================
+def test_applock_excluye_a_otra_transaccion(motor, conn, request):
+    if motor.nombre == "standin":
+        request.applymarker(pytest.mark.xfail(
+            strict=True, reason="el stand-in concede siempre el applock: solo se prueba contra SQL Server"
+        ))
+    recurso = "GOLDEN:applock"
+    assert ejecutar(conn, service._SQL_APPLOCK, (recurso, 0))[0][1] == [(0,)]
+
+    otra = motor.connect()
+    tx = otra.begin()
+    try:
+        assert ejecutar(otra, oleadas._SQL_APPLOCK_OLEADAS, {"recurso": recurso, "timeout": 0})[0][1] == [(-1,)]
+    finally:
+        tx.rollback()
+        otra.close()
+
+
+def test_esquema_indices(conn):
+    (columnas, filas), = ejecutar(conn, esquema._SQL_INDICES, ())
+    assert columnas == ["tabla", "indice", "columna", "key_ordinal"]
+    existentes = {}
+    for tabla, indice, columna, _ in sorted(filas, key=lambda f: (f[0], f[1], f[3])):
+        existentes.setdefault(tabla.upper(), {}).setdefault(indice, []).append(columna.upper())
+    for tabla, igualdad, siguientes, uso in esquema.INDICES_REQUERIDOS:
+        assert any(esquema._sirve(c, igualdad, siguientes) for c in existentes.get(tabla.upper(), {}).values()), uso
@@ -0,0 +1,129 @@
+# tests/test_oleadas.py
+"""
+Oleadas: varios pedidos con una lista de picking combinada. Los tres pedidos
+del módulo comparten el producto X1 (ITEM 1, abastecido 2/3/1) antes de
+generar su detalle; los tests siguen el orden del flujo (crear, inicio, scans, cerrar).
+Los lotes de oleada corren como copia Python del stand-in (ver conftest.py).
+"""
+import pytest
+
+from benchmarks.standin.esquema import PREPARADORES
+
+URL = "/api/despachos/oleadas"
+ABASTECIDO = (2, 3, 1)
+
+
+@pytest.fixture(scope="module")
+def miembros(pedidos):
+    return [{"codppc": p, "cododc": o} for p, o in pedidos.tomar(3)]
+
+
+@pytest.fixture(scope="module")
+def oleada(bd_modulo, cliente_modulo, miembros):
+    for m, ab in zip(miembros, ABASTECIDO):
+        bd_modulo.execute(
+            "UPDATE STUB_DETALLE SET Cod_Producto_Pedido = 'X1', Ubicacion = 'A01-R01-N1', "
+            "Cantidd_abastecida = ?, Cantidad_a_Despachar = ? "
+            "WHERE PPC_NUMPPC = ? AND ODC_NUMODC = ? AND ITEM = 1",
+            (ab, ab, m["codppc"], m["cododc"])
+        )
+    bd_modulo.commit()
+
+    r = cliente_modulo.post(URL, json={"pedidos": miembros, "preparado_id": PREPARADORES[0]})
+    assert r.status_code == 201, r.get_data(as_text=True)
+    return r.get_json()["oleada_id"]
+
+
+def _scan(cliente, oleada, **body):
+    return cliente.post(f"{URL}/{oleada}/scan", json=body)
+
+
+def test_pedido_ya_en_otra_oleada(cliente, oleada, miembros):
+    r = cliente.post(URL, json={"pedidos": miembros[1:]})
+    assert r.status_code == 409
+    assert r.get_json()["ok"] is False
+
+
+def test_scan_antes_de_inicio(cliente, oleada):
+    assert _scan(cliente, oleada, codprod="X1").status_code == 409
+
+
+def test_scan_reparte_entre_pedidos(cliente, oleada, miembros):
+    assert cliente.post(f"{URL}/{oleada}/inicio").status_code == 200
+
+    r = _scan(cliente, oleada, codprod="X1", cantidad=4, etiqueta="OL-1")
+    assert r.status_code == 200, r.get_data(as_text=True)
+    reparto = r.get_json()["reparto"]
+    assert sum(x["cantidad"] for x in reparto) == 4
+    assert len({(x["codppc"], x["cododc"]) for x in reparto}) >= 2
+
+    lista = cliente.get(f"{URL}/{oleada}").get_json()["lista"]
+    x1 = next(l for l in lista if l["Cod_Producto_Pedido"] == "X1")
+    assert x1["Cantidd_abastecida"] == sum(ABASTECIDO)
+    assert x1["Cantidad_Scaneada"] == 4
+
+
+def test_sobrepicking(cliente, oleada):
+    # quedan 2 de X1 entre los tres pedidos
+    assert _scan(cliente, oleada, codprod="X1", cantidad=3).status_code == 400
+    assert _scan(cliente, oleada, codprod="X1", cantidad=3, ubicacion="A01-R01-N1").status_code == 400
+
+
+def test_fuera_de_la_ubicacion_no_es_sobrepicking(cliente, oleada):
+    r = _scan(cliente, oleada, codprod="X1", cantidad=1, ubicacion="Z99-R99-N9")
+    assert r.status_code == 404
+    assert "Z99-R99-N9" in r.get_json()["msg"]
+
+
+def test_etiqueta_duplicada(cliente, oleada):
+    assert _scan(cliente, oleada, codprod="X1", cantidad=1, etiqueta="OL-1").status_code == 409
+
+
+def test_etiqueta_cuenta_una_vez_en_los_dos_modos(cliente, oleada, miembros):
+    from app.despachos import service
+
+    def con_saldo(m):
+        return next(
+            f["Cod_Producto_Pedido"] for f in service.listar_detalle_tabla("01", "01", m["codppc"], m["cododc"])
+            if f["Cod_Producto_Pedido"] != "X1" and f["Cantidad_Scaneada"] < f["Cantidd_abastecida"]
+        )
+
+    # primero en el detalle del pedido, después en la oleada
+    a, b, c = miembros
+    prod = con_saldo(a)
+    r = cliente.post("/api/despachos/detalle/scan", json={**a, "codprod": prod, "cantidad": 1, "etiqueta": "OL-PED"})
+    assert r.status_code == 200, r.get_data(as_text=True)
+    assert _scan(cliente, oleada, codprod=prod, cantidad=1, etiqueta="OL-PED").status_code == 409
+
+    # primero en la oleada, después en el detalle de cualquier miembro
+    prod = con_saldo(b)
+    assert _scan(cliente, oleada, codprod=prod, cantidad=1, etiqueta="OL-2").status_code == 200
+    for m in (b, c):
+        r = cliente.post("/api/despachos/detalle/scan", json={**m, "codprod": con_saldo(m), "cantidad": 1, "etiqueta": "OL-2"})
+        assert r.status_code == 409
+
+
+def test_cerrar_finaliza_y_archiva(cliente, bd, oleada, miembros):
+    r = cliente.post(f"{URL}/{oleada}/cerrar")
+    assert r.status_code == 409
+    assert r.get_json()["cerrada"] is False
+
+    for l in cliente.get(f"{URL}/{oleada}").get_json()["lista"]:
+        falta = l["Cantidd_abastecida"] - l["Cantidad_Scaneada"]
+        if falta > 0:
+            r = _scan(cliente, oleada, codprod=l["Cod_Producto_Pedido"], cantidad=falta, ubicacion=l["Ubicacion"])
+            assert r.status_code == 200, r.get_data(as_text=True)
+
+    r = cliente.post(f"{URL}/{oleada}/cerrar")
+    assert r.status_code == 200, r.get_data(as_text=True)
+    assert r.get_json()["cerrada"] is True
+    assert all(p["ok"] for p in r.get_json()["pedidos"])
+
+    for m in miembros:
+        clave = ("01", "01", m["codppc"], m["cododc"])
+        donde = "CIA_CODCIA = ? AND SUC_CODSUC = ? AND PPC_NUMPPC = ? AND ODC_NUMODC = ?"
+        assert bd.execute(f"SELECT COUNT(*) FROM PICKING_DETALLE WHERE {donde}", clave).fetchone()[0] == 0
+        assert bd.execute(f"SELECT COUNT(*) FROM PICKING_HISTORICO WHERE {donde}", clave).fetchone()[0] > 0
+        assert bd.execute(f"SELECT fin_dt FROM PICKING_ASIGNACION WHERE {donde}", clave).fetchone()[0] is not None
+
+    assert _scan(cliente, oleada, codprod="X1").status_code == 404
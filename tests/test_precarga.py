@@ -0,0 +1,47 @@
+# tests/test_precarga.py
+"""
+Precarga en pleno abastecimiento: el snapshot que arma la precarga se
+revisa contra el SP en la primera apertura sin inicio y se rehace si
+Cantidd_abastecida cambió; una vez iniciado ya no se toca.
+"""
+from app.despachos import service
+
+_DONDE = "CIA_CODCIA = '01' AND SUC_CODSUC = '01' AND PPC_NUMPPC = ? AND ODC_NUMODC = ?"
+
+
+def _hash(bd, ppc, odc):
+    return bd.execute(f"SELECT precarga_hash FROM PICKING_ASIGNACION WHERE {_DONDE}", (ppc, odc)).fetchone()[0]
+
+
+def _abastecer(bd, ppc, odc, item, cantidad):
+    bd.execute(f"UPDATE STUB_DETALLE SET Cantidd_abastecida = ? WHERE {_DONDE} AND ITEM = ?", (cantidad, ppc, odc, item))
+    bd.commit()
+
+
+def test_apertura_rehace_snapshot_precargado_si_cambio_el_abastecimiento(cliente, pedidos, bd):
+    (ppc, odc), (ppc2, odc2) = pedidos.tomar(2)
+    pedido = {"codppc": ppc, "cododc": odc}
+
+    assert service.precargar_detalle("01", "01", ppc, odc) == "generado"
+    assert _hash(bd, ppc, odc)
+    _abastecer(bd, ppc, odc, 1, 99)
+
+    detalle = cliente.post("/api/despachos/detalle/generar", json=pedido).get_json()["detalle"]
+    assert {f["ITEM"]: f["Cantidd_abastecida"] for f in detalle}[1] == 99
+    assert _hash(bd, ppc, odc) is None
+    total, = bd.execute(f"SELECT unidades_abastecidas FROM PICKING_ASIGNACION WHERE {_DONDE}", (ppc, odc)).fetchone()
+    assert total == sum(f["Cantidd_abastecida"] for f in detalle)
+
+    # sin cambios en el ERP: se sirve lo precargado (mismas versiones)
+    assert service.precargar_detalle("01", "01", ppc2, odc2) == "generado"
+    antes = {f["ITEM"]: f["RowVer"] for f in service.listar_detalle_tabla("01", "01", ppc2, odc2)}
+    detalle = cliente.post("/api/despachos/detalle/generar", json={"codppc": ppc2, "cododc": odc2}).get_json()["detalle"]
+    assert {f["ITEM"]: f["RowVer"] for f in detalle} == antes
+    assert _hash(bd, ppc2, odc2) is None
+
+    # iniciado: el snapshot queda fijo
+    cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+    assert cliente.post("/api/despachos/detalle/inicio", json=pedido).status_code == 200
+    _abastecer(bd, ppc, odc, 1, 5)
+    detalle = cliente.post("/api/despachos/detalle/generar", json=pedido).get_json()["detalle"]
+    assert {f["ITEM"]: f["Cantidd_abastecida"] for f in detalle}[1] == 99
@@ -0,0 +1,44 @@
+# tests/test_scan_cantidad.py
+"""
+Cantidades de scan: las no positivas o no finitas se rechazan antes de ir a
+BD (el lote solo suma).
+El lote corre como copia Python del stand-in (ver conftest.py).
+"""
+from app.despachos import service
+
+
+def _pedido_completo(cliente, ppc, odc):
+    pedido = {"codppc": ppc, "cododc": odc}
+    cliente.post("/api/despachos/detalle/generar", json=pedido)
+    cliente.post("/api/despachos/detalle/asignar", json={**pedido, "preparado_id": "P0001"})
+    assert cliente.post("/api/despachos/detalle/inicio", json=pedido).status_code == 200
+    for f in service.listar_detalle_tabla("01", "01", ppc, odc):
+        falta = (f["Cantidd_abastecida"] or 0) - (f["Cantidad_Scaneada"] or 0)
+        if falta > 0:
+            r = cliente.post("/api/despachos/detalle/scan", json={**pedido, "codprod": f["Cod_Producto_Pedido"], "cantidad": falta})
+            assert r.status_code == 200, r.get_data(as_text=True)
+    return pedido
+
+
+INVALIDAS = [-1, 0, "nan", "inf", "-inf"]
+
+
+def test_scan_rechaza_cantidad(cliente, pedidos):
+    ppc, odc = pedidos.tomar(1)[0]
+    pedido = _pedido_completo(cliente, ppc, odc)
+    prod = service.listar_detalle_tabla("01", "01", ppc, odc)[0]["Cod_Producto_Pedido"]
+
+    for cantidad in INVALIDAS:
+        r = cliente.post("/api/despachos/detalle/scan", json={**pedido, "codprod": prod, "cantidad": cantidad})
+        assert r.status_code == 400, cantidad
+
+    r = cliente.post("/api/despachos/detalle/scan/batch", json={**pedido, "items": [
+        {"codprod": prod, "cantidad": cantidad} for cantidad in INVALIDAS
+    ]})
+    assert r.status_code == 200
+    assert [x["motivo"] for x in r.get_json()["resultados"]] == ["invalido"] * len(INVALIDAS)
+
+    lineas = service.listar_detalle_tabla("01", "01", ppc, odc)
+    assert all(f["Cantidad_Scaneada"] == f["Cantidd_abastecida"] for f in lineas)
+    assert cliente.post("/api/despachos/detalle/fin", json=pedido).status_code == 200
+
@@ -0,0 +1,56 @@
+# tests/test_sedes.py
+"""
+Sedes por usuario: el login solo acepta las del usuario (PICKING_USUARIO_SEDE)
+y las deja en el token; codcia/codsuc del request fuera de ese conjunto -> 403
+aunque la sede esté en Config.SEDES.
+"""
+import pytest
+from flask_jwt_extended import decode_token
+
+from app.config import Config
+from benchmarks.standin.esquema import CODIGO_USUARIO, USUARIO
+
+URL = "/api/despachos/"
+
+
+@pytest.fixture
+def sedes(monkeypatch, bd):
+    monkeypatch.setattr(Config, "SEDES", [("01", "01"), ("01", "02"), ("02", "01")])
+    bd.executemany("INSERT INTO PICKING_USUARIO_SEDE VALUES (?, ?, ?)",
+                   [(CODIGO_USUARIO, "01", "01"), (CODIGO_USUARIO, "01", "02")])
+    bd.commit()
+    yield
+    bd.execute("DELETE FROM PICKING_USUARIO_SEDE")
+    bd.commit()
+
+
+def _login(app, **sede):
+    c = app.test_client()
+    return c, c.post("/api/auth/login", json={"username": USUARIO, "password": "1234", **sede})
+
+
+def test_login_y_requests_solo_en_sedes_del_usuario(app, sedes):
+    _, r = _login(app, codcia="02", codsuc="01")
+    assert r.status_code == 403
+
+    c, r = _login(app, codcia="01", codsuc="02")
+    assert r.status_code == 200
+    assert r.get_json()["sedes"] == ["01-01", "01-02"]
+    token = c.get_cookie(app.config["JWT_ACCESS_COOKIE_NAME"]).value
+    with app.app_context():
+        assert decode_token(token)["sedes"] == ["01-01", "01-02"]
+
+    assert c.get(URL).status_code == 200
+    assert c.get(URL, query_string={"codcia": "01", "codsuc": "01"}).status_code == 200
+    assert c.get(URL, query_string={"codcia": "02", "codsuc": "01"}).status_code == 403
+    r = c.post("/api/despachos/detalle/generar", json={"codppc": "X", "cododc": "Y", "codcia": "02", "codsuc": "01"})
+    assert r.status_code == 403
+
+
+def test_usuario_sin_sedes_solo_la_por_defecto(app, monkeypatch):
+    monkeypatch.setattr(Config, "SEDES", [("01", "01"), ("01", "02")])
+    _, r = _login(app, codcia="01", codsuc="02")
+    assert r.status_code == 403
+    c, r = _login(app)
+    assert r.status_code == 200
+    assert c.get(URL, query_string={"codcia": "01", "codsuc": "02"}).status_code == 403
@@ -0,0 +1,57 @@
+# tests/test_snapshot_concurrente.py
+"""
+Un solo generador de snapshot por pedido aunque lo abran varias tablets a la
+vez dentro del mismo proceso: cubre el candado en memoria. El sp_getapplock
+entre procesos no se prueba acá (el stand-in lo concede siempre); ver
+test_lotes_golden.py contra SQL Server.
+"""
+import threading
+import time
+
+from app.despachos import service
+
+
+def test_snapshot_concurrente_corre_el_sp_una_vez(pedidos, bd, monkeypatch):
+    ppc, odc = pedidos.tomar()[0]
+
+    llamadas = []
+    sp_original = service._ejecutar_sp_detalle
+
+    def sp_lento(cur, *args):
+        llamadas.append(args)
+        time.sleep(0.2)   # ventana para que el segundo hilo llegue mientras el primero genera
+        return sp_original(cur, *args)
+
+    monkeypatch.setattr(service, "_ejecutar_sp_detalle", sp_lento)
+
+    salida = threading.Barrier(2)
+    resultados, errores = [], []
+
+    def abrir():
+        salida.wait()
+        try:
+            resultados.append(service.generar_detalle_si_no_existe("01", "01", ppc, odc))
+        except Exception as e:  # el assert de abajo muestra cuál
+            errores.append(e)
+
+    hilos = [threading.Thread(target=abrir) for _ in range(2)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(timeout=30)
+
+    assert not errores
+    assert len(llamadas) == 1
+
+    esperadas = bd.execute(
+        "SELECT COUNT(*) FROM STUB_DETALLE WHERE PPC_NUMPPC=? AND ODC_NUMODC=?", (ppc, odc)
+    ).fetchone()[0]
+    items = [r[0] for r in bd.execute(
+        "SELECT ITEM FROM PICKING_DETALLE WHERE PPC_NUMPPC=? AND ODC_NUMODC=?", (ppc, odc)
+    )]
+    assert len(items) == esperadas
+    assert len(set(items)) == len(items)
+
+    # los dos hilos ven el mismo detalle
+    assert len(resultados) == 2
+    assert [sorted(f["ITEM"] for f in r) for r in resultados] == [sorted(items)] * 2
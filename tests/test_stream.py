@@ -0,0 +1,37 @@
+# tests/test_stream.py
+"""
+GET /stream bajo WSGI: cada stream retiene un hilo, así que se aceptan hasta
+EVENTOS_STREAMS_WSGI por proceso y el resto recibe 503 con Retry-After.
+"""
+import threading
+
+from app.config import Config
+from app.despachos import routes
+
+URL = "/api/despachos/stream"
+
+
+def test_sin_cupo_responde_503_con_polling(cliente):
+    # valor por defecto: bajo WSGI no hay stream
+    assert Config.EVENTOS_STREAMS_WSGI == 0
+    r = cliente.get(URL)
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == str(Config.EVENTOS_POLLING_S)
+    assert r.get_json()["polling_s"] == Config.EVENTOS_POLLING_S
+
+
+def test_cupo_se_libera_al_cerrar(cliente, monkeypatch):
+    monkeypatch.setattr(routes, "_cupos_stream", threading.BoundedSemaphore(1))
+
+    abierto = cliente.get(URL, buffered=False)
+    assert abierto.status_code == 200
+    assert abierto.mimetype == "text/event-stream"
+    assert next(abierto.response) == b"retry: 3000\n\n"
+
+    assert cliente.get(URL).status_code == 503
+
+    abierto.close()
+    segundo = cliente.get(URL, buffered=False)
+    assert segundo.status_code == 200
+    segundo.close()
+    assert routes._cupos_stream.acquire(blocking=False)
@@ -0,0 +1,22 @@
+# tests/test_tareas.py
+"""
+create_app() no arranca hilos de fondo (tests, CLI, benchmarks); solo con
+tareas_de_fondo=True (el servidor), y una vez por proceso.
+"""
+import app as paquete
+from app import tareas
+from app.config import Config
+
+
+def test_hilos_de_fondo_solo_al_levantar_el_servidor(monkeypatch):
+    iniciadas = []
+    monkeypatch.setattr(tareas, "iniciar_tarea_periodica", lambda nombre, *a, **k: iniciadas.append(nombre))
+    monkeypatch.setattr(Config, "COMPACTACION_INTERVALO_S", 60)
+    monkeypatch.setitem(paquete._tareas, "iniciadas", False)
+
+    paquete.create_app()
+    assert iniciadas == []
+
+    paquete.create_app(tareas_de_fondo=True)
+    paquete.create_app(tareas_de_fondo=True)
+    assert iniciadas == ["compactar-detalle", "directorio"]